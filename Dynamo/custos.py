@@ -0,0 +1,100 @@
+"""
+Cálculo de custo, impostos e margem dos itens vendidos (faturamento / Dynamo).
+
+O custo parte do valor unitário da última NF de compra do produto e soma a ST (com MVA ajustado
+pelo ICMS do fornecedor), o IPI e o frete. Os percentuais ficam em ConfigCusto; CONFIG_PADRAO
+tem os valores usados hoje.
+
+- calcular_valores_finais(): um item por vez, com floats do Python.
+- calcular_valores_finais_lote(): os mesmos cálculos sobre arrays NumPy, para o chunk inteiro de uma vez.
+  As operações seguem a mesma ordem da versão escalar, então os resultados são idênticos.
+"""
+import numpy as np
+
+
+class ConfigCusto:
+    """Percentuais do cálculo de custo (em %, como aparecem nas planilhas) e o fator de margem."""
+
+    def __init__(self, mva_st_original=71.78, icms_destino=20.5, frete=10.0, fator_margem=0.67):
+        self.mva_st_original = mva_st_original
+        self.icms_destino = icms_destino
+        self.frete = frete
+        self.fator_margem = fator_margem
+
+    def __repr__(self):
+        return (f"ConfigCusto(mva_st_original={self.mva_st_original}, icms_destino={self.icms_destino}, "
+                f"frete={self.frete}, fator_margem={self.fator_margem})")
+
+
+CONFIG_PADRAO = ConfigCusto()
+
+
+def calcular_valores_finais(valor_custo, ipi_perc, icms_forn_perc, valor_final_venda, qtd, config=CONFIG_PADRAO):
+    """
+    Função pura de cálculo, sem acesso ao banco. Recebe os valores e retorna os resultados.
+    Retorna (valor_custo_total, valor_impostos_total, valor_margem); a margem é "" sem valor de venda.
+    """
+    ipi = ipi_perc / 100.0
+    icms_forn = icms_forn_perc / 100.0
+
+    # Cálculo revisado
+    mva_st_original = config.mva_st_original / 100
+    icms_destino = config.icms_destino / 100
+
+    # Evita divisão por zero
+    if (1 - icms_destino) == 0:
+        mva_ajustado = 0
+    else:
+        mva_ajustado = (((1 + mva_st_original) * (1 - icms_forn) / (1 - icms_destino)) - 1) * 100
+
+    ST = (((((100 + mva_ajustado) * (1 + ipi)) * (icms_destino * 100)) / 100) - 100 * icms_forn) / 100
+    valor_com_st = valor_custo + (ST * valor_custo)
+    valor_com_st_e_ipi = valor_com_st + (valor_custo * ipi)
+    frete = valor_com_st_e_ipi * (config.frete / 100)
+    valor_total = valor_com_st_e_ipi + frete
+    valor_impostos = valor_total - valor_custo - frete
+
+    valor_custo_total = valor_custo * qtd
+    valor_impostos_total = valor_impostos * qtd
+
+    if valor_final_venda is None:
+        valor_margem = ""
+    else:
+        valor_margem = (valor_final_venda * config.fator_margem) - valor_custo_total
+
+    return valor_custo_total, valor_impostos_total, valor_margem
+
+
+def calcular_valores_finais_lote(valor_custo, ipi_perc, icms_forn_perc, valor_final_venda, qtd, config=CONFIG_PADRAO):
+    """
+    Versão em lote de calcular_valores_finais: cada argumento é uma sequência (ou array) com um valor por item.
+    Retorna três arrays float64 (custo total, impostos total, margem). Onde o valor de venda for None/NaN
+    a margem sai NaN (quem formata decide o que escrever, a versão escalar devolve "").
+    """
+    valor_custo = np.asarray(valor_custo, dtype=np.float64)
+    ipi = np.asarray(ipi_perc, dtype=np.float64) / 100.0
+    icms_forn = np.asarray(icms_forn_perc, dtype=np.float64) / 100.0
+    qtd = np.asarray(qtd, dtype=np.float64)
+    # None vira NaN na conversão
+    valor_final_venda = np.asarray(valor_final_venda, dtype=object).astype(np.float64)
+
+    mva_st_original = config.mva_st_original / 100
+    icms_destino = config.icms_destino / 100
+
+    if (1 - icms_destino) == 0:
+        mva_ajustado = np.zeros_like(icms_forn)
+    else:
+        mva_ajustado = (((1 + mva_st_original) * (1 - icms_forn) / (1 - icms_destino)) - 1) * 100
+
+    ST = (((((100 + mva_ajustado) * (1 + ipi)) * (icms_destino * 100)) / 100) - 100 * icms_forn) / 100
+    valor_com_st = valor_custo + (ST * valor_custo)
+    valor_com_st_e_ipi = valor_com_st + (valor_custo * ipi)
+    frete = valor_com_st_e_ipi * (config.frete / 100)
+    valor_total = valor_com_st_e_ipi + frete
+    valor_impostos = valor_total - valor_custo - frete
+
+    valor_custo_total = valor_custo * qtd
+    valor_impostos_total = valor_impostos * qtd
+    valor_margem = (valor_final_venda * config.fator_margem) - valor_custo_total
+
+    return valor_custo_total, valor_impostos_total, valor_margem
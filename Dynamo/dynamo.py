@@ -1,50 +1,38 @@
 import os
 import re
 import csv
+import sys
 import datetime
-import firebirdsql
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from queue import Queue
+
+# Raiz do repositório no path para usar o pacote compartilhado seculos_db
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seculos_db import FirebirdPool, HistoricoProduto, get_firebird_connection  # noqa: E402
+
+from custos import calcular_valores_finais  # noqa: E402
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-
-def get_firebird_connection():
-    # Ajustar com os parâmetros corretos do Firebird, inclusive charset
-    return firebirdsql.connect(
-        host=os.getenv('HOST'),
-        port=int(os.getenv('PORT', '3050')),
-        database=os.getenv('DB_PATH'),
-        user=os.getenv('APP_USER'),
-        password=os.getenv('PASSWORD'),
-        role=os.getenv('ROLE'),
-        auth_plugin_name=os.getenv('AUTH'),
-        wire_crypt=False,
-        charset='ISO8859_1'
-    )
+# Planejador das consultas em HISTORICOPRODUTO1..10 (faixas de data amostradas uma vez e cacheadas)
+historico = HistoricoProduto()
 
 
 def create_connection_pool(pool_size):
-    # Criar um pool para conexões Firebird
-    pool = Queue(maxsize=pool_size)
-    for _ in range(pool_size):
-        conn = get_firebird_connection()
-        pool.put(conn)
-    return pool
+    # Criar um pool para conexões Firebird (tamanho fixo, já com as conexões abertas)
+    return FirebirdPool(max_tamanho=pool_size, min_tamanho=pool_size)
 
 
 def get_connection_from_pool(pool):
     # Fica bloqueado até ter uma conexão disponível no pool
-    conn = pool.get()
-    return conn
+    return pool.obter()
 
 
 def release_connection_to_pool(pool, conn):
     # Devolve a conexão ao pool
-    pool.put(conn)
+    pool.devolver(conn)
 
 
 def dividir_em_blocos(lst, grp_size):
@@ -120,22 +108,14 @@ def get_data_insercao_item(conn, cd_produto, cd_ped):
     Pega a data de inserção do item a partir das tabelas HISTORICOPRODUTOX
     onde TIPO='PEDIDO', NUMDOCUMENTO=cd_ped, CDPRODUTO=cd_produto.
     Pegaremos a primeira data encontrada (a query ordena por DATA).
+    Uma única consulta (UNION ALL) sobre as tabelas de histórico; como antes, vale a
+    primeira tabela de 1 a 10 que tiver o item.
     """
-    for i in range(1, 11):
-        tabela = f"HISTORICOPRODUTO{i}"
-        sql = f"""
-            SELECT FIRST 1 DATA
-            FROM {tabela}
-            WHERE TIPO = 'PEDIDO'
-              AND CDPRODUTO = ?
-              AND NUMDOCUMENTO = ?
-            ORDER BY DATA
-        """
-        cur = conn.cursor()
-        cur.execute(sql, (cd_produto, cd_ped))
-        row = cur.fetchone()
-        if row:
-            return row[0]
+    row = historico.consultar_primeiro(
+        conn, "DATA", "TIPO = 'PEDIDO' AND CDPRODUTO = ? AND NUMDOCUMENTO = ?",
+        (cd_produto, cd_ped), ordem="DATA", por_tabela=True)
+    if row:
+        return row[0]
     return None
 
 
@@ -143,58 +123,31 @@ def get_numdocumento_nf_compra(conn, cd_produto, data_insercao_item):
     """
     Pega o número da NF de compra mais recente (DATA <= data_insercao_item)
     a partir das tabelas HISTORICOPRODUTOX onde TIPO='NF COMPRA'.
+    Tabelas que começam depois da data de inserção nem entram na consulta; entre as
+    outras, vale a primeira de 1 a 10 que tiver NF.
     """
     if data_insercao_item is None:
         return None
-    for i in range(1, 11):
-        tabela = f"HISTORICOPRODUTO{i}"
-        sql = f"""
-            SELECT FIRST 1 NUMDOCUMENTO
-            FROM {tabela}
-            WHERE TIPO = 'NF COMPRA'
-              AND CDPRODUTO = ?
-              AND DATA <= ?
-            ORDER BY DATA DESC
-        """
-        cur = conn.cursor()
-        cur.execute(sql, (cd_produto, data_insercao_item))
-        row = cur.fetchone()
-        if row:
-            return row[0]
+    row = historico.consultar_primeiro(
+        conn, "NUMDOCUMENTO, DATA", "TIPO = 'NF COMPRA' AND CDPRODUTO = ?",
+        (cd_produto,), ordem="DATA DESC", data_fim=data_insercao_item, por_tabela=True)
+    if row:
+        return row[0]
     return None
 
 
 def recuperar_historico_numdocumento(conn, cd_produto, data_venda):
     """
-    Precisa buscar nas tabelas HISTORICOPRODUTO1 a HISTORICOPRODUTO10 
+    Precisa buscar nas tabelas HISTORICOPRODUTO1 a HISTORICOPRODUTO10
     o registro mais recente anterior ou igual à data da venda com TIPO = 'NF COMPRA'.
-    Como não sabemos a estrutura exata, tentaremos todas de 1 a 10.
+    Caso não encontre em nenhuma das tabelas, retorna None.
     """
-
-    # Queremos a data anterior OU IGUAL mais próxima. Vamos tentar <= data_venda.
-    # De acordo com a descrição, "a data anterior mais próxima da data da venda".
-    # Se não achar exatamente menor, pode igualar a data da venda.
-
-    # Tentaremos do mais próximo da venda:
-    # SELECT NUMDOCUMENTO, DATA FROM HISTORICOPRODUTOX WHERE TIPO='NF COMPRA' AND CDPRODUTO=? AND DATA<=? ORDER BY DATA DESC ROWS 1
-    # Caso não encontre em nenhuma das 10 tabelas, retorna None.
-
-    for i in range(1, 11):
-        tabela = f"HISTORICOPRODUTO{i}"
-        sql = f"""
-            SELECT NUMDOCUMENTO, DATA
-            FROM {tabela}
-            WHERE TIPO = 'NF COMPRA'
-              AND CDPRODUTO = ?
-              AND DATA <= ?
-            ORDER BY DATA DESC
-            ROWS 1
-        """
-        cur = conn.cursor()
-        cur.execute(sql, (cd_produto, data_venda))
-        row = cur.fetchone()
-        if row:
-            return row[0]  # NUMDOCUMENTO da NF de compra encontrada
+    # Queremos a data anterior OU IGUAL mais próxima: DATA <= data_venda, ordenado por DATA DESC.
+    row = historico.consultar_primeiro(
+        conn, "NUMDOCUMENTO, DATA", "TIPO = 'NF COMPRA' AND CDPRODUTO = ?",
+        (cd_produto,), ordem="DATA DESC", data_fim=data_venda, por_tabela=True)
+    if row:
+        return row[0]  # NUMDOCUMENTO da NF de compra encontrada
     return None
 
 
@@ -206,6 +159,7 @@ def obter_valores_custo_imposto_margem(conn, numdocumento, cd_produto, valor_fin
     3) valor_custo = ITENSNOTACOMPRA.VALORUNITARIO
     4) ipi = ITENSNOTACOMPRA.IPI/100
     5) icms_forn = ITENSNOTACOMPRA.ICMS/100
+    Os percentuais do cálculo (MVA, ICMS destino, frete, margem) ficam em custos.ConfigCusto.
     """
     if numdocumento is None:
         return "", "", ""
@@ -227,33 +181,11 @@ def obter_valores_custo_imposto_margem(conn, numdocumento, cd_produto, valor_fin
         return "", "", ""
 
     valor_custo = float(item_nc[0])
-    ipi = (float(item_nc[1]) or 0) / 100.0
-    icms_forn = (float(item_nc[2]) or 0) / 100.0
-
-    # Cálculo revisado
-    mva_st_original = 71.78 / 100
-    icms_destino = 20.5 / 100
-
-    mva_ajustado = ((1 + mva_st_original) * (1 - icms_forn)) / (1 - icms_destino) - 1
-
-    ST = (((100 + 100 * mva_ajustado) * (1 + ipi) * (icms_destino * 100)) / 100 - 100 * icms_forn) / 100
-
-    valor_com_st = valor_custo + (ST * valor_custo)
-
-    valor_com_st_e_ipi = valor_com_st + (valor_custo * ipi)
-
-    frete = valor_com_st_e_ipi * 0.1
-
-    valor_total = valor_com_st_e_ipi + frete
-
-    valor_impostos = valor_total - valor_custo - frete
-
-    if valor_final is None:
-        valor_margem = ""
-    else:
-        valor_margem = (valor_final * 0.67) - valor_custo
+    ipi_perc = float(item_nc[1]) or 0
+    icms_forn_perc = float(item_nc[2]) or 0
 
-    return valor_custo, valor_impostos, valor_margem
+    # Mesmo cálculo do faturamento (custos.py), por unidade
+    return calcular_valores_finais(valor_custo, ipi_perc, icms_forn_perc, valor_final, 1)
 
 
 def processar_pedido(pool, pedido, itens_por_pedido, clientes_dict, fones_dict, funcs_dict, cnpj):
@@ -621,9 +553,7 @@ def main():
     #         rodar_ida_e_volta(pool, pedidos, writer, ps, itens_por_pedido, clientes_dict, fones_dict, funcs_dict, cnpj)
 
     #         # 4.3) Fechar as conexões do pool
-    #         while not pool.empty():
-    #             c = pool.get()
-    #             c.close()
+    #         pool.fechar()
 
     #     print("Faturamento processado.")
 
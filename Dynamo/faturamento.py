@@ -1,79 +1,61 @@
 import os
 import re
-import csv
+import sys
+import json
+import shutil
 import datetime
 import argparse
-import firebirdsql
-import pysftp
 
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from queue import Queue
+
+# Raiz do repositório no path para usar o pacote compartilhado seculos_db
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seculos_db import FirebirdPool, HistoricoProduto, SnapshotHistorico, como_data  # noqa: E402
+
+from custos import CONFIG_PADRAO, calcular_valores_finais, calcular_valores_finais_lote  # noqa: E402
+from saida_csv import DestinoSFTP, SaidaCSV, enviar_arquivo  # noqa: E402
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-
-def get_firebird_connection():
-    # Ajustar com os parâmetros corretos do Firebird, inclusive charset
-    return firebirdsql.connect(
-        host=os.getenv('HOST'),
-        port=int(os.getenv('PORT', '3050')),
-        database=os.getenv('DB_PATH'),
-        user=os.getenv('APP_USER'),
-        password=os.getenv('PASSWORD'),
-        role=os.getenv('ROLE'),
-        auth_plugin_name=os.getenv('AUTH'),
-        wire_crypt=False,
-        charset='ISO8859_1'
-    )
+# Quantos dias antes do início do chunk ainda procuramos a inserção do item no pedido (HISTORICOPRODUTO).
+# None = histórico inteiro, como sempre foi: um item pode entrar no pedido meses antes do faturamento
+# e, com a busca limitada, perderia o custo de compra. Um número aqui poda tabelas antigas em troca disso.
+FOLGA_INSERCAO_DIAS = None
 
 
 def enviar_arquivo_sftp(file_path):
     """
-    Função para ilustrar uma conexão SFTP.
-    Dados de host, user, password etc. ainda não estão definidos.
+    Envia um arquivo já pronto para a /workarea do SFTP (nome temporário + rename, com retomada).
+    A execução diária normalmente já envia durante a escrita (SaidaCSV); isto fica para o backfill e --sftp fim.
     """
-
-    cnopts = pysftp.CnOpts()
-
-    # Carrega o arquivo 'my_known_hosts' com chaves conhecidas
-    cnopts.hostkeys.load('my_known_hosts')
-
-    # Configuração do servidor SFTP
-    sftp_host = os.getenv('SFTP_HOST')
-    sftp_user = os.getenv('SFTP_USER')
-    sftp_pass = os.getenv('SFTP_PASSWORD')
-    remote_dir = '/workarea'
-
-    with pysftp.Connection(host=sftp_host, username=sftp_user, password=sftp_pass, cnopts=cnopts) as sftp:
-        with sftp.cd(remote_dir):
-            sftp.put(file_path)  # envia o arquivo
-            print("Arquivo enviado com sucesso.")
+    destino = DestinoSFTP.do_ambiente()
+    try:
+        enviar_arquivo(destino, file_path)
+        print("Arquivo enviado com sucesso.")
+    finally:
+        destino.fechar()
 
 
 def create_connection_pool(pool_size=20):
     """
-    Cria pool de conexões Firebird com pool_size=20 (fixo).
+    Cria pool de conexões Firebird já com pool_size conexões abertas.
+    Caso particular do FirebirdPool compartilhado (tamanho fixo, pré-aquecido).
     """
-    pool = Queue(maxsize=pool_size)
-
-    for _ in range(pool_size):
-        conn = get_firebird_connection()
-        pool.put(conn)
-    return pool
+    return FirebirdPool(max_tamanho=pool_size, min_tamanho=pool_size)
 
 
 def get_connection_from_pool(pool):
     # Fica bloqueado até ter uma conexão disponível no pool
-    conn = pool.get()
-    return conn
+    return pool.obter()
 
 
 def release_connection_to_pool(pool, conn):
     # Devolve a conexão ao pool
-    pool.put(conn)
+    pool.devolver(conn)
 
 
 def dividir_em_blocos(lst, grp_size):
@@ -169,51 +151,126 @@ def normalizar_numero(valor):
         return val_str
 
 
-def pre_cache_historico_produtos(conn, produtos_ids, end_date):
+def pre_cache_historico_produtos(historico, produtos_ids, start_date, end_date, folga_dias=FOLGA_INSERCAO_DIAS):
     """
-    Busca o histórico de produtos consultando cada uma das 10 tabelas de histórico
-    separadamente e em blocos para respeitar os limites do Firebird 2.1.
+    Busca o histórico (PEDIDO e NF COMPRA) dos produtos só nas tabelas HISTORICOPRODUTO que
+    interessam ao período, em blocos para respeitar os limites do Firebird 2.1 e com as tabelas
+    consultadas em paralelo no pool.
+
+    1. PEDIDO: só tabelas que cruzam [start_date - folga_dias, end_date] (folga_dias=None busca tudo).
+    2. NF COMPRA: da tabela mais recente para a mais antiga, em levas. O produto sai da busca quando já
+       tem uma NF anterior à sua primeira inserção e todas as tabelas restantes são mais antigas que ela.
+
+    Retorna o índice de indexar_historico().
     """
     if not produtos_ids:
-        return defaultdict(list)
+        return {}
 
     historico_por_produto = defaultdict(list)
-    cur = conn.cursor()
 
     # Limite seguro de parâmetros para a cláusula IN. Limite é 1500
     chunk_size = 1450
 
-    # 1. Itera sobre cada uma das 10 tabelas de histórico
-    for i in range(1, 11):
-        tabela = f"HISTORICOPRODUTO{i}"
-
-        # 2. Divide a lista total de produtos em blocos menores (chunks)
-        for grupo_produtos in dividir_em_blocos(list(produtos_ids), chunk_size):
+    def buscar(tipo, produtos, data_ini, tabelas):
+        # Divide a lista de produtos em blocos menores (chunks); cada bloco roda nas tabelas em paralelo
+        for grupo_produtos in dividir_em_blocos(list(produtos), chunk_size):
             format_strings = ','.join(['?'] * len(grupo_produtos))
-            sql = f"""
-                SELECT CDPRODUTO, DATA, NUMDOCUMENTO, TIPO
-                FROM {tabela}
-                WHERE 
-                TIPO IN ('PEDIDO', 'NF COMPRA') AND 
-                CDPRODUTO IN ({format_strings})
-                AND DATA <= ?
-            """
-
-            try:
-                params = tuple(grupo_produtos) + (end_date,)
-                cur.execute(sql, params)
-                for cd_produto, data, num_documento, tipo in cur.fetchall():
+            resultados = historico.consultar(
+                "CDPRODUTO, DATA, NUMDOCUMENTO, TIPO",
+                f"TIPO = '{tipo}' AND CDPRODUTO IN ({format_strings})",
+                tuple(grupo_produtos), data_ini=data_ini, data_fim=end_date, tabelas=tabelas)
+            for linhas in resultados.values():
+                for cd_produto, data, num_documento, tipo_ev in linhas:
                     historico_por_produto[cd_produto].append({
                         'data': data,
                         'numdoc': num_documento,
-                        'tipo': tipo
+                        'tipo': tipo_ev
                     })
-            except Exception as e:
-                print(f"Aviso: Erro ao consultar a tabela {tabela}. Erro: {e}")
-                # Continua para a próxima tabela/bloco
-                continue
 
-    return historico_por_produto
+    # 1. Eventos PEDIDO (inserção do item no pedido)
+    inicio_pedidos = None
+    if folga_dias is not None:
+        inicio_pedidos = como_data(start_date) - datetime.timedelta(days=folga_dias)
+    buscar('PEDIDO', produtos_ids, inicio_pedidos, historico.tabelas(inicio_pedidos, end_date))
+
+    primeira_insercao = {}
+    for cd_produto, eventos in historico_por_produto.items():
+        datas = [como_data(e['data']) for e in eventos if e['tipo'] == 'PEDIDO']
+        if datas:
+            primeira_insercao[cd_produto] = min(datas)
+
+    # 2. Eventos NF COMPRA, só para produtos que têm inserção (os outros ficam sem custo de qualquer jeito)
+    pendentes = set(primeira_insercao)
+    restantes = historico.tabelas(None, end_date)
+    while restantes and pendentes:
+        leva, restantes = restantes[:historico.max_paralelo], restantes[historico.max_paralelo:]
+        buscar('NF COMPRA', pendentes, None, leva)
+
+        limites = [historico.data_max(t) for t in restantes]
+        if not restantes or None in limites:
+            continue
+        limite = max(limites)
+        for cd_produto in list(pendentes):
+            nfs = [como_data(e['data']) for e in historico_por_produto[cd_produto]
+                   if e['tipo'] == 'NF COMPRA' and como_data(e['data']) <= primeira_insercao[cd_produto]]
+            # Estritamente maior: uma NF do mesmo dia numa tabela mais antiga ainda pode valer
+            if nfs and max(nfs) > limite:
+                pendentes.discard(cd_produto)
+
+    return indexar_historico(historico_por_produto)
+
+
+def indexar_historico(historico_por_produto):
+    """
+    Monta, uma vez por chunk, o índice usado na resolução das NFs de compra:
+        cd_produto -> {
+            'insercao': {numdoc: data do primeiro evento PEDIDO},
+            'nf_datas': [datas das NF COMPRA em ordem crescente],
+            'nf_docs':  [NUMDOCUMENTO correspondente a cada data],
+        }
+    Assim cada item do pedido custa um acesso ao dict e um bisect, em vez de filtrar e
+    ordenar o histórico inteiro do produto de novo.
+    """
+    indice = {}
+    for cd_produto, eventos in historico_por_produto.items():
+        insercao = {}
+        nfs = []
+        for ev in eventos:
+            if ev['tipo'] == 'PEDIDO':
+                atual = insercao.get(ev['numdoc'])
+                if atual is None or ev['data'] < atual:
+                    insercao[ev['numdoc']] = ev['data']
+            elif ev['tipo'] == 'NF COMPRA':
+                nfs.append(ev)
+        # sorted é estável: entre NFs do mesmo dia vale a ordem em que vieram do banco
+        nfs.sort(key=lambda x: x['data'])
+        indice[cd_produto] = {
+            'insercao': insercao,
+            'nf_datas': [ev['data'] for ev in nfs],
+            'nf_docs': [ev['numdoc'] for ev in nfs],
+        }
+    return indice
+
+
+def buscar_data_insercao(indice, cd_prod, cd_ped):
+    """Data em que o item entrou no pedido (primeiro evento PEDIDO com NUMDOCUMENTO = cd_ped)."""
+    info = indice.get(cd_prod)
+    if not info:
+        return None
+    return info['insercao'].get(str(cd_ped))
+
+
+def buscar_nf_compra_anterior(indice, cd_prod, data_limite):
+    """NUMDOCUMENTO da NF de compra mais recente com data <= data_limite (O(log n))."""
+    info = indice.get(cd_prod)
+    if not info:
+        return None
+    datas = info['nf_datas']
+    pos = bisect_right(datas, data_limite)
+    if not pos:
+        return None
+    # Empate de datas: fica a primeira NF daquele dia, como no sort decrescente antigo
+    return info['nf_docs'][bisect_left(datas, datas[pos - 1])]
 
 
 def pre_cache_dados_compra(conn, num_documentos_compra):
@@ -248,45 +305,56 @@ def pre_cache_dados_compra(conn, num_documentos_compra):
     return dados_compra
 
 
-def calcular_valores_finais(valor_custo, ipi_perc, icms_forn_perc, valor_final_venda, qtd):
-    """
-    Função pura de cálculo, sem acesso ao banco. Recebe os valores e retorna os resultados.
-    """
-    ipi = ipi_perc / 100.0
-    icms_forn = icms_forn_perc / 100.0
+def valor_final_item(valor_c_d, qtd_float, desc_ped, vl_total_ped):
+    """Valor final do item, com o desconto geral do pedido rateado pelo valor do item."""
+    valor_uni = valor_c_d if valor_c_d else 0.0
 
-    # Cálculo revisado
-    mva_st_original = 71.78 / 100
-    icms_destino = 20.5 / 100
+    # Cálculo proporcional do desconto
+    vl_proporc_desc_geral = 0
+    if vl_total_ped and vl_total_ped > 0:
+        vl_proporc_desc_geral = desc_ped * (valor_uni / vl_total_ped)
 
-    # Evita divisão por zero
-    if (1 - icms_destino) == 0:
-        mva_ajustado = 0
-    else:
-        mva_ajustado = (((1 + mva_st_original) * (1 - icms_forn) / (1 - icms_destino)) - 1) * 100
+    return float(valor_uni - vl_proporc_desc_geral) * qtd_float
 
-    ST = (((((100 + mva_ajustado) * (1 + ipi)) * (icms_destino * 100)) / 100) - 100 * icms_forn) / 100
-    valor_com_st = valor_custo + (ST * valor_custo)
-    valor_com_st_e_ipi = valor_com_st + (valor_custo * ipi)
-    frete = valor_com_st_e_ipi * 0.1
-    valor_total = valor_com_st_e_ipi + frete
-    valor_impostos = valor_total - valor_custo - frete
 
-    valor_custo_total = valor_custo * qtd
-    valor_impostos_total = valor_impostos * qtd
-
-    if valor_final_venda is None:
-        valor_margem = ""
-    else:
-        valor_margem = (valor_final_venda * 0.67) - valor_custo_total
+def calcular_custos_itens(pedidos, itens_por_pedido, item_custo_info, config=CONFIG_PADRAO):
+    """
+    Custo, impostos e margem de todos os itens com NF de compra, numa única chamada vetorizada.
+    Retorna (cd_ped, posição do item no pedido) -> (custo, impostos, margem).
+    """
+    chaves, custos, ipis, icmss, valores, qtds = [], [], [], [], [], []
+    for cd_ped, _, _, _, _, desc_ped, vl_total_ped in pedidos:
+        for i, (cd_prod, _, qtd, valor_c_d, _) in enumerate(itens_por_pedido.get(cd_ped, [])):
+            custo_info = item_custo_info.get((cd_ped, cd_prod))
+            # NF achada no histórico mas sem linha em NOTACOMPRA/ITENSNOTACOMPRA: o item fica sem custo
+            if not custo_info or 'valor_unitario' not in custo_info:
+                continue
+            # Itens com dado inválido ficam de fora; processar_pedido_otimizado avisa do mesmo jeito de antes
+            try:
+                qtd_float = float(qtd)
+                valor_final = valor_final_item(valor_c_d, qtd_float, desc_ped, vl_total_ped)
+            except Exception:
+                continue
+            chaves.append((cd_ped, i))
+            custos.append(custo_info['valor_unitario'])
+            ipis.append(custo_info['ipi'])
+            icmss.append(custo_info['icms'])
+            valores.append(valor_final)
+            qtds.append(qtd_float)
+
+    if not chaves:
+        return {}
 
-    return valor_custo_total, valor_impostos_total, valor_margem
+    custo, imp, marg = calcular_valores_finais_lote(custos, ipis, icmss, valores, qtds, config)
+    return dict(zip(chaves, zip(custo.tolist(), imp.tolist(), marg.tolist())))
 
 
-def processar_pedido_otimizado(pedido, itens_do_pedido, clientes_dict, fones_dict, funcs_dict, cnpj, item_custo_info):
+def processar_pedido_otimizado(pedido, itens_do_pedido, clientes_dict, fones_dict, funcs_dict, cnpj, item_custo_info,
+                               custos_itens=None):
     """
     Processa um pedido e seus itens usando os dados pré-carregados (em cache).
     NÃO faz nenhuma consulta ao banco de dados.
+    Com 'custos_itens' (de calcular_custos_itens) os valores de custo já vêm calculados em lote.
     """
     cd_ped, data_ped, nome_cli, cd_cli, cd_func, desc_ped, vl_total_ped = pedido
     linhas = []
@@ -306,11 +374,10 @@ def processar_pedido_otimizado(pedido, itens_do_pedido, clientes_dict, fones_dic
         canal = funcs_dict.get(cd_func, "")
         nome_cli = normalizar_texto(nome_cli)
 
-        for (cd_prod, num_orig, qtd, valor_c_d, desc) in itens_do_pedido:
+        for i, (cd_prod, num_orig, qtd, valor_c_d, desc) in enumerate(itens_do_pedido):
             num_orig = normalizar_texto(num_orig)
             desc = normalizar_texto(desc)
             classificacao_peca = classificar_item_descricao(desc)
-            valor_uni = valor_c_d if valor_c_d else 0.0
 
             try:
                 qtd_float = float(qtd)
@@ -318,19 +385,21 @@ def processar_pedido_otimizado(pedido, itens_do_pedido, clientes_dict, fones_dic
                 print(f"Quantidade inválida para o pedido {cd_ped}, produto {cd_prod}: {qtd}")
                 continue
 
-            # Cálculo proporcional do desconto
-            vl_proporc_desc_geral = 0
-            if vl_total_ped and vl_total_ped > 0:
-                vl_proporc_desc_geral = desc_ped * (valor_uni / vl_total_ped)
-
-            valor_final = float(valor_uni - vl_proporc_desc_geral) * qtd_float
+            valor_final = valor_final_item(valor_c_d, qtd_float, desc_ped, vl_total_ped)
 
             valor_custo, valor_impostos, valor_margem = "", "", ""
 
             # Busca as informações de custo no dicionário pré-carregado
             custo_info = item_custo_info.get((cd_ped, cd_prod))
 
-            if custo_info:
+            if custos_itens is not None:
+                calculado = custos_itens.get((cd_ped, i))
+                if calculado:
+                    custo, imp, marg = calculado
+                    valor_custo = normalizar_numero(custo)
+                    valor_impostos = normalizar_numero(imp)
+                    valor_margem = normalizar_numero(marg)
+            elif custo_info:
                 custo, imp, marg = calcular_valores_finais(
                     custo_info['valor_unitario'],
                     custo_info['ipi'],
@@ -390,197 +459,455 @@ def processar_pedido_otimizado(pedido, itens_do_pedido, clientes_dict, fones_dic
     return linhas
 
 
+CNPJ_LOJA = "14.255.350/0001-03"
+
+# Chunk de 30 dias para não estourar a memória
+CHUNK_DIAS = 30
+
+
+def consultar_pedidos(cur, cnpj_loja, current_start_dt, current_end_dt):
+    """Pedidos de venda efetivados da loja no período."""
+    cur.execute("""
+        SELECT P.CDPEDIDOVENDA, P.DATA, P.NOMECLIENTE, P.CDCLIENTE, P.CDFUNC, P.DESCONTO, P.VALORTOTAL
+        FROM PEDIDOVENDA P JOIN EMPRESA E ON E.CNPJ = ?
+        WHERE P.DATA BETWEEN ? AND ? AND P.EFETIVADO = 'S'
+    """, (cnpj_loja, current_start_dt, current_end_dt))
+    return cur.fetchall()
+
+
+def consultar_itens(cur, pedidos):
+    """Itens dos pedidos: retorna (itens_por_pedido, todos_produtos_ids)."""
+    pedidos_ids = [p[0] for p in pedidos]
+    itens_por_pedido = defaultdict(list)
+    todos_produtos_ids = set()
+
+    for grupo in dividir_em_blocos(pedidos_ids, 1499):
+        format_strings = ','.join(['?'] * len(grupo))
+        cur.execute(f"""
+            SELECT CDPEDIDOVENDA, CDPRODUTO, NUMORIGINAL, QUANTIDADE, VALORUNITARIOCDESC, DESCRICAO
+            FROM ITENSPEDIDOVENDA WHERE CDPEDIDOVENDA IN ({format_strings})
+        """, tuple(grupo))
+        for cd_ped, cd_prod, num_orig, qtd, valor, desc in cur.fetchall():
+            itens_por_pedido[cd_ped].append((cd_prod, num_orig, qtd, valor, desc))
+            todos_produtos_ids.add(cd_prod)
+
+    return itens_por_pedido, todos_produtos_ids
+
+
+def consultar_cadastros(cur, pedidos):
+    """Clientes, fones e funcionários dos pedidos: retorna (clientes_dict, fones_dict, funcs_dict)."""
+    # Dados de Clientes e Fones
+    cd_clientes = {p[3] for p in pedidos if p[3]}
+    clientes_dict = {}
+    fones_dict = {}
+    if cd_clientes:
+        for grupo_cli in dividir_em_blocos(list(cd_clientes), 1499):
+            format_strings = ','.join(['?'] * len(grupo_cli))
+            cur.execute(
+                f"SELECT CDCLIENTE, CPF_CNPJ, CEP, CIDADE, ESTADO FROM CLIENTE WHERE CDCLIENTE IN ({format_strings})", tuple(grupo_cli))
+            for cd_cli, cpf, cep, cid, uf in cur.fetchall():
+                clientes_dict[cd_cli] = {
+                    'cpf_cnpj': normalizar_texto(cpf),
+                    'cep': normalizar_texto(cep),
+                    'cidade': normalizar_texto(cid),
+                    'uf': normalizar_texto(uf)}
+            cur.execute(f"SELECT CDCLIENTE, FONE FROM FONE WHERE CDCLIENTE IN ({format_strings})", tuple(grupo_cli))
+            for cd_cli, fone in cur.fetchall():
+                if cd_cli not in fones_dict:
+                    fones_dict[cd_cli] = normalizar_texto(fone)
+
+    # Dados de Funcionários
+    cd_funcs = {p[4] for p in pedidos if p[4]}
+    funcs_dict = {}
+    if cd_funcs:
+        format_strings = ','.join(['?'] * len(cd_funcs))
+        cur.execute(f"SELECT CDFUNC, NUMCNH FROM FUNCIONARIO WHERE CDFUNC IN ({format_strings})", tuple(cd_funcs))
+        for cdf, ncnh in cur.fetchall():
+            ncnh_norm = normalizar_texto(ncnh).upper()
+            funcs_dict[cdf] = "TELEP" if ncnh_norm == "TELEPECAS" else ncnh_norm
+
+    return clientes_dict, fones_dict, funcs_dict
+
+
+def carregar_historico(historico, snapshot, todos_produtos_ids, current_start_dt, current_end_dt):
+    """Índice do histórico (PEDIDO / NF COMPRA) dos produtos do chunk, do snapshot local ou do Firebird."""
+    if snapshot:
+        return indexar_historico(snapshot.eventos(todos_produtos_ids, current_end_dt))
+    return pre_cache_historico_produtos(historico, list(todos_produtos_ids), current_start_dt, current_end_dt)
+
+
+def localizar_nfs_compra(historico_cache, itens_por_pedido):
+    """
+    Para cada item, a NF de compra mais recente anterior à inserção do item no pedido.
+    Retorna (item_compra_info, num_docs_compra_necessarios).
+    """
+    item_compra_info = {}  # (cd_ped, cd_prod) -> num_documento_compra
+    num_docs_compra_necessarios = set()
+
+    for cd_ped, itens in itens_por_pedido.items():
+        for cd_prod, _, _, _, _ in itens:
+            # Encontrar a data de inserção do item no pedido
+            data_insercao_item = buscar_data_insercao(historico_cache, cd_prod, cd_ped)
+
+            if not data_insercao_item:
+                continue
+
+            # Encontrar a NF de compra mais recente ANTERIOR à data de inserção
+            nf_compra_recente = buscar_nf_compra_anterior(historico_cache, cd_prod, data_insercao_item)
+
+            if nf_compra_recente:
+                item_compra_info[(cd_ped, cd_prod)] = {'num_doc': nf_compra_recente}
+                num_docs_compra_necessarios.add(nf_compra_recente)
+
+    return item_compra_info, num_docs_compra_necessarios
+
+
+def anexar_dados_compra(item_compra_info, dados_compra_cache):
+    """Enriquece 'item_compra_info' com os dados de custo de cada NF."""
+    for key, value in item_compra_info.items():
+        num_doc = value['num_doc']
+        cd_prod = key[1]  # cd_prod
+        dados_custo = dados_compra_cache.get((num_doc, cd_prod))
+        if dados_custo:
+            item_compra_info[key].update(dados_custo)
+
+
+# Dados do chunk já carregados em cada processo do executor 'process' (enviados uma vez pelo initializer)
+_dados_pedidos = {}
+
+# Pedidos por tarefa no executor 'process': uma future por pedido custaria mais em pickle do que o próprio cálculo
+LOTE_PEDIDOS = 500
+
+
+def _iniciar_worker_pedidos(itens_por_pedido, clientes_dict, fones_dict, funcs_dict, cnpj, item_compra_info,
+                            custos_itens):
+    _dados_pedidos.update(itens_por_pedido=itens_por_pedido, clientes_dict=clientes_dict, fones_dict=fones_dict,
+                          funcs_dict=funcs_dict, cnpj=cnpj, item_compra_info=item_compra_info,
+                          custos_itens=custos_itens)
+
+
+def _processar_lote_pedidos(lote):
+    d = _dados_pedidos
+    linhas = []
+    for pedido in lote:
+        linhas.extend(processar_pedido_otimizado(pedido, d['itens_por_pedido'].get(pedido[0], []), d['clientes_dict'],
+                                                 d['fones_dict'], d['funcs_dict'], d['cnpj'], d['item_compra_info'],
+                                                 d['custos_itens']))
+    return linhas
+
+
+def iterar_pedidos(pedidos, itens_por_pedido, clientes_dict, fones_dict, funcs_dict, cnpj, item_compra_info,
+                   threads, executor="thread", config=CONFIG_PADRAO):
+    """
+    Processamento final (sem I/O de banco). Gera listas de linhas do CSV à medida que ficam prontas,
+    para quem escreve não precisar esperar (nem guardar) o chunk inteiro.
+    Custo, impostos e margem de todos os itens são calculados antes, em lote (calcular_custos_itens).
+
+    executor:
+      - 'thread': ThreadPoolExecutor com 'threads' threads, uma future por pedido (comportamento antigo);
+      - 'process': ProcessPoolExecutor com até 'threads' processos; os dicionários do chunk vão para cada
+        processo uma vez só (initializer) e os pedidos seguem em lotes de LOTE_PEDIDOS;
+      - 'serial': tudo na thread atual.
+    """
+    if executor not in ("thread", "process", "serial"):
+        raise ValueError(f"Executor desconhecido: {executor} (use thread, process ou serial)")
+
+    custos_itens = calcular_custos_itens(pedidos, itens_por_pedido, item_compra_info, config)
+
+    if executor == "serial" or not pedidos:
+        for pedido in pedidos:
+            yield processar_pedido_otimizado(pedido, itens_por_pedido.get(pedido[0], []), clientes_dict,
+                                             fones_dict, funcs_dict, cnpj, item_compra_info, custos_itens)
+        return
+
+    if executor == "process":
+        lotes = [pedidos[i:i + LOTE_PEDIDOS] for i in range(0, len(pedidos), LOTE_PEDIDOS)]
+        processos = max(1, min(threads, os.cpu_count() or 1, len(lotes)))
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker_pedidos,
+                                 initargs=(dict(itens_por_pedido), clientes_dict, fones_dict, funcs_dict,
+                                           cnpj, item_compra_info, custos_itens)) as pool_processos:
+            yield from pool_processos.map(_processar_lote_pedidos, lotes)
+        return
+
+    with ThreadPoolExecutor(max_workers=threads) as pool_threads:
+        # Submete tarefas para processamento
+        futures = [pool_threads.submit(processar_pedido_otimizado, pedido, itens_por_pedido.get(
+            pedido[0], []), clientes_dict, fones_dict, funcs_dict, cnpj, item_compra_info, custos_itens)
+            for pedido in pedidos]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+
+def processar_pedidos(pedidos, itens_por_pedido, clientes_dict, fones_dict, funcs_dict, cnpj, item_compra_info,
+                      threads, executor="thread", config=CONFIG_PADRAO):
+    """Mesmo que iterar_pedidos, mas devolve todas as linhas numa lista."""
+    linhas_csv = []
+    for linhas in iterar_pedidos(pedidos, itens_por_pedido, clientes_dict, fones_dict, funcs_dict, cnpj,
+                                 item_compra_info, threads, executor, config):
+        linhas_csv.extend(linhas)
+    return linhas_csv
+
+
+def processar_chunk(conn, historico, snapshot, current_start_dt, current_end_dt, threads, saida, executor="thread"):
+    """
+    Escreve em 'saida' (SaidaCSV) as linhas do CSV de faturamento dos pedidos entre current_start_dt e
+    current_end_dt, conforme ficam prontas. Retorna quantas linhas foram geradas.
+    Usada tanto pela execução diária quanto pelos workers do backfill retroativo.
+    """
+    cnpj_loja = CNPJ_LOJA
+    cnpj = remover_caracteres_nao_numericos(cnpj_loja)
+    cur = conn.cursor()
+
+    # 1. Obter dados primários (pedidos, itens, clientes, funcionários)
+    pedidos = consultar_pedidos(cur, cnpj_loja, current_start_dt, current_end_dt)
+
+    if not pedidos:
+        print("Nenhum pedido encontrado no período.")
+        return 0
+
+    itens_por_pedido, todos_produtos_ids = consultar_itens(cur, pedidos)
+    clientes_dict, fones_dict, funcs_dict = consultar_cadastros(cur, pedidos)
+
+    # --- OTIMIZAÇÃO PRINCIPAL ---
+    # 2. Pré-cache do histórico de todos os produtos do chunk
+    print("Pré-carregando histórico de produtos...")
+    historico_cache = carregar_historico(historico, snapshot, todos_produtos_ids, current_start_dt, current_end_dt)
+
+    # 3. Processar histórico em memória para achar NFs de compra
+    item_compra_info, num_docs_compra_necessarios = localizar_nfs_compra(historico_cache, itens_por_pedido)
+
+    # 4. Pré-cache dos dados de custo das NFs encontradas
+    print(f"Pré-carregando dados de custo de {len(num_docs_compra_necessarios)} notas fiscais...")
+    dados_compra_cache = pre_cache_dados_compra(conn, num_docs_compra_necessarios)
+
+    # 5. Enriquecer 'item_compra_info' com os dados de custo
+    anexar_dados_compra(item_compra_info, dados_compra_cache)
+
+    # 6. Processamento final em paralelo (sem I/O de banco)
+    # 7. Cada pedido pronto já vai para o CSV (e, se houver destino remoto, para o SFTP)
+    print("Processando pedidos em memória...")
+    total = 0
+    for linhas in iterar_pedidos(pedidos, itens_por_pedido, clientes_dict, fones_dict, funcs_dict,
+                                 cnpj, item_compra_info, threads, executor):
+        saida.escrever(linhas)
+        total += len(linhas)
+    return total
+
+
+def gerar_chunks(start_dt, end_dt, chunk_days=CHUNK_DIAS):
+    """Divide [start_dt, end_dt] em períodos de chunk_days dias."""
+    current_start_dt = start_dt
+    while current_start_dt <= end_dt:
+        current_end_dt = current_start_dt + datetime.timedelta(days=chunk_days - 1)
+        if current_end_dt > end_dt:
+            current_end_dt = end_dt
+        yield current_start_dt, current_end_dt
+        current_start_dt = current_end_dt + datetime.timedelta(days=1)
+
+
+def caminho_csv(start_dt, end_dt):
+    if end_dt == start_dt:
+        return f"./arquivos/faturamento_diario_{start_dt.strftime('%d%m%y')}.csv"
+    return f"./arquivos/faturamento_retroativo_{start_dt.strftime('%d%m%y')} _{end_dt.strftime('%d%m%y')}.csv"
+
+
+# ==============================================================================
+# BACKFILL RETROATIVO (--from/--to): chunks em paralelo, com checkpoint
+# ==============================================================================
+
+# Estado de cada processo do backfill: pool, histórico e snapshot abertos uma vez no initializer
+_worker = {}
+
+
+def _iniciar_worker_backfill(poolsize, usar_snapshot):
+    pool = FirebirdPool(max_tamanho=max(poolsize, 2))
+    historico = HistoricoProduto(pool, max_paralelo=max(poolsize - 1, 1))
+    _worker['pool'] = pool
+    _worker['historico'] = historico
+    # O snapshot já foi sincronizado pelo processo principal; aqui ele só é lido
+    _worker['snapshot'] = SnapshotHistorico(historico) if usar_snapshot else None
+
+
+def _executar_chunk_backfill(current_start_dt, current_end_dt, caminho_parte, threads, executor):
+    print(f"\n=== [pid {os.getpid()}] Processando chunk: {current_start_dt.date()} até {current_end_dt.date()} ===")
+    inicio = datetime.datetime.now()
+    # SaidaCSV grava em '<parte>.tmp' e renomeia no fim: parte pela metade nunca fica com o nome final
+    with _worker['pool'].conexao() as conn, SaidaCSV(caminho_parte) as saida:
+        total = processar_chunk(conn, _worker['historico'], _worker['snapshot'],
+                                current_start_dt, current_end_dt, threads, saida, executor)
+
+    print(f"Chunk {current_start_dt.date()} - {current_end_dt.date()} finalizado em "
+          f"{datetime.datetime.now() - inicio}. {total} linhas geradas.")
+    return total
+
+
+def carregar_checkpoint(caminho):
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f).get("concluidos", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def salvar_checkpoint(caminho, concluidos):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({"concluidos": concluidos}, f, indent=2, sort_keys=True)
+    os.replace(temporario, caminho)
+
+
+def executar_backfill(start_dt, end_dt, poolsize, threads, workers, usar_snapshot, executor_pedidos="thread"):
+    """
+    Reenvio retroativo: cada chunk roda num processo (com pool de conexões próprio) e vira um
+    arquivo de parte; os chunks concluídos ficam no checkpoint, então se o processo cair basta
+    rodar de novo com o mesmo --from/--to que só o que falta é refeito. No fim as partes são
+    juntadas, em ordem de data, no CSV faturamento_retroativo.
+    Retorna o caminho do CSV final, ou None se algum chunk falhou.
+    """
+    dir_partes = f"./arquivos/faturamento_retroativo_{start_dt.strftime('%Y%m%d')}_{end_dt.strftime('%Y%m%d')}_partes"
+    os.makedirs(dir_partes, exist_ok=True)
+    arquivo_checkpoint = os.path.join(dir_partes, "checkpoint.json")
+    concluidos = carregar_checkpoint(arquivo_checkpoint)
+
+    chunks = []
+    for current_start_dt, current_end_dt in gerar_chunks(start_dt, end_dt):
+        chave = f"{current_start_dt.strftime('%Y-%m-%d')}_{current_end_dt.strftime('%Y-%m-%d')}"
+        chunks.append((current_start_dt, current_end_dt, chave, os.path.join(dir_partes, f"parte_{chave}.csv")))
+
+    pendentes = [c for c in chunks if c[2] not in concluidos or not os.path.exists(c[3])]
+    print(f"== BACKFILL {start_dt.date()} até {end_dt.date()}: {len(chunks)} chunks, "
+          f"{len(chunks) - len(pendentes)} já concluídos, {len(pendentes)} pendentes, workers={workers} ==")
+
+    if pendentes and usar_snapshot:
+        # Sincroniza o snapshot uma vez aqui; os workers só leem
+        with FirebirdPool(max_tamanho=max(poolsize, 2)) as pool:
+            snapshot = SnapshotHistorico(HistoricoProduto(pool, max_paralelo=max(poolsize - 1, 1)))
+            snapshot.sincronizar()
+            snapshot.fechar()
+
+    falhas = 0
+    if pendentes:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker_backfill,
+                                 initargs=(poolsize, usar_snapshot)) as executor:
+            futures = {
+                executor.submit(_executar_chunk_backfill, ini, fim, caminho_parte, threads, executor_pedidos): chave
+                for ini, fim, chave, caminho_parte in pendentes
+            }
+            for fut in as_completed(futures):
+                chave = futures[fut]
+                try:
+                    concluidos[chave] = fut.result()
+                except Exception as e:
+                    falhas += 1
+                    print(f"Erro no chunk {chave}: {e}")
+                    continue
+                salvar_checkpoint(arquivo_checkpoint, concluidos)
+
+    if falhas:
+        print(f"{falhas} chunk(s) falharam. Rode de novo com o mesmo --from/--to para retomar.")
+        return None
+
+    # Junta as partes em ordem cronológica no CSV final
+    csv_path = caminho_csv(start_dt, end_dt)
+    with open(csv_path, "w", encoding="utf-8", newline='') as saida:
+        for _, _, _, caminho_parte in chunks:
+            with open(caminho_parte, "r", encoding="utf-8", newline='') as parte:
+                shutil.copyfileobj(parte, saida)
+    print(f"Backfill concluído: {sum(concluidos.get(c[2], 0) for c in chunks)} linhas em {csv_path}")
+    return csv_path
+
+
 def main():
     # Argumentos de linha de comando
     parser = argparse.ArgumentParser()
     parser.add_argument("--poolsize", type=int, default=5, help="Tamanho do pool de conexões Firebird")
     parser.add_argument("--threads", type=int, default=5, help="Número de threads (threads)")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="thread",
+                        help="Como o passo 6 (processamento em memória) roda: threads, processos ou serial")
     parser.add_argument("--passada", type=int, default=1, help="Qual passada é? (só para log)")
+    parser.add_argument("--sem-snapshot", action="store_true",
+                        help="Consulta o histórico direto no Firebird em vez do snapshot local (arquivos/cache)")
+    parser.add_argument("--from", dest="data_ini", help="Backfill retroativo: data inicial (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="data_fim", help="Backfill retroativo: data final (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Backfill: processos em paralelo (cada um com seu pool de --poolsize conexões)")
+    parser.add_argument("--sftp", choices=["stream", "fim", "nao"], default="stream",
+                        help="Envio para o SFTP: durante a escrita (stream), só no fim (fim) ou não enviar (nao)")
     args = parser.parse_args()
 
     threads = args.threads
     ps = args.poolsize
     passada = args.passada
 
-    # Pool de conexões não é mais necessário para o processamento em threads,
-    # mas pode ser mantido para as buscas iniciais se forem paralelizadas no futuro.
-    # Por enquanto, uma conexão principal é suficiente.
-
-    print(f"== Iniciando FATURAMENTO: threads={threads} ==\n")
-
-    # Conexão com Firebird
-    conn = get_firebird_connection()
-    cur = conn.cursor()
-
-    cnpj_loja = "14.255.350/0001-03"
-    cnpj = remover_caracteres_nao_numericos(cnpj_loja)
-
     # 3) FATURAMENTO
 
-    # Data de início e fim
-    # start_date = '2023-02-18'
-    # end_date = '2023-03-31'
+    if args.data_ini or args.data_fim:
+        if not (args.data_ini and args.data_fim):
+            parser.error("--from e --to devem ser usados juntos.")
+        start_dt = datetime.datetime.strptime(args.data_ini, "%Y-%m-%d")
+        end_dt = datetime.datetime.strptime(args.data_fim, "%Y-%m-%d")
+        csv_path = executar_backfill(start_dt, end_dt, ps, threads, args.workers, not args.sem_snapshot, args.executor)
+        if csv_path and args.sftp != "nao":
+            enviar_arquivo_sftp(csv_path)
+        return
+
+    # O processamento em threads não usa o banco; o pool serve às buscas iniciais.
+    # Por enquanto, uma conexão principal emprestada do pool é suficiente.
+
+    print(f"== Iniciando FATURAMENTO: threads={threads}, poolsize={ps}, executor={args.executor} ==\n")
+
+    # Conexão com Firebird (1 principal + pelo menos 1 para as consultas paralelas do histórico)
+    pool = FirebirdPool(max_tamanho=max(ps, 2))
+    historico = HistoricoProduto(pool, max_paralelo=max(ps - 1, 1))
+    conn = pool.obter()
+
+    # Snapshot local do histórico: só as linhas novas desde a última execução vêm do Firebird
+    snapshot = None
+    if not args.sem_snapshot:
+        snapshot = SnapshotHistorico(historico)
+        snapshot.sincronizar()
+
+    # Execução diária: o dia anterior
     start_date = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
     end_date = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
 
-    # Chunk de 30 dias para não estourar a memória
-    chunk_days = 30
-
-    # Variáveis para usar com o chunk de 30 dias
-    current_start_dt = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    start_dt = datetime.datetime.strptime(start_date, "%Y-%m-%d")
     end_full_dt = datetime.datetime.strptime(end_date, "%Y-%m-%d")
 
-    if end_date == start_date:
-        # Caminho do CVS
-        csv_path = f"./arquivos/faturamento_diario_{current_start_dt.strftime('%d%m%y')}.csv"
-    else:
-        # Caminho do CVS
-        csv_path = f"./arquivos/faturamento_retroativo_{
-            current_start_dt.strftime('%d%m%y')} _{
-            end_full_dt.strftime('%d%m%y')}.csv"
-
-    with open(csv_path, "w", encoding="utf-8", newline='') as f:
-        # Apenas cria/limpa o arquivo
-        pass
-
-    # Loop principal para processar os chunks de 30 dias até a data final
-    while current_start_dt <= end_full_dt:
-        current_end_dt = current_start_dt + datetime.timedelta(days=chunk_days - 1)
-        if current_end_dt > end_full_dt:
-            current_end_dt = end_full_dt
-
-        print(f"\n=== Processando chunk: {current_start_dt.date()} até {current_end_dt.date()} ===")
-        start_chunk_time = datetime.datetime.now()
-
-        # 1. Obter dados primários (pedidos, itens, clientes, funcionários)
-        cur.execute("""
-            SELECT P.CDPEDIDOVENDA, P.DATA, P.NOMECLIENTE, P.CDCLIENTE, P.CDFUNC, P.DESCONTO, P.VALORTOTAL
-            FROM PEDIDOVENDA P JOIN EMPRESA E ON E.CNPJ = ?
-            WHERE P.DATA BETWEEN ? AND ? AND P.EFETIVADO = 'S'
-        """, (cnpj_loja, current_start_dt, current_end_dt))
-        pedidos = cur.fetchall()
-
-        if not pedidos:
-            print("Nenhum pedido encontrado no período.")
-            current_start_dt = current_end_dt + datetime.timedelta(days=1)
-            continue
-
-        pedidos_ids = [p[0] for p in pedidos]
-        itens_por_pedido = defaultdict(list)
-        todos_produtos_ids = set()
-
-        for grupo in dividir_em_blocos(pedidos_ids, 1499):
-            format_strings = ','.join(['?'] * len(grupo))
-            cur.execute(f"""
-                SELECT CDPEDIDOVENDA, CDPRODUTO, NUMORIGINAL, QUANTIDADE, VALORUNITARIOCDESC, DESCRICAO
-                FROM ITENSPEDIDOVENDA WHERE CDPEDIDOVENDA IN ({format_strings})
-            """, tuple(grupo))
-            for cd_ped, cd_prod, num_orig, qtd, valor, desc in cur.fetchall():
-                itens_por_pedido[cd_ped].append((cd_prod, num_orig, qtd, valor, desc))
-                todos_produtos_ids.add(cd_prod)
-
-        # Dados de Clientes e Fones
-        cd_clientes = {p[3] for p in pedidos if p[3]}
-        clientes_dict = {}
-        fones_dict = {}
-        if cd_clientes:
-            for grupo_cli in dividir_em_blocos(list(cd_clientes), 1499):
-                format_strings = ','.join(['?'] * len(grupo_cli))
-                cur.execute(
-                    f"SELECT CDCLIENTE, CPF_CNPJ, CEP, CIDADE, ESTADO FROM CLIENTE WHERE CDCLIENTE IN ({format_strings})", tuple(grupo_cli))
-                for cd_cli, cpf, cep, cid, uf in cur.fetchall():
-                    clientes_dict[cd_cli] = {
-                        'cpf_cnpj': normalizar_texto(cpf),
-                        'cep': normalizar_texto(cep),
-                        'cidade': normalizar_texto(cid),
-                        'uf': normalizar_texto(uf)}
-                cur.execute(f"SELECT CDCLIENTE, FONE FROM FONE WHERE CDCLIENTE IN ({format_strings})", tuple(grupo_cli))
-                for cd_cli, fone in cur.fetchall():
-                    if cd_cli not in fones_dict:
-                        fones_dict[cd_cli] = normalizar_texto(fone)
-
-        # Dados de Funcionários
-        cd_funcs = {p[4] for p in pedidos if p[4]}
-        funcs_dict = {}
-        if cd_funcs:
-            format_strings = ','.join(['?'] * len(cd_funcs))
-            cur.execute(f"SELECT CDFUNC, NUMCNH FROM FUNCIONARIO WHERE CDFUNC IN ({format_strings})", tuple(cd_funcs))
-            for cdf, ncnh in cur.fetchall():
-                ncnh_norm = normalizar_texto(ncnh).upper()
-                funcs_dict[cdf] = "TELEP" if ncnh_norm == "TELEPECAS" else ncnh_norm
-
-        # --- OTIMIZAÇÃO PRINCIPAL ---
-        # 2. Pré-cache do histórico de todos os produtos do chunk
-        print("Pré-carregando histórico de produtos...")
-        historico_cache = pre_cache_historico_produtos(conn, list(todos_produtos_ids), current_end_dt)
-
-        # 3. Processar histórico em memória para achar NFs de compra
-        item_compra_info = {}  # (cd_ped, cd_prod) -> num_documento_compra
-        num_docs_compra_necessarios = set()
-
-        for cd_ped, itens in itens_por_pedido.items():
-            for cd_prod, _, _, _, _ in itens:
-                eventos_prod = historico_cache.get(cd_prod, [])
-
-                # Encontrar a data de inserção do item no pedido
-                data_insercao_item = None
-                for ev in sorted(
-                    [e for e in eventos_prod if e['tipo'] == 'PEDIDO' and e['numdoc'] == str(cd_ped)],
-                        key=lambda x: x['data']):
-                    data_insercao_item = ev['data']
-                    break
-
-                if not data_insercao_item:
-                    continue
-
-                # Encontrar a NF de compra mais recente ANTERIOR à data de inserção
-                nf_compra_recente = None
-                for ev in sorted(
-                    [e for e in eventos_prod if e['tipo'] == 'NF COMPRA' and e['data'] <= data_insercao_item],
-                    key=lambda x: x['data'],
-                        reverse=True):
-                    nf_compra_recente = ev['numdoc']
-                    break
-
-                if nf_compra_recente:
-                    item_compra_info[(cd_ped, cd_prod)] = {'num_doc': nf_compra_recente}
-                    num_docs_compra_necessarios.add(nf_compra_recente)
-
-        # 4. Pré-cache dos dados de custo das NFs encontradas
-        print(f"Pré-carregando dados de custo de {len(num_docs_compra_necessarios)} notas fiscais...")
-        dados_compra_cache = pre_cache_dados_compra(conn, num_docs_compra_necessarios)
-
-        # 5. Enriquecer 'item_compra_info' com os dados de custo
-        for key, value in item_compra_info.items():
-            num_doc = value['num_doc']
-            cd_prod = key[1]  # cd_prod
-            dados_custo = dados_compra_cache.get((num_doc, cd_prod))
-            if dados_custo:
-                item_compra_info[key].update(dados_custo)
-
-        # 6. Processamento final em paralelo (sem I/O de banco)
-        print("Processando pedidos em memória...")
-        linhas_csv = []
-        with ThreadPoolExecutor(max_workers=args.threads) as executor:
-            # Submete tarefas para processamento
-            futures = [executor.submit(processar_pedido_otimizado, pedido, itens_por_pedido.get(
-                pedido[0], []), clientes_dict, fones_dict, funcs_dict, cnpj, item_compra_info) for pedido in pedidos]
-            for fut in as_completed(futures):
-                linhas_csv.extend(fut.result())
-
-        # 7. Escrever resultados no CSV
-        with open(csv_path, "a", encoding="utf-8", newline='') as csv_file:
-            writer = csv.writer(csv_file, delimiter=';', quoting=csv.QUOTE_NONE, escapechar='\\')
-            writer.writerows(linhas_csv)
+    # Caminho do CVS
+    csv_path = caminho_csv(start_dt, end_full_dt)
 
-        end_chunk_time = datetime.datetime.now()
-        print(f"Chunk finalizado em {end_chunk_time - start_chunk_time}. {len(linhas_csv)} linhas geradas.")
+    # Com --sftp stream o arquivo sobe para a /workarea enquanto é escrito, numa sessão SFTP só
+    destino = DestinoSFTP.do_ambiente() if args.sftp == "stream" else None
 
-        # Avançar para o próximo chunk
-        current_start_dt = current_end_dt + datetime.timedelta(days=1)
-
-    conn.close()
-    enviar_arquivo_sftp(csv_path)
+    try:
+        with SaidaCSV(csv_path, destino=destino) as saida:
+            # Loop principal para processar os chunks de 30 dias até a data final
+            for current_start_dt, current_end_dt in gerar_chunks(start_dt, end_full_dt):
+                print(f"\n=== Processando chunk: {current_start_dt.date()} até {current_end_dt.date()} ===")
+                start_chunk_time = datetime.datetime.now()
+
+                total = processar_chunk(conn, historico, snapshot, current_start_dt, current_end_dt,
+                                        threads, saida, args.executor)
+
+                end_chunk_time = datetime.datetime.now()
+                print(f"Chunk finalizado em {end_chunk_time - start_chunk_time}. {total} linhas geradas.")
+    finally:
+        if destino:
+            destino.fechar()
+        if snapshot:
+            snapshot.fechar()
+        pool.devolver(conn)
+        print(f"Métricas do pool: {pool.metricas()}")
+        pool.fechar()
+
+    if destino:
+        if saida.erro_envio is not None:
+            # CSV já está no disco; a falha de envio ainda derruba a execução, como antes do streaming
+            raise saida.erro_envio
+        print("Arquivo enviado com sucesso.")
+    elif args.sftp == "fim":
+        enviar_arquivo_sftp(csv_path)
     print("Processamento concluído.")
 
 
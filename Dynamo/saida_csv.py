@@ -0,0 +1,284 @@
+"""
+Saída do CSV de faturamento em streaming, com envio incremental opcional para o SFTP.
+
+- SaidaCSV grava as linhas no arquivo local à medida que os pedidos ficam prontos (nada de juntar o
+  chunk inteiro em memória). O arquivo é escrito como '<nome>.tmp' e só ganha o nome final no fechar().
+- Com um destino remoto, a cada 'bloco' bytes o que já está no disco segue para o servidor numa sessão
+  SFTP só, reaproveitada até o fim. O remoto também é escrito com nome temporário ('.parcial') e
+  renomeado no fim, então quem lê a /workarea nunca pega arquivo pela metade.
+- Se o envio falhar, reconecta e continua do tamanho que o servidor já tem (o arquivo local é a fonte).
+  Esgotadas as tentativas, o envio em streaming para e o CSV local segue sendo escrito normalmente;
+  no fechar() o arquivo pronto ainda é enviado inteiro mais uma vez (enviar_arquivo). O CSV local
+  nunca depende do servidor.
+
+DestinoSFTP fala com o servidor de verdade; DestinoLocal faz o mesmo papel numa pasta local, para testar
+sem servidor (ou para copiar para um compartilhamento de rede).
+"""
+import os
+import csv
+import time
+import posixpath
+
+import pysftp
+
+SUFIXO_REMOTO = ".parcial"
+BLOCO_ENVIO = 1024 * 1024  # 1 MiB
+
+
+class DestinoSFTP:
+    """Diretório remoto via SFTP (pysftp), com uma conexão aberta na primeira operação e reaproveitada."""
+
+    def __init__(self, host, usuario, senha, diretorio="/workarea", known_hosts="my_known_hosts", porta=22):
+        self.host = host
+        self.usuario = usuario
+        self.senha = senha
+        self.diretorio = diretorio
+        self.known_hosts = known_hosts
+        self.porta = porta
+        self._conn = None
+
+    @classmethod
+    def do_ambiente(cls, diretorio="/workarea"):
+        """Usa SFTP_HOST, SFTP_USER e SFTP_PASSWORD do .env."""
+        return cls(os.getenv("SFTP_HOST"), os.getenv("SFTP_USER"), os.getenv("SFTP_PASSWORD"), diretorio)
+
+    def _sftp(self):
+        if self._conn is None:
+            cnopts = pysftp.CnOpts()
+            # Carrega o arquivo 'my_known_hosts' com chaves conhecidas
+            cnopts.hostkeys.load(self.known_hosts)
+            self._conn = pysftp.Connection(host=self.host, username=self.usuario, password=self.senha,
+                                           port=self.porta, cnopts=cnopts)
+        return self._conn
+
+    def _caminho(self, nome):
+        return posixpath.join(self.diretorio, nome)
+
+    def tamanho(self, nome):
+        """Tamanho do arquivo remoto em bytes, ou None se ele não existir."""
+        try:
+            return self._sftp().stat(self._caminho(nome)).st_size
+        except FileNotFoundError:
+            return None
+
+    def escrever(self, nome, offset, dados):
+        # offset 0 começa o arquivo do zero (descarta sobra de execução anterior)
+        with self._sftp().open(self._caminho(nome), "r+" if offset else "w") as f:
+            f.seek(offset)
+            f.write(dados)
+
+    def renomear(self, origem, destino):
+        sftp = self._sftp()
+        try:
+            # posix_rename substitui o destino de forma atômica (rename comum falha se ele já existir)
+            sftp.sftp_client.posix_rename(self._caminho(origem), self._caminho(destino))
+        except IOError as e:
+            if e.errno is not None:
+                raise
+            # Servidor sem a extensão posix-rename@openssh.com (o paramiko levanta IOError sem errno):
+            # apaga o destino e usa o rename comum
+            self.remover(destino)
+            sftp.rename(self._caminho(origem), self._caminho(destino))
+
+    def remover(self, nome):
+        try:
+            self._sftp().remove(self._caminho(nome))
+        except FileNotFoundError:
+            pass
+
+    def reconectar(self):
+        self.fechar()
+
+    def fechar(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def __str__(self):
+        return f"sftp://{self.usuario}@{self.host}{self.diretorio}"
+
+
+class DestinoLocal:
+    """Mesma interface do DestinoSFTP numa pasta local (substituto do servidor em testes)."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def tamanho(self, nome):
+        try:
+            return os.path.getsize(self._caminho(nome))
+        except FileNotFoundError:
+            return None
+
+    def escrever(self, nome, offset, dados):
+        with open(self._caminho(nome), "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.write(dados)
+
+    def renomear(self, origem, destino):
+        os.replace(self._caminho(origem), self._caminho(destino))
+
+    def remover(self, nome):
+        try:
+            os.remove(self._caminho(nome))
+        except FileNotFoundError:
+            pass
+
+    def reconectar(self):
+        pass
+
+    def fechar(self):
+        pass
+
+    def __str__(self):
+        return self.diretorio
+
+
+class EnvioIncremental:
+    """
+    Envia um arquivo local que ainda está crescendo para 'nome_remoto' + SUFIXO_REMOTO.
+    enviar_ate() manda o que falta até um tamanho; concluir() renomeia para o nome final.
+    """
+
+    def __init__(self, destino, nome_remoto, bloco=BLOCO_ENVIO, tentativas=5, espera=2):
+        self.destino = destino
+        self.nome_remoto = nome_remoto
+        self.nome_temp = nome_remoto + SUFIXO_REMOTO
+        self.bloco = bloco
+        self.tentativas = tentativas
+        self.espera = espera
+        self.enviado = 0
+
+    def _com_retentativa(self, descricao, funcao):
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                return funcao()
+            except Exception as e:
+                if tentativa == self.tentativas:
+                    raise
+                pausa = self.espera * 2 ** (tentativa - 1)
+                print(f"Aviso: falha ao {descricao} em {self.destino} ({e}). "
+                      f"Tentativa {tentativa}/{self.tentativas}, nova tentativa em {pausa}s.")
+                time.sleep(pausa)
+                self.destino.reconectar()
+                # Retoma do que o servidor realmente recebeu (se nem isso responder, a próxima tentativa descobre)
+                if self.enviado:
+                    try:
+                        self.enviado = min(self.enviado, self.destino.tamanho(self.nome_temp) or 0)
+                    except Exception:
+                        pass
+
+    def enviar_ate(self, caminho_local, tamanho):
+        """Envia os bytes [enviado, tamanho) do arquivo local."""
+        def enviar():
+            with open(caminho_local, "rb") as f:
+                f.seek(self.enviado)
+                while self.enviado < tamanho:
+                    dados = f.read(min(self.bloco, tamanho - self.enviado))
+                    if not dados:
+                        break
+                    self.destino.escrever(self.nome_temp, self.enviado, dados)
+                    self.enviado += len(dados)
+
+        self._com_retentativa("enviar", enviar)
+
+    def concluir(self):
+        if self.enviado == 0:
+            # Arquivo vazio: cria o temporário para o rename ter o que renomear
+            self._com_retentativa("enviar", lambda: self.destino.escrever(self.nome_temp, 0, b""))
+        self._com_retentativa("renomear", lambda: self.destino.renomear(self.nome_temp, self.nome_remoto))
+
+
+def enviar_arquivo(destino, caminho_local, nome_remoto=None, **kwargs):
+    """Envia um arquivo pronto (com temporário + rename e retomada em caso de falha)."""
+    envio = EnvioIncremental(destino, nome_remoto or os.path.basename(caminho_local), **kwargs)
+    envio.enviar_ate(caminho_local, os.path.getsize(caminho_local))
+    envio.concluir()
+
+
+class SaidaCSV:
+    """
+    Escreve o CSV do faturamento linha a linha (';', sem aspas, '\\' como escape).
+
+    Uso:
+        with SaidaCSV(csv_path, destino=DestinoSFTP.do_ambiente()) as saida:
+            saida.escrever(linhas)
+    Se o bloco 'with' terminar com erro o temporário local é apagado e nada é renomeado no remoto.
+    Falha no envio não interrompe a escrita: o CSV local sempre ganha o nome final e 'erro_envio'
+    fica com a exceção se nem o envio do arquivo pronto no fechar() funcionou.
+    """
+
+    def __init__(self, caminho, destino=None, nome_remoto=None, bloco=BLOCO_ENVIO, **kwargs_envio):
+        self.caminho = caminho
+        self.caminho_temp = caminho + ".tmp"
+        self.bloco = bloco
+        self.linhas = 0
+        self.erro_envio = None
+        self._arquivo = open(self.caminho_temp, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._arquivo, delimiter=";", quoting=csv.QUOTE_NONE, escapechar="\\")
+        self._destino = destino
+        self._nome_remoto = nome_remoto or os.path.basename(caminho)
+        self._kwargs_envio = kwargs_envio
+        self._envio = None
+        if destino is not None:
+            self._envio = EnvioIncremental(destino, self._nome_remoto, bloco=bloco, **kwargs_envio)
+
+    def _parar_envio(self, erro):
+        print(f"Aviso: envio para {self._destino} interrompido ({erro}). "
+              f"O CSV local continua sendo gravado e será enviado inteiro no fim.")
+        self.erro_envio = erro
+        self._envio = None
+
+    def escrever(self, linhas):
+        self._writer.writerows(linhas)
+        self.linhas += len(linhas)
+        if self._envio is not None and self._arquivo.tell() - self._envio.enviado >= self.bloco:
+            self._arquivo.flush()
+            try:
+                self._envio.enviar_ate(self.caminho_temp, self._arquivo.tell())
+            except Exception as e:
+                self._parar_envio(e)
+
+    def fechar(self):
+        """Fecha o arquivo local e dá o nome final a ele; depois manda o resto e renomeia no remoto."""
+        self._arquivo.close()
+        # O arquivo local vem primeiro: nada no servidor pode deixá-lo preso como .tmp
+        os.replace(self.caminho_temp, self.caminho)
+        if self._envio is not None:
+            try:
+                self._envio.enviar_ate(self.caminho, os.path.getsize(self.caminho))
+                self._envio.concluir()
+            except Exception as e:
+                self._parar_envio(e)
+        if self.erro_envio is not None:
+            # Última chance: o arquivo pronto inteiro, do zero, numa conexão nova
+            try:
+                self._destino.reconectar()
+                enviar_arquivo(self._destino, self.caminho, self._nome_remoto, **self._kwargs_envio)
+                self.erro_envio = None
+            except Exception as e:
+                print(f"ERRO: {self.caminho} ficou salvo localmente, mas não foi enviado para {self._destino}: {e}")
+                self.erro_envio = e
+
+    def abortar(self):
+        self._arquivo.close()
+        try:
+            os.remove(self.caminho_temp)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        if tipo is None:
+            self.fechar()
+        else:
+            self.abortar()
@@ -0,0 +1,33 @@
+import random
+
+import pytest
+
+from custos import ConfigCusto, calcular_valores_finais, calcular_valores_finais_lote
+
+
+@pytest.mark.parametrize("config", [ConfigCusto(), ConfigCusto(mva_st_original=40.0, icms_destino=18.0,
+                                                               frete=0.0, fator_margem=0.7)])
+def test_lote_igual_ao_escalar_ate_o_centavo(config):
+    rnd = random.Random(2024)
+    n = 5000
+    custos = [round(rnd.uniform(0, 2000), 2) for _ in range(n)]
+    ipis = [rnd.choice([0.0, 3.25, 5.0, 10.0, 15.0]) for _ in range(n)]
+    icmss = [rnd.choice([0.0, 4.0, 7.0, 12.0, 17.0, 20.5]) for _ in range(n)]
+    valores = [round(rnd.uniform(0, 5000), 2) for _ in range(n)]
+    qtds = [rnd.choice([1.0, 2.0, 3.0, 0.5, 12.0]) for _ in range(n)]
+
+    # Como em calcular_custos_itens: tolist() devolve floats do Python (round de np.float64 arredonda diferente)
+    custo, imp, marg = (a.tolist() for a in calcular_valores_finais_lote(custos, ipis, icmss, valores, qtds, config))
+
+    for i in range(n):
+        esperado = calcular_valores_finais(custos[i], ipis[i], icmss[i], valores[i], qtds[i], config)
+        assert (round(custo[i], 2), round(imp[i], 2), round(marg[i], 2)) == tuple(round(v, 2) for v in esperado)
+
+
+def test_lote_sem_valor_de_venda_deixa_margem_nan():
+    custo, imp, marg = (a.tolist() for a in calcular_valores_finais_lote(
+        [100.0, 50.0], [5.0, 0.0], [12.0, 4.0], [None, 80.0], [1, 2]))
+    esperado = calcular_valores_finais(100.0, 5.0, 12.0, None, 1)
+    assert (round(custo[0], 2), round(imp[0], 2)) == (round(esperado[0], 2), round(esperado[1], 2))
+    assert esperado[2] == "" and marg[0] != marg[0]
+    assert round(marg[1], 2) == round(calcular_valores_finais(50.0, 0.0, 4.0, 80.0, 2)[2], 2)
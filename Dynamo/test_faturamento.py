@@ -0,0 +1,141 @@
+import io
+import csv
+import random
+import datetime
+
+from collections import defaultdict
+
+import faturamento
+
+
+def localizar_nfs_compra_linear(historico_por_produto, itens_por_pedido):
+    """Busca antiga (antes do índice): filtra e ordena o histórico do produto para cada item."""
+    item_compra_info = {}
+    num_docs_compra_necessarios = set()
+    for cd_ped, itens in itens_por_pedido.items():
+        for cd_prod, _, _, _, _ in itens:
+            eventos_prod = historico_por_produto.get(cd_prod, [])
+
+            data_insercao_item = None
+            for ev in sorted(
+                [e for e in eventos_prod if e['tipo'] == 'PEDIDO' and e['numdoc'] == str(cd_ped)],
+                    key=lambda x: x['data']):
+                data_insercao_item = ev['data']
+                break
+
+            if not data_insercao_item:
+                continue
+
+            nf_compra_recente = None
+            for ev in sorted(
+                [e for e in eventos_prod if e['tipo'] == 'NF COMPRA' and e['data'] <= data_insercao_item],
+                key=lambda x: x['data'],
+                    reverse=True):
+                nf_compra_recente = ev['numdoc']
+                break
+
+            if nf_compra_recente:
+                item_compra_info[(cd_ped, cd_prod)] = {'num_doc': nf_compra_recente}
+                num_docs_compra_necessarios.add(nf_compra_recente)
+    return item_compra_info, num_docs_compra_necessarios
+
+
+def gerar_chunk(seed=7, n_pedidos=60, n_produtos=25):
+    """Pedidos, itens, histórico e notas de compra sintéticos, com datas repetidas de propósito."""
+    rnd = random.Random(seed)
+    inicio = datetime.date(2025, 1, 1)
+    dia = lambda: inicio + datetime.timedelta(days=rnd.randrange(120))  # noqa: E731
+
+    pedidos, itens_por_pedido = [], {}
+    for cd_ped in range(1000, 1000 + n_pedidos):
+        itens = []
+        for _ in range(rnd.randint(1, 4)):
+            cd_prod = rnd.randrange(n_produtos)
+            itens.append((cd_prod, f"PECA-{cd_prod}", str(rnd.randint(1, 5)),
+                          round(rnd.uniform(10, 500), 2), f"PECA {cd_prod} ORIGINAL" if cd_prod % 3 else "PECA"))
+        itens_por_pedido[cd_ped] = itens
+        total = sum(float(q) * v for _, _, q, v, _ in itens)
+        pedidos.append((cd_ped, datetime.date(2025, 5, 2), f"CLIENTE {cd_ped}", cd_ped % 7, cd_ped % 3,
+                        round(rnd.uniform(0, 20), 2), total))
+
+    historico_por_produto = defaultdict(list)
+    dados_compra = {}
+    for cd_prod in range(n_produtos):
+        for k in range(rnd.randint(0, 6)):
+            numdoc = f"NF{cd_prod}-{k}"
+            historico_por_produto[cd_prod].append({'data': dia(), 'numdoc': numdoc, 'tipo': 'NF COMPRA'})
+            dados_compra[(numdoc, cd_prod)] = {
+                'valor_unitario': round(rnd.uniform(5, 300), 2),
+                'ipi': rnd.choice([0.0, 5.0, 10.0]),
+                'icms': rnd.choice([0.0, 4.0, 12.0]),
+            }
+    for cd_ped, itens in itens_por_pedido.items():
+        for cd_prod, *_ in itens:
+            # Às vezes o item entra mais de uma vez no pedido, às vezes no mesmo dia de uma NF
+            for _ in range(rnd.randint(0, 2)):
+                historico_por_produto[cd_prod].append({'data': dia(), 'numdoc': str(cd_ped), 'tipo': 'PEDIDO'})
+    for eventos in historico_por_produto.values():
+        rnd.shuffle(eventos)
+
+    clientes = {c: {'cpf_cnpj': f"123.456.789-0{c}", 'cep': "45000-000", 'cidade': "VITORIA DA CONQUISTA",
+                    'uf': "BA"} for c in range(7)}
+    fones = {c: f"(77) 9900{c}-0000" for c in range(7)}
+    funcs = {0: "BALCAO", 1: "TELEP", 2: ""}
+    return pedidos, itens_por_pedido, historico_por_produto, dados_compra, clientes, fones, funcs
+
+
+def linhas_csv(pedidos, itens_por_pedido, item_compra_info, dados_compra, clientes, fones, funcs):
+    faturamento.anexar_dados_compra(item_compra_info, dados_compra)
+    linhas = faturamento.processar_pedidos(pedidos, itens_por_pedido, clientes, fones, funcs,
+                                           "14255350000103", item_compra_info, threads=1, executor="serial")
+    saida = io.StringIO()
+    csv.writer(saida, delimiter=';', quoting=csv.QUOTE_NONE, escapechar='\\').writerows(linhas)
+    return saida.getvalue()
+
+
+def test_indice_gera_o_mesmo_csv_que_a_busca_linear():
+    pedidos, itens, historico, dados_compra, clientes, fones, funcs = gerar_chunk()
+
+    info_linear, docs_linear = localizar_nfs_compra_linear(historico, itens)
+    indice = faturamento.indexar_historico(historico)
+    info_indice, docs_indice = faturamento.localizar_nfs_compra(indice, itens)
+
+    assert info_indice == info_linear
+    assert docs_indice == docs_linear
+    assert info_linear, "o histórico sintético precisa resolver alguma NF"
+
+    csv_linear = linhas_csv(pedidos, itens, info_linear, dados_compra, clientes, fones, funcs)
+    csv_indice = linhas_csv(pedidos, itens, info_indice, dados_compra, clientes, fones, funcs)
+    assert csv_indice == csv_linear
+
+
+def test_nf_do_mesmo_dia_fica_a_primeira_que_veio_do_banco():
+    dia = datetime.date(2025, 3, 10)
+    historico = {1: [
+        {'data': dia, 'numdoc': "A", 'tipo': 'NF COMPRA'},
+        {'data': dia, 'numdoc': "B", 'tipo': 'NF COMPRA'},
+        {'data': dia + datetime.timedelta(days=1), 'numdoc': "C", 'tipo': 'NF COMPRA'},
+        {'data': dia, 'numdoc': "77", 'tipo': 'PEDIDO'},
+    ]}
+    itens = {77: [(1, "X", "1", 10.0, "X")]}
+
+    assert faturamento.localizar_nfs_compra(faturamento.indexar_historico(historico), itens) == \
+        localizar_nfs_compra_linear(historico, itens)
+    assert faturamento.buscar_nf_compra_anterior(faturamento.indexar_historico(historico), 1, dia) == "A"
+
+
+def test_nf_sem_dados_de_compra_so_perde_o_custo_do_item():
+    pedidos, itens, historico, dados_compra, clientes, fones, funcs = gerar_chunk()
+    item_compra_info, _ = faturamento.localizar_nfs_compra(faturamento.indexar_historico(historico), itens)
+    # Uma das NFs não tem linha em NOTACOMPRA/ITENSNOTACOMPRA
+    sem_dados = next(iter(item_compra_info))
+    dados_compra.pop((item_compra_info[sem_dados]['num_doc'], sem_dados[1]))
+    faturamento.anexar_dados_compra(item_compra_info, dados_compra)
+
+    custos = faturamento.calcular_custos_itens(pedidos, itens, item_compra_info)
+
+    cd_ped, cd_prod = sem_dados
+    posicoes = [i for i, item in enumerate(itens[cd_ped]) if item[0] == cd_prod]
+    assert all((cd_ped, i) not in custos for i in posicoes)
+    com_dados = [k for k, v in item_compra_info.items() if 'valor_unitario' in v]
+    assert len(custos) >= len(com_dados)
@@ -0,0 +1,220 @@
+import os
+import posixpath
+from types import SimpleNamespace
+
+import pytest
+
+import saida_csv
+from saida_csv import SUFIXO_REMOTO, DestinoLocal, DestinoSFTP, SaidaCSV
+
+
+class DestinoInstavel(DestinoLocal):
+    """DestinoLocal que falha nas operações escolhidas enquanto 'falhas' > 0."""
+
+    def __init__(self, diretorio, falhar_em=("escrever",), falhas=10 ** 6):
+        super().__init__(diretorio)
+        self.falhar_em = set(falhar_em)
+        self.falhas = falhas
+
+    def _talvez_falhar(self, operacao):
+        if operacao in self.falhar_em and self.falhas > 0:
+            self.falhas -= 1
+            raise OSError(f"falha simulada em {operacao}")
+
+    def escrever(self, nome, offset, dados):
+        self._talvez_falhar("escrever")
+        super().escrever(nome, offset, dados)
+
+    def renomear(self, origem, destino):
+        self._talvez_falhar("renomear")
+        super().renomear(origem, destino)
+
+
+class ServidorFalso:
+    """Faz o papel do servidor SFTP numa pasta local; guarda as conexões abertas e as escritas recebidas."""
+
+    def __init__(self, pasta, falhar_escritas=(), posix_rename=True):
+        self.pasta = pasta
+        # Números (contando do 1) das chamadas a write() que derrubam a conexão
+        self.falhar_escritas = set(falhar_escritas)
+        self.posix_rename = posix_rename
+        self.conexoes = []
+        self.escritas = []
+
+    def local(self, caminho):
+        return os.path.join(self.pasta, posixpath.basename(caminho))
+
+    def conectar(self, host, username, password, port, cnopts):
+        conexao = ConexaoFalsa(self)
+        self.conexoes.append(conexao)
+        return conexao
+
+
+class ArquivoRemotoFalso:
+    def __init__(self, servidor, conexao, arquivo):
+        self.servidor = servidor
+        self.conexao = conexao
+        self.arquivo = arquivo
+
+    def seek(self, offset):
+        self.arquivo.seek(offset)
+
+    def write(self, dados):
+        self.conexao.ativa()
+        self.servidor.escritas.append((self.arquivo.tell(), len(dados)))
+        if len(self.servidor.escritas) in self.servidor.falhar_escritas:
+            self.conexao.aberta = False
+            raise OSError("conexão perdida")
+        self.arquivo.write(dados)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.arquivo.close()
+
+
+class ConexaoFalsa:
+    """O que o DestinoSFTP usa do pysftp.Connection."""
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.aberta = True
+        self.sftp_client = SimpleNamespace(posix_rename=self._posix_rename)
+
+    def ativa(self):
+        if not self.aberta:
+            raise OSError("Socket is closed")
+
+    def stat(self, caminho):
+        self.ativa()
+        return os.stat(self.servidor.local(caminho))
+
+    def open(self, caminho, modo):
+        self.ativa()
+        return ArquivoRemotoFalso(self.servidor, self, open(self.servidor.local(caminho), modo + "b"))
+
+    def _posix_rename(self, origem, destino):
+        self.ativa()
+        if not self.servidor.posix_rename:
+            # O paramiko levanta IOError sem errno quando o servidor não tem a extensão
+            raise IOError("Operation unsupported")
+        os.replace(self.servidor.local(origem), self.servidor.local(destino))
+
+    def rename(self, origem, destino):
+        self.ativa()
+        # Como no SFTP, o rename comum não substitui um destino existente
+        if os.path.exists(self.servidor.local(destino)):
+            raise IOError(f"{destino} já existe")
+        os.rename(self.servidor.local(origem), self.servidor.local(destino))
+
+    def remove(self, caminho):
+        self.ativa()
+        os.remove(self.servidor.local(caminho))
+
+    def close(self):
+        self.aberta = False
+
+
+@pytest.fixture
+def servidor(tmp_path, monkeypatch):
+    """Troca o pysftp do saida_csv por um ServidorFalso; ajuste falhar_escritas/posix_rename no teste."""
+    servidor = ServidorFalso(str(tmp_path / "remoto"))
+    os.makedirs(servidor.pasta)
+    cnopts = SimpleNamespace(hostkeys=SimpleNamespace(load=lambda arquivo: None))
+    monkeypatch.setattr(saida_csv.pysftp, "CnOpts", lambda: cnopts)
+    monkeypatch.setattr(saida_csv.pysftp, "Connection", servidor.conectar)
+    return servidor
+
+
+def destino_sftp():
+    return DestinoSFTP("sftp.teste", "usuario", "senha", "/workarea")
+
+
+LINHAS = [[str(i), "PECA", "10,00", "x" * 40] for i in range(2000)]
+
+
+def escrever_csv(caminho, destino):
+    with SaidaCSV(caminho, destino=destino, bloco=4096, tentativas=2, espera=0) as saida:
+        for i in range(0, len(LINHAS), 100):
+            saida.escrever(LINHAS[i:i + 100])
+    return saida
+
+
+def test_stream_envia_o_mesmo_arquivo(tmp_path):
+    caminho = str(tmp_path / "fat.csv")
+    saida = escrever_csv(caminho, DestinoLocal(str(tmp_path / "remoto")))
+    assert saida.erro_envio is None
+    assert open(caminho, "rb").read() == open(tmp_path / "remoto" / "fat.csv", "rb").read()
+    assert not os.path.exists(caminho + ".tmp")
+
+
+def test_servidor_fora_do_ar_mantem_o_csv_local(tmp_path):
+    caminho = str(tmp_path / "fat.csv")
+    saida = escrever_csv(caminho, DestinoInstavel(str(tmp_path / "remoto")))
+    assert isinstance(saida.erro_envio, OSError)
+    assert len(open(caminho, encoding="utf-8").read().splitlines()) == len(LINHAS)
+    assert not os.path.exists(caminho + ".tmp")
+    assert not os.path.exists(tmp_path / "remoto" / "fat.csv")
+
+
+@pytest.mark.parametrize("falhar_em,falhas", [(("escrever",), 3), (("renomear",), 2)])
+def test_falha_no_stream_cai_para_envio_do_arquivo_pronto(tmp_path, falhar_em, falhas):
+    caminho = str(tmp_path / "fat.csv")
+    saida = escrever_csv(caminho, DestinoInstavel(str(tmp_path / "remoto"), falhar_em, falhas))
+    assert saida.erro_envio is None
+    assert open(caminho, "rb").read() == open(tmp_path / "remoto" / "fat.csv", "rb").read()
+
+
+def test_erro_no_processamento_descarta_o_temporario(tmp_path):
+    caminho = str(tmp_path / "fat.csv")
+    with pytest.raises(RuntimeError):
+        with SaidaCSV(caminho) as saida:
+            saida.escrever(LINHAS[:10])
+            raise RuntimeError("falha no chunk")
+    assert not os.path.exists(caminho) and not os.path.exists(caminho + ".tmp")
+
+
+def test_sftp_envia_em_blocos_numa_conexao_so_e_renomeia_no_fim(tmp_path, servidor):
+    # Sobra de uma execução anterior interrompida: deve ser sobrescrita, não continuada
+    with open(os.path.join(servidor.pasta, "fat.csv" + SUFIXO_REMOTO), "wb") as f:
+        f.write(b"lixo" * 5000)
+    caminho = str(tmp_path / "fat.csv")
+
+    saida = escrever_csv(caminho, destino_sftp())
+
+    assert saida.erro_envio is None
+    assert open(caminho, "rb").read() == open(os.path.join(servidor.pasta, "fat.csv"), "rb").read()
+    assert os.listdir(servidor.pasta) == ["fat.csv"]
+    assert len(servidor.conexoes) == 1
+    # Várias escritas em sequência, cada uma continuando de onde a anterior parou
+    offsets = [offset for offset, _ in servidor.escritas]
+    assert len(offsets) > 10 and offsets[0] == 0
+    assert all(b == a + n for (a, n), b in zip(servidor.escritas, offsets[1:]))
+
+
+def test_sftp_conexao_caida_retoma_do_tamanho_no_servidor(tmp_path, servidor):
+    servidor.falhar_escritas = {4}
+    caminho = str(tmp_path / "fat.csv")
+
+    saida = escrever_csv(caminho, destino_sftp())
+
+    assert saida.erro_envio is None
+    assert open(caminho, "rb").read() == open(os.path.join(servidor.pasta, "fat.csv"), "rb").read()
+    assert len(servidor.conexoes) == 2 and not servidor.conexoes[0].aberta
+    # A escrita que caiu é refeita na conexão nova a partir do que o servidor já tinha, sem voltar ao zero
+    (offset_falha, _), (offset_retomada, _) = servidor.escritas[3:5]
+    assert offset_retomada == offset_falha > 0
+
+
+def test_sftp_sem_posix_rename_substitui_o_arquivo_existente(tmp_path, servidor):
+    servidor.posix_rename = False
+    with open(os.path.join(servidor.pasta, "fat.csv"), "wb") as f:
+        f.write(b"versao antiga")
+    caminho = str(tmp_path / "fat.csv")
+
+    saida = escrever_csv(caminho, destino_sftp())
+
+    assert saida.erro_envio is None
+    assert open(caminho, "rb").read() == open(os.path.join(servidor.pasta, "fat.csv"), "rb").read()
+    assert os.listdir(servidor.pasta) == ["fat.csv"]
@@ -1,46 +1,364 @@
-# testar.py
-import subprocess
+# testar_varias_threads.py
+"""
+Benchmark do faturamento, etapa por etapa.
+
+Roda um período fixo (--de/--ate) pelas mesmas funções do faturamento.py e mede cada etapa
+separadamente: consulta de pedidos, consulta de itens, cadastros, pré-cache do histórico,
+resolução das NFs de compra, pré-cache do custo das NFs, processamento em memória e escrita do CSV.
+
+- Varre tamanhos de pool (--pool-sizes) e número de workers (--workers), com --repeticoes por combinação.
+- Grava mediana/p95 de cada etapa em arquivos/benchmark/benchmark_<data>.json e .csv.
+- Compara com a baseline guardada (--baseline) e aponta as etapas que ficaram mais lentas.
+- Na primeira execução o período é gravado como dataset (pickle); com --offline as etapas
+  em memória são repetidas a partir dele, sem banco, sempre sobre os mesmos dados.
+
+Exemplos:
+    python Dynamo/testar_varias_threads.py --de 2025-01-01 --ate 2025-01-31 --pool-sizes 5,10,20 --workers 5,10,20
+    python Dynamo/testar_varias_threads.py --de 2025-01-01 --ate 2025-01-31 --offline --workers 1,5,10
+    python Dynamo/testar_varias_threads.py --de 2025-01-01 --ate 2025-01-31 --salvar-baseline
+"""
+import os
 import sys
+import csv
+import json
+import math
+import time
+import pickle
+import shutil
+import datetime
+import argparse
+import statistics
+
+import faturamento as fat
+
+DIR_BENCHMARK = "./arquivos/benchmark"
+
+ETAPAS = ["consulta_pedidos", "consulta_itens", "consulta_cadastros", "precache_historico",
+          "resolucao_nf", "precache_custo_nf", "processamento", "escrita_csv"]
+
+
+def lista_inteiros(texto):
+    return [int(x) for x in texto.split(",") if x.strip()]
+
+
+def percentil(amostras, p):
+    """Percentil pelo método do posto mais próximo (com poucas amostras não inventa valor)."""
+    ordenadas = sorted(amostras)
+    indice = max(0, math.ceil(p / 100 * len(ordenadas)) - 1)
+    return ordenadas[indice]
+
+
+class Cronometro:
+    """Acumula os tempos de cada etapa: with cron.medir('etapa'): ..."""
+
+    def __init__(self):
+        self.tempos = {}
+
+    def medir(self, etapa):
+        cron = self
+
+        class _Medicao:
+            def __enter__(self):
+                self.inicio = time.perf_counter()
+
+            def __exit__(self, *exc):
+                cron.tempos[etapa] = time.perf_counter() - self.inicio
+
+        return _Medicao()
+
+
+# ==============================================================================
+# DATASET
+# ==============================================================================
+
+def caminho_dataset(de, ate):
+    return os.path.join(DIR_BENCHMARK, f"dataset_{de:%Y%m%d}_{ate:%Y%m%d}.pickle")
+
+
+def gravar_dataset(caminho, dados):
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        pickle.dump(dados, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, caminho)
+    print(f"Dataset gravado em {caminho}")
+
+
+def carregar_dataset(caminho):
+    with open(caminho, "rb") as f:
+        return pickle.load(f)
+
+
+def conferir_dataset(dataset, dados):
+    """Avisa se o banco não devolve mais o mesmo período que foi gravado (os números deixam de ser comparáveis)."""
+    for chave in ("pedidos", "num_itens", "num_docs_compra"):
+        if dataset.get(chave) != dados.get(chave):
+            print(f"Aviso: o período mudou no banco desde a gravação do dataset ({chave}). "
+                  f"Apague {dataset['arquivo']} para gravar de novo.")
+            return
+
+
+# ==============================================================================
+# EXECUÇÃO DAS ETAPAS
+# ==============================================================================
+
+def rodar_etapas_banco(conn, historico, snapshot, de, ate, cron):
+    """Etapas que dependem do Firebird. Retorna os dados necessários para as etapas em memória."""
+    cur = conn.cursor()
+
+    with cron.medir("consulta_pedidos"):
+        pedidos = fat.consultar_pedidos(cur, fat.CNPJ_LOJA, de, ate)
+    with cron.medir("consulta_itens"):
+        itens_por_pedido, todos_produtos_ids = fat.consultar_itens(cur, pedidos)
+    with cron.medir("consulta_cadastros"):
+        clientes_dict, fones_dict, funcs_dict = fat.consultar_cadastros(cur, pedidos)
+    with cron.medir("precache_historico"):
+        historico_cache = fat.carregar_historico(historico, snapshot, todos_produtos_ids, de, ate)
+    with cron.medir("resolucao_nf"):
+        item_compra_info, num_docs = fat.localizar_nfs_compra(historico_cache, itens_por_pedido)
+    with cron.medir("precache_custo_nf"):
+        dados_compra_cache = fat.pre_cache_dados_compra(conn, num_docs)
+
+    return {
+        "pedidos": pedidos,
+        "itens_por_pedido": dict(itens_por_pedido),
+        "clientes_dict": clientes_dict,
+        "fones_dict": fones_dict,
+        "funcs_dict": funcs_dict,
+        "historico_cache": historico_cache,
+        "dados_compra_cache": dados_compra_cache,
+        "num_itens": sum(len(v) for v in itens_por_pedido.values()),
+        "num_docs_compra": len(num_docs),
+    }
+
+
+def rodar_etapas_memoria(dados, workers, executor, arquivo_csv, cron):
+    """Etapas sem banco: resolução das NFs, processamento e escrita do CSV. Retorna o número de linhas."""
+    with cron.medir("resolucao_nf"):
+        item_compra_info, _ = fat.localizar_nfs_compra(dados["historico_cache"], dados["itens_por_pedido"])
+    fat.anexar_dados_compra(item_compra_info, dados["dados_compra_cache"])
+
+    cnpj = fat.remover_caracteres_nao_numericos(fat.CNPJ_LOJA)
+    with cron.medir("processamento"):
+        linhas_csv = fat.processar_pedidos(dados["pedidos"], dados["itens_por_pedido"], dados["clientes_dict"],
+                                           dados["fones_dict"], dados["funcs_dict"], cnpj, item_compra_info,
+                                           workers, executor)
+    with cron.medir("escrita_csv"):
+        with fat.SaidaCSV(arquivo_csv) as saida:
+            saida.escrever(linhas_csv)
+    return len(linhas_csv)
+
+
+def rodar_combinacao(args, de, ate, pool_size, workers, dataset, arquivo_csv):
+    """Todas as repetições de uma combinação pool_size x workers. Retorna etapa -> [segundos, ...]."""
+    amostras = {etapa: [] for etapa in ETAPAS}
+    total = args.aquecimento + args.repeticoes
+
+    pool = historico = snapshot = None
+    if not args.offline:
+        pool = fat.FirebirdPool(max_tamanho=max(pool_size, 2))
+        historico = fat.HistoricoProduto(pool, max_paralelo=max(pool_size - 1, 1))
+        if args.snapshot:
+            snapshot = fat.SnapshotHistorico(historico)
+
+    try:
+        for rodada in range(total):
+            cron = Cronometro()
+            if args.offline:
+                # As etapas em memória não alteram o dataset: todas as rodadas usam os mesmos dados
+                dados = dataset
+            else:
+                with pool.conexao() as conn:
+                    dados = rodar_etapas_banco(conn, historico, snapshot, de, ate, cron)
+                if dataset is not None:
+                    conferir_dataset(dataset, dados)
+            linhas = rodar_etapas_memoria(dados, workers, args.executor, arquivo_csv, cron)
+
+            aquecendo = rodada < args.aquecimento
+            resumo = ", ".join(f"{e}={cron.tempos[e]:.3f}s" for e in ETAPAS if e in cron.tempos)
+            print(f"  {'aquecimento' if aquecendo else f'rodada {rodada - args.aquecimento + 1}'}: "
+                  f"{linhas} linhas | {resumo}")
+            if aquecendo:
+                continue
+            for etapa, segundos in cron.tempos.items():
+                amostras[etapa].append(segundos)
+    finally:
+        if snapshot:
+            snapshot.fechar()
+        if pool:
+            print(f"  Métricas do pool: {pool.metricas()}")
+            pool.fechar()
+
+    return {etapa: valores for etapa, valores in amostras.items() if valores}
+
+
+# ==============================================================================
+# RESULTADOS E BASELINE
+# ==============================================================================
+
+def chave_resultado(r):
+    return f"{r['pool_size']}|{r['workers']}|{r['etapa']}"
+
+
+def resumir(pool_size, workers, amostras):
+    resultados = []
+    for etapa in ETAPAS:
+        valores = amostras.get(etapa)
+        if not valores:
+            continue
+        resultados.append({
+            "pool_size": pool_size,
+            "workers": workers,
+            "etapa": etapa,
+            "amostras": len(valores),
+            "mediana_s": round(statistics.median(valores), 4),
+            "p95_s": round(percentil(valores, 95), 4),
+            "min_s": round(min(valores), 4),
+            "max_s": round(max(valores), 4),
+        })
+    return resultados
+
+
+def comparar_baseline(resultados, baseline, tolerancia, piso):
+    """
+    Compara a mediana de cada etapa com a da baseline. É regressão quando fica mais de 'tolerancia'
+    (fração) mais lenta e a diferença passa de 'piso' segundos (abaixo disso é ruído).
+    """
+    base = {chave_resultado(r): r for r in baseline.get("resultados", [])}
+    comparacao = []
+    for r in resultados:
+        b = base.get(chave_resultado(r))
+        if not b:
+            continue
+        diferenca = r["mediana_s"] - b["mediana_s"]
+        razao = r["mediana_s"] / b["mediana_s"] if b["mediana_s"] else None
+        regressao = razao is not None and razao > 1 + tolerancia and diferenca > piso
+        comparacao.append({
+            "pool_size": r["pool_size"],
+            "workers": r["workers"],
+            "etapa": r["etapa"],
+            "baseline_mediana_s": b["mediana_s"],
+            "mediana_s": r["mediana_s"],
+            "variacao_pct": round((razao - 1) * 100, 1) if razao is not None else None,
+            "regressao": regressao,
+        })
+    return comparacao
+
+
+def gravar_resultados(relatorio, prefixo):
+    with open(prefixo + ".json", "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+    colunas = ["pool_size", "workers", "etapa", "amostras", "mediana_s", "p95_s", "min_s", "max_s"]
+    with open(prefixo + ".csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=colunas, delimiter=";")
+        writer.writeheader()
+        writer.writerows(relatorio["resultados"])
+    print(f"\nResultados gravados em {prefixo}.json e {prefixo}.csv")
+
 
 def main():
-    # pool_sizes que você deseja testar
-    pool_sizes = [20]
-
-    # As 4 passadas de threads que você quer:
-    #  1) 5->20
-    #  2) 20->5
-    #  3) 5->20
-    #  4) 20->5
-    passadas = [
-        range(5, 21),       # 1ª: 5 a 20 (inclusive)
-        range(20, 4, -1),   # 2ª: 20 a 5 (decrescente)
-        range(5, 21),       # 3ª: 5 a 20
-        range(20, 4, -1)    # 4ª: 20 a 5
-    ]
-
-    # Vamos rodar para cada pool_size
+    parser = argparse.ArgumentParser(description="Benchmark do faturamento por etapa.")
+    parser.add_argument("--de", required=True, help="Início do período fixo (YYYY-MM-DD)")
+    parser.add_argument("--ate", required=True, help="Fim do período fixo (YYYY-MM-DD)")
+    parser.add_argument("--pool-sizes", type=lista_inteiros, default=[5, 10, 20],
+                        help="Tamanhos de pool, separados por vírgula")
+    parser.add_argument("--workers", type=lista_inteiros, default=[5, 10, 20],
+                        help="Threads do processamento em memória, separadas por vírgula")
+    parser.add_argument("--executor", choices=["thread", "process", "serial"], default="thread",
+                        help="Executor do processamento em memória (mesmo --executor do faturamento.py)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Rodadas medidas por combinação")
+    parser.add_argument("--aquecimento", type=int, default=1, help="Rodadas descartadas antes das medidas")
+    parser.add_argument("--offline", action="store_true",
+                        help="Só as etapas em memória, a partir do dataset gravado (não usa o banco)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Pré-cache do histórico pelo snapshot local em vez do Firebird")
+    parser.add_argument("--baseline", default=os.path.join(DIR_BENCHMARK, "baseline.json"),
+                        help="Arquivo de baseline para comparação")
+    parser.add_argument("--salvar-baseline", action="store_true", help="Grava este resultado como a nova baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.10,
+                        help="Quanto mais lenta (fração) uma etapa pode ficar antes de contar como regressão")
+    parser.add_argument("--piso", type=float, default=0.05,
+                        help="Diferença mínima em segundos para contar como regressão")
+    args = parser.parse_args()
+
+    de = datetime.datetime.strptime(args.de, "%Y-%m-%d")
+    ate = datetime.datetime.strptime(args.ate, "%Y-%m-%d")
+    os.makedirs(DIR_BENCHMARK, exist_ok=True)
+
+    arquivo_dataset = caminho_dataset(de, ate)
+    dataset = None
+    if os.path.exists(arquivo_dataset):
+        dataset = carregar_dataset(arquivo_dataset)
+        dataset["arquivo"] = arquivo_dataset
+    elif args.offline:
+        print(f"Dataset {arquivo_dataset} não existe: rode uma vez sem --offline para gravá-lo.")
+        sys.exit(2)
+    else:
+        # Grava o período uma vez; daí em diante todas as rodadas são conferidas contra ele
+        print("Gravando o dataset do período...")
+        with fat.FirebirdPool(max_tamanho=2) as pool:
+            historico = fat.HistoricoProduto(pool, max_paralelo=1)
+            with pool.conexao() as conn:
+                dataset = rodar_etapas_banco(conn, historico, None, de, ate, Cronometro())
+        gravar_dataset(arquivo_dataset, dataset)
+        dataset["arquivo"] = arquivo_dataset
+
+    print(f"Dataset: {len(dataset['pedidos'])} pedidos, {dataset['num_itens']} itens, "
+          f"{dataset['num_docs_compra']} NFs de compra")
+
+    # Sem banco o tamanho do pool não faz diferença
+    pool_sizes = [0] if args.offline else args.pool_sizes
+    arquivo_csv = os.path.join(DIR_BENCHMARK, "saida_benchmark.csv")
+
+    resultados = []
     for ps in pool_sizes:
-        for idx_passada, pass_range in enumerate(passadas, start=1):
-            for mw in pass_range:
-                print(f"\n=== pool_size={ps}, passada={idx_passada}, threads={mw} ===\n")
-                
-                # Montar a linha de comando para rodar "faturamento.py"
-                # Passamos pool_size, max_workers e idx_passada só para log, se quiser
-                cmd = [
-                    sys.executable,      # python atual
-                    "./Dynamo/faturamento.py",    # seu script de faturamento
-                    "--poolsize", str(ps),
-                    "--threads", str(mw),
-                    "--passada", str(idx_passada)
-                ]
-
-                # Executar e esperar terminar
-                result = subprocess.run(cmd)
-                if result.returncode != 0:
-                    print(f"** ERRO com pool_size={ps}, passada={idx_passada}, threads={mw}, code={result.returncode}. Abortando. **")
-                    return
-    
+        for mw in args.workers:
+            print(f"\n=== pool_size={ps}, workers={mw} ===")
+            amostras = rodar_combinacao(args, de, ate, ps, mw, dataset, arquivo_csv)
+            resultados.extend(resumir(ps, mw, amostras))
+    if os.path.exists(arquivo_csv):
+        os.remove(arquivo_csv)
+
+    relatorio = {
+        "gerado_em": datetime.datetime.now().isoformat(sep=" ", timespec="seconds"),
+        "periodo": [args.de, args.ate],
+        "modo": "offline" if args.offline else ("snapshot" if args.snapshot else "firebird"),
+        "executor": args.executor,
+        "repeticoes": args.repeticoes,
+        "resultados": resultados,
+    }
+
+    regressoes = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("periodo") != relatorio["periodo"] or baseline.get("modo") != relatorio["modo"]
+                or baseline.get("executor", "thread") != relatorio["executor"]):
+            print(f"Aviso: a baseline é de outro período/modo/executor ({baseline.get('periodo')}, "
+                  f"{baseline.get('modo')}, {baseline.get('executor', 'thread')}); "
+                  f"a comparação pode não fazer sentido.")
+        relatorio["comparacao"] = comparar_baseline(resultados, baseline, args.tolerancia, args.piso)
+        regressoes = [c for c in relatorio["comparacao"] if c["regressao"]]
+
+        print("\n=== Comparação com a baseline (mediana) ===")
+        for c in relatorio["comparacao"]:
+            marca = "  << REGRESSÃO" if c["regressao"] else ""
+            variacao = f"{c['variacao_pct']:+.1f}%" if c["variacao_pct"] is not None else "n/d"
+            print(f"pool={c['pool_size']:>3} workers={c['workers']:>3} {c['etapa']:<20} "
+                  f"{c['baseline_mediana_s']:>9.4f}s -> {c['mediana_s']:>9.4f}s ({variacao}){marca}")
+
+    prefixo = os.path.join(DIR_BENCHMARK, f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+    gravar_resultados(relatorio, prefixo)
+
+    if args.salvar_baseline:
+        shutil.copyfile(prefixo + ".json", args.baseline)
+        print(f"Baseline atualizada: {args.baseline}")
+
+    if regressoes:
+        print(f"\n** {len(regressoes)} etapa(s) mais lentas que a baseline. **")
+        sys.exit(1)
     print("Todos os testes concluídos com sucesso.")
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,4 @@
-import os
-import firebirdsql
+from seculos_db import get_firebird_connection
 import pandas as pd
 import numpy as np
 from xlsxwriter.utility import xl_col_to_name
@@ -14,21 +13,6 @@ from tkinter import messagebox
 load_dotenv()
 
 
-def get_firebird_connection():
-    # Conecta ao banco de dados Firebird
-    return firebirdsql.connect(
-        host=os.getenv('HOST'),
-        port=int(os.getenv('PORT', '3050')),
-        database=os.getenv('DB_PATH'),
-        user=os.getenv('APP_USER'),
-        password=os.getenv('PASSWORD'),
-        role=os.getenv('ROLE'),
-        auth_plugin_name=os.getenv('AUTH'),
-        wire_crypt=False,
-        charset='ISO8859_1'
-    )
-
-
 def choose_file():
     # Abre a caixa de diálogo para escolher o arquivo
     Tk().withdraw()  # Evita que a janela principal do Tkinter apareça
@@ -1,6 +1,6 @@
-import os
 import pandas as pd
 import firebirdsql
+from seculos_db import pool_compartilhado
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkcalendar import DateEntry
@@ -86,18 +86,8 @@ class ConciliadorFinanceiro:
     # --- Funções de Conexão e Dados ---
     @staticmethod
     def get_firebird_connection():
-        # Ajustar com os parâmetros corretos do Firebird, inclusive charset
-        return firebirdsql.connect(
-            host=os.getenv('HOST'),
-            port=int(os.getenv('PORT', '3050')),
-            database=os.getenv('DB_PATH'),
-            user=os.getenv('APP_USER'),
-            password=os.getenv('PASSWORD'),
-            role=os.getenv('ROLE'),
-            auth_plugin_name=os.getenv('AUTH'),
-            wire_crypt=False,
-            charset='ISO8859_1'
-        )
+        # Conexão emprestada do pool do processo: conferências seguidas reaproveitam o mesmo socket (VPN)
+        return pool_compartilhado(max_tamanho=1).obter()
 
     def buscar_dados_banco(self, data_str):
         """Busca dados de PEDIDOVENDA, ORDEMSERVICO e RECEBIMENTO."""
@@ -156,7 +146,7 @@ class ConciliadorFinanceiro:
         except Exception as e:
             raise Exception(f"Erro ao consultar banco de dados: {e}")
         finally:
-            conn.close()
+            pool_compartilhado(max_tamanho=1).devolver(conn)
 
         if not dfs:
             return pd.DataFrame(columns=['ORIGEM', 'NUMERO', 'VALOR', 'FORMA_PAG'])
@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 from datetime import datetime
 import pandas as pd
 import firebirdsql
+from seculos_db import HistoricoProduto
 import sys
 import os
 
@@ -119,25 +120,28 @@ def main():
             data_limite = datetime.now() - relativedelta(months=1) # Alterado de 6 para 1
             data_limite_str = data_limite.strftime('%Y-%m-%d')
             
-            union_queries = []
-            for i in range(1, 11):
-                union_queries.append(f"SELECT * FROM HISTORICOPRODUTO{i} WHERE DATA >= '{data_limite_str}'")
-            
-            sql_historico_base = " UNION ALL ".join(union_queries)
+            # Só as tabelas HISTORICOPRODUTO que têm movimento a partir da data limite entram no UNION ALL
+            sql_historico_base, params_historico = HistoricoProduto().sql_union(
+                "*", data_ini=data_limite_str, conn=conn)
 
-            sql_historico_completo = f"""
-                SELECT
-                    p.NUMORIGINAL,
-                    h.*
-                FROM
-                    ({sql_historico_base}) h
-                JOIN
-                    PRODUTO p ON h.CDPRODUTO = p.CDPRODUTO
-                ORDER BY
-                    h.CDPRODUTO, h.DATA
-            """
-            
-            df_historico = pd.read_sql_query(sql_historico_completo, conn)
+            if sql_historico_base is None:
+                # Nenhuma tabela com movimento desde a data limite: a aba sai vazia
+                print("Nenhuma tabela de histórico com movimento no período.")
+                df_historico = pd.DataFrame(columns=['NUMORIGINAL'])
+            else:
+                sql_historico_completo = f"""
+                    SELECT
+                        p.NUMORIGINAL,
+                        h.*
+                    FROM
+                        ({sql_historico_base}) h
+                    JOIN
+                        PRODUTO p ON h.CDPRODUTO = p.CDPRODUTO
+                    ORDER BY
+                        h.CDPRODUTO, h.DATA
+                """
+
+                df_historico = pd.read_sql_query(sql_historico_completo, conn, params=params_historico)
             df_historico.to_excel(writer, sheet_name='Histórico de Produtos', index=False)
             print(f"-> {len(df_historico)} registros de histórico encontrados.")
 
@@ -1,6 +1,6 @@
 import os
 import datetime
-import firebirdsql
+from seculos_db import get_firebird_connection
 import pandas as pd
 import tkinter as tk
 from tkinter import messagebox
@@ -33,21 +33,6 @@ COLORS = {
 }
 
 
-def get_firebird_connection():
-    # Ajustar com os parâmetros corretos do Firebird, inclusive charset
-    return firebirdsql.connect(
-        host=os.getenv('HOST'),
-        port=int(os.getenv('PORT', '3050')),
-        database=os.getenv('DB_PATH'),
-        user=os.getenv('APP_USER'),
-        password=os.getenv('PASSWORD'),
-        role=os.getenv('ROLE'),
-        auth_plugin_name=os.getenv('AUTH'),
-        wire_crypt=False,
-        charset='ISO8859_1'
-    )
-
-
 def fetch_data(start_date, end_date):
     """
     start_date e end_date devem ser strings no formato 'YYYY-MM-DD'.
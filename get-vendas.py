@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import messagebox
 import firebirdsql
+from seculos_db import get_firebird_connection
 import pandas as pd
 import calendar
 from datetime import datetime, timedelta
@@ -28,7 +29,7 @@ def fetch_data(start_date, end_date):
     """
     try:
         # Conexão com o banco de dados Firebird
-        conn = firebirdsql.connect(
+        conn = get_firebird_connection(
             host=HOST,
             port=PORT,
             database=DATABASE,
@@ -36,7 +37,6 @@ def fetch_data(start_date, end_date):
             password=PASSWORD,
             role=ROLE,
             auth_plugin_name='Legacy_Auth',
-            wire_crypt=False,
             charset=CHARSET
         )
 
@@ -1,20 +1,27 @@
 # OCR via Windows.Media.Ocr (embutido no Windows 10/11).
 # Uso: powershell -NoProfile -ExecutionPolicy Bypass -File ocr_windows.ps1 -Path C:\temp\pagina.png
+#  ou: powershell -NoProfile -ExecutionPolicy Bypass -File ocr_windows.ps1 -Servidor
+#      (fica aberto: uma imagem PNG em base64 por linha no stdin; cada resposta termina com <<FIM>>)
 # Requer Windows PowerShell 5.1 (NAO usar PowerShell 7).
 param(
-    [Parameter(Mandatory = $true)]
-    [string]$Path
+    [string]$Path,
+    [switch]$Servidor
 )
 
 $ErrorActionPreference = 'Stop'
 
-if (-not (Test-Path -LiteralPath $Path)) {
-    Write-Error "Arquivo nao encontrado: $Path"
-    exit 2
+if (-not $Servidor) {
+    if (-not $Path) {
+        Write-Error "Informe -Path <imagem> ou -Servidor"
+        exit 2
+    }
+    if (-not (Test-Path -LiteralPath $Path)) {
+        Write-Error "Arquivo nao encontrado: $Path"
+        exit 2
+    }
+    $Path = (Resolve-Path -LiteralPath $Path).Path
 }
 
-$Path = (Resolve-Path -LiteralPath $Path).Path
-
 Add-Type -AssemblyName System.Runtime.WindowsRuntime | Out-Null
 
 $null = [Windows.Storage.StorageFile, Windows.Storage, ContentType = WindowsRuntime]
@@ -22,6 +29,8 @@ $null = [Windows.Media.Ocr.OcrEngine, Windows.Foundation, ContentType = WindowsR
 $null = [Windows.Graphics.Imaging.BitmapDecoder, Windows.Foundation, ContentType = WindowsRuntime]
 $null = [Windows.Graphics.Imaging.SoftwareBitmap, Windows.Foundation, ContentType = WindowsRuntime]
 $null = [Windows.Storage.Streams.RandomAccessStream, Windows.Storage.Streams, ContentType = WindowsRuntime]
+$null = [Windows.Storage.Streams.InMemoryRandomAccessStream, Windows.Storage.Streams, ContentType = WindowsRuntime]
+$null = [Windows.Storage.Streams.DataWriter, Windows.Storage.Streams, ContentType = WindowsRuntime]
 $null = [Windows.Globalization.Language, Windows.Foundation, ContentType = WindowsRuntime]
 
 $getAwaiter = [WindowsRuntimeSystemExtensions].GetMember('GetAwaiter').Where({
@@ -57,12 +66,44 @@ if (-not $engine) {
     exit 3
 }
 
+function Ler-Linhas {
+    param($Stream)
+    $decoder = Await-WinRT ([Windows.Graphics.Imaging.BitmapDecoder]::CreateAsync($Stream)) ([Windows.Graphics.Imaging.BitmapDecoder])
+    $bitmap = Await-WinRT ($decoder.GetSoftwareBitmapAsync()) ([Windows.Graphics.Imaging.SoftwareBitmap])
+    $result = Await-WinRT ($engine.RecognizeAsync($bitmap)) ([Windows.Media.Ocr.OcrResult])
+    foreach ($line in $result.Lines) {
+        $line.Text
+    }
+}
+
+if ($Servidor) {
+    # Motor carregado uma vez; erro de uma imagem vira <<ERRO>> e o servidor continua
+    [Console]::OutputEncoding = [Text.Encoding]::UTF8
+    [Console]::Out.WriteLine('<<PRONTO>>')
+    [Console]::Out.Flush()
+    while ($null -ne ($linha = [Console]::In.ReadLine())) {
+        try {
+            $stream = [Windows.Storage.Streams.InMemoryRandomAccessStream]::new()
+            $writer = [Windows.Storage.Streams.DataWriter]::new($stream)
+            $writer.WriteBytes([Convert]::FromBase64String($linha))
+            $null = Await-WinRT ($writer.StoreAsync()) ([UInt32])
+            $null = $writer.DetachStream()
+            $stream.Seek(0)
+            foreach ($texto in (Ler-Linhas $stream)) {
+                [Console]::Out.WriteLine($texto)
+            }
+        } catch {
+            [Console]::Out.WriteLine("<<ERRO>> $($_.Exception.Message)")
+        }
+        [Console]::Out.WriteLine('<<FIM>>')
+        [Console]::Out.Flush()
+    }
+    exit 0
+}
+
 $file = Await-WinRT ([Windows.Storage.StorageFile]::GetFileFromPathAsync($Path)) ([Windows.Storage.StorageFile])
 $stream = Await-WinRT ($file.OpenAsync([Windows.Storage.FileAccessMode]::Read)) ([Windows.Storage.Streams.IRandomAccessStream])
-$decoder = Await-WinRT ([Windows.Graphics.Imaging.BitmapDecoder]::CreateAsync($stream)) ([Windows.Graphics.Imaging.BitmapDecoder])
-$bitmap = Await-WinRT ($decoder.GetSoftwareBitmapAsync()) ([Windows.Graphics.Imaging.SoftwareBitmap])
-$result = Await-WinRT ($engine.RecognizeAsync($bitmap)) ([Windows.Media.Ocr.OcrResult])
 
-foreach ($line in $result.Lines) {
-    Write-Output $line.Text
+foreach ($line in (Ler-Linhas $stream)) {
+    Write-Output $line
 }
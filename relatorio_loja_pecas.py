@@ -17,7 +17,7 @@ Período: por padrão 2024-01-01 a 2026-05-31. Pode passar manual:
 import os
 import sys
 
-import firebirdsql
+from seculos_db import get_firebird_connection
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -39,20 +39,6 @@ PERIODO_INI_PADRAO = "2024-01-01"
 PERIODO_FIM_PADRAO = "2026-05-31"
 
 
-def get_firebird_connection():
-    return firebirdsql.connect(
-        host=os.getenv("HOST"),
-        port=int(os.getenv("PORT", "3050")),
-        database=os.getenv("DB_PATH"),
-        user=os.getenv("APP_USER"),
-        password=os.getenv("PASSWORD"),
-        role=os.getenv("ROLE"),
-        auth_plugin_name=os.getenv("AUTH"),
-        wire_crypt=False,
-        charset="ISO8859_1",
-    )
-
-
 def buscar_pecas_loja(conn, ini, fim):
     """
     Itens (peças) de pedidos de venda da loja no período.
@@ -23,7 +23,7 @@ import calendar
 import unicodedata
 from datetime import datetime
 
-import firebirdsql
+from seculos_db import get_firebird_connection
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -93,20 +93,6 @@ def classificar_peca(descricao: str):
     return None
 
 
-def get_firebird_connection():
-    return firebirdsql.connect(
-        host=os.getenv("HOST"),
-        port=int(os.getenv("PORT", "3050")),
-        database=os.getenv("DB_PATH"),
-        user=os.getenv("APP_USER"),
-        password=os.getenv("PASSWORD"),
-        role=os.getenv("ROLE"),
-        auth_plugin_name=os.getenv("AUTH"),
-        wire_crypt=False,
-        charset="ISO8859_1",
-    )
-
-
 def periodo_mes_passado():
     """(primeiro_dia, ultimo_dia) do mês passado em strings YYYY-MM-DD."""
     hoje = datetime.today()
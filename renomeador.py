@@ -1,38 +1,883 @@
 import os
 import re
+import io
 import json
+import time
+import base64
+import queue
+import sqlite3
+import hashlib
 import shutil
+import threading
 import subprocess
 import tempfile
+import argparse
+import multiprocessing
 import pdfplumber
-import tkinter as as_tk
-from tkinter import filedialog, messagebox
-from tkinter.scrolledtext import ScrolledText
 from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import tkinter as as_tk
+    from tkinter import filedialog, messagebox
+    from tkinter.scrolledtext import ScrolledText
+except ImportError:  # linha de comando / modo vigia em máquina sem Tk
+    as_tk = None
+
+ARQUIVO_REGRAS = os.getenv("RENOMEADOR_REGRAS") or \
+    "\\\\Servidor\\Users\\Pichau\\Documents\\Drive Comagro\\regras_renomeador.json"
+
+# Extração/OCR em paralelo: deixa um núcleo para a janela e para os renames
+MAX_PROCESSOS = max(1, (os.cpu_count() or 2) - 1)
+# Arquivos em voo por processo: limita a memória de textos prontos esperando a vez do rename
+EM_VOO_POR_PROCESSO = 2
+
+# Suba quando mudar a extração de texto/OCR: invalida o cache de textos
+VERSAO_EXTRATOR = "1"
+# Cache local (não no Servidor: SQLite em compartilhamento de rede não é confiável)
+ARQUIVO_CACHE_TEXTOS = os.getenv("RENOMEADOR_CACHE") or os.path.join(
+    os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "renomeador", "cache_textos.sqlite")
+LIMITE_CACHE_MB = 64
+
+# ITAÚ → ITAU. Montada uma vez: a normalização roda para cada termo e cada linha de OCR.
+_MAPA_SEM_ACENTO = str.maketrans({
+    "Á": "A", "À": "A", "Ã": "A", "Â": "A",
+    "É": "E", "Ê": "E",
+    "Í": "I",
+    "Ó": "O", "Õ": "O", "Ô": "O",
+    "Ú": "U", "Ü": "U",
+    "Ç": "C",
+})
+
+# Fronteira alfanumérica (não \b): underscore/hífen contam como separador, para casar
+# SECULOS dentro de MENSALIDADE_SISTEMA_SECULOS sem o falso positivo DAS⊂TODAS
+_ANTES = r'(?<![A-Z0-9])'
+_DEPOIS = r'(?![A-Z0-9])'
+
+
+# --- OCR (Inter imprime valores como curvas; pdfplumber só vê os rótulos) ---
+
+# Script PowerShell embutido (mesmo conteúdo do ocr_windows.ps1, que fica para uso manual).
+# Com -Servidor fica aberto lendo uma imagem PNG em base64 por linha do stdin, para o
+# motor OCR do Windows ser carregado uma vez só por processo.
+_OCR_WINDOWS_PS1 = r'''
+param([string]$Path, [switch]$Servidor)
+$ErrorActionPreference = 'Stop'
+Add-Type -AssemblyName System.Runtime.WindowsRuntime | Out-Null
+$null = [Windows.Storage.StorageFile,Windows.Storage,ContentType=WindowsRuntime]
+$null = [Windows.Media.Ocr.OcrEngine,Windows.Foundation,ContentType=WindowsRuntime]
+$null = [Windows.Graphics.Imaging.BitmapDecoder,Windows.Foundation,ContentType=WindowsRuntime]
+$null = [Windows.Graphics.Imaging.SoftwareBitmap,Windows.Foundation,ContentType=WindowsRuntime]
+$null = [Windows.Storage.Streams.RandomAccessStream,Windows.Storage.Streams,ContentType=WindowsRuntime]
+$null = [Windows.Storage.Streams.InMemoryRandomAccessStream,Windows.Storage.Streams,ContentType=WindowsRuntime]
+$null = [Windows.Storage.Streams.DataWriter,Windows.Storage.Streams,ContentType=WindowsRuntime]
+$null = [Windows.Globalization.Language,Windows.Foundation,ContentType=WindowsRuntime]
+$getAwaiter = [WindowsRuntimeSystemExtensions].GetMember('GetAwaiter').Where({
+    $PSItem.GetParameters()[0].ParameterType.Name -eq 'IAsyncOperation`1'
+}, 'First')[0]
+function Await-WinRT($AsyncTask, [Type]$ResultType) {
+    $getAwaiter.MakeGenericMethod($ResultType).Invoke($null, @($AsyncTask)).GetResult()
+}
+$engine = $null
+$tentativas = @('pt-BR','pt-PT','en-US','en-GB')
+foreach ($tag in $tentativas) {
+    try {
+        $lang = [Windows.Globalization.Language]::new($tag)
+        $engine = [Windows.Media.Ocr.OcrEngine]::TryCreateFromLanguage($lang)
+        if ($engine) { break }
+    } catch {}
+}
+if (-not $engine) {
+    try { $engine = [Windows.Media.Ocr.OcrEngine]::TryCreateFromUserProfileLanguages() } catch {}
+}
+if (-not $engine) {
+    $disponiveis = @()
+    try {
+        foreach ($l in [Windows.Media.Ocr.OcrEngine]::AvailableRecognizerLanguages) {
+            $disponiveis += $l.LanguageTag
+        }
+    } catch {}
+    $lista = if ($disponiveis.Count) { $disponiveis -join ', ' } else { '(nenhum)' }
+    [Console]::Error.WriteLine("OCR_ENGINE_MISSING langs=$lista")
+    Write-Error "Nenhum motor OCR do Windows disponivel. Idiomas OCR instalados: $lista. Instale 'OCR do idioma' em Configuracoes > Hora e idioma > Idioma, ou: pip install rapidocr-onnxruntime"
+    exit 3
+}
+function Ler-Linhas($stream) {
+    $decoder = Await-WinRT ([Windows.Graphics.Imaging.BitmapDecoder]::CreateAsync($stream)) ([Windows.Graphics.Imaging.BitmapDecoder])
+    $bitmap = Await-WinRT ($decoder.GetSoftwareBitmapAsync()) ([Windows.Graphics.Imaging.SoftwareBitmap])
+    $result = Await-WinRT ($engine.RecognizeAsync($bitmap)) ([Windows.Media.Ocr.OcrResult])
+    foreach ($line in $result.Lines) { $line.Text }
+}
+if ($Servidor) {
+    # Cada resposta termina com <<FIM>>; erro de uma imagem não derruba o servidor
+    [Console]::OutputEncoding = [Text.Encoding]::UTF8
+    [Console]::Out.WriteLine('<<PRONTO>>')
+    [Console]::Out.Flush()
+    while ($null -ne ($linha = [Console]::In.ReadLine())) {
+        try {
+            $stream = [Windows.Storage.Streams.InMemoryRandomAccessStream]::new()
+            $writer = [Windows.Storage.Streams.DataWriter]::new($stream)
+            $writer.WriteBytes([Convert]::FromBase64String($linha))
+            $null = Await-WinRT ($writer.StoreAsync()) ([UInt32])
+            $null = $writer.DetachStream()
+            $stream.Seek(0)
+            foreach ($texto in (Ler-Linhas $stream)) { [Console]::Out.WriteLine($texto) }
+        } catch {
+            [Console]::Out.WriteLine("<<ERRO>> $($_.Exception.Message)")
+        }
+        [Console]::Out.WriteLine('<<FIM>>')
+        [Console]::Out.Flush()
+    }
+    exit 0
+}
+if (-not $Path) { Write-Error "Informe -Path <imagem> ou -Servidor"; exit 2 }
+if (-not (Test-Path -LiteralPath $Path)) { Write-Error "Arquivo nao encontrado: $Path"; exit 2 }
+$Path = (Resolve-Path -LiteralPath $Path).Path
+$file = Await-WinRT ([Windows.Storage.StorageFile]::GetFileFromPathAsync($Path)) ([Windows.Storage.StorageFile])
+$stream = Await-WinRT ($file.OpenAsync([Windows.Storage.FileAccessMode]::Read)) ([Windows.Storage.Streams.IRandomAccessStream])
+Ler-Linhas $stream
+'''
 
 
-class RenomeadorComprovantes:
-    def __init__(self):
-        self.root = as_tk.Tk()
-        self.root.title("Renomeador de Comprovantes")
-        self.root.geometry("600x450")
+class MotorOCRWindows:
+    """OCR nativo do Windows 10/11 (Windows.Media.Ocr) num PowerShell 5.1 que fica aberto.
 
-        self.config = self.carregar_configuracao()
+    A 1ª imagem sobe o PowerShell com o script em modo servidor; as seguintes vão
+    pelo stdin do mesmo processo (PNG em base64), sem arquivo temporário por página.
+    """
+    nome = "Windows"
+    TIMEOUT = 90  # segundos por página
+
+    def __init__(self, log):
+        self.log = log
+        self._proc = None
+        self._saida = None
+        self._ps1 = None
+        self._indisponivel = False
+
+    def disponivel(self):
+        return os.name == "nt" and not self._indisponivel
+
+    def versao(self):
+        return "windows ocr" if os.name == "nt" else None
+
+    def _powershell_51(self):
+        """Sempre usa Windows PowerShell 5.1 (WinRT OCR quebra no PowerShell 7)."""
+        candidatos = [
+            os.path.expandvars(r"%SystemRoot%\System32\WindowsPowerShell\v1.0\powershell.exe"),
+            r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe",
+        ]
+        for c in candidatos:
+            if c and os.path.exists(c):
+                return c
+        # Último recurso: o que estiver no PATH (pode ser PS7 e falhar)
+        return shutil.which("powershell") or shutil.which("powershell.exe")
+
+    def _iniciar(self):
+        powershell = self._powershell_51()
+        if not powershell:
+            self.log("  OCR Windows: powershell.exe nao encontrado")
+            self._indisponivel = True
+            return False
+        # Script num temp único do processo (apagado no fechar): pool com vários processos não colide
+        fd, self._ps1 = tempfile.mkstemp(prefix="renomeador_ocr_", suffix=".ps1")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(_OCR_WINDOWS_PS1)
+        self._proc = subprocess.Popen(
+            [powershell, "-NoProfile", "-ExecutionPolicy", "Bypass", "-File", self._ps1, "-Servidor"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace",
+            creationflags=subprocess.CREATE_NO_WINDOW,
+        )
+        # Leitura numa thread para poder aplicar timeout por página
+        self._saida = queue.Queue()
+
+        def ler(stdout, fila):
+            for linha in stdout:
+                fila.put(linha.rstrip("\r\n"))
+            fila.put(None)
+
+        threading.Thread(target=ler, args=(self._proc.stdout, self._saida), daemon=True).start()
+        if self._proxima_linha(self.TIMEOUT) == "<<PRONTO>>":
+            return True
+
+        err = ""
+        try:
+            self._proc.wait(timeout=5)
+            err = (self._proc.stderr.read() or "").strip()
+        except Exception:
+            pass
+        if "OCR_ENGINE_MISSING" in err or "Nenhum motor OCR" in err:
+            self.log(
+                "  OCR Windows: pacote de idioma OCR nao instalado no Windows. "
+                "Instale pt-BR/en-US em Configuracoes > Idioma, "
+                "OU rode: pip install rapidocr-onnxruntime"
+            )
+        elif err:
+            self.log(f"  OCR Windows stderr: {err[:400]}")
+        else:
+            self.log(f"  OCR Windows exit={self._proc.returncode} (sem texto)")
+        self.fechar()
+        self._indisponivel = True
+        return False
+
+    def _proxima_linha(self, timeout):
+        try:
+            return self._saida.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def reconhecer(self, imagens):
+        if self._proc is None and not self._iniciar():
+            return [""] * len(imagens)
+        textos = []
+        for im in imagens:
+            buf = io.BytesIO()
+            im.save(buf, format="PNG")
+            try:
+                self._proc.stdin.write(base64.b64encode(buf.getvalue()).decode("ascii") + "\n")
+                self._proc.stdin.flush()
+            except OSError as e:
+                self.log(f"  OCR Windows falhou: {e}")
+                self.fechar()
+                return textos + [""] * (len(imagens) - len(textos))
+            linhas = []
+            while True:
+                linha = self._proxima_linha(self.TIMEOUT)
+                if linha is None:
+                    # Travou ou morreu: derruba e deixa a próxima página subir outro
+                    self.log("  OCR Windows: sem resposta, reiniciando o PowerShell")
+                    self.fechar()
+                    return textos + [""] * (len(imagens) - len(textos))
+                if linha == "<<FIM>>":
+                    break
+                if linha.startswith("<<ERRO>>"):
+                    self.log(f"  OCR Windows falhou: {linha[8:].strip()[:400]}")
+                    continue
+                linhas.append(linha)
+            textos.append("\n".join(linhas).strip())
+        return textos
+
+    def fechar(self):
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=5)
+            except Exception:
+                self._proc.kill()
+            self._proc = None
+        if self._ps1:
+            try:
+                os.unlink(self._ps1)
+            except Exception:
+                pass
+            self._ps1 = None
+
+
+class MotorRapidOCR:
+    """Python puro (pip install rapidocr-onnxruntime) — nao depende do Windows.
+
+    O modelo é carregado na 1ª página e fica na memória do processo.
+    """
+    nome = "RapidOCR"
+
+    def __init__(self, log):
+        self.log = log
+        self._engine = None
+
+    def disponivel(self):
+        try:
+            import rapidocr_onnxruntime  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def versao(self):
+        try:
+            from importlib.metadata import version
+            return f"rapidocr {version('rapidocr-onnxruntime')}"
+        except Exception:
+            return None
+
+    def reconhecer(self, imagens):
+        import numpy as np
+        from rapidocr_onnxruntime import RapidOCR
+
+        if self._engine is None:
+            self.log("  OCR RapidOCR: carregando modelo (1a vez pode demorar)...")
+            self._engine = RapidOCR()
+        textos = []
+        for im in imagens:
+            try:
+                # Array em memória (BGR, como o cv2 do RapidOCR espera) em vez de PNG no disco
+                bgr = np.ascontiguousarray(np.asarray(im.convert("RGB"))[:, :, ::-1])
+                result, _ = self._engine(bgr)
+                # Cada item: [box, texto, confianca]
+                textos.append("\n".join(item[1] for item in (result or []) if item and len(item) > 1).strip())
+            except Exception as e:
+                self.log(f"  OCR RapidOCR falhou: {e}")
+                textos.append("")
+        return textos
+
+    def fechar(self):
+        self._engine = None
+
+
+class MotorTesseract:
+    """Tesseract: pela API em processo (pip install tesserocr) ou pelo executável no PATH.
+
+    Sem tesserocr, o lote inteiro vai num TIFF multipágina pelo stdin do tesseract
+    (um processo por lote, não por página) e o texto volta separado por página.
+    """
+    nome = "tesseract"
+    IDIOMAS = "por+eng"
+
+    def __init__(self, log):
+        self.log = log
+        self._api = None
+        self._sem_api = False
+
+    def _abrir_api(self):
+        if self._api is None and not self._sem_api:
+            try:
+                import tesserocr
+                self._api = tesserocr.PyTessBaseAPI(lang=self.IDIOMAS)
+            except Exception:
+                self._sem_api = True
+        return self._api
+
+    def disponivel(self):
+        return self._abrir_api() is not None or bool(shutil.which("tesseract"))
+
+    def versao(self):
+        if not shutil.which("tesseract"):
+            try:
+                import tesserocr
+                return f"tesserocr {tesserocr.tesseract_version().splitlines()[0]}"
+            except Exception:
+                return None
+        try:
+            r = subprocess.run(["tesseract", "--version"], capture_output=True, text=True, timeout=10)
+            return (r.stdout or r.stderr or "tesseract").splitlines()[0].strip()
+        except Exception:
+            return "tesseract"
+
+    def reconhecer(self, imagens):
+        api = self._abrir_api()
+        if api is not None:
+            textos = []
+            for im in imagens:
+                try:
+                    api.SetImage(im)
+                    textos.append((api.GetUTF8Text() or "").strip())
+                except Exception as e:
+                    self.log(f"  OCR tesseract falhou: {e}")
+                    textos.append("")
+            return textos
+
+        buf = io.BytesIO()
+        paginas = [im.convert("RGB") for im in imagens]
+        paginas[0].save(buf, format="TIFF", save_all=True, append_images=paginas[1:], compression="tiff_lzw")
+        try:
+            r = subprocess.run(
+                ["tesseract", "stdin", "stdout", "-l", self.IDIOMAS],
+                input=buf.getvalue(), capture_output=True, timeout=60 * len(imagens)
+            )
+        except Exception as e:
+            self.log(f"  OCR tesseract falhou: {e}")
+            return [""] * len(imagens)
+        # O tesseract separa as páginas com form feed
+        textos = [t.strip() for t in r.stdout.decode("utf-8", errors="replace").split("\f")]
+        return (textos + [""] * len(imagens))[:len(imagens)]
+
+    def fechar(self):
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+
+
+class MotorMacVision:
+    """OCR via Vision (macOS), se o helper estiver disponível.
+
+    O helper só lê arquivo: cada página vai num temp com nome único, apagado em seguida.
+    """
+    nome = "Mac Vision"
+
+    def __init__(self, log):
+        self.log = log
         self._ocr_bin = None  # cache do caminho do helper Vision (macOS)
 
-        # Interface Gráfica
-        frame = as_tk.Frame(self.root)
-        frame.pack(pady=20)
+    def _garantir_helper(self):
+        """Compila (se preciso) e devolve o binário ocr_vision_helper no macOS."""
+        if self._ocr_bin and os.path.exists(self._ocr_bin):
+            return self._ocr_bin
 
-        btn_selecionar = as_tk.Button(frame, text="Selecionar Arquivos PDF",
-                                      command=self.executar, font=("Arial", 12), bg="#dddddd")
-        btn_selecionar.pack()
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        bin_path = os.path.join(script_dir, "ocr_vision_helper")
+        src_path = os.path.join(script_dir, "ocr_vision.swift")
 
-        self.log_text = ScrolledText(self.root, height=20, width=70, state='disabled')
-        self.log_text.pack(pady=10, padx=10)
+        if os.path.exists(bin_path) and os.access(bin_path, os.X_OK):
+            self._ocr_bin = bin_path
+            return bin_path
+
+        swiftc = shutil.which("swiftc")
+        if not swiftc or not os.path.exists(src_path):
+            return None
+        try:
+            subprocess.run(
+                [swiftc, src_path, "-o", bin_path],
+                check=True, capture_output=True, timeout=120
+            )
+            self._ocr_bin = bin_path
+            return bin_path
+        except Exception:
+            return None
+
+    def disponivel(self):
+        return os.name != "nt" and self._garantir_helper() is not None
+
+    def versao(self):
+        return "mac vision" if self.disponivel() else None
+
+    def reconhecer(self, imagens):
+        helper = self._garantir_helper()
+        textos = []
+        for im in imagens:
+            fd, caminho_png = tempfile.mkstemp(prefix="renomeador_ocr_", suffix=".png")
+            os.close(fd)
+            try:
+                im.save(caminho_png)
+                r = subprocess.run(
+                    [helper, caminho_png],
+                    capture_output=True, text=True, timeout=60
+                )
+                textos.append((r.stdout or "").strip())
+            except Exception as e:
+                self.log(f"  OCR Mac Vision falhou: {e}")
+                textos.append("")
+            finally:
+                try:
+                    os.unlink(caminho_png)
+                except Exception:
+                    pass
+        return textos
+
+    def fechar(self):
+        pass
+
+
+class ServicoOCR:
+    """Motores OCR de um processo, carregados na 1ª página e mantidos abertos.
+
+    reconhecer(imagens) recebe imagens PIL em memória (uma ou várias páginas) e
+    tenta os motores na ordem Windows → RapidOCR → Mac Vision → tesseract; uma
+    página só passa para o próximo motor se o anterior devolveu pouco texto.
+    `latencias` acumula, por motor, [segundos, páginas]; tomar_latencias() devolve
+    e zera (o pool de processos manda junto com cada resultado).
+    """
+    MOTORES = (MotorOCRWindows, MotorRapidOCR, MotorMacVision, MotorTesseract)
+    MIN_CARACTERES = 40
+
+    def __init__(self, log=None, motores=None):
+        self.log = log or print
+        # Os motores logam pelo serviço (o ExtratorTexto troca o log durante cada arquivo)
+        self.motores = [m(lambda mensagem: self.log(mensagem)) for m in (motores or self.MOTORES)]
+        self.latencias = {}
+
+    def versoes(self):
+        return [v for v in (m.versao() for m in self.motores) if v]
+
+    def reconhecer(self, imagens):
+        imagens = list(imagens)
+        textos = [""] * len(imagens)
+        faltando = list(range(len(imagens)))
+        for motor in self.motores:
+            if not faltando:
+                break
+            if not motor.disponivel():
+                continue
+            inicio = time.perf_counter()
+            saida = motor.reconhecer([imagens[i] for i in faltando])
+            segundos = time.perf_counter() - inicio
+            total = self.latencias.setdefault(motor.nome, [0.0, 0])
+            total[0] += segundos
+            total[1] += len(faltando)
+            for i, texto in zip(faltando, saida):
+                if texto and len(texto) > self.MIN_CARACTERES:
+                    textos[i] = texto
+                    self.log(f"  OCR ok via {motor.nome} ({len(texto)} chars, "
+                             f"{segundos / len(faltando):.2f}s/pagina)")
+            faltando = [i for i in faltando if not textos[i]]
+        return textos
+
+    def tomar_latencias(self):
+        latencias, self.latencias = self.latencias, {}
+        return latencias
+
+    def fechar(self):
+        for motor in self.motores:
+            try:
+                motor.fechar()
+            except Exception:
+                pass
+
+
+class ExtratorTexto:
+    """Etapa pesada do renomeador: texto nativo do PDF e, no Inter "oco", OCR da 1ª página.
+
+    Não depende do Tk, para poder rodar dentro do pool de processos. As mensagens
+    vão para `log` (no processo filho, uma lista que volta junto com o resultado).
+    """
+
+    def __init__(self, log=None):
+        self.log = log or print
+        self.ocr = ServicoOCR(log=lambda mensagem: self.log(mensagem))
+
+    def extrair_texto_pdf(self, caminho_arq):
+        """Extrai texto de todas as páginas; se for Inter 'oco', complementa com OCR."""
+        texto_nativo, texto_ocr, num_paginas = self.extrair_partes(caminho_arq)
+        return self.juntar_textos(texto_nativo, texto_ocr), num_paginas
+
+    def extrair_partes(self, caminho_arq):
+        """(texto nativo, texto do OCR ou "", número de páginas) — o que o cache de textos guarda."""
+        with pdfplumber.open(caminho_arq) as pdf:
+            num_paginas = len(pdf.pages)
+            texto_nativo = ""
+            for page in pdf.pages:
+                # Em PDFs imagem (Print To PDF), extract_text pode retornar None
+                page_text = page.extract_text() or ""
+                texto_nativo += page_text + "\n"
+
+        ocr = ""
+        if self._texto_precisa_ocr(texto_nativo):
+            self.log(f"  OCR necessario: {os.path.basename(caminho_arq)} (Inter sem texto util)")
+            ocr = self._ocr_primeira_pagina(caminho_arq)
+            if ocr:
+                tu = ocr.upper()
+                self.log(
+                    "  OCR anchors: "
+                    f"SECULOS={'SECULOS' in tu or 'SECU' in tu} "
+                    f"CAROLINE={'CAROLINE' in tu} "
+                    f"MENSALIDADE={'MENSALIDADE' in tu} "
+                    f"PGTO={'PGTO' in tu} "
+                    f"014809={'014809' in re.sub(r'[^0-9]', '', ocr)}"
+                )
+            else:
+                self.log(
+                    "  AVISO: OCR falhou — comprovante Inter pode sair sem data/descrição. "
+                    "No Windows: pip install rapidocr-onnxruntime"
+                )
+
+        return texto_nativo, ocr, num_paginas
+
+    def juntar_textos(self, texto_nativo, texto_ocr):
+        """Texto usado pelas regras: só o nativo, ou OCR + nativo quando houve OCR."""
+        if not texto_ocr:
+            return texto_nativo
+        # OCR traz valores (data, PGTO - …). O nativo às vezes já tem o nome
+        # do recebedor (ex: Luis Filipe / Viacao Novo Horizonte) — junta os dois.
+        # Remove o lixo vertical "Deixe seu comentário" (ues/exieD) do nativo.
+        nativo_limpo = re.sub(
+            r'(?im)^(oirátnemoc|ues|exied|deixe|seu|coment[aá]rio)\s*$',
+            '',
+            texto_nativo,
+        )
+        return texto_ocr + "\n" + nativo_limpo
+
+    def assinatura(self):
+        """Versão da extração + motores OCR disponíveis; entra na chave do cache de textos.
+
+        Instalar/atualizar um motor (ex: pip install rapidocr-onnxruntime) muda a
+        assinatura e os comprovantes são extraídos de novo.
+        """
+        partes = [f"extrator {VERSAO_EXTRATOR}", f"pdfplumber {getattr(pdfplumber, '__version__', '?')}"]
+        partes += self.ocr.versoes()
+        return " | ".join(partes)
+
+    def _texto_precisa_ocr(self, texto):
+        """Heurística: comprovante Inter sem valores extraíveis (só labels).
+
+        Cuidado: o pdfplumber lê 'Chave Pix' no nativo — isso NÃO significa que
+        o comprovante já tem texto útil. Exigir 'Pix enviado/recebido' ou 'R$'.
+        """
+        if "Internet Banking Inter" in texto or "contadigital.inter.co" in texto:
+            tem_pix_real = ("Pix enviado" in texto or "Pix recebido" in texto)
+            tem_valor = "R$" in texto
+            # Sem título real nem valor → valores estão em curva/outline
+            if not tem_pix_real and not tem_valor:
+                return True
+        return False
+
+    def _ocr_primeira_pagina(self, caminho_arq):
+        """Renderiza a 1ª página e roda OCR (Windows → RapidOCR → Mac → tesseract)."""
+        return self.ocr_paginas(caminho_arq, [0])[0]
+
+    def ocr_paginas(self, caminho_arq, paginas):
+        """OCR de várias páginas do PDF num lote só; um texto ("" se falhou) por página pedida."""
+        try:
+            imagens = []
+            with pdfplumber.open(caminho_arq) as pdf:
+                if not pdf.pages:
+                    return [""] * len(paginas)
+                for n in paginas:
+                    try:
+                        # Resolução um pouco maior ajuda o OCR nos laranjas do Inter
+                        imagens.append(pdf.pages[n].to_image(resolution=180).original)
+                    except Exception as e_img:
+                        self.log(
+                            f"  OCR: nao consegui renderizar a pagina ({e_img}). "
+                            f"Confirme: pip install pypdfium2"
+                        )
+                        return [""] * len(paginas)
+
+            textos = self.ocr.reconhecer(imagens)
+            if not all(textos) and not any(m.disponivel() for m in self.ocr.motores):
+                # Nenhum motor funcionou — mensagem acionável
+                self.log(
+                    "  OCR: nenhum motor disponivel. No Windows rode UM destes:\n"
+                    "    pip install rapidocr-onnxruntime\n"
+                    "  ou instale o pacote 'OCR' do idioma (pt-BR/en-US) em\n"
+                    "    Configuracoes > Hora e idioma > Idioma e regiao"
+                )
+            return textos
+        except Exception as e:
+            self.log(f"  OCR falhou: {e}")
+            return [""] * len(paginas)
+
+    def fechar(self):
+        self.ocr.fechar()
+
+
+class CacheTextos:
+    """Cache persistente (SQLite) do que o ExtratorTexto leu de cada comprovante.
+
+    A chave é o SHA-256 do conteúdo do PDF + a assinatura do extrator/motores OCR,
+    então renomear ou mover o arquivo não perde o cache, e rodar o lote de novo
+    depois de mexer no regras_renomeador.json só reaplica as regras. Guarda texto
+    nativo, texto do OCR e número de páginas. Passando de `limite_mb`, os menos
+    usados recentemente são apagados até sobrar 80% do limite.
+    """
+
+    def __init__(self, assinatura, arquivo=None, limite_mb=LIMITE_CACHE_MB):
+        self.assinatura = assinatura
+        self.arquivo = arquivo or ARQUIVO_CACHE_TEXTOS
+        self.limite = limite_mb * 1024 * 1024
+        self.acertos = 0
+        self.faltas = 0
+        os.makedirs(os.path.dirname(self.arquivo) or ".", exist_ok=True)
+        self.db = sqlite3.connect(self.arquivo)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS textos (
+                chave TEXT PRIMARY KEY,
+                nativo TEXT NOT NULL,
+                ocr TEXT NOT NULL,
+                paginas INTEGER NOT NULL,
+                tamanho INTEGER NOT NULL,
+                usado_em REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_textos_usado ON textos (usado_em)")
+        self.db.commit()
+
+    def fechar(self):
+        self.db.close()
+
+    def chave(self, caminho_arq):
+        h = hashlib.sha256()
+        with open(caminho_arq, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(bloco)
+        return h.hexdigest() + "|" + self.assinatura
+
+    def obter(self, chave):
+        """(nativo, ocr, paginas) ou None."""
+        row = self.db.execute("SELECT nativo, ocr, paginas FROM textos WHERE chave = ?", (chave,)).fetchone()
+        if row is None:
+            self.faltas += 1
+            return None
+        self.acertos += 1
+        self.db.execute("UPDATE textos SET usado_em = ? WHERE chave = ?", (time.time(), chave))
+        self.db.commit()
+        return row
+
+    def gravar(self, chave, nativo, ocr, paginas):
+        tamanho = len(nativo.encode("utf-8")) + len(ocr.encode("utf-8"))
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO textos (chave, nativo, ocr, paginas, tamanho, usado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, nativo, ocr, paginas, tamanho, time.time()))
+            total = self.db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM textos").fetchone()[0]
+            if total > self.limite:
+                self._despejar(total - int(self.limite * 0.8))
+
+    def _despejar(self, excesso):
+        """Apaga as entradas usadas há mais tempo até liberar `excesso` bytes."""
+        apagar = []
+        for chave, tamanho in self.db.execute("SELECT chave, tamanho FROM textos ORDER BY usado_em"):
+            if excesso <= 0:
+                break
+            apagar.append((chave,))
+            excesso -= tamanho
+        self.db.executemany("DELETE FROM textos WHERE chave = ?", apagar)
+
+
+def _tokens_termo(t):
+    """Pedaços de regex do termo (já em maiúsculas), um por caractere.
+
+    Sem espaço e com 5+ letras, aceita espaços no meio (OCR: "SECU LOS") — a
+    variante exata fica coberta porque \\s* também casa vazio.
+    """
+    if " " not in t and len(t) >= 5:
+        return [re.escape(t[0])] + [r'\s*' + re.escape(c) for c in t[1:]]
+    return [re.escape(c) for c in t]
+
+
+def _regex_trie(sequencias):
+    """Alternância fatorada pelos prefixos comuns ('DAS|DARF|DAE' → 'DA(?:S|RF|E)').
+
+    O re do Python testa as alternativas de uma em uma; fatorada, cada posição do
+    texto custa no máximo uma alternativa por caractere possível, não uma por termo.
+    Termo que é prefixo de outro já basta (o regex só marca onde vale conferir).
+    """
+    trie = {}
+    for seq in sequencias:
+        no = trie
+        for token in seq:
+            if None in no:
+                break
+            no = no.setdefault(token, {})
+        else:
+            no.clear()
+            no[None] = {}
+
+    def montar(no):
+        if None in no:
+            return ""
+        partes = [token + montar(filho) for token, filho in no.items()]
+        return partes[0] if len(partes) == 1 else "(?:" + "|".join(partes) + ")"
+
+    return montar(trie)
+
+
+class RegrasCompiladas:
+    """Termos do regras_renomeador.json compilados uma vez para o texto inteiro.
+
+    Cada termo vale se aparecer (com fronteira alfanumérica, ou com espaços no meio
+    para termos longos) no texto em maiúsculas ou, sem acento, no texto sem acento.
+    Um regex só (lookahead com a alternância de todos os termos fatorada em trie)
+    acha as posições onde algum termo pode começar; só nelas os termos com aquela
+    inicial são conferidos. O custo fica em uma passada pelo texto (duas: com e sem
+    acento), em vez de uma busca por termo de cada regra.
+    """
+
+    def __init__(self, regras):
+        self.regras = regras
+        formas = ({}, {})  # (maiúsculas, sem acento): termo normalizado -> [(regra, termo)]
+        for i, regra in enumerate(regras):
+            for j, termo in enumerate(regra.get("termos", [])):
+                for alvo, forma in zip(formas, (termo.upper(), termo.upper().translate(_MAPA_SEM_ACENTO))):
+                    if forma:
+                        alvo.setdefault(forma, []).append((i, j))
+        self._buscas = [self._compilar(alvo) for alvo in formas]
+
+    @staticmethod
+    def _compilar(formas):
+        por_inicial = {}
+        for forma, ids in formas.items():
+            padrao = re.compile(_ANTES + "".join(_tokens_termo(forma)) + _DEPOIS)
+            por_inicial.setdefault(forma[0], []).append((padrao, ids))
+        if not formas:
+            return None, por_inicial
+        inicio = re.compile(_ANTES + "(?=" + _regex_trie(_tokens_termo(f) for f in formas) + ")")
+        return inicio, por_inicial
+
+    def termos_presentes(self, texto_upper, texto_norm):
+        """Conjunto de (índice da regra, índice do termo) que aparecem no texto."""
+        presentes = set()
+        for (inicio, por_inicial), texto in zip(self._buscas, (texto_upper, texto_norm)):
+            if inicio is None:
+                continue
+            for m in inicio.finditer(texto):
+                pos = m.start()
+                for padrao, ids in por_inicial.get(texto[pos], ()):
+                    if padrao.match(texto, pos):
+                        presentes.update(ids)
+        return presentes
+
+    def termo_casado(self, i, presentes):
+        """Primeiro termo da regra i (na ordem do JSON) presente no texto, em maiúsculas; ou None."""
+        for j, termo in enumerate(self.regras[i].get("termos", [])):
+            if (i, j) in presentes:
+                return termo.upper()
+        return None
+
+
+_extrator_processo = None
+
+
+def _iniciar_processo():
+    """Initializer do pool: um ExtratorTexto por processo (motores OCR carregados uma vez só)."""
+    global _extrator_processo
+    _extrator_processo = ExtratorTexto()
+
+
+def _extrair_capturando(extrator, caminho_arq):
+    """((nativo, ocr, num_paginas) ou None, mensagens de log, erro ou None, latências do OCR)."""
+    mensagens = []
+    log_anterior = extrator.log
+    extrator.log = mensagens.append
+    try:
+        return extrator.extrair_partes(caminho_arq), mensagens, None, extrator.ocr.tomar_latencias()
+    except Exception as e:
+        return None, mensagens, str(e), extrator.ocr.tomar_latencias()
+    finally:
+        extrator.log = log_anterior
+
+
+def extrair_em_processo(caminho_arq):
+    """Roda no pool; as mensagens de log voltam junto para saírem na ordem do lote."""
+    return _extrair_capturando(_extrator_processo, caminho_arq)
+
+
+class MotorRenomeador:
+    """Classificação e renomeação dos comprovantes, sem interface.
+
+    Usado pela janela (RenomeadorComprovantes), pela linha de comando e pelo modo
+    vigia. As mensagens vão para log(), que aqui imprime no terminal.
+    Sem a janela o JSON de regras é obrigatório: se faltar ou não abrir, o motor não
+    sobe (senão todo comprovante sairia como PGTO sem ninguém ver o aviso).
+    """
+
+    REGRAS_OBRIGATORIAS = True
+
+    def __init__(self, arquivo_regras=None):
+        self.arquivo_regras = arquivo_regras or ARQUIVO_REGRAS
+        self.config = self.carregar_configuracao()
+        self.extrator = ExtratorTexto(log=self.log)
+        # Pool de extração/OCR mantido entre lotes (modo vigia/janela): motores OCR ficam carregados
+        self._pool = None
+        # Encerramento (sem volta): o lote em andamento para no próximo arquivo e nenhum pool novo é aberto
+        self._parar = threading.Event()
+
+    def parar(self):
+        self._parar.set()
+
+    def fechar(self, esperar=True):
+        """Libera o pool e os motores OCR. Só depois que nenhum lote estiver rodando.
+
+        esperar=False não segura quem chamou até os processos terminarem o arquivo atual.
+        """
+        self._parar.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=esperar, cancel_futures=True)
+            self._pool = None
+        self.extrator.fechar()
 
     def carregar_configuracao(self):
-        arquivo_json = "\\\\Servidor\\Users\\Pichau\\Documents\\Drive Comagro\\regras_renomeador.json"
+        arquivo_json = self.arquivo_regras
         config_padrao = {
             "regras": [],
             "recorrentes": [],
@@ -41,6 +886,9 @@ class RenomeadorComprovantes:
         }
 
         if not os.path.exists(arquivo_json):
+            if self.REGRAS_OBRIGATORIAS:
+                raise FileNotFoundError(f"JSON de regras nao encontrado: {arquivo_json} "
+                                        "(passe --regras ou defina RENOMEADOR_REGRAS)")
             try:
                 with open(arquivo_json, 'w', encoding='utf-8') as f:
                     json.dump(config_padrao, f, indent=4, ensure_ascii=False)
@@ -54,22 +902,16 @@ class RenomeadorComprovantes:
             config["_caminho_carregado"] = arquivo_json
             return config
         except Exception as e:
-            messagebox.showerror("Erro Config", f"Erro ao ler JSON: {e}")
+            if self.REGRAS_OBRIGATORIAS:
+                raise ValueError(f"Erro ao ler JSON de regras {arquivo_json}: {e}") from e
+            self._erro_config(f"Erro ao ler JSON: {e}")
             return config_padrao
 
-    def log(self, mensagem):
-        self.log_text.config(state='normal')
-        self.log_text.insert(as_tk.END, mensagem + "\n")
-        self.log_text.see(as_tk.END)
-        self.log_text.config(state='disabled')
-        self.root.update()
+    def _erro_config(self, mensagem):
+        self.log(f"Erro Config: {mensagem}")
 
-    def selecionar_arquivos(self):
-        arquivos = filedialog.askopenfilenames(
-            title="Selecione os Comprovantes PDF",
-            filetypes=[("Arquivos PDF", "*.pdf")]
-        )
-        return arquivos
+    def log(self, mensagem):
+        print(mensagem, flush=True)
 
     def limpar_texto(self, texto):
         """Remove caracteres ilegais para nome de arquivo"""
@@ -320,403 +1162,95 @@ class RenomeadorComprovantes:
         if grupo in regras_data:
             for regra in regras_data[grupo]:
                 if regra["inicio"] <= dia <= regra["fim"]:
-                    return regra["descricao"]
-        return None
-
-    def _remover_rodape_legal(self, texto):
-        """Remove rodapés legais padrão dos comprovantes para não contaminar regras.
-
-        Exemplo concreto: o Itaú coloca "em dias úteis, das 9h às 18h" no rodapé,
-        e o termo "das" estava sendo confundido com a sigla DAS (impostos).
-
-        IMPORTANTE (OCR Windows do Inter): os rótulos "Ouvidoria:" / "Fale com a gente"
-        aparecem CEDO no texto (coluna de labels), antes dos valores. Cortar na
-        primeira ocorrência jogava fora Caroline/SECULOS/descrição. Por isso só
-        cortamos se o marcador estiver na metade final do documento.
-        """
-        marcadores_corte = [
-            "Em caso de dúvidas",  # Itaú
-            "Em caso de duvidas",
-            "SAC 0800",
-            "Ouvidoria:",
-            "Fale com a gente",  # Inter
-        ]
-        n = len(texto)
-        if n == 0:
-            return texto
-        # Só aceita corte a partir da metade do texto (rodapé de verdade)
-        limite_min = n // 2
-        idx_corte = n
-        for marcador in marcadores_corte:
-            # Última ocorrência: no Inter OCR os labels repetem e o rodapé real é o último
-            idx = texto.rfind(marcador)
-            if idx != -1 and idx >= limite_min and idx < idx_corte:
-                idx_corte = idx
-        return texto[:idx_corte]
-
-    def _texto_sem_acento(self, texto):
-        """Normaliza acentos para comparações (ITAÚ → ITAU)."""
-        mapa = str.maketrans({
-            "Á": "A", "À": "A", "Ã": "A", "Â": "A",
-            "É": "E", "Ê": "E",
-            "Í": "I",
-            "Ó": "O", "Õ": "O", "Ô": "O",
-            "Ú": "U", "Ü": "U",
-            "Ç": "C",
-        })
-        return texto.upper().translate(mapa)
-
-    def _termo_presente(self, termo, texto_upper):
-        """Verifica se o termo aparece no texto sem falso positivo tipo DAS⊂TODAS.
-
-        Usa fronteira alfanumérica (não \\b), para casar SECULOS dentro de
-        MENSALIDADE_SISTEMA_SECULOS (underscore não quebra \\b do Python).
-        """
-        t = termo.upper()
-        if not t:
-            return False
-        # (?<![A-Z0-9]) termo (?![A-Z0-9]) — underscore/_hífen contam como separador
-        padrao = r'(?<![A-Z0-9])' + re.escape(t) + r'(?![A-Z0-9])'
-        if re.search(padrao, texto_upper) is not None:
-            return True
-        # Variante com espaços no meio (OCR: "SECU LOS")
-        if " " not in t and len(t) >= 5:
-            flex = r'(?<![A-Z0-9])' + r'\s*'.join(re.escape(c) for c in t) + r'(?![A-Z0-9])'
-            if re.search(flex, texto_upper) is not None:
-                return True
-        return False
-
-    def _aplicar_regras_json(self, texto_limpo, dados):
-        """Aplica as regras do JSON na descrição. Retorna True se casou alguma."""
-        texto_upper = texto_limpo.upper()
-        texto_norm = self._texto_sem_acento(texto_limpo)
-
-        for regra in self.config.get("regras", []):
-            grupo = regra.get("grupo", "")
-            termos = regra.get("termos", [])
-            termo_casado = None
-            for termo in termos:
-                if self._termo_presente(termo, texto_upper) or self._termo_presente(
-                    self._texto_sem_acento(termo), texto_norm
-                ):
-                    termo_casado = termo.upper()
-                    break
-            # Séculos: reforço quando o OCR come letras do nome/descrição
-            if not termo_casado and grupo.upper() == "SECULOS" and self._parece_seculos(texto_limpo):
-                termo_casado = "SECULOS"
-
-            if not termo_casado:
-                continue
-
-            # Desambiguação INTERNO: "INTERNO" sozinho precisa do banco de destino
-            if grupo.startswith("INTERNO_") and termo_casado == "INTERNO":
-                if "ITAU" in grupo.upper():
-                    if "ITAU" not in texto_norm:
-                        continue
-                elif "BNB" in grupo.upper():
-                    if "BNB" not in texto_norm:
-                        continue
-
-            desc_refinada = self.refinar_por_data(grupo, dados["data_pgto"])
-            if desc_refinada:
-                dados["descricao"] = termos[0] + "_" + desc_refinada
-            elif "AGUA" in grupo or "LUZ" in grupo:
-                dados["descricao"] = termos[0] + "_" + grupo
-            else:
-                dados["descricao"] = grupo
-
-            # Séculos: no nome do arquivo só entra SECULOS (sem o nome da beneficiária)
-            if grupo.upper() == "SECULOS":
-                dados["nome_recebedor"] = ""
-
-            # Preserva mês explícito no comprovante (ex: MENSALIDADE_SISTEMA_SECULOS 07/2026)
-            if not dados.get("data_ref"):
-                dados["data_ref"] = self.extrair_data_referencia(texto_limpo)
-            return True
-        return False
-
-    # --- OCR (Inter imprime valores como curvas; pdfplumber só vê os rótulos) ---
-
-    # Script PowerShell embutido: assim o OCR Windows funciona mesmo se o .ps1
-    # nao estiver na mesma pasta do renomeador.py (caso comum no Servidor).
-    _OCR_WINDOWS_PS1 = r'''
-param([Parameter(Mandatory=$true)][string]$Path)
-$ErrorActionPreference = 'Stop'
-if (-not (Test-Path -LiteralPath $Path)) { Write-Error "Arquivo nao encontrado: $Path"; exit 2 }
-$Path = (Resolve-Path -LiteralPath $Path).Path
-Add-Type -AssemblyName System.Runtime.WindowsRuntime | Out-Null
-$null = [Windows.Storage.StorageFile,Windows.Storage,ContentType=WindowsRuntime]
-$null = [Windows.Media.Ocr.OcrEngine,Windows.Foundation,ContentType=WindowsRuntime]
-$null = [Windows.Graphics.Imaging.BitmapDecoder,Windows.Foundation,ContentType=WindowsRuntime]
-$null = [Windows.Graphics.Imaging.SoftwareBitmap,Windows.Foundation,ContentType=WindowsRuntime]
-$null = [Windows.Storage.Streams.RandomAccessStream,Windows.Storage.Streams,ContentType=WindowsRuntime]
-$null = [Windows.Globalization.Language,Windows.Foundation,ContentType=WindowsRuntime]
-$getAwaiter = [WindowsRuntimeSystemExtensions].GetMember('GetAwaiter').Where({
-    $PSItem.GetParameters()[0].ParameterType.Name -eq 'IAsyncOperation`1'
-}, 'First')[0]
-function Await-WinRT($AsyncTask, [Type]$ResultType) {
-    $getAwaiter.MakeGenericMethod($ResultType).Invoke($null, @($AsyncTask)).GetResult()
-}
-$engine = $null
-$tentativas = @('pt-BR','pt-PT','en-US','en-GB')
-foreach ($tag in $tentativas) {
-    try {
-        $lang = [Windows.Globalization.Language]::new($tag)
-        $engine = [Windows.Media.Ocr.OcrEngine]::TryCreateFromLanguage($lang)
-        if ($engine) { break }
-    } catch {}
-}
-if (-not $engine) {
-    try { $engine = [Windows.Media.Ocr.OcrEngine]::TryCreateFromUserProfileLanguages() } catch {}
-}
-if (-not $engine) {
-    $disponiveis = @()
-    try {
-        foreach ($l in [Windows.Media.Ocr.OcrEngine]::AvailableRecognizerLanguages) {
-            $disponiveis += $l.LanguageTag
-        }
-    } catch {}
-    $lista = if ($disponiveis.Count) { $disponiveis -join ', ' } else { '(nenhum)' }
-    [Console]::Error.WriteLine("OCR_ENGINE_MISSING langs=$lista")
-    Write-Error "Nenhum motor OCR do Windows disponivel. Idiomas OCR instalados: $lista. Instale 'OCR do idioma' em Configuracoes > Hora e idioma > Idioma, ou: pip install rapidocr-onnxruntime"
-    exit 3
-}
-$file = Await-WinRT ([Windows.Storage.StorageFile]::GetFileFromPathAsync($Path)) ([Windows.Storage.StorageFile])
-$stream = Await-WinRT ($file.OpenAsync([Windows.Storage.FileAccessMode]::Read)) ([Windows.Storage.Streams.IRandomAccessStream])
-$decoder = Await-WinRT ([Windows.Graphics.Imaging.BitmapDecoder]::CreateAsync($stream)) ([Windows.Graphics.Imaging.BitmapDecoder])
-$bitmap = Await-WinRT ($decoder.GetSoftwareBitmapAsync()) ([Windows.Graphics.Imaging.SoftwareBitmap])
-$result = Await-WinRT ($engine.RecognizeAsync($bitmap)) ([Windows.Media.Ocr.OcrResult])
-foreach ($line in $result.Lines) { Write-Output $line.Text }
-'''
-
-    def _texto_precisa_ocr(self, texto):
-        """Heurística: comprovante Inter sem valores extraíveis (só labels).
-
-        Cuidado: o pdfplumber lê 'Chave Pix' no nativo — isso NÃO significa que
-        o comprovante já tem texto útil. Exigir 'Pix enviado/recebido' ou 'R$'.
-        """
-        if "Internet Banking Inter" in texto or "contadigital.inter.co" in texto:
-            tem_pix_real = ("Pix enviado" in texto or "Pix recebido" in texto)
-            tem_valor = "R$" in texto
-            # Sem título real nem valor → valores estão em curva/outline
-            if not tem_pix_real and not tem_valor:
-                return True
-        return False
-
-    def _garantir_ocr_helper_mac(self):
-        """Compila (se preciso) e devolve o binário ocr_vision_helper no macOS."""
-        if self._ocr_bin and os.path.exists(self._ocr_bin):
-            return self._ocr_bin
-
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        bin_path = os.path.join(script_dir, "ocr_vision_helper")
-        src_path = os.path.join(script_dir, "ocr_vision.swift")
-
-        if os.path.exists(bin_path) and os.access(bin_path, os.X_OK):
-            self._ocr_bin = bin_path
-            return bin_path
-
-        swiftc = shutil.which("swiftc")
-        if not swiftc or not os.path.exists(src_path):
-            return None
-        try:
-            subprocess.run(
-                [swiftc, src_path, "-o", bin_path],
-                check=True, capture_output=True, timeout=120
-            )
-            self._ocr_bin = bin_path
-            return bin_path
-        except Exception:
-            return None
+                    return regra["descricao"]
+        return None
 
-    def _powershell_51(self):
-        """Sempre usa Windows PowerShell 5.1 (WinRT OCR quebra no PowerShell 7)."""
-        candidatos = [
-            os.path.expandvars(r"%SystemRoot%\System32\WindowsPowerShell\v1.0\powershell.exe"),
-            r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe",
-        ]
-        for c in candidatos:
-            if c and os.path.exists(c):
-                return c
-        # Último recurso: o que estiver no PATH (pode ser PS7 e falhar)
-        return shutil.which("powershell") or shutil.which("powershell.exe")
+    def _remover_rodape_legal(self, texto):
+        """Remove rodapés legais padrão dos comprovantes para não contaminar regras.
 
-    def _ocr_via_windows(self, caminho_png):
-        """OCR nativo do Windows 10/11 (Windows.Media.Ocr via PowerShell 5.1)."""
-        powershell = self._powershell_51()
-        if not powershell:
-            self.log("  OCR Windows: powershell.exe nao encontrado")
-            return ""
+        Exemplo concreto: o Itaú coloca "em dias úteis, das 9h às 18h" no rodapé,
+        e o termo "das" estava sendo confundido com a sigla DAS (impostos).
 
-        # Garante caminho absoluto (WinRT StorageFile exige)
-        caminho_png = os.path.abspath(caminho_png)
+        IMPORTANTE (OCR Windows do Inter): os rótulos "Ouvidoria:" / "Fale com a gente"
+        aparecem CEDO no texto (coluna de labels), antes dos valores. Cortar na
+        primeira ocorrência jogava fora Caroline/SECULOS/descrição. Por isso só
+        cortamos se o marcador estiver na metade final do documento.
+        """
+        marcadores_corte = [
+            "Em caso de dúvidas",  # Itaú
+            "Em caso de duvidas",
+            "SAC 0800",
+            "Ouvidoria:",
+            "Fale com a gente",  # Inter
+        ]
+        n = len(texto)
+        if n == 0:
+            return texto
+        # Só aceita corte a partir da metade do texto (rodapé de verdade)
+        limite_min = n // 2
+        idx_corte = n
+        for marcador in marcadores_corte:
+            # Última ocorrência: no Inter OCR os labels repetem e o rodapé real é o último
+            idx = texto.rfind(marcador)
+            if idx != -1 and idx >= limite_min and idx < idx_corte:
+                idx_corte = idx
+        return texto[:idx_corte]
 
-        # Prefere o .ps1 ao lado do script; senão grava o embutido num temp
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        ps1 = os.path.join(script_dir, "ocr_windows.ps1")
-        ps1_temp = None
-        if not os.path.exists(ps1):
-            try:
-                fd, ps1_temp = tempfile.mkstemp(suffix=".ps1")
-                os.close(fd)
-                with open(ps1_temp, "w", encoding="utf-8") as f:
-                    f.write(self._OCR_WINDOWS_PS1)
-                ps1 = ps1_temp
-                self.log("  OCR Windows: usando script embutido (ocr_windows.ps1 ausente)")
-            except Exception as e:
-                self.log(f"  OCR Windows: nao consegui gravar script temp ({e})")
-                return ""
+    def _texto_sem_acento(self, texto):
+        """Normaliza acentos para comparações (ITAÚ → ITAU)."""
+        return texto.upper().translate(_MAPA_SEM_ACENTO)
 
-        try:
-            # creationflags só existe no Windows
-            kwargs = {"capture_output": True, "text": True, "timeout": 90}
-            if os.name == "nt":
-                kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+    def _regras_compiladas(self):
+        """Matcher das regras do config, recompilado só se a lista de regras trocar."""
+        regras = self.config.get("regras", [])
+        compiladas = getattr(self, "_compiladas", None)
+        if compiladas is None or compiladas.regras is not regras:
+            compiladas = self._compiladas = RegrasCompiladas(regras)
+        return compiladas
 
-            r = subprocess.run(
-                [
-                    powershell,
-                    "-NoProfile",
-                    "-ExecutionPolicy", "Bypass",
-                    "-File", ps1,
-                    "-Path", caminho_png,
-                ],
-                **kwargs,
-            )
-            out = (r.stdout or "").strip()
-            err = (r.stderr or "").strip()
-            if not out:
-                if "OCR_ENGINE_MISSING" in err or "Nenhum motor OCR" in err:
-                    self.log(
-                        "  OCR Windows: pacote de idioma OCR nao instalado no Windows. "
-                        "Instale pt-BR/en-US em Configuracoes > Idioma, "
-                        "OU rode: pip install rapidocr-onnxruntime"
-                    )
-                elif err:
-                    self.log(f"  OCR Windows stderr: {err[:400]}")
-                elif r.returncode:
-                    self.log(f"  OCR Windows exit={r.returncode} (sem texto)")
-            return out
-        except Exception as e:
-            self.log(f"  OCR Windows falhou: {e}")
-            return ""
-        finally:
-            if ps1_temp:
-                try:
-                    os.unlink(ps1_temp)
-                except Exception:
-                    pass
+    def _aplicar_regras_json(self, texto_limpo, dados):
+        """Aplica as regras do JSON na descrição. Retorna True se casou alguma."""
+        texto_norm = self._texto_sem_acento(texto_limpo)
+        compiladas = self._regras_compiladas()
+        presentes = compiladas.termos_presentes(texto_limpo.upper(), texto_norm)
 
-    def _ocr_via_rapidocr(self, caminho_png):
-        """Fallback Python puro (pip install rapidocr-onnxruntime) — nao depende do Windows."""
-        try:
-            from rapidocr_onnxruntime import RapidOCR
-        except ImportError:
-            return ""
-        try:
-            # Cache do engine na instancia (modelo demora a carregar na 1ª vez)
-            if not getattr(self, "_rapidocr_engine", None):
-                self.log("  OCR RapidOCR: carregando modelo (1a vez pode demorar)...")
-                self._rapidocr_engine = RapidOCR()
-            result, _ = self._rapidocr_engine(caminho_png)
-            if not result:
-                return ""
-            # Cada item: [box, texto, confianca]
-            return "\n".join(item[1] for item in result if item and len(item) > 1).strip()
-        except Exception as e:
-            self.log(f"  OCR RapidOCR falhou: {e}")
-            return ""
+        for i, regra in enumerate(compiladas.regras):
+            grupo = regra.get("grupo", "")
+            termos = regra.get("termos", [])
+            termo_casado = compiladas.termo_casado(i, presentes)
+            # Séculos: reforço quando o OCR come letras do nome/descrição
+            if not termo_casado and grupo.upper() == "SECULOS" and self._parece_seculos(texto_limpo):
+                termo_casado = "SECULOS"
 
-    def _ocr_via_tesseract(self, caminho_png):
-        """Fallback se o Tesseract estiver instalado no PATH."""
-        if not shutil.which("tesseract"):
-            return ""
-        try:
-            r = subprocess.run(
-                ["tesseract", caminho_png, "stdout", "-l", "por+eng"],
-                capture_output=True, text=True, timeout=60
-            )
-            return (r.stdout or "").strip()
-        except Exception as e:
-            self.log(f"  OCR tesseract falhou: {e}")
-            return ""
+            if not termo_casado:
+                continue
 
-    def _ocr_via_mac_vision(self, caminho_png):
-        """OCR via Vision (macOS), se o helper estiver disponível."""
-        helper = self._garantir_ocr_helper_mac()
-        if not helper:
-            return ""
-        try:
-            r = subprocess.run(
-                [helper, caminho_png],
-                capture_output=True, text=True, timeout=60
-            )
-            return (r.stdout or "").strip()
-        except Exception as e:
-            self.log(f"  OCR Mac Vision falhou: {e}")
-            return ""
+            # Desambiguação INTERNO: "INTERNO" sozinho precisa do banco de destino
+            if grupo.startswith("INTERNO_") and termo_casado == "INTERNO":
+                if "ITAU" in grupo.upper():
+                    if "ITAU" not in texto_norm:
+                        continue
+                elif "BNB" in grupo.upper():
+                    if "BNB" not in texto_norm:
+                        continue
 
-    def _ocr_primeira_pagina(self, caminho_arq):
-        """Renderiza a 1ª página e roda OCR (Windows → RapidOCR → Mac → tesseract)."""
-        tmp_path = None
-        try:
-            with pdfplumber.open(caminho_arq) as pdf:
-                if not pdf.pages:
-                    return ""
-                try:
-                    # Resolução um pouco maior ajuda o OCR nos laranjas do Inter
-                    im = pdf.pages[0].to_image(resolution=180)
-                except Exception as e_img:
-                    self.log(
-                        f"  OCR: nao consegui renderizar a pagina ({e_img}). "
-                        f"Confirme: pip install pypdfium2"
-                    )
-                    return ""
-
-                # Caminho simples em TEMP — WinRT às vezes falha com nomes estranhos
-                tmp_dir = tempfile.gettempdir()
-                tmp_path = os.path.join(tmp_dir, "renomeador_ocr_page.png")
-                im.save(tmp_path)
-
-            tentativas = [
-                ("Windows", self._ocr_via_windows),
-                ("RapidOCR", self._ocr_via_rapidocr),
-                ("Mac Vision", self._ocr_via_mac_vision),
-                ("tesseract", self._ocr_via_tesseract),
-            ]
-            for nome, fn in tentativas:
-                if nome == "Windows" and os.name != "nt":
-                    continue
-                if nome == "Mac Vision" and os.name == "nt":
-                    continue
-                texto = fn(tmp_path)
-                if texto and len(texto) > 40:
-                    self.log(f"  OCR ok via {nome} ({len(texto)} chars)")
-                    return texto
+            desc_refinada = self.refinar_por_data(grupo, dados["data_pgto"])
+            if desc_refinada:
+                dados["descricao"] = termos[0] + "_" + desc_refinada
+            elif "AGUA" in grupo or "LUZ" in grupo:
+                dados["descricao"] = termos[0] + "_" + grupo
+            else:
+                dados["descricao"] = grupo
 
-            # Nenhum motor funcionou — mensagem acionável
-            tem_rapid = True
-            try:
-                import rapidocr_onnxruntime  # noqa: F401
-            except ImportError:
-                tem_rapid = False
-            if not tem_rapid:
-                self.log(
-                    "  OCR: nenhum motor disponivel. No Windows rode UM destes:\n"
-                    "    pip install rapidocr-onnxruntime\n"
-                    "  ou instale o pacote 'OCR' do idioma (pt-BR/en-US) em\n"
-                    "    Configuracoes > Hora e idioma > Idioma e regiao"
-                )
-            return ""
-        except Exception as e:
-            self.log(f"  OCR falhou: {e}")
-            return ""
-        finally:
-            if tmp_path:
-                try:
-                    os.unlink(tmp_path)
-                except Exception:
-                    pass
+            # Séculos: no nome do arquivo só entra SECULOS (sem o nome da beneficiária)
+            if grupo.upper() == "SECULOS":
+                dados["nome_recebedor"] = ""
+
+            # Preserva mês explícito no comprovante (ex: MENSALIDADE_SISTEMA_SECULOS 07/2026)
+            if not dados.get("data_ref"):
+                dados["data_ref"] = self.extrair_data_referencia(texto_limpo)
+            return True
+        return False
 
     def extrair_dados(self, texto):
         dados = {
@@ -1338,114 +1872,439 @@ foreach ($line in $result.Lines) { Write-Output $line.Text }
 
         return novo_nome
 
-    def _extrair_texto_pdf(self, caminho_arq):
-        """Extrai texto de todas as páginas; se for Inter 'oco', complementa com OCR."""
-        with pdfplumber.open(caminho_arq) as pdf:
-            num_paginas = len(pdf.pages)
-            texto_nativo = ""
-            for page in pdf.pages:
-                # Em PDFs imagem (Print To PDF), extract_text pode retornar None
-                page_text = page.extract_text() or ""
-                texto_nativo += page_text + "\n"
-
-        texto_completo = texto_nativo
-
-        if self._texto_precisa_ocr(texto_nativo):
-            self.log(f"  OCR necessario: {os.path.basename(caminho_arq)} (Inter sem texto util)")
-            ocr = self._ocr_primeira_pagina(caminho_arq)
-            if ocr:
-                # OCR traz valores (data, PGTO - …). O nativo às vezes já tem o nome
-                # do recebedor (ex: Luis Filipe / Viacao Novo Horizonte) — junta os dois.
-                # Remove o lixo vertical "Deixe seu comentário" (ues/exieD) do nativo.
-                nativo_limpo = re.sub(
-                    r'(?im)^(oirátnemoc|ues|exied|deixe|seu|coment[aá]rio)\s*$',
-                    '',
-                    texto_nativo,
-                )
-                texto_completo = ocr + "\n" + nativo_limpo
-                tu = ocr.upper()
-                self.log(
-                    "  OCR anchors: "
-                    f"SECULOS={'SECULOS' in tu or 'SECU' in tu} "
-                    f"CAROLINE={'CAROLINE' in tu} "
-                    f"MENSALIDADE={'MENSALIDADE' in tu} "
-                    f"PGTO={'PGTO' in tu} "
-                    f"014809={'014809' in re.sub(r'[^0-9]', '', ocr)}"
-                )
-            else:
-                self.log(
-                    "  AVISO: OCR falhou — comprovante Inter pode sair sem data/descrição. "
-                    "No Windows: pip install rapidocr-onnxruntime"
-                )
-
-        return texto_completo, num_paginas
-
-    def executar(self):
-        arquivos = self.selecionar_arquivos()
-        if not arquivos:
-            return
+    def processar_lote(self, arquivos, simular=False, progresso=None):
+        """Texto/OCR no pool de processos; regras e renames aqui, na ordem de `arquivos`.
 
-        sucessos = 0
-        erros = 0
+        Devolve [(caminho, novo_caminho ou None, erro ou None)]. Com simular=True só
+        mostra os nomes (inclusive os _2, _3 de colisão dentro do próprio lote).
+        progresso(i, total) é chamado depois de cada arquivo.
+        """
+        resultados = []
         n_regras = len(self.config.get("regras", []))
         caminho_cfg = self.config.get("_caminho_carregado", r"\\Servidor\...\regras_renomeador.json")
-        self.log(f"Iniciando... regras={n_regras} grupos | {caminho_cfg}")
+        self.log(f"Iniciando... regras={n_regras} grupos | {caminho_cfg}" + (" | SIMULACAO" if simular else ""))
         if n_regras == 0:
             self.log("AVISO: JSON de regras vazio ou nao carregou — tudo vai sair como PGTO.")
 
-        for caminho_arq in arquivos:
+        simulacao = {"ocupados": set(), "liberados": set()} if simular else None
+        self._latencias_lote = {}
+        cache = self._abrir_cache()
+        try:
+            for i, (caminho_arq, texto_completo, num_paginas, mensagens, erro) in enumerate(
+                    self._textos_extraidos(arquivos, cache), start=1):
+                if self._parar.is_set():
+                    break
+                for mensagem in mensagens:
+                    self.log(mensagem)
+                try:
+                    if erro:
+                        raise RuntimeError(erro)
+                    novo_caminho = self._renomear(caminho_arq, texto_completo, num_paginas, simulacao)
+                    self.log(f"{'SIMULADO' if simular else 'OK'}: {os.path.basename(caminho_arq)} "
+                             f"-> {os.path.basename(novo_caminho)}")
+                    resultados.append((caminho_arq, novo_caminho, None))
+                except Exception as e:
+                    self.log(f"ERRO em {os.path.basename(caminho_arq)}: {str(e)}")
+                    resultados.append((caminho_arq, None, str(e)))
+                if progresso:
+                    progresso(i, len(arquivos))
+            if len(resultados) < len(arquivos):
+                self.log(f"Lote interrompido: {len(arquivos) - len(resultados)} arquivo(s) nao processados.")
+        except Exception as e:
+            # Pool quebrado (processo morto etc.): o que não foi processado conta como erro
+            self.log(f"ERRO no lote: {e}")
+            feitos = {r[0] for r in resultados}
+            resultados += [(c, None, str(e)) for c in arquivos if c not in feitos]
+        finally:
+            if cache:
+                self.log(f"Cache de textos: {cache.acertos} reaproveitados, {cache.faltas} extraidos")
+                cache.fechar()
+            if self._latencias_lote:
+                self.log("OCR por motor: " + "; ".join(
+                    f"{nome} {paginas} pag. em {segundos:.1f}s ({segundos / paginas:.2f}s/pag)"
+                    for nome, (segundos, paginas) in self._latencias_lote.items()))
+        return resultados
+
+    def _abrir_cache(self):
+        try:
+            return CacheTextos(self.extrator.assinatura())
+        except Exception as e:
+            self.log(f"AVISO: cache de textos indisponivel ({e}) — todos os PDFs serao lidos de novo")
+            return None
+
+    def _textos_extraidos(self, arquivos, cache=None):
+        """Gera (caminho, texto, num_paginas, mensagens, erro) na mesma ordem de `arquivos`.
+
+        O que já está no cache não é extraído de novo. O resto roda no pool de
+        processos (aberto só se houver mais de um arquivo e algo a extrair, e mantido
+        para os lotes seguintes) com no máximo EM_VOO_POR_PROCESSO arquivos por
+        processo em andamento; o resultado de cada arquivo só é entregue depois dos
+        anteriores.
+        """
+        processos = min(len(arquivos), MAX_PROCESSOS)
+        limite = processos * EM_VOO_POR_PROCESSO if processos > 1 else 1
+        pendentes = deque()
+        try:
+            for caminho_arq in arquivos:
+                if self._parar.is_set():
+                    break
+                chave, partes = self._consultar_cache(cache, caminho_arq)
+                if partes is not None:
+                    pendentes.append((caminho_arq, None, (partes, [], None, {})))
+                elif processos > 1:
+                    if self._pool is None:
+                        self.log(f"Extraindo texto em ate {MAX_PROCESSOS} processos...")
+                        self._pool = ProcessPoolExecutor(max_workers=MAX_PROCESSOS, initializer=_iniciar_processo)
+                    pendentes.append((caminho_arq, chave, self._pool.submit(extrair_em_processo, caminho_arq)))
+                else:
+                    pendentes.append((caminho_arq, chave, _extrair_capturando(self.extrator, caminho_arq)))
+                if len(pendentes) >= limite:
+                    yield self._resultado_extracao(cache, *pendentes.popleft())
+            while pendentes and not self._parar.is_set():
+                yield self._resultado_extracao(cache, *pendentes.popleft())
+        except BrokenProcessPool:
+            # Processo do pool morreu: o próximo lote sobe um pool novo
+            self._pool = None
+            raise
+        finally:
+            # Lote interrompido: o que ainda não começou não roda à toa no pool
+            for _, _, resultado in pendentes:
+                if not isinstance(resultado, tuple):
+                    resultado.cancel()
+
+    def _consultar_cache(self, cache, caminho_arq):
+        """(chave, (nativo, ocr, paginas) ou None). Erro de leitura fica para a extração relatar."""
+        if cache is None:
+            return None, None
+        try:
+            chave = cache.chave(caminho_arq)
+            return chave, cache.obter(chave)
+        except Exception:
+            return None, None
+
+    def _resultado_extracao(self, cache, caminho_arq, chave, resultado):
+        if not isinstance(resultado, tuple):
+            resultado = resultado.result()  # Future do pool
+        partes, mensagens, erro, latencias = resultado
+        for nome, (segundos, paginas) in latencias.items():
+            total = self._latencias_lote.setdefault(nome, [0.0, 0])
+            total[0] += segundos
+            total[1] += paginas
+        if partes is None:
+            return caminho_arq, None, 0, mensagens, erro
+        nativo, ocr, num_paginas = partes
+        # OCR que falhou não vai para o cache: na próxima rodada (motor instalado) tenta de novo
+        if cache and chave and (ocr or not self.extrator._texto_precisa_ocr(nativo)):
             try:
-                texto_completo, num_paginas = self._extrair_texto_pdf(caminho_arq)
+                cache.gravar(chave, nativo, ocr, num_paginas)
+            except Exception as e:
+                mensagens = mensagens + [f"  AVISO: nao gravou no cache de textos ({e})"]
+        return caminho_arq, self.extrator.juntar_textos(nativo, ocr), num_paginas, mensagens, None
 
-                # Verifica se é DDA / consolidado (caso especial)
-                # Tenta primeiro o BB, depois o Itaú (inclui caso de PDF imagem).
-                nome_dda = (
-                    self.processar_bb_dda(texto_completo)
-                    or self.processar_itau_dda(texto_completo, caminho_arq, num_paginas)
-                )
+    def _renomear(self, caminho_arq, texto_completo, num_paginas, simulacao=None):
+        """Classifica o comprovante e renomeia na mesma pasta; devolve o caminho final.
+
+        `simulacao` ({"ocupados", "liberados"}) faz o papel do disco num lote sem
+        rename: nomes já dados no lote contam como existentes e os originais como livres.
+        """
+        # Verifica se é DDA / consolidado (caso especial)
+        # Tenta primeiro o BB, depois o Itaú (inclui caso de PDF imagem).
+        nome_dda = (
+            self.processar_bb_dda(texto_completo)
+            or self.processar_itau_dda(texto_completo, caminho_arq, num_paginas)
+        )
 
-                pasta = os.path.dirname(caminho_arq)
+        pasta = os.path.dirname(caminho_arq)
 
-                if nome_dda:
-                    novo_nome = nome_dda + ".pdf"
-                else:
-                    dados = self.extrair_dados(texto_completo)
-                    novo_nome = self.gerar_novo_nome(
-                        dados, os.path.basename(caminho_arq), caminho_arq
-                    )
-                    # Log curto do que as regras/OCR enxergaram (ajuda a debugar PGTO generico)
-                    self.log(
-                        f"  dados: desc={dados.get('descricao')!r} "
-                        f"recebedor={dados.get('nome_recebedor')!r} "
-                        f"data={dados.get('data_pgto')!r}"
-                    )
+        if nome_dda:
+            novo_nome = nome_dda + ".pdf"
+        else:
+            dados = self.extrair_dados(texto_completo)
+            novo_nome = self.gerar_novo_nome(
+                dados, os.path.basename(caminho_arq), caminho_arq
+            )
+            # Log curto do que as regras/OCR enxergaram (ajuda a debugar PGTO generico)
+            self.log(
+                f"  dados: desc={dados.get('descricao')!r} "
+                f"recebedor={dados.get('nome_recebedor')!r} "
+                f"data={dados.get('data_pgto')!r}"
+            )
 
+        novo_caminho = os.path.join(pasta, novo_nome)
+
+        def existe(caminho):
+            if simulacao is None:
+                return os.path.exists(caminho)
+            caminho = os.path.abspath(caminho)
+            return caminho in simulacao["ocupados"] or (
+                caminho not in simulacao["liberados"] and os.path.exists(caminho))
+
+        # Evita sobrescrever se já existir nome igual
+        if os.path.abspath(caminho_arq) != os.path.abspath(novo_caminho):
+            if existe(novo_caminho):
+                base, ext = os.path.splitext(novo_nome)
+                i = 2
+                while existe(os.path.join(pasta, f"{base}_{i}{ext}")):
+                    i += 1
+                novo_nome = f"{base}_{i}{ext}"
                 novo_caminho = os.path.join(pasta, novo_nome)
+            if simulacao is None:
+                os.rename(caminho_arq, novo_caminho)
+            else:
+                simulacao["liberados"].add(os.path.abspath(caminho_arq))
+                simulacao["liberados"].discard(os.path.abspath(novo_caminho))
+                simulacao["ocupados"].discard(os.path.abspath(caminho_arq))
+                simulacao["ocupados"].add(os.path.abspath(novo_caminho))
+
+        return novo_caminho
+
+    def vigiar(self, pasta, intervalo=2.0, espera=5.0, recursivo=False, existentes=False, simular=False):
+        """Modo vigia: renomeia os PDFs que forem chegando na pasta, até Ctrl+C.
+
+        A pasta é varrida a cada `intervalo` segundos (polling: inotify não enxerga
+        gravações feitas por outra máquina num compartilhamento SMB). Um PDF só entra
+        no lote depois de passar `espera` segundos sem mudar de tamanho nem de data e
+        de conseguir ser aberto (cópia ainda em andamento fica de fora). Os nomes que
+        o próprio vigia gerou não são processados de novo; um PDF que deu erro só é
+        tentado de novo se mudar (ex: cópia que parou no meio e depois terminou).
+        """
+        vistos = {}   # caminho -> ((tamanho, mtime), desde quando está assim)
+        falhas = {}   # caminho -> (tamanho, mtime) de quando deu erro
+        ignorar = set() if existentes else set(listar_pdfs([pasta], recursivo))
+        self.log(f"Vigiando {pasta} (a cada {intervalo:g}s, arquivo parado ha {espera:g}s; "
+                 f"{len(ignorar)} PDFs ja existentes ignorados). Ctrl+C para sair.")
+        try:
+            while True:
+                agora = time.monotonic()
+                prontos = []
+                atuais = set(listar_pdfs([pasta], recursivo))
+                for caminho in atuais - ignorar:
+                    try:
+                        st = os.stat(caminho)
+                    except OSError:
+                        continue
+                    assinatura = (st.st_size, st.st_mtime)
+                    if falhas.get(caminho) == assinatura:
+                        continue
+                    anterior = vistos.get(caminho)
+                    if anterior is None or anterior[0] != assinatura:
+                        vistos[caminho] = (assinatura, agora)
+                    elif st.st_size and agora - anterior[1] >= espera and _pode_abrir(caminho):
+                        prontos.append(caminho)
+                # Some da pasta (movido/apagado por alguém) → esquece
+                for caminho in list(vistos):
+                    if caminho not in atuais:
+                        del vistos[caminho]
+                        falhas.pop(caminho, None)
+                ignorar &= atuais
+
+                if prontos:
+                    prontos.sort()
+                    for caminho_arq, novo_caminho, _ in self.processar_lote(prontos, simular=simular):
+                        assinatura = vistos.pop(caminho_arq, ((None, None), 0))[0]
+                        if novo_caminho:
+                            ignorar.add(caminho_arq)
+                            ignorar.add(novo_caminho)
+                        else:
+                            falhas[caminho_arq] = assinatura
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            self.log("Vigia encerrado.")
+
+
+def listar_pdfs(caminhos, recursivo=False):
+    """Arquivos .pdf dados diretamente ou dentro das pastas, em ordem de nome."""
+    pdfs = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            if recursivo:
+                for raiz, _, nomes in os.walk(caminho):
+                    pdfs += sorted(os.path.join(raiz, n) for n in nomes if n.lower().endswith(".pdf"))
+            else:
+                pdfs += sorted(e.path for e in os.scandir(caminho)
+                               if e.is_file() and e.name.lower().endswith(".pdf"))
+        else:
+            pdfs.append(caminho)
+    return pdfs
+
+
+def _pode_abrir(caminho):
+    """No Windows o arquivo ainda sendo copiado fica travado para leitura."""
+    try:
+        with open(caminho, "rb") as f:
+            f.read(1)
+        return True
+    except OSError:
+        return False
 
-                # Evita sobrescrever se já existir nome igual
-                if os.path.abspath(caminho_arq) != os.path.abspath(novo_caminho):
-                    if os.path.exists(novo_caminho):
-                        base, ext = os.path.splitext(novo_nome)
-                        i = 2
-                        while os.path.exists(os.path.join(pasta, f"{base}_{i}{ext}")):
-                            i += 1
-                        novo_nome = f"{base}_{i}{ext}"
-                        novo_caminho = os.path.join(pasta, novo_nome)
-                    os.rename(caminho_arq, novo_caminho)
 
-                self.log(f"OK: {os.path.basename(caminho_arq)} -> {novo_nome}")
-                sucessos += 1
+class RenomeadorComprovantes(MotorRenomeador):
+    """Janela Tk: escolhe os PDFs e mostra o log; o lote roda numa thread.
 
-            except Exception as e:
-                erros += 1
-                self.log(f"ERRO em {os.path.basename(caminho_arq)}: {str(e)}")
+    Na janela o JSON de regras que falta é criado vazio e erro de leitura vira aviso.
+    """
 
-        # Relatório final
-        msg = f"Processados: {sucessos}\nErros: {erros}"
-        messagebox.showinfo("Concluído", msg)
-        # self.root.destroy() # Manter janela aberta
+    REGRAS_OBRIGATORIAS = False
 
+    def __init__(self, arquivo_regras=None):
+        # Mensagens da thread do lote para a janela (o Tk só pode ser mexido na thread principal)
+        self._fila_ui = queue.Queue()
+        self._processando = False
+        self._fechar_no_fim = False
 
-if __name__ == "__main__":
-    app = RenomeadorComprovantes()
+        self.root = as_tk.Tk()
+        self.root.title("Renomeador de Comprovantes")
+        self.root.geometry("600x450")
+
+        super().__init__(arquivo_regras)
+
+        # Interface Gráfica
+        frame = as_tk.Frame(self.root)
+        frame.pack(pady=20)
+
+        self.btn_selecionar = as_tk.Button(frame, text="Selecionar Arquivos PDF",
+                                           command=self.executar, font=("Arial", 12), bg="#dddddd")
+        self.btn_selecionar.pack()
+
+        self.log_text = ScrolledText(self.root, height=20, width=70, state='disabled')
+        self.log_text.pack(pady=10, padx=10)
+
+        self.root.after(100, self._drenar_fila_ui)
+        self.root.protocol("WM_DELETE_WINDOW", self._fechar_janela)
+
+    def _fechar_janela(self):
+        """Sem lote rodando fecha na hora. Com lote, pede para parar e fecha quando a thread terminar."""
+        if not self._processando:
+            self.fechar(esperar=False)
+            self.root.destroy()
+            return
+        self.parar()
+        self._fechar_no_fim = True
+        self.root.withdraw()
+
+    def _erro_config(self, mensagem):
+        messagebox.showerror("Erro Config", mensagem)
+
+    def log(self, mensagem):
+        """Pode ser chamado de qualquer thread: a mensagem entra na fila e a janela escreve."""
+        self._fila_ui.put(("log", mensagem))
+
+    def _drenar_fila_ui(self):
+        """Roda no mainloop a cada 100 ms: escreve o log, atualiza o progresso e fecha o lote."""
+        linhas = []
+        try:
+            while True:
+                tipo, valor = self._fila_ui.get_nowait()
+                if tipo == "log":
+                    linhas.append(valor)
+                elif tipo == "progresso":
+                    self.root.title(f"Renomeador de Comprovantes — {valor[0]}/{valor[1]}")
+                elif tipo == "fim":
+                    self._processando = False
+                    if self._fechar_no_fim:
+                        self.fechar(esperar=False)
+                        self.root.destroy()
+                        return
+                    self._escrever_log(linhas)
+                    linhas = []
+                    self.btn_selecionar.config(state='normal')
+                    self.root.title("Renomeador de Comprovantes")
+                    messagebox.showinfo("Concluído", valor)
+        except queue.Empty:
+            pass
+        self._escrever_log(linhas)
+        self.root.after(100, self._drenar_fila_ui)
+
+    def _escrever_log(self, linhas):
+        if not linhas:
+            return
+        self.log_text.config(state='normal')
+        self.log_text.insert(as_tk.END, "\n".join(linhas) + "\n")
+        self.log_text.see(as_tk.END)
+        self.log_text.config(state='disabled')
+
+    def selecionar_arquivos(self):
+        arquivos = filedialog.askopenfilenames(
+            title="Selecione os Comprovantes PDF",
+            filetypes=[("Arquivos PDF", "*.pdf")]
+        )
+        return arquivos
+
+    def executar(self):
+        if self._processando:
+            return
+        arquivos = self.selecionar_arquivos()
+        if not arquivos:
+            return
+
+        self._processando = True
+        self.btn_selecionar.config(state='disabled')
+        threading.Thread(target=self._processar_lote, args=(list(arquivos),), daemon=True).start()
+
+    def _processar_lote(self, arquivos):
+        resultados = []
+        try:
+            resultados = self.processar_lote(
+                arquivos, progresso=lambda i, total: self._fila_ui.put(("progresso", (i, total))))
+        finally:
+            # Relatório final
+            erros = len(arquivos) - sum(1 for _, novo, _ in resultados if novo)
+            self._fila_ui.put(("fim", f"Processados: {len(arquivos) - erros}\nErros: {erros}"))
+
+
+def _abrir_motor(parser, arquivo_regras):
+    """MotorRenomeador da linha de comando; sem JSON de regras válido sai com erro."""
+    try:
+        return MotorRenomeador(arquivo_regras)
+    except (OSError, ValueError) as e:
+        parser.exit(2, f"ERRO: {e}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Renomeia comprovantes de pagamento (PDF). Sem argumentos abre a janela.")
+    parser.add_argument("caminhos", nargs="*", help="PDFs ou pastas com PDFs")
+    parser.add_argument("--simular", "--dry-run", action="store_true",
+                        help="Só mostra os nomes novos, sem renomear")
+    parser.add_argument("--recursivo", "-r", action="store_true", help="Entra nas subpastas")
+    parser.add_argument("--regras", default=None,
+                        help=f"JSON de regras (padrão: RENOMEADOR_REGRAS ou {ARQUIVO_REGRAS})")
+    parser.add_argument("--vigiar", metavar="PASTA", help="Fica vigiando a pasta e renomeia o que chegar")
+    parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre varreduras da pasta vigiada")
+    parser.add_argument("--espera", type=float, default=5.0,
+                        help="Segundos que o PDF precisa ficar sem mudar antes de ser renomeado")
+    parser.add_argument("--existentes", action="store_true",
+                        help="No modo vigia, processa também os PDFs que já estavam na pasta")
+    args = parser.parse_args()
+
+    if args.vigiar:
+        motor = _abrir_motor(parser, args.regras)
+        try:
+            motor.vigiar(args.vigiar, args.intervalo, args.espera, args.recursivo, args.existentes, args.simular)
+        finally:
+            motor.fechar()
+        return 0
+    if args.caminhos:
+        arquivos = listar_pdfs(args.caminhos, args.recursivo)
+        if not arquivos:
+            print("Nenhum PDF encontrado.")
+            return 1
+        motor = _abrir_motor(parser, args.regras)
+        try:
+            resultados = motor.processar_lote(arquivos, simular=args.simular)
+        finally:
+            motor.fechar()
+        erros = sum(1 for _, novo, _ in resultados if not novo)
+        print(f"Processados: {len(resultados) - erros}  Erros: {erros}")
+        return 1 if erros else 0
+
+    if as_tk is None:
+        parser.error("tkinter indisponível: passe arquivos/pastas ou --vigiar PASTA")
+    app = RenomeadorComprovantes(args.regras)
     app.root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # pool de processos no executável do Windows
+    raise SystemExit(main())
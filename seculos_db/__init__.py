@@ -0,0 +1,11 @@
+"""
+Acesso compartilhado ao banco Firebird do Seculos.
+
+Os scripts de Dynamo/ e xfin/ colocam a raiz do repositório no sys.path para importar daqui.
+"""
+from .conexao import get_firebird_connection
+from .pool import FirebirdPool, pool_compartilhado
+from .historico import HistoricoProduto, TABELAS_HISTORICO, como_data
+from .snapshot import SnapshotHistorico
+from .correspondencia import BuscaAproximada, normalizar_nome
+from .fornecedores import IndiceFornecedores
@@ -0,0 +1,26 @@
+import os
+import firebirdsql
+
+
+def get_firebird_connection(**parametros):
+    """
+    Abre uma conexão nova com o Firebird do Seculos usando as variáveis do .env
+    (HOST, PORT, DB_PATH, APP_USER, PASSWORD, ROLE, AUTH).
+
+    Qualquer parâmetro do firebirdsql.connect pode ser sobrescrito via kwargs
+    (ex: scripts que ainda usam credenciais fixas no próprio arquivo).
+    O load_dotenv() continua sendo responsabilidade de quem chama.
+    """
+    config = {
+        'host': os.getenv('HOST'),
+        'port': int(os.getenv('PORT', '3050')),
+        'database': os.getenv('DB_PATH'),
+        'user': os.getenv('APP_USER'),
+        'password': os.getenv('PASSWORD'),
+        'role': os.getenv('ROLE'),
+        'auth_plugin_name': os.getenv('AUTH'),
+        'wire_crypt': False,
+        'charset': 'ISO8859_1'
+    }
+    config.update(parametros)
+    return firebirdsql.connect(**config)
@@ -0,0 +1,129 @@
+"""
+Busca aproximada de nomes (fornecedores, pessoas do Xfin) para sugerir correspondências.
+
+O nome é reduzido a palavras significativas (sem acento, pontuação, prefixo de código "123 - " e termos
+como LTDA, ME, EIRELI, DE, DA...). Cada nome do índice é quebrado em trigramas de caracteres e um índice
+invertido trigrama -> nomes escolhe os candidatos que dividem mais trigramas com a busca; só esses são
+pontuados (média entre o Dice dos trigramas e a semelhança das palavras), então a busca não compara com
+a lista inteira. A pré-seleção usa os trigramas mais raros da busca até um orçamento de entradas lidas:
+trigramas muito comuns ("PEC", "AUT") quase não separam candidatos e só entram na nota.
+"""
+import re
+import difflib
+import unicodedata
+
+from collections import Counter
+
+# Termos que não ajudam a distinguir um fornecedor de outro
+PALAVRAS_IGNORADAS = {
+    "LTDA", "LTD", "ME", "EPP", "EIRELI", "SA", "S", "A", "CIA", "COMERCIO", "COM", "IND", "INDUSTRIA",
+    "DE", "DA", "DO", "DAS", "DOS", "E", "EM", "MEI",
+}
+
+
+def normalizar_nome(nome):
+    """Maiúsculas, sem acentos, sem pontuação e com espaços simples ('Peças & Cia.' -> 'PECAS CIA')."""
+    if not nome:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(nome).upper())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^A-Z0-9 ]+", " ", texto)
+    return " ".join(texto.split())
+
+
+def somente_digitos(valor):
+    return re.sub(r"\D", "", str(valor)) if valor else ""
+
+
+def palavras_nome(nome):
+    """Palavras significativas do nome, na ordem ('123 - Peças São João Ltda.' -> ['PECAS', 'SAO', 'JOAO'])."""
+    texto = re.sub(r"^\s*\d+\s*-\s*", "", str(nome)) if nome else ""
+    palavras = normalizar_nome(texto).split()
+    significativas = [p for p in palavras if p not in PALAVRAS_IGNORADAS]
+    # Nome feito só de termos ignorados ("COMERCIO E INDUSTRIA LTDA") fica como está
+    return significativas or palavras
+
+
+def chave_nome(nome):
+    return " ".join(palavras_nome(nome))
+
+
+def _trigramas(chave):
+    texto = f"  {chave} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class BuscaAproximada:
+    """
+    Índice de nomes para sugestões ranqueadas.
+
+        busca = BuscaAproximada(nomes)
+        busca.candidatos("AUTO PECAS BRASIL LTDA")  -> [(nome_original, semelhança 0..1), ...]
+    """
+
+    def __init__(self, nomes, max_pre_selecao=30, orcamento=1000):
+        self.max_pre_selecao = max_pre_selecao
+        self.orcamento = orcamento
+        self._nomes = []        # nome original
+        self._chaves = []       # palavras significativas unidas por espaço
+        self._trigramas = []
+        self._por_trigrama = {}
+        vistos = set()
+        for nome in nomes:
+            if not nome or nome in vistos:
+                continue
+            vistos.add(nome)
+            chave = chave_nome(nome)
+            if not chave:
+                continue
+            indice = len(self._nomes)
+            trigramas = _trigramas(chave)
+            self._nomes.append(nome)
+            self._chaves.append(chave)
+            self._trigramas.append(trigramas)
+            for trigrama in trigramas:
+                self._por_trigrama.setdefault(trigrama, []).append(indice)
+
+    def __len__(self):
+        return len(self._nomes)
+
+    def candidatos(self, nome, limite=3, corte=0.6):
+        """Até 'limite' nomes do índice com semelhança >= corte, do mais parecido para o menos."""
+        chave = chave_nome(nome)
+        if not chave:
+            return []
+        trigramas = _trigramas(chave)
+
+        # Pré-seleção pelo índice invertido: quem divide mais trigramas raros com a busca
+        listas = sorted((self._por_trigrama[t] for t in trigramas if t in self._por_trigrama), key=len)
+        comuns = Counter()
+        lidas = 0
+        for i, lista in enumerate(listas):
+            if i >= 3 and lidas + len(lista) > self.orcamento:
+                break
+            comuns.update(lista)
+            lidas += len(lista)
+
+        # Dice dos trigramas para os pré-selecionados; a comparação das palavras (mais cara) só nos melhores
+        por_dice = []
+        for indice, _ in comuns.most_common(self.max_pre_selecao):
+            outros = self._trigramas[indice]
+            por_dice.append((2 * len(trigramas & outros) / (len(trigramas) + len(outros)), indice))
+        por_dice.sort(reverse=True)
+
+        palavras_ordenadas = " ".join(sorted(chave.split()))
+        resultado = []
+        for dice, indice in por_dice[:max(5, 2 * limite)]:
+            chave_indice = self._chaves[indice]
+            if chave_indice == chave:
+                nota = 1.0
+            else:
+                # Palavras em outra ordem ou uma palavra a mais/menos ainda pontuam bem
+                ordem = difflib.SequenceMatcher(None, palavras_ordenadas,
+                                                " ".join(sorted(chave_indice.split()))).ratio()
+                nota = (dice + ordem) / 2
+            if nota >= corte:
+                resultado.append((self._nomes[indice], round(nota, 3)))
+
+        resultado.sort(key=lambda item: -item[1])
+        return resultado[:limite]
@@ -0,0 +1,174 @@
+import os
+import time
+import pickle
+import sqlite3
+import threading
+
+from .historico import DIR_CACHE
+from .correspondencia import BuscaAproximada, normalizar_nome, somente_digitos
+
+
+class IndiceFornecedores:
+    """
+    Índice local de fornecedores: cópia da tabela FORNECEDOR (SQLite) + a planilha de dados bancários.
+
+    atualizar() confere COUNT(*) e MAX(CDFORNECEDOR) no Firebird e a data de modificação da planilha;
+    só relê a tabela inteira (ou a planilha na rede) quando algum deles mudou. Entre uma atualização e
+    outra as consultas são em memória:
+    - cnpj_por_nome(): nome exato em maiúsculas (a mesma chave que o robô de pagamentos sempre usou);
+    - por_nome() / por_cnpj(): nome normalizado (sem acento e pontuação) e CNPJ só com dígitos;
+    - aproximados(): nomes parecidos, ranqueados pela BuscaAproximada (índice de trigramas).
+    Se a planilha não estiver acessível, usa a última cópia lida (com aviso).
+    """
+
+    def __init__(self, arquivo_config=None, arquivo=None):
+        self.arquivo_config = arquivo_config
+        self.arquivo = arquivo or os.path.join(DIR_CACHE, 'fornecedores.sqlite')
+        self.arquivo_planilha = os.path.splitext(self.arquivo)[0] + '_config.pickle'
+        os.makedirs(os.path.dirname(self.arquivo), exist_ok=True)
+        # A tela chama de uma thread de trabalho; o índice pode ser usado por mais de uma
+        self.db = sqlite3.connect(self.arquivo, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS fornecedor (
+                cdfornecedor INTEGER PRIMARY KEY,
+                nome TEXT,
+                cpf_cnpj TEXT
+            )
+        """)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        self.db.commit()
+        self._lock = threading.Lock()
+        self._planilha = None
+        self._carregar_memoria()
+
+    def fechar(self):
+        self.db.close()
+
+    # ------------------------------------------------------------------ #
+    # Atualização                                                         #
+    # ------------------------------------------------------------------ #
+    def _meta(self, chave):
+        row = self.db.execute("SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+        return row[0] if row else None
+
+    def _gravar_meta(self, chave, valor):
+        self.db.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)", (chave, str(valor)))
+
+    def _atualizar_tabela(self, conn):
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), MAX(CDFORNECEDOR) FROM FORNECEDOR")
+        assinatura = "{}/{}".format(*cur.fetchone())
+        if assinatura == self._meta('assinatura_fornecedor'):
+            return False
+
+        cur.execute("SELECT CDFORNECEDOR, NOME, CPF_CNPJ FROM FORNECEDOR")
+        linhas = cur.fetchall()
+        try:
+            self.db.execute("DELETE FROM fornecedor")
+            self.db.executemany("INSERT INTO fornecedor (cdfornecedor, nome, cpf_cnpj) VALUES (?, ?, ?)", linhas)
+            self._gravar_meta('assinatura_fornecedor', assinatura)
+            self._gravar_meta('fornecedor_atualizado_em', time.strftime("%Y-%m-%d %H:%M:%S"))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        print(f"Índice de fornecedores: {len(linhas)} fornecedores copiados do Firebird ({assinatura}).")
+        return True
+
+    def _atualizar_planilha(self):
+        import pandas as pd
+
+        try:
+            mtime = os.path.getmtime(self.arquivo_config)
+        except OSError as e:
+            if self._ler_planilha_local() is not None:
+                print(f"Aviso: planilha de dados bancários inacessível ({e}). Usando a última cópia lida.")
+                return False
+            raise
+
+        local = self._ler_planilha_local()
+        if local is not None and local['caminho'] == self.arquivo_config and local['mtime'] == mtime:
+            return False
+
+        df = pd.read_excel(self.arquivo_config, dtype=str)
+        try:
+            with open(self.arquivo_planilha + '.tmp', 'wb') as f:
+                pickle.dump({'caminho': self.arquivo_config, 'mtime': mtime, 'df': df}, f)
+            os.replace(self.arquivo_planilha + '.tmp', self.arquivo_planilha)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar a cópia local da planilha de dados bancários: {e}")
+        self._planilha = df
+        print(f"Índice de fornecedores: planilha de dados bancários relida ({len(df)} linhas).")
+        return True
+
+    def _ler_planilha_local(self):
+        try:
+            with open(self.arquivo_planilha, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def atualizar(self, conn=None):
+        """
+        Confere se a tabela (com 'conn') e a planilha mudaram e relê só o que mudou.
+        Retorna (tabela_relida, planilha_relida).
+        """
+        with self._lock:
+            tabela = self._atualizar_tabela(conn) if conn is not None else False
+            planilha = self._atualizar_planilha() if self.arquivo_config else False
+            if tabela:
+                self._carregar_memoria()
+            return tabela, planilha
+
+    # ------------------------------------------------------------------ #
+    # Índices em memória                                                  #
+    # ------------------------------------------------------------------ #
+    def _carregar_memoria(self):
+        self._cnpj_por_nome = {}
+        self._por_nome = {}
+        self._por_cnpj = {}
+        # Montada só na primeira busca aproximada
+        self._busca = None
+        for cd, nome, cpf_cnpj in self.db.execute(
+                "SELECT cdfornecedor, nome, cpf_cnpj FROM fornecedor ORDER BY cdfornecedor"):
+            nome_exato = nome.strip().upper() if nome else ""
+            cnpj = cpf_cnpj.strip() if cpf_cnpj else ""
+            registro = (cd, nome, cnpj)
+            self._cnpj_por_nome[nome_exato] = cnpj
+            chave = normalizar_nome(nome)
+            self._por_nome.setdefault(chave, []).append(registro)
+            digitos = somente_digitos(cnpj)
+            if digitos:
+                self._por_cnpj.setdefault(digitos, []).append(registro)
+
+    def __len__(self):
+        return len(self._cnpj_por_nome)
+
+    def mapa_cnpj_por_nome(self):
+        """Dicionário nome em maiúsculas -> CPF/CNPJ (o mesmo que o SELECT NOME, CPF_CNPJ FROM FORNECEDOR montava)."""
+        return self._cnpj_por_nome
+
+    def cnpj_por_nome(self, nome):
+        return self._cnpj_por_nome.get(str(nome).strip().upper()) if nome else None
+
+    def por_nome(self, nome):
+        """Fornecedores (cd, nome, cpf_cnpj) com o mesmo nome normalizado."""
+        return self._por_nome.get(normalizar_nome(nome), [])
+
+    def por_cnpj(self, cpf_cnpj):
+        return self._por_cnpj.get(somente_digitos(cpf_cnpj), [])
+
+    def aproximados(self, nome, limite=3, corte=0.6):
+        """[(nome, cpf_cnpj, semelhança)] dos fornecedores com nome parecido, do mais parecido para o menos."""
+        if self._busca is None:
+            self._busca = BuscaAproximada(self._cnpj_por_nome)
+        return [(parecido, self._cnpj_por_nome[parecido], nota)
+                for parecido, nota in self._busca.candidatos(nome, limite, corte)]
+
+    def planilha(self):
+        """Cópia do DataFrame da planilha de dados bancários (None se não houver planilha configurada)."""
+        if self._planilha is None:
+            local = self._ler_planilha_local()
+            if local is not None:
+                self._planilha = local['df']
+        return None if self._planilha is None else self._planilha.copy()
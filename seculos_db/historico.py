@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import datetime
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# O Seculos espalha o histórico de movimentação em 10 tabelas com a mesma estrutura
+TABELAS_HISTORICO = [f"HISTORICOPRODUTO{i}" for i in range(1, 11)]
+
+# Onde os caches locais do pacote ficam (pode ser trocado pelo .env)
+DIR_CACHE = os.getenv('SECULOS_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'arquivos', 'cache')
+
+
+def como_data(valor):
+    """Normaliza date/datetime/'YYYY-MM-DD' para date (o Firebird devolve date e os scripts passam datetime)."""
+    if valor is None:
+        return None
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    return datetime.date.fromisoformat(str(valor)[:10])
+
+
+class HistoricoProduto:
+    """
+    Camada de consulta sobre HISTORICOPRODUTO1..10.
+
+    Amostra MIN/MAX(DATA) de cada tabela uma única vez (cache em disco com validade 'ttl_horas')
+    e, para cada consulta, só toca nas tabelas cuja faixa de datas cruza o período pedido.
+    A tabela com a maior data é a que está recebendo movimento, então ela é tratada como aberta
+    (sem limite superior) para não ser podada por um cache de ontem.
+
+    - consultar(): uma consulta por tabela, em paralelo, cada uma numa conexão do pool.
+    - sql_union(): um único SELECT ... UNION ALL ... (uma ida ao banco) para quem só tem uma conexão.
+    """
+
+    def __init__(self, pool=None, arquivo_cache=None, ttl_horas=24, max_paralelo=4):
+        self.pool = pool
+        self.arquivo_cache = arquivo_cache or os.path.join(DIR_CACHE, 'faixas_historico.json')
+        self.ttl_horas = ttl_horas
+        self.max_paralelo = max_paralelo
+        self._faixas = None
+        self._lock = threading.Lock()  # Várias threads podem pedir as faixas ao mesmo tempo
+
+    # ------------------------------------------------------------------ #
+    # Faixas de data de cada tabela                                       #
+    # ------------------------------------------------------------------ #
+    def _ler_cache(self):
+        try:
+            with open(self.arquivo_cache, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - dados.get('amostrado_em', 0) > self.ttl_horas * 3600:
+            return None
+        faixas = {}
+        for tabela, (ini, fim) in dados['faixas'].items():
+            faixas[tabela] = (como_data(ini), como_data(fim))
+        return faixas
+
+    def _gravar_cache(self, faixas):
+        try:
+            os.makedirs(os.path.dirname(self.arquivo_cache), exist_ok=True)
+            dados = {
+                'amostrado_em': time.time(),
+                'faixas': {t: [ini and ini.isoformat(), fim and fim.isoformat()] for t, (ini, fim) in faixas.items()}
+            }
+            with open(self.arquivo_cache, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, indent=2)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cache de faixas do histórico: {e}")
+
+    def _amostrar(self, conn):
+        faixas = {}
+        cur = conn.cursor()
+        for tabela in TABELAS_HISTORICO:
+            try:
+                cur.execute(f"SELECT MIN(DATA), MAX(DATA) FROM {tabela}")
+                ini, fim = cur.fetchone()
+            except Exception as e:
+                # Na dúvida a tabela fica sem limites, ou seja, sempre consultada
+                print(f"Aviso: Erro ao amostrar a tabela {tabela}. Erro: {e}")
+                ini, fim = None, None
+            faixas[tabela] = (como_data(ini), como_data(fim))
+        return faixas
+
+    def faixas(self, conn=None, forcar=False):
+        """Dicionário tabela -> (data_min, data_max). Tabela vazia fica (None, None)."""
+        with self._lock:
+            if self._faixas is not None and not forcar:
+                return self._faixas
+            faixas = None if forcar else self._ler_cache()
+            if faixas is None:
+                if conn is not None:
+                    faixas = self._amostrar(conn)
+                elif self.pool is not None:
+                    with self.pool.conexao() as conn_pool:
+                        faixas = self._amostrar(conn_pool)
+                else:
+                    raise ValueError("HistoricoProduto precisa de um pool ou de uma conexão para amostrar as faixas.")
+                self._gravar_cache(faixas)
+            self._faixas = faixas
+            return faixas
+
+    def tabelas(self, data_ini=None, data_fim=None, conn=None):
+        """Tabelas cuja faixa cruza [data_ini, data_fim], da mais recente para a mais antiga."""
+        faixas = self.faixas(conn)
+        data_ini, data_fim = como_data(data_ini), como_data(data_fim)
+        maiores = [fim for _, fim in faixas.values() if fim is not None]
+        mais_recente = max(maiores) if maiores else None
+
+        selecionadas = []
+        for tabela, (ini, fim) in faixas.items():
+            if fim is not None and fim != mais_recente:
+                # Tabela "fechada": só entra se a faixa dela cruzar o período
+                if data_ini is not None and fim < data_ini:
+                    continue
+                if data_fim is not None and ini is not None and ini > data_fim:
+                    continue
+            elif fim is not None:
+                # Tabela que recebe movimento: aberta para cima, só o início importa
+                if data_fim is not None and ini is not None and ini > data_fim:
+                    continue
+            # Tabela vazia (ou que falhou na amostra) sempre entra: pode ser a próxima a receber movimento
+            selecionadas.append(tabela)
+
+        return sorted(selecionadas, key=lambda t: faixas[t][1] or datetime.date.max, reverse=True)
+
+    def data_max(self, tabela):
+        """Maior DATA amostrada da tabela (None se desconhecida ou se a tabela for a que recebe movimento)."""
+        faixas = self.faixas()
+        maiores = [fim for _, fim in faixas.values() if fim is not None]
+        fim = faixas.get(tabela, (None, None))[1]
+        if fim is None or (maiores and fim == max(maiores)):
+            return None
+        return fim
+
+    # ------------------------------------------------------------------ #
+    # Montagem e execução das consultas                                   #
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def sql_tabela(tabela, colunas, where="", data_ini=None, data_fim=None):
+        """
+        SELECT de uma tabela de histórico só, com o filtro de DATA no período.
+        Retorna (sql, params) - params só com as datas; os do 'where' ficam por conta de quem chama.
+        """
+        condicoes = [where] if where else []
+        params_data = []
+        if data_ini is not None:
+            condicoes.append("DATA >= ?")
+            params_data.append(data_ini)
+        if data_fim is not None:
+            condicoes.append("DATA <= ?")
+            params_data.append(data_fim)
+        sql = f"SELECT {colunas} FROM {tabela}"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(f"({c})" for c in condicoes)
+        return sql, params_data
+
+    def sql_union(self, colunas, where="", params=(), data_ini=None, data_fim=None, conn=None, ordem_tabela=False):
+        """
+        Monta um único SELECT com UNION ALL só das tabelas relevantes.
+        Retorna (sql, params) - os parâmetros já vêm repetidos para cada tabela.
+        Com ordem_tabela=True cada linha ganha a coluna ORDEM_TABELA (1 para HISTORICOPRODUTO1, ...).
+        Se nenhuma tabela cruzar o período, devolve (None, ()).
+        """
+        partes, todos_params = [], []
+        for tabela in self.tabelas(data_ini, data_fim, conn):
+            colunas_tabela = colunas
+            if ordem_tabela:
+                colunas_tabela += f", {TABELAS_HISTORICO.index(tabela) + 1} AS ORDEM_TABELA"
+            sql, params_data = self.sql_tabela(tabela, colunas_tabela, where, data_ini, data_fim)
+            partes.append(sql)
+            todos_params.extend(params)
+            todos_params.extend(params_data)
+        if not partes:
+            return None, ()
+        return "\nUNION ALL\n".join(partes), tuple(todos_params)
+
+    def consultar_primeiro(self, conn, colunas, where, params, ordem, data_ini=None, data_fim=None,
+                           por_tabela=False):
+        """
+        SELECT FIRST 1 sobre a união das tabelas relevantes, numa ida só ao banco. Retorna a linha ou None.
+        por_tabela=True reproduz o loop antigo de HISTORICOPRODUTO1 a 10: vale a primeira tabela
+        (nessa ordem) que tiver alguma linha, e só dentro dela a 'ordem' pedida.
+        """
+        sql_base, todos_params = self.sql_union(colunas, where, params, data_ini, data_fim, conn,
+                                                ordem_tabela=por_tabela)
+        if sql_base is None:
+            return None
+        if por_tabela:
+            ordem = f"ORDEM_TABELA, {ordem}"
+        cur = conn.cursor()
+        cur.execute(f"SELECT FIRST 1 * FROM ({sql_base}) H ORDER BY {ordem}", todos_params)
+        row = cur.fetchone()
+        if row and por_tabela:
+            row = tuple(row)[:-1]
+        return row
+
+    def _consultar_tabela(self, tabela, colunas, where, params, data_ini, data_fim):
+        sql, params_data = self.sql_tabela(tabela, colunas, where, data_ini, data_fim)
+        with self.pool.conexao() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, tuple(params) + tuple(params_data))
+            return cur.fetchall()
+
+    def consultar(self, colunas, where="", params=(), data_ini=None, data_fim=None, tabelas=None):
+        """
+        Executa a consulta em cada tabela relevante em paralelo (uma conexão do pool por tabela).
+        Retorna dict tabela -> linhas. Erro numa tabela vira aviso e a tabela volta vazia,
+        como os loops antigos faziam.
+        """
+        if self.pool is None:
+            raise ValueError("consultar() precisa de um pool; para uma conexão só use sql_union().")
+        if tabelas is None:
+            tabelas = self.tabelas(data_ini, data_fim)
+        data_ini, data_fim = como_data(data_ini), como_data(data_fim)
+
+        resultados = {}
+        workers = max(1, min(self.max_paralelo, self.pool.max_tamanho, len(tabelas) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                tabela: executor.submit(self._consultar_tabela, tabela, colunas, where, params, data_ini, data_fim)
+                for tabela in tabelas
+            }
+            for tabela, fut in futures.items():
+                try:
+                    resultados[tabela] = fut.result()
+                except Exception as e:
+                    print(f"Aviso: Erro ao consultar a tabela {tabela}. Erro: {e}")
+                    resultados[tabela] = []
+        return resultados
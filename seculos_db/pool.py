@@ -0,0 +1,243 @@
+import os
+import time
+import atexit
+import threading
+
+from collections import deque
+from contextlib import contextmanager
+
+from .conexao import get_firebird_connection
+
+# Consulta mínima usada para saber se a conexão ainda responde (a VPN derruba sockets ociosos)
+SQL_PING = "SELECT 1 FROM RDB$DATABASE"
+
+
+class FirebirdPool:
+    """
+    Pool de conexões Firebird seguro para threads.
+
+    - Nunca abre mais que 'max_tamanho' conexões; quem pede além disso espera (ou estoura 'timeout').
+    - Conexões ociosas há mais de 'validar_apos' segundos recebem um ping antes de serem entregues.
+    - Conexões mais velhas que 'vida_max' segundos (ou ociosas há mais de 'ocioso_max') são recicladas.
+    - Ao devolver, faz rollback para não carregar transação aberta (e snapshot velho) para o próximo uso.
+    - metricas() devolve contadores de checkout, conexões criadas/descartadas e tempo de espera.
+    """
+
+    def __init__(self, max_tamanho=5, min_tamanho=0, timeout=None, validar_apos=30,
+                 vida_max=1800, ocioso_max=600, fabrica=None):
+        if max_tamanho < 1:
+            raise ValueError("max_tamanho precisa ser pelo menos 1")
+        self.max_tamanho = max_tamanho
+        self.timeout = timeout
+        self.validar_apos = validar_apos
+        self.vida_max = vida_max
+        self.ocioso_max = ocioso_max
+        self._fabrica = fabrica or get_firebird_connection
+
+        self._cond = threading.Condition()
+        self._ociosas = deque()   # (conn, devolvida_em) - LIFO para reaproveitar a mais "quente"
+        self._criada_em = {}      # id(conn) -> instante de criação (inclui as que estão em uso)
+        self._total = 0           # conexões abertas + reservadas em criação
+        self._fechado = False
+        self._pid = os.getpid()
+
+        self._checkouts = 0
+        self._criadas = 0
+        self._descartadas = 0
+        self._pings_falhos = 0
+        self._timeouts = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+        # Pré-aquece as conexões mínimas (ex: o pool fixo do Dynamo)
+        for _ in range(min(min_tamanho, max_tamanho)):
+            conn = self._criar()
+            with self._cond:
+                self._total += 1
+                self._ociosas.append((conn, time.monotonic()))
+
+    # ------------------------------------------------------------------ #
+    # Ciclo de vida das conexões                                          #
+    # ------------------------------------------------------------------ #
+    def _criar(self):
+        conn = self._fabrica()
+        with self._cond:
+            self._criada_em[id(conn)] = time.monotonic()
+            self._criadas += 1
+        return conn
+
+    def _fechar_conexao(self, conn):
+        with self._cond:
+            self._criada_em.pop(id(conn), None)
+            self._descartadas += 1
+        try:
+            conn.close()
+        except Exception:
+            pass  # Socket já morto, nada a fazer
+
+    def _ping(self, conn):
+        try:
+            cur = conn.cursor()
+            cur.execute(SQL_PING)
+            cur.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _precisa_reciclar(self, conn, devolvida_em, agora):
+        criada_em = self._criada_em.get(id(conn), agora)
+        if self.vida_max and agora - criada_em > self.vida_max:
+            return True
+        if self.ocioso_max and agora - devolvida_em > self.ocioso_max:
+            return True
+        return False
+
+    # ------------------------------------------------------------------ #
+    # API pública                                                         #
+    # ------------------------------------------------------------------ #
+    def obter(self, timeout=None):
+        """Pega uma conexão válida do pool, bloqueando se todas estiverem em uso."""
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + timeout if timeout is not None else None
+
+        with self._cond:
+            while True:
+                if self._fechado:
+                    raise RuntimeError("Pool de conexões já foi fechado.")
+                if self._ociosas:
+                    conn, devolvida_em = self._ociosas.pop()
+                    break
+                if self._total < self.max_tamanho:
+                    self._total += 1  # Reserva a vaga antes de conectar fora do lock
+                    conn, devolvida_em = None, None
+                    break
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    self._timeouts += 1
+                    raise TimeoutError(f"Nenhuma conexão livre no pool após {timeout}s "
+                                       f"(max_tamanho={self.max_tamanho}).")
+                self._cond.wait(restante)
+
+        try:
+            if conn is not None:
+                agora = time.monotonic()
+                if self._precisa_reciclar(conn, devolvida_em, agora):
+                    self._fechar_conexao(conn)
+                    conn = None
+                elif self.validar_apos is not None and agora - devolvida_em > self.validar_apos:
+                    if not self._ping(conn):
+                        with self._cond:
+                            self._pings_falhos += 1
+                        self._fechar_conexao(conn)
+                        conn = None
+            if conn is None:
+                conn = self._criar()
+        except Exception:
+            # Não conseguiu conectar: libera a vaga para outra thread tentar
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._checkouts += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devolve a conexão ao pool. Com descartar=True (ou se o rollback falhar) ela é fechada."""
+        if not descartar:
+            try:
+                conn.rollback()
+            except Exception:
+                descartar = True
+
+        if descartar or self._fechado:
+            self._fechar_conexao(conn)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._ociosas.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self, timeout=None):
+        """Uso: with pool.conexao() as conn: ... (a conexão volta ao pool mesmo com erro)."""
+        conn = self.obter(timeout)
+        descartar = False
+        try:
+            yield conn
+        except Exception:
+            # Se o erro foi de rede a conexão não presta mais; se foi de SQL o ping da próxima vez resolve
+            descartar = not self._ping(conn)
+            raise
+        finally:
+            self.devolver(conn, descartar=descartar)
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas. As que estiverem em uso são fechadas ao serem devolvidas."""
+        with self._cond:
+            self._fechado = True
+            ociosas = list(self._ociosas)
+            self._ociosas.clear()
+            self._total -= len(ociosas)
+            self._cond.notify_all()
+        for conn, _ in ociosas:
+            self._fechar_conexao(conn)
+
+    def metricas(self):
+        """Retrato dos contadores do pool (para log ou benchmark)."""
+        with self._cond:
+            return {
+                'max_tamanho': self.max_tamanho,
+                'abertas': self._total,
+                'ociosas': len(self._ociosas),
+                'em_uso': self._total - len(self._ociosas),
+                'checkouts': self._checkouts,
+                'conexoes_criadas': self._criadas,
+                'conexoes_descartadas': self._descartadas,
+                'pings_falhos': self._pings_falhos,
+                'timeouts': self._timeouts,
+                'espera_total_s': round(self._espera_total, 4),
+                'espera_media_s': round(self._espera_total / self._checkouts, 4) if self._checkouts else 0.0,
+                'espera_max_s': round(self._espera_max, 4),
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+_pool_compartilhado = None
+_lock_compartilhado = threading.Lock()
+
+
+def pool_compartilhado(max_tamanho=5, **kwargs):
+    """
+    Pool único por processo, para scripts/telas que consultam o banco várias vezes.
+    Depois de um fork (ProcessPoolExecutor) o filho ganha um pool próprio: sockets herdados não são reutilizados.
+    Quem pede um max_tamanho maior que o do pool já criado faz o pool crescer; as demais opções
+    valem só na criação (chamada posterior com opções é avisada e ignorada).
+    """
+    global _pool_compartilhado
+    with _lock_compartilhado:
+        if _pool_compartilhado is None or _pool_compartilhado._pid != os.getpid():
+            _pool_compartilhado = FirebirdPool(max_tamanho=max_tamanho, **kwargs)
+            atexit.register(_pool_compartilhado.fechar)
+            return _pool_compartilhado
+        pool = _pool_compartilhado
+    if max_tamanho > pool.max_tamanho:
+        with pool._cond:
+            pool.max_tamanho = max_tamanho
+            pool._cond.notify_all()  # Quem espera uma vaga pode conectar agora
+    if kwargs:
+        print(f"Aviso: pool_compartilhado já existe; opções ignoradas: {', '.join(sorted(kwargs))}.")
+    return pool
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import datetime
+
+from collections import defaultdict
+
+from .historico import DIR_CACHE, como_data
+
+
+def _para_texto(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat(sep=' ')
+    return valor.isoformat()
+
+
+def _de_texto(texto):
+    if len(texto) == 10:
+        return datetime.date.fromisoformat(texto)
+    return datetime.datetime.fromisoformat(texto)
+
+
+class SnapshotHistorico:
+    """
+    Cópia local (SQLite) das linhas PEDIDO / NF COMPRA de HISTORICOPRODUTO1..10.
+
+    O histórico antigo não muda, então cada sincronizar() só traz do Firebird as linhas com
+    DATA >= marca d'água (o último dia gravado é apagado e relido, porque pode ter sido
+    copiado pela metade). A primeira carga lê tudo, uma tabela por vez, em lotes.
+    Depois disso as perguntas "quando o item entrou no pedido" e "qual a última NF de compra
+    antes dessa data" são respondidas localmente pelo índice (CDPRODUTO, TIPO, DATA).
+    """
+
+    def __init__(self, historico, arquivo=None, lote=5000):
+        self.historico = historico
+        self.arquivo = arquivo or os.path.join(DIR_CACHE, 'historico_produto.sqlite')
+        self.lote = lote
+        os.makedirs(os.path.dirname(self.arquivo), exist_ok=True)
+        self.db = sqlite3.connect(self.arquivo)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS historico (
+                cdproduto INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                numdoc TEXT,
+                tipo TEXT NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_historico_prod ON historico (cdproduto, tipo, data)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        self.db.commit()
+
+    def fechar(self):
+        self.db.close()
+
+    # ------------------------------------------------------------------ #
+    # Marca d'água                                                        #
+    # ------------------------------------------------------------------ #
+    def marca_dagua(self):
+        """Maior DATA já copiada (date) ou None se o snapshot estiver vazio."""
+        row = self.db.execute("SELECT valor FROM meta WHERE chave = 'marca_dagua'").fetchone()
+        return como_data(row[0]) if row and row[0] else None
+
+    def _gravar_marca_dagua(self):
+        row = self.db.execute("SELECT MAX(data) FROM historico").fetchone()
+        if row and row[0]:
+            self.db.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('marca_dagua', ?)", (row[0][:10],))
+        self.db.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('sincronizado_em', ?)",
+                        (datetime.datetime.now().isoformat(sep=' ', timespec='seconds'),))
+
+    # ------------------------------------------------------------------ #
+    # Sincronização com o Firebird                                        #
+    # ------------------------------------------------------------------ #
+    def _copiar_tabela(self, tabela, desde):
+        # Só estes tipos de movimento interessam ao custo (inserção no pedido e entrada por nota de compra)
+        where = "TIPO IN ('PEDIDO', 'NF COMPRA') AND DATA IS NOT NULL"
+        sql, params = self.historico.sql_tabela(tabela, "CDPRODUTO, DATA, NUMDOCUMENTO, TIPO", where, desde)
+        total = 0
+        with self.historico.pool.conexao() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, tuple(params))
+            while True:
+                linhas = cur.fetchmany(self.lote)
+                if not linhas:
+                    break
+                self.db.executemany(
+                    "INSERT INTO historico (cdproduto, data, numdoc, tipo) VALUES (?, ?, ?, ?)",
+                    [(cd, _para_texto(data), numdoc, tipo) for cd, data, numdoc, tipo in linhas])
+                total += len(linhas)
+        return total
+
+    def sincronizar(self):
+        """Traz do Firebird só o que é novo desde a marca d'água. Retorna quantas linhas foram lidas."""
+        desde = self.marca_dagua()
+        tabelas = self.historico.tabelas(desde, None)
+
+        if desde is None:
+            print(f"Snapshot do histórico vazio: carga inicial de {len(tabelas)} tabelas (só acontece uma vez)...")
+        else:
+            print(f"Atualizando snapshot do histórico a partir de {desde} ({len(tabelas)} tabela(s))...")
+
+        total = 0
+        try:
+            if desde is not None:
+                # O último dia pode ter sido copiado pela metade: apaga e relê
+                self.db.execute("DELETE FROM historico WHERE data >= ?", (desde.isoformat(),))
+            for tabela in tabelas:
+                total += self._copiar_tabela(tabela, desde)
+            self._gravar_marca_dagua()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        print(f"Snapshot atualizado: {total} linhas lidas do Firebird (marca d'água {self.marca_dagua()}).")
+        return total
+
+    # ------------------------------------------------------------------ #
+    # Consultas locais                                                    #
+    # ------------------------------------------------------------------ #
+    def eventos(self, produtos_ids, data_fim):
+        """
+        Mesmo formato de pre_cache_historico_produtos: cd_produto -> [{'data', 'numdoc', 'tipo'}, ...]
+        com os eventos PEDIDO / NF COMPRA até data_fim.
+        """
+        historico_por_produto = defaultdict(list)
+        produtos_ids = list(produtos_ids)
+        # Mesma comparação do Firebird: datetime à meia-noite não pega as horas seguintes do dia
+        fim = _para_texto(data_fim if isinstance(data_fim, datetime.date) else como_data(data_fim))
+        # SQLite aceita no máximo 999 parâmetros nas versões antigas
+        for i in range(0, len(produtos_ids), 900):
+            grupo = produtos_ids[i:i + 900]
+            format_strings = ','.join(['?'] * len(grupo))
+            cur = self.db.execute(f"""
+                SELECT cdproduto, data, numdoc, tipo FROM historico
+                WHERE cdproduto IN ({format_strings}) AND data <= ?
+            """, tuple(grupo) + (fim,))
+            for cd_produto, data, numdoc, tipo in cur:
+                historico_por_produto[cd_produto].append({
+                    'data': _de_texto(data),
+                    'numdoc': numdoc,
+                    'tipo': tipo
+                })
+        return historico_por_produto
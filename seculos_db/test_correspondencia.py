@@ -0,0 +1,50 @@
+from seculos_db.correspondencia import BuscaAproximada, chave_nome
+
+NOMES = [
+    "AUTO PECAS BRASIL LTDA",
+    "AUTO PECAS BRASILIA LTDA",
+    "123 - Peças São João Ltda.",
+    "DISTRIBUIDORA NORTE",
+    "DISTRIBUIDORA NORTE SUL",
+    "FERRAGENS CENTRAL",
+]
+
+
+def test_chave_ignora_codigo_acento_e_termos_comuns():
+    assert chave_nome("123 - Peças São João Ltda.") == "PECAS SAO JOAO"
+    # Nome feito só de termos ignorados fica como está
+    assert chave_nome("COMERCIO E INDUSTRIA LTDA") == "COMERCIO E INDUSTRIA LTDA"
+
+
+def test_mesma_chave_vem_primeiro_com_nota_maxima():
+    busca = BuscaAproximada(NOMES)
+
+    candidatos = busca.candidatos("AUTO PECAS BRASIL EIRELI")
+
+    assert [nome for nome, _ in candidatos] == ["AUTO PECAS BRASIL LTDA", "AUTO PECAS BRASILIA LTDA"]
+    assert candidatos[0][1] == 1.0 and candidatos[1][1] < 1.0
+
+
+def test_ordem_das_palavras_e_acentos():
+    busca = BuscaAproximada(NOMES)
+
+    nome, nota = busca.candidatos("JOAO SAO PECAS")[0]
+
+    assert nome == "123 - Peças São João Ltda."
+    assert 0.6 <= nota < 1.0
+
+
+def test_ranking_limite_e_corte():
+    busca = BuscaAproximada(NOMES)
+
+    candidatos = busca.candidatos("DISTRIBUIDORA NORTE LTDA", limite=3)
+    assert [nome for nome, _ in candidatos] == ["DISTRIBUIDORA NORTE", "DISTRIBUIDORA NORTE SUL"]
+    assert candidatos[0][1] > candidatos[1][1]
+
+    assert len(busca.candidatos("DISTRIBUIDORA NORTE LTDA", limite=1)) == 1
+    assert busca.candidatos("XYZ") == []
+    assert busca.candidatos("FERRAGENS CENTRO", corte=0.95) == []
+
+
+def test_indice_ignora_repetidos_e_vazios():
+    assert len(BuscaAproximada(["A B C", "A B C", "", None, "LTDA"])) == 2
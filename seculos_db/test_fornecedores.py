@@ -0,0 +1,111 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from seculos_db.fornecedores import IndiceFornecedores
+
+
+@pytest.fixture
+def firebird():
+    """FORNECEDOR em memória no lugar do Firebird."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE FORNECEDOR (CDFORNECEDOR INTEGER PRIMARY KEY, NOME TEXT, CPF_CNPJ TEXT)")
+    conn.executemany("INSERT INTO FORNECEDOR VALUES (?, ?, ?)", [
+        (1, "Peças São João Ltda", "11.111.111/0001-11"),
+        (2, "AUTO PECAS BRASIL", "22222222000122"),
+    ])
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def planilha(tmp_path):
+    caminho = str(tmp_path / "dados_bancarios.xlsx")
+    pd.DataFrame({"Fornecedor": ["AUTO PECAS BRASIL"], "Chave PIX": ["pix@brasil"]}).to_excel(caminho, index=False)
+    return caminho
+
+
+def novo_indice(tmp_path, arquivo_config=None):
+    return IndiceFornecedores(arquivo_config, arquivo=str(tmp_path / "cache" / "fornecedores.sqlite"))
+
+
+def test_tabela_so_e_relida_quando_count_ou_max_mudam(tmp_path, firebird):
+    indice = novo_indice(tmp_path)
+    try:
+        assert indice.atualizar(firebird) == (True, False)
+        assert indice.cnpj_por_nome("auto pecas brasil") == "22222222000122"
+        assert [cd for cd, _, _ in indice.por_nome("PECAS SAO JOAO LTDA")] == [1]
+        assert [cd for cd, _, _ in indice.por_cnpj("11111111000111")] == [1]
+
+        assert indice.atualizar(firebird) == (False, False)
+
+        # Fornecedor novo: muda COUNT e MAX
+        firebird.execute("INSERT INTO FORNECEDOR VALUES (3, 'DISTRIBUIDORA NORTE', NULL)")
+        assert indice.atualizar(firebird) == (True, False)
+        assert len(indice) == 3
+
+        # Um sai e outro entra: COUNT igual, MAX diferente
+        firebird.execute("DELETE FROM FORNECEDOR WHERE CDFORNECEDOR = 1")
+        firebird.execute("INSERT INTO FORNECEDOR VALUES (4, 'FERRAGENS CENTRAL', '44444444000144')")
+        assert indice.atualizar(firebird) == (True, False)
+        assert indice.por_nome("Peças São João Ltda") == []
+        assert indice.aproximados("FERRAGENS CENTRAL")[0][:2] == ("FERRAGENS CENTRAL", "44444444000144")
+    finally:
+        indice.fechar()
+
+
+def test_copia_local_da_tabela_vale_para_a_proxima_abertura(tmp_path, firebird):
+    indice = novo_indice(tmp_path)
+    indice.atualizar(firebird)
+    indice.fechar()
+
+    indice = novo_indice(tmp_path)
+    try:
+        assert len(indice) == 2
+        assert indice.atualizar(firebird) == (False, False)
+    finally:
+        indice.fechar()
+
+
+def test_planilha_so_e_relida_quando_a_data_de_modificacao_muda(tmp_path, planilha):
+    indice = novo_indice(tmp_path, planilha)
+    try:
+        assert indice.atualizar() == (False, True)
+        assert indice.atualizar() == (False, False)
+
+        pd.DataFrame({"Fornecedor": ["AUTO PECAS BRASIL", "FERRAGENS CENTRAL"],
+                      "Chave PIX": ["pix@novo", "pix@ferragens"]}).to_excel(planilha, index=False)
+        mtime = os.path.getmtime(planilha) + 10
+        os.utime(planilha, (mtime, mtime))
+        assert indice.atualizar() == (False, True)
+        assert indice.planilha()["Chave PIX"].tolist() == ["pix@novo", "pix@ferragens"]
+    finally:
+        indice.fechar()
+
+
+def test_planilha_inacessivel_usa_a_ultima_copia_lida(tmp_path, planilha, capsys):
+    indice = novo_indice(tmp_path, planilha)
+    indice.atualizar()
+    indice.fechar()
+    os.remove(planilha)
+
+    # Outra abertura (o robô reiniciado) sem acesso à rede
+    indice = novo_indice(tmp_path, planilha)
+    try:
+        assert indice.atualizar() == (False, False)
+        assert "Usando a última cópia lida" in capsys.readouterr().out
+        assert indice.planilha()["Chave PIX"].tolist() == ["pix@brasil"]
+    finally:
+        indice.fechar()
+
+
+def test_planilha_inacessivel_sem_copia_local_da_erro(tmp_path):
+    indice = novo_indice(tmp_path, str(tmp_path / "nao_existe.xlsx"))
+    try:
+        with pytest.raises(OSError):
+            indice.atualizar()
+        assert indice.planilha() is None
+    finally:
+        indice.fechar()
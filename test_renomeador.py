@@ -0,0 +1,253 @@
+import os
+import json
+
+import pdfplumber
+import pytest
+
+from PIL import Image, ImageDraw, ImageFont
+
+import renomeador
+from renomeador import CacheTextos, MotorRapidOCR, MotorRenomeador, MotorTesseract, ServicoOCR
+
+PAGINAS = [
+    ["COMPROVANTE DE PAGAMENTO", "FAVORECIDO COELBA", "VALOR 150,25"],
+    ["COMPROVANTE DE TRANSFERENCIA", "FAVORECIDO EMBASA", "VALOR 80,00"],
+    ["COMPROVANTE DE PAGAMENTO", "FAVORECIDO SEFAZ BAHIA", "VALOR 1200,00"],
+]
+
+
+def renderizar(linhas):
+    """Página branca com texto preto grande, como um comprovante escaneado limpo."""
+    fonte = ImageFont.load_default(size=48)
+    im = Image.new("RGB", (1400, 120 + 90 * len(linhas)), "white")
+    desenho = ImageDraw.Draw(im)
+    for k, linha in enumerate(linhas):
+        desenho.text((60, 60 + 90 * k), linha, fill="black", font=fonte)
+    return im
+
+
+def normalizar(texto):
+    return " ".join(texto.upper().split())
+
+
+def motor_ou_pular(classe):
+    if not classe(print).disponivel():
+        pytest.skip(f"{classe.nome} não instalado")
+    return classe
+
+
+@pytest.fixture(params=[MotorTesseract, MotorRapidOCR], ids=lambda classe: classe.nome)
+def servico(request):
+    servico = ServicoOCR(log=lambda mensagem: None, motores=(motor_ou_pular(request.param),))
+    yield servico
+    servico.fechar()
+
+
+@pytest.mark.parametrize("quantas", [1, 3])
+def test_reconhece_as_paginas_na_ordem(servico, quantas):
+    textos = servico.reconhecer([renderizar(linhas) for linhas in PAGINAS[:quantas]])
+
+    assert len(textos) == quantas
+    for texto, linhas in zip(textos, PAGINAS):
+        texto = normalizar(texto)
+        assert len(texto) > ServicoOCR.MIN_CARACTERES
+        for palavra in linhas[1].split()[1:] + ["COMPROVANTE"]:
+            assert palavra in texto
+
+    nome = servico.motores[0].nome
+    latencias = servico.tomar_latencias()
+    assert list(latencias) == [nome]
+    segundos, paginas = latencias[nome]
+    assert paginas == quantas and segundos > 0
+    assert servico.tomar_latencias() == {}
+
+
+class MotorFalso:
+    """Devolve texto curto para as páginas em 'fracas' (o serviço deve tentar o próximo motor)."""
+    nome = "falso"
+    fracas = ()
+
+    def __init__(self, log):
+        self.chamadas = []
+
+    def disponivel(self):
+        return True
+
+    def reconhecer(self, imagens):
+        self.chamadas.append(len(imagens))
+        return ["ok" if im.info.get("pagina") in self.fracas else f"texto da pagina {im.info['pagina']} " * 5
+                for im in imagens]
+
+    def fechar(self):
+        pass
+
+
+class MotorFraco(MotorFalso):
+    nome = "fraco"
+    fracas = (1,)
+
+
+def test_pagina_com_pouco_texto_vai_para_o_proximo_motor():
+    imagens = []
+    for i in range(3):
+        im = Image.new("RGB", (10, 10), "white")
+        im.info["pagina"] = i
+        imagens.append(im)
+    servico = ServicoOCR(log=lambda mensagem: None, motores=(MotorFraco, MotorFalso))
+
+    textos = servico.reconhecer(imagens)
+
+    assert [t.split()[3] for t in textos] == ["0", "1", "2"]
+    assert [m.chamadas for m in servico.motores] == [[3], [1]]
+    latencias = servico.tomar_latencias()
+    assert {nome: paginas for nome, (_, paginas) in latencias.items()} == {"fraco": 3, "falso": 1}
+
+
+# --- Lote, cache de textos e vigia ---
+
+@pytest.fixture
+def motor(tmp_path, monkeypatch):
+    """MotorRenomeador sem regras (todo comprovante vira DATA_PGTO.pdf) e com o cache na pasta temporária."""
+    monkeypatch.setattr(renomeador, "ARQUIVO_CACHE_TEXTOS", str(tmp_path / "cache" / "textos.sqlite"))
+    regras = tmp_path / "regras.json"
+    regras.write_text(json.dumps({"regras": [], "recorrentes": [], "termos_ignorar": [], "regras_data": {}}))
+    motor = MotorRenomeador(str(regras))
+    motor.log = lambda mensagem: None
+    yield motor
+    motor.fechar()
+
+
+def gerar_pdf(caminho, linhas):
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(str(caminho))
+    for k, linha in enumerate(linhas):
+        c.drawString(50, 800 - 15 * k, linha)
+    c.save()
+
+
+def texto_pdf(caminho):
+    with pdfplumber.open(caminho) as pdf:
+        return pdf.pages[0].extract_text()
+
+
+@pytest.mark.parametrize("simular", [False, True], ids=["renomeando", "simulacao"])
+def test_lote_no_pool_mantem_ordem_e_sufixos(tmp_path, motor, monkeypatch, simular):
+    monkeypatch.setattr(renomeador, "MAX_PROCESSOS", 2)
+    pasta = tmp_path / "05-03-26"
+    pasta.mkdir()
+    # Tamanhos diferentes para os processos terminarem fora de ordem; todos geram o mesmo nome
+    arquivos = []
+    for i in range(6):
+        caminho = pasta / f"comprovante_{i}.pdf"
+        gerar_pdf(caminho, [f"COMPROVANTE {i}"] + ["LINHA DE ENCHIMENTO"] * (40 * (i % 3)))
+        arquivos.append(str(caminho))
+
+    resultados = motor.processar_lote(arquivos, simular=simular)
+
+    esperados = ["05-03-26_PGTO.pdf"] + [f"05-03-26_PGTO_{i}.pdf" for i in range(2, 7)]
+    assert [r[0] for r in resultados] == arquivos
+    assert [os.path.basename(r[1]) for r in resultados] == esperados
+    assert motor._pool is not None
+    if not simular:
+        assert [texto_pdf(pasta / nome).split("\n")[0] for nome in esperados] == [
+            f"COMPROVANTE {i}" for i in range(6)]
+        assert not any(os.path.exists(c) for c in arquivos)
+
+
+def test_cache_despeja_os_usados_ha_mais_tempo(tmp_path, monkeypatch):
+    relogio = iter(range(1000))
+    monkeypatch.setattr(renomeador.time, "time", lambda: next(relogio))
+    cache = CacheTextos("teste", arquivo=str(tmp_path / "textos.sqlite"), limite_mb=1000 / (1024 * 1024))
+    try:
+        for chave in "ABC":
+            cache.gravar(chave, "x" * 300, "", 1)
+        assert cache.obter("A") is not None  # A passa a ser o mais recente
+
+        # 1200 bytes > 1000: apaga os mais antigos até sobrar 80% do limite (B e C)
+        cache.gravar("D", "x" * 200, "y" * 100, 1)
+
+        assert sorted(c for c, in cache.db.execute("SELECT chave FROM textos")) == ["A", "D"]
+        assert cache.obter("B") is None
+        assert (cache.acertos, cache.faltas) == (1, 1)
+    finally:
+        cache.fechar()
+
+
+@pytest.mark.parametrize("nativo, ocr, guarda", [
+    ("Internet Banking Inter\nChave Pix\n", "", False),
+    ("Internet Banking Inter\nChave Pix\n", "PGTO MENSALIDADE R$ 10,00", True),
+    ("SISBB - BANCO DO BRASIL\nR$ 10,00\n", "", True),
+], ids=["ocr_falhou", "ocr_ok", "sem_ocr"])
+def test_cache_nao_guarda_ocr_que_falhou(tmp_path, motor, nativo, ocr, guarda):
+    cache = CacheTextos("teste", arquivo=str(tmp_path / "textos.sqlite"))
+    motor._latencias_lote = {}
+    try:
+        _, texto, paginas, _, erro = motor._resultado_extracao(
+            cache, "comprovante.pdf", "chave", ((nativo, ocr, 1), [], None, {}))
+
+        assert (erro, paginas) == (None, 1) and ocr in texto
+        assert (cache.obter("chave") is not None) == guarda
+    finally:
+        cache.fechar()
+
+
+def test_vigia_espera_o_arquivo_parar_e_nao_repete(tmp_path, motor, monkeypatch):
+    pasta = tmp_path / "vigiada"
+    pasta.mkdir()
+    (pasta / "antigo.pdf").write_bytes(b"%PDF antigo")
+    lotes = []
+
+    def processar_lote(prontos, simular=False):
+        lotes.append([os.path.basename(p) for p in prontos])
+        resultados = []
+        for caminho in prontos:
+            if os.path.basename(caminho) == "ruim.pdf" and len(lotes) < 3:
+                resultados.append((caminho, None, "PDF truncado"))
+            else:
+                novo = caminho[:-4] + "_PGTO.pdf"
+                os.rename(caminho, novo)
+                resultados.append((caminho, novo, None))
+        return resultados
+
+    def acrescentar(nome, dados):
+        with open(pasta / nome, "ab") as f:
+            f.write(dados)
+
+    # passos[i] roda no sleep depois da volta i; a volta i vê o relógio em i segundos (intervalo=1, espera=2)
+    passos = [
+        lambda: acrescentar("novo.pdf", b"%PDF parte 1"),
+        lambda: acrescentar("novo.pdf", b" parte 2"),   # ainda copiando: a espera recomeça na volta 2
+        lambda: (acrescentar("ruim.pdf", b"%PDF"), acrescentar("vazio.pdf", b"")),
+        lambda: None,
+        lambda: None,
+        lambda: None,
+        lambda: None,
+        lambda: None,
+        lambda: acrescentar("ruim.pdf", b" resto"),    # mudou depois da falha: volta para a fila
+        lambda: None,
+        lambda: None,
+        lambda: None,
+    ]
+    relogio = [0.0]
+    lotes_por_volta = []
+
+    def dormir(segundos):
+        lotes_por_volta.append(len(lotes))
+        if not passos:
+            raise KeyboardInterrupt
+        relogio[0] += segundos
+        passos.pop(0)()
+
+    monkeypatch.setattr(renomeador.time, "monotonic", lambda: relogio[0])
+    monkeypatch.setattr(renomeador.time, "sleep", dormir)
+    monkeypatch.setattr(renomeador, "_pode_abrir", lambda caminho: True)
+    monkeypatch.setattr(motor, "processar_lote", processar_lote)
+
+    motor.vigiar(str(pasta), intervalo=1, espera=2)
+
+    assert lotes == [["novo.pdf"], ["ruim.pdf"], ["ruim.pdf"]]
+    # novo.pdf na volta 4 (parado desde a 2), ruim.pdf na 5 (falha), nada nas 6-8 (falhou e não mudou),
+    # ruim.pdf de novo na 11 (mudou na 9); vazio.pdf e antigo.pdf nunca, nem os nomes gerados
+    assert lotes_por_volta == [0, 0, 0, 0, 1, 2, 2, 2, 2, 2, 2, 3, 3]
+    assert sorted(os.listdir(pasta)) == ["antigo.pdf", "novo_PGTO.pdf", "ruim_PGTO.pdf", "vazio.pdf"]
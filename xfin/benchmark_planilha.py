@@ -0,0 +1,164 @@
+# benchmark_planilha.py
+"""
+Benchmark da planilha de pagamentos: create_excel (write-only) contra create_excel_legado (célula a célula).
+
+Gera um mês sintético de contas a pagar com as mesmas colunas que o process_data entrega (filiais, formas
+de pagamento com mais de um banco, PIX com vários títulos por fornecedor, faturas), grava o arquivo pelos
+dois caminhos e mostra tempo (mediana de --repeticoes) e pico de memória de cada um.
+Com --conferir, abre os dois arquivos e compara célula a célula (valor, fonte, preenchimento, borda,
+formato), mesclas, validações de agendamento e formatação condicional.
+
+Exemplos:
+    python xfin/benchmark_planilha.py --linhas 20000 --repeticoes 3 --conferir
+    python xfin/benchmark_planilha.py --linhas 5000 --saida temp_xfin/benchmark
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+import pandas as pd
+
+from planilha_pagamentos import create_excel, create_excel_legado
+
+COLS_MAP = ("pessoa", "dataVencimento", "valor", "numeroDocumento", "descricao", "tipoDocumento", "banco")
+
+FILIAIS = [(1, "LOJA"), (2, "OFICINA"), (3, "DIVISA"), (4, "SERVIÇOS")]
+FORMAS = ["NF", "BOLETO", "PIX", "VALE", "CRÉDITO", "DDA"]
+BANCOS = ["", "ITAU", "BNB", "SICOOB"]
+
+
+def dados_sinteticos(linhas, semente=42):
+    """DataFrame com 'linhas' títulos a pagar num mês, no formato de saída do process_data."""
+    rnd = random.Random(semente)
+    fornecedores = [f"FORNECEDOR {i:04d} LTDA" for i in range(max(10, linhas // 8))]
+    inicio = pd.Timestamp("2025-01-01")
+    registros = []
+    for i in range(linhas):
+        filial_order, filial_sheet = rnd.choice(FILIAIS)
+        forma = rnd.choice(FORMAS)
+        fornecedor = rnd.choice(fornecedores)
+        registros.append({
+            "pessoa": fornecedor,
+            "dataVencimento": inicio + pd.Timedelta(days=rnd.randrange(31)),
+            "valor": round(rnd.uniform(10, 20000), 2),
+            "numeroDocumento": str(rnd.randrange(1, 999999)),
+            "descricao": f"Obs {i}",
+            "tipoDocumento": forma,
+            "banco": rnd.choice(BANCOS),
+            "Filial_Order": filial_order,
+            "Filial_Sheet": filial_sheet,
+            "Config_Banco": f"{rnd.randrange(1, 999):03d} / {rnd.randrange(1000, 99999)}",
+            "CNPJ_Final": f"{rnd.randrange(10**13, 10**14)}",
+            "Config_Nome Titular": fornecedor.title(),
+            "Config_Chave PIX": f"chave{fornecedor[-9:-5]}@pix",
+            "Fatura": str(rnd.randrange(100, 200)) if forma == "BOLETO" and rnd.random() < 0.3 else "",
+        })
+    return pd.DataFrame(registros)
+
+
+def medir(funcao, df, caminho, repeticoes):
+    """(mediana em segundos, pico de memória em MiB) de 'repeticoes' gravações."""
+    tempos = []
+    for _ in range(repeticoes):
+        copia = df.copy()
+        inicio = time.perf_counter()
+        funcao(copia, caminho, COLS_MAP)
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    funcao(df.copy(), caminho, COLS_MAP)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(tempos), pico / 1024 / 1024
+
+
+def _descrever_estilo(cell):
+    font, fill, border = cell.font, cell.fill, cell.border
+    # Lado sem borda pode vir como None ou como Side() vazio, conforme quem gravou o arquivo
+    lados = tuple(lado.style if lado is not None else None
+                  for lado in (border.left, border.right, border.top, border.bottom))
+    return (
+        font.b, font.sz, font.color.rgb if font.color is not None else None,
+        fill.fill_type, fill.fgColor.rgb if fill.fill_type else None,
+        lados, cell.number_format, cell.alignment.vertical,
+    )
+
+
+def conferir(caminho_a, caminho_b):
+    """Lista de diferenças entre os dois arquivos (vazia se o layout for o mesmo)."""
+    import openpyxl
+
+    wb_a = openpyxl.load_workbook(caminho_a)
+    wb_b = openpyxl.load_workbook(caminho_b)
+    diferencas = []
+    if wb_a.sheetnames != wb_b.sheetnames:
+        return [f"abas: {wb_a.sheetnames} != {wb_b.sheetnames}"]
+
+    for nome in wb_a.sheetnames:
+        ws_a, ws_b = wb_a[nome], wb_b[nome]
+        celulas_a = {(c.row, c.column): c for linha in ws_a.iter_rows() for c in linha if c.value is not None}
+        celulas_b = {(c.row, c.column): c for linha in ws_b.iter_rows() for c in linha if c.value is not None}
+        if celulas_a.keys() != celulas_b.keys():
+            diferencas.append(f"{nome}: células preenchidas diferentes "
+                              f"({len(celulas_a.keys() ^ celulas_b.keys())} posições)")
+        for posicao in sorted(celulas_a.keys() & celulas_b.keys()):
+            a, b = celulas_a[posicao], celulas_b[posicao]
+            if a.value != b.value:
+                diferencas.append(f"{nome}!{a.coordinate}: valor {a.value!r} != {b.value!r}")
+            elif _descrever_estilo(a) != _descrever_estilo(b):
+                diferencas.append(f"{nome}!{a.coordinate}: estilo {_descrever_estilo(a)} != {_descrever_estilo(b)}")
+
+        if sorted(map(str, ws_a.merged_cells.ranges)) != sorted(map(str, ws_b.merged_cells.ranges)):
+            diferencas.append(f"{nome}: mesclas diferentes")
+        validacoes_a = sorted(str(dv.sqref) for dv in ws_a.data_validations.dataValidation)
+        validacoes_b = sorted(str(dv.sqref) for dv in ws_b.data_validations.dataValidation)
+        if validacoes_a != validacoes_b:
+            diferencas.append(f"{nome}: validações diferentes")
+        regras_a = sorted((str(cf.sqref), tuple(r.formula)) for cf in ws_a.conditional_formatting for r in cf.rules)
+        regras_b = sorted((str(cf.sqref), tuple(r.formula)) for cf in ws_b.conditional_formatting for r in cf.rules)
+        if regras_a != regras_b:
+            diferencas.append(f"{nome}: formatação condicional diferente")
+        for coluna in "ABCDEFGHKL":
+            if ws_a.column_dimensions[coluna].width != ws_b.column_dimensions[coluna].width:
+                diferencas.append(f"{nome}: largura da coluna {coluna} diferente")
+    return diferencas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da planilha de pagamentos (write-only x célula a célula)")
+    parser.add_argument("--linhas", type=int, default=10000, help="Títulos a pagar no mês sintético")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", default=None, help="Pasta dos arquivos gerados (padrão: pasta temporária)")
+    parser.add_argument("--conferir", action="store_true", help="Compara os dois arquivos célula a célula")
+    args = parser.parse_args()
+
+    saida = args.saida or tempfile.mkdtemp(prefix="benchmark_planilha_")
+    os.makedirs(saida, exist_ok=True)
+    df = dados_sinteticos(args.linhas)
+    caminho_novo = os.path.join(saida, "pagamentos_write_only.xlsx")
+    caminho_legado = os.path.join(saida, "pagamentos_legado.xlsx")
+
+    print(f"{args.linhas} títulos, {args.repeticoes} repetições, arquivos em {saida}")
+    tempo_legado, memoria_legado = medir(create_excel_legado, df, caminho_legado, args.repeticoes)
+    print(f"  célula a célula: {tempo_legado:8.3f}s  pico {memoria_legado:7.1f} MiB")
+    tempo_novo, memoria_novo = medir(create_excel, df, caminho_novo, args.repeticoes)
+    print(f"  write-only:      {tempo_novo:8.3f}s  pico {memoria_novo:7.1f} MiB")
+    print(f"  ganho: {tempo_legado / tempo_novo:.2f}x no tempo, {memoria_legado / memoria_novo:.2f}x na memória")
+
+    if args.conferir:
+        diferencas = conferir(caminho_legado, caminho_novo)
+        if diferencas:
+            print(f"Layout DIFERENTE ({len(diferencas)} diferenças):")
+            for diferenca in diferencas[:20]:
+                print(f"  {diferenca}")
+            sys.exit(1)
+        print("Layout conferido: mesmas células, estilos, mesclas, validações e formatação condicional.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+-- Recorte mínimo das tabelas do Seculos usadas por receb_sec_p_xfin.py (SQLite no lugar do Firebird).
+-- Cada pedido cobre uma regra: fatura, recebimento de carteira, cartão de crédito/débito, misto,
+-- à vista, previsão de carteira, cliente de boleto e os filtros da consulta de pedidos.
+
+CREATE TABLE CLIENTE (CDCLIENTE INTEGER PRIMARY KEY, NOME TEXT);
+CREATE TABLE PEDIDOVENDA (
+    CDPEDIDOVENDA INTEGER PRIMARY KEY, DATA DATE, VALORCDESC REAL, CDFORMAPAG INTEGER, CDCLIENTE INTEGER,
+    EFETIVADO TEXT, DEVOLVIDO TEXT, CDFUNC INTEGER, VALORTOTALPRODUTOS REAL, NOMECLIENTE TEXT
+);
+CREATE TABLE NOTA (CDNOTA INTEGER PRIMARY KEY, CDPEDIDOVENDA INTEGER, CDFATURA INTEGER);
+CREATE TABLE DUPLICATADAFATURA (
+    NUMDUPLICATA TEXT, VALOR REAL, DTVENCIMENTO DATE, PAGO TEXT, DTULTPGTO DATE, JUROSTOTALPAGO REAL,
+    DTSITUACAO DATE, CDFATURA INTEGER
+);
+CREATE TABLE RECEBIMENTO (
+    CDRECEBIMENTO INTEGER PRIMARY KEY, DATA DATE, CDFORMAPAG INTEGER, VALORTOTAL REAL, CDCLIENTE INTEGER
+);
+CREATE TABLE ITENSRECEBIMENTO (CDRECEBIMENTO INTEGER, VALORREAL REAL, CDNOTA INTEGER, CDPEDIDOVENDA INTEGER);
+CREATE TABLE PAGAMENTOSACARTAO (
+    CDPAGAMENTOACARTAO INTEGER PRIMARY KEY, CREDITODEBITO TEXT, CDPEDIDOVENDA INTEGER, CDRECEBIMENTO INTEGER
+);
+CREATE TABLE PARCELASCARTAO (
+    PARCELANUM INTEGER, VALOR REAL, DTVENCIMENTO DATE, LANCADO TEXT, DTCOMPENSADO DATE, CDPAGAMENTOACARTAO INTEGER
+);
+
+INSERT INTO CLIENTE VALUES (1, 'OFICINA SAO JOSE'), (2, 'MARIA DE SOUZA'), (3, 'TRANSPORTES BOLETO LTDA'),
+                           (4, NULL), (5, 'JOAO CARTAO');
+
+INSERT INTO PEDIDOVENDA VALUES
+    -- Faturado: três duplicatas, uma paga com juros, uma paga sem data, uma em aberto
+    (5001, '2026-01-05', 900.00, 5, 1, 'S', NULL, 10, 900.00, 'OFICINA SAO JOSE'),
+    -- A prazo com recebimento pela nota: um em dinheiro, um no cartão de crédito (parcelas), um zerado
+    (5002, '2026-01-10', 300.00, 5, 2, 'S', 'N', 10, 300.00, 'MARIA DE SOUZA'),
+    -- A prazo sem nota nem recebimento, cliente sem boleto: previsão de carteira (7 dias)
+    (5003, '2026-02-01', 150.50, 5, 2, 'S', NULL, 11, 150.50, 'MARIA DE SOUZA'),
+    -- A prazo de cliente que paga boleto: não gera título
+    (5004, '2026-02-02', 80.00, 26, 3, 'S', NULL, 11, 80.00, 'TRANSPORTES BOLETO LTDA'),
+    -- À vista em dinheiro e PIX, cliente sem nome
+    (5005, '2026-02-03', 45.90, 1, 4, 'S', NULL, 10, 45.90, 'BALCAO'),
+    (5006, '2026-02-04', 120.00, 27, 5, 'S', NULL, 10, 0.01, 'JOAO CARTAO'),
+    -- Cartão de crédito em 3 parcelas (uma compensada) e cartão de débito
+    (5007, '2026-02-05', 600.00, 4, 5, 'S', NULL, 10, 600.00, 'JOAO CARTAO'),
+    (5008, '2026-02-06', 75.00, 4, 5, 'S', NULL, 10, 75.00, 'JOAO CARTAO'),
+    -- Misto (16) todo no cartão
+    (5009, '2026-02-07', 200.00, 16, 5, 'S', NULL, 10, 200.00, 'JOAO CARTAO'),
+    -- Cartão sem pagamento lançado: sem título
+    (5010, '2026-02-08', 99.00, 35, 5, 'S', NULL, 10, 99.00, 'JOAO CARTAO'),
+    -- Venda de 2025 paga em 2025 (fica fora pelo corte) e fatura de 2025 com parcela que vence em 2026
+    (5011, '2025-06-01', 50.00, 1, 1, 'S', NULL, 10, 50.00, 'OFICINA SAO JOSE'),
+    (5012, '2025-12-20', 400.00, 5, 1, 'S', NULL, 10, 400.00, 'OFICINA SAO JOSE'),
+    -- Filtrados pela consulta: não efetivado, devolvido, funcionário excluído, só serviço, COMAGRO, antigo
+    (5013, '2026-03-01', 10.00, 1, 1, 'N', NULL, 10, 10.00, 'OFICINA SAO JOSE'),
+    (5014, '2026-03-01', 10.00, 1, 1, 'S', 'S', 10, 10.00, 'OFICINA SAO JOSE'),
+    (5015, '2026-03-01', 10.00, 1, 1, 'S', NULL, 2621, 10.00, 'OFICINA SAO JOSE'),
+    (5016, '2026-03-01', 10.00, 1, 1, 'S', NULL, 10, 0, 'OFICINA SAO JOSE'),
+    (5017, '2026-03-01', 10.00, 1, 1, 'S', NULL, 10, 10.00, 'COMAGRO MATRIZ'),
+    (5018, '2024-12-31', 10.00, 1, 1, 'S', NULL, 10, 10.00, 'OFICINA SAO JOSE'),
+    -- A prazo sem nota com recebimento pelo pedido, em depósito Bradesco
+    (5019, '2026-03-02', 210.00, 10, 1, 'S', NULL, 10, 210.00, 'OFICINA SAO JOSE');
+
+INSERT INTO NOTA VALUES (7001, 5001, 9001), (7002, 5002, 0), (7012, 5012, 9012);
+
+INSERT INTO DUPLICATADAFATURA VALUES
+    ('123/1', 300.00, '2026-02-05', 'S', '2026-02-07', 4.5, '2026-01-05', 9001),
+    ('123/2', 300.00, '2026-03-05', 'S', NULL, NULL, '2026-01-05', 9001),
+    ('123/3', 300.00, '2026-04-05', 'N', NULL, 0, '2026-01-05', 9001),
+    ('130/1', 200.00, '2025-12-30', 'S', '2025-12-30', 0, '2025-12-20', 9012),
+    ('130/2', 200.00, '2026-01-20', 'N', NULL, 0, '2025-12-20', 9012);
+
+INSERT INTO RECEBIMENTO VALUES
+    (8001, '2026-01-20', 1, 100.00, 2),
+    (8002, '2026-01-25', 4, 200.00, 2),
+    (8003, '2026-01-26', 1, 0, 2),
+    (8004, '2025-06-01', 1, 50.00, 1),
+    (8005, '2026-03-10', 9, 210.00, 1);
+
+INSERT INTO ITENSRECEBIMENTO VALUES
+    (8001, 100.00, 7002, 5002),
+    (8002, 200.00, 7002, 5002),
+    (8003, 0, 7002, 5002),
+    (8005, 210.00, NULL, 5019);
+
+INSERT INTO PAGAMENTOSACARTAO VALUES
+    (6001, 'C', NULL, 8002),
+    (6002, 'C', 5007, NULL),
+    (6003, 'D', 5008, NULL),
+    (6004, 'C', 5009, NULL);
+
+INSERT INTO PARCELASCARTAO VALUES
+    (1, 100.00, '2026-02-25', 'S', '2026-02-25', 6001),
+    (2, 100.00, '2026-03-25', 'N', NULL, 6001),
+    (1, 200.00, '2026-03-07', 'S', '2026-03-08', 6002),
+    (2, 200.00, '2026-04-07', 'N', NULL, 6002),
+    (3, 200.00, '2026-05-07', 'N', NULL, 6002),
+    (1, 120.00, '2026-03-09', 'N', NULL, 6004),
+    (2, 80.00, '2026-04-09', 'N', NULL, 6004);
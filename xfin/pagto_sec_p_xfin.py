@@ -1,10 +1,15 @@
 import os
+import sys
+import argparse
 import sqlite3
-import firebirdsql
 import email_alert
 import pandas as pd
 from dotenv import load_dotenv
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+
+# Raiz do repositório no path para usar o pacote compartilhado seculos_db
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import seculos_db  # noqa: E402
 
 # ==============================================================================
 # 1. FUNÇÃO DE CONEXÃO (INALTERADA)
@@ -17,10 +22,28 @@ DB_CONTROLE = "controle_exportacao.db"
 # Contas com vencimento A PARTIR desta data serão verificadas APENAS com o ID novo.
 DATA_CORTE_LEGADO = date(2026, 3, 4)  # Y,M,D - Data da implementação da nova lógica de ID (com vencimento)
 
+# Quantos CDAPAGAR abaixo da marca d'água ainda são relidos a cada execução. O CDAPAGAR sai de um
+# generator, mas as transações do Seculos fazem commit fora de ordem: um título com código menor pode
+# aparecer depois de uma execução já ter lido um maior. Reler a janela é de graça (ja_foi_exportado
+# descarta o que já foi exportado).
+# Só entram títulos NOVOS: alteração num título já exportado (valor, vencimento, pagamento) NÃO é
+# relida, porque o APAGAR não tem data de alteração para filtrar. Correções em título já exportado
+# são feitas direto no Xfin.
+JANELA_SEGURANCA_CDAPAGAR = 500
+
+# Vencimento mínimo dos títulos lidos do APAGAR (pode ser trocado com --desde AAAA-MM-DD)
+DATA_INICIO_APAGAR = date(2026, 1, 1)
+
+# Título sem centro de custo (filial 0) é reconferido a cada execução, mas só por esse tempo: depois sai
+# da lista de pendentes (com aviso) para ela não crescer para sempre. --completo volta a lê-lo.
+DIAS_LIMITE_PENDENTE = 60
+
 
-def inicializar_db_controle():
-    """Cria a tabela de histórico se não existir."""
-    conn = sqlite3.connect(DB_CONTROLE)
+def inicializar_db_controle(conn=None):
+    """Cria as tabelas de controle se não existirem (e acrescenta as colunas novas em bancos antigos)."""
+    proprio = conn is None
+    if proprio:
+        conn = sqlite3.connect(DB_CONTROLE)
     cursor = conn.cursor()
     # Chave única: NumDoc + Fornecedor + Parcela (para evitar duplicidade de boleto)
     cursor.execute("""
@@ -29,44 +52,124 @@ def inicializar_db_controle():
             data_exportacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    # Em qual execução e em qual arquivo cada ID saiu
+    colunas = {row[1] for row in cursor.execute("PRAGMA table_info(historico_pagar)")}
+    if "id_execucao" not in colunas:
+        cursor.execute("ALTER TABLE historico_pagar ADD COLUMN id_execucao TEXT")
+    if "arquivo" not in colunas:
+        cursor.execute("ALTER TABLE historico_pagar ADD COLUMN arquivo TEXT")
+    # Marca d'água do APAGAR (maior CDAPAGAR já lido) e títulos lidos que ainda não puderam ser exportados
+    cursor.execute("CREATE TABLE IF NOT EXISTS meta_pagar (chave TEXT PRIMARY KEY, valor TEXT)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS pendentes_pagar (cdapagar INTEGER PRIMARY KEY)")
+    # Desde quando cada título está pendente (para tirá-lo da lista depois de DIAS_LIMITE_PENDENTE)
+    if "desde" not in {row[1] for row in cursor.execute("PRAGMA table_info(pendentes_pagar)")}:
+        cursor.execute("ALTER TABLE pendentes_pagar ADD COLUMN desde TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS execucoes (
+            id_execucao TEXT PRIMARY KEY,
+            iniciada_em TIMESTAMP,
+            finalizada_em TIMESTAMP,
+            total_exportados INTEGER DEFAULT 0
+        )
+    """)
     conn.commit()
-    conn.close()
+    if proprio:
+        conn.close()
 
 
-def ja_foi_exportado(id_unico):
-    conn = sqlite3.connect(DB_CONTROLE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM historico_pagar WHERE id_unico = ?", (id_unico,))
-    existe = cursor.fetchone() is not None
-    conn.close()
-    return existe
+class ControleExportacao:
+    """
+    Controle dos títulos já exportados (controle_exportacao.db) durante uma execução.
 
+    Carrega todos os IDs uma vez na abertura e responde ja_foi_exportado() em memória.
+    marcar_como_exportado() grava os IDs novos numa transação só (executemany), junto com o
+    ID da execução e o nome do arquivo gerado. O banco fica em WAL para o scheduler e o
+    sincronizar_historico.py não se bloquearem.
+    """
 
-def marcar_como_exportado(lista_ids):
-    conn = sqlite3.connect(DB_CONTROLE)
-    cursor = conn.cursor()
-    for id_unico in lista_ids:
-        try:
-            cursor.execute("INSERT INTO historico_pagar (id_unico) VALUES (?)", (id_unico,))
-        except sqlite3.IntegrityError:
-            pass  # Já existe, segue o baile
-    conn.commit()
-    conn.close()
+    def __init__(self, arquivo=DB_CONTROLE, id_execucao=None):
+        self.id_execucao = id_execucao or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.total_exportados = 0
+        self.conn = sqlite3.connect(arquivo)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        inicializar_db_controle(self.conn)
+        self.exportados = {row[0] for row in self.conn.execute("SELECT id_unico FROM historico_pagar")}
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO execucoes (id_execucao, iniciada_em) VALUES (?, ?)",
+                              (self.id_execucao, datetime.now().isoformat(sep=' ', timespec='seconds')))
+        print(f"Controle de exportação: {len(self.exportados)} IDs já exportados (execução {self.id_execucao}).")
+
+    def ja_foi_exportado(self, id_unico):
+        return id_unico in self.exportados
+
+    def marcar_como_exportado(self, lista_ids, arquivo=None):
+        """Grava os IDs que ainda não estavam no controle. Retorna quantos eram novos."""
+        return self.marcar_lote_como_exportado((id_unico, arquivo) for id_unico in lista_ids)
+
+    def marcar_lote_como_exportado(self, pares):
+        """
+        Igual a marcar_como_exportado, com o arquivo de cada ID: pares (id_unico, arquivo), todos numa
+        transação só (ou entram todos ou nenhum). Repetido vale o primeiro arquivo. Retorna quantos eram novos.
+        """
+        novos = {}
+        for id_unico, arquivo in pares:
+            if id_unico not in self.exportados and id_unico not in novos:
+                novos[id_unico] = arquivo
+        if not novos:
+            return 0
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO historico_pagar (id_unico, id_execucao, arquivo) VALUES (?, ?, ?)",
+                [(id_unico, self.id_execucao, arquivo) for id_unico, arquivo in novos.items()])
+        self.exportados.update(novos)
+        self.total_exportados += len(novos)
+        return len(novos)
+
+    def marca_dagua(self):
+        """Maior CDAPAGAR lido numa execução concluída (None na primeira execução)."""
+        row = self.conn.execute("SELECT valor FROM meta_pagar WHERE chave = 'marca_dagua_cdapagar'").fetchone()
+        return int(row[0]) if row else None
+
+    def pendentes(self):
+        return [row[0] for row in self.conn.execute("SELECT cdapagar FROM pendentes_pagar")]
+
+    def atualizar_marca_dagua(self, maior_cdapagar, pendentes, hoje=None):
+        """
+        Grava a nova marca d'água (nunca recua) e substitui a lista de pendentes, numa transação.
+        Cada pendente guarda a data em que ficou pendente pela primeira vez; quem já está na lista há
+        mais de DIAS_LIMITE_PENDENTE dias é descartado. Retorna os CDAPAGAR descartados.
+        """
+        hoje = hoje or date.today()
+        limite = (hoje - timedelta(days=DIAS_LIMITE_PENDENTE)).isoformat()
+        desde = dict(self.conn.execute("SELECT cdapagar, desde FROM pendentes_pagar"))
+        manter, descartados = {}, []
+        for cd in pendentes:
+            # Pendente de banco antigo (sem data) começa a contar agora
+            inicio = desde.get(cd) or hoje.isoformat()
+            if inicio < limite:
+                descartados.append(cd)
+            else:
+                manter[cd] = inicio
+        atual = self.marca_dagua()
+        with self.conn:
+            if atual is None or maior_cdapagar > atual:
+                self.conn.execute("INSERT OR REPLACE INTO meta_pagar (chave, valor) VALUES ('marca_dagua_cdapagar', ?)",
+                                  (str(maior_cdapagar),))
+            self.conn.execute("DELETE FROM pendentes_pagar")
+            self.conn.executemany("INSERT INTO pendentes_pagar (cdapagar, desde) VALUES (?, ?)", manter.items())
+        return descartados
+
+    def fechar(self):
+        with self.conn:
+            self.conn.execute("UPDATE execucoes SET finalizada_em = ?, total_exportados = ? WHERE id_execucao = ?",
+                              (datetime.now().isoformat(sep=' ', timespec='seconds'), self.total_exportados,
+                               self.id_execucao))
+        self.conn.close()
 
 
 def get_firebird_connection():
     try:
-        return firebirdsql.connect(
-            host=os.getenv('HOST'),
-            port=int(os.getenv('PORT', '3050')),
-            database=os.getenv('DB_PATH'),
-            user=os.getenv('APP_USER'),
-            password=os.getenv('PASSWORD'),
-            role=os.getenv('ROLE'),
-            auth_plugin_name=os.getenv('AUTH'),
-            wire_crypt=False,
-            charset='ISO8859_1'
-        )
+        return seculos_db.get_firebird_connection()
     except Exception as e:
         print(f"Erro CRÍTICO ao tentar conectar ao banco de dados: {e}")
         print("Verifique as variáveis de ambiente no seu arquivo .env")
@@ -223,35 +326,10 @@ def formatar_data(data_obj):
 # ==============================================================================
 
 
-def main():
-    conn = get_firebird_connection()
-    if not conn:
-        return None
-
-    mapa_contas = carregar_mapa_contas()
-    print("Mapa de contas carregado com sucesso.")
-
-    # 1. Identificar Filiais (Centros de Custo) com movimentos pendentes
-    cursor_filiais = conn.cursor()
-    sql_filiais = """
-    SELECT DISTINCT A.CDCENTRODECUSTO
-    FROM APAGAR A
-    WHERE A.DTVENCIMENTO >= '2026-01-01'
-    """
-    cursor_filiais.execute(sql_filiais)
-    filiais_encontradas = [row[0] for row in cursor_filiais.fetchall()]
-    filiais_encontradas.pop(0)  # Remove a filial 0 (Contas sem filial)
-
-    print(f"Filiais encontradas com movimentos: {filiais_encontradas}")
-
-    arquivos_gerados_prontos = []
-    cursor = conn.cursor()
-
-    # Query SQL otimizada com JOINs
-    # Pegamos apenas 10 registros > 2026 conforme solicitado
-    sql = """
+SQL_APAGAR = """
     SELECT
         A.CDAPAGAR,
+        A.CDCENTRODECUSTO,
         A.CDFORNECEDOR,
         A.NOMEFORNECEDOR,
         A.CDNOTACOMPRA,
@@ -269,15 +347,82 @@ def main():
     LEFT JOIN FORNECEDOR F ON A.CDFORNECEDOR = F.CDFORNECEDOR
     LEFT JOIN SUBSUBCONTA S ON A.SUBSUBNUMCONTA = S.SUBSUBNUMCONTA
     LEFT JOIN NOTACOMPRA N ON A.CDNOTACOMPRA = N.CDNOTACOMPRA
-    WHERE A.DTVENCIMENTO >= '2026-01-01' AND A.CDCENTRODECUSTO = ?
+    WHERE A.DTVENCIMENTO >= ? AND {filtro}
     ORDER BY A.DTVENCIMENTO ASC
+"""
+
+
+def buscar_apagar(conn, controle, completo=False, desde=None):
     """
+    Uma passada só no APAGAR para todas as filiais. Retorna (colunas, registros).
+
+    - Só vêm os títulos com CDAPAGAR acima da marca d'água da última execução menos
+      JANELA_SEGURANCA_CDAPAGAR (os novos e os que fizeram commit atrasado);
+    - mais os que já passaram por uma execução anterior mas ficaram pendentes (sem centro de custo);
+    - com completo=True a marca d'água é ignorada e volta tudo com vencimento desde 'desde'
+      (DATA_INICIO_APAGAR se não for informado).
+    Título antigo alterado depois de exportado não volta (ver JANELA_SEGURANCA_CDAPAGAR).
+    """
+    cursor = conn.cursor()
+    desde = desde or DATA_INICIO_APAGAR
+    marca = None if completo else controle.marca_dagua()
+
+    if marca is None:
+        print(f"Extração completa do APAGAR (sem marca d'água), vencimentos desde {formatar_data(desde)}.")
+        cursor.execute(SQL_APAGAR.format(filtro="1 = 1"), (desde,))
+    else:
+        inicio = marca - JANELA_SEGURANCA_CDAPAGAR
+        print(f"Extração incremental do APAGAR: CDAPAGAR > {inicio} (marca d'água {marca}).")
+        cursor.execute(SQL_APAGAR.format(filtro="A.CDAPAGAR > ?"), (desde, inicio))
+    colunas = [desc[0] for desc in cursor.description]
+    registros = cursor.fetchall()
+
+    # Pendentes de execuções anteriores (já abaixo da marca d'água): busca só eles, em blocos por causa do IN
+    vistos = {reg[0] for reg in registros}
+    pendentes = [cd for cd in controle.pendentes() if cd not in vistos]
+    for i in range(0, len(pendentes), 1000):
+        grupo = pendentes[i:i + 1000]
+        cursor.execute(SQL_APAGAR.format(filtro=f"A.CDAPAGAR IN ({','.join(['?'] * len(grupo))})"),
+                       (desde,) + tuple(grupo))
+        registros.extend(cursor.fetchall())
+
+    print(f"{len(registros)} títulos lidos ({len(pendentes)} pendentes de execuções anteriores conferidos).")
+    return colunas, registros
+
+
+def main(completo=False, desde=None):
+    conn = get_firebird_connection()
+    if not conn:
+        return None
+
+    mapa_contas = carregar_mapa_contas()
+    print("Mapa de contas carregado com sucesso.")
+
+    arquivos_gerados_prontos = []
+    controle = ControleExportacao()
+
+    # 1. Uma extração só (delta desde a última execução) e separação por filial (centro de custo) em memória
+    colunas, todos_registros = buscar_apagar(conn, controle, completo, desde)
+    idx_cdapagar = colunas.index('CDAPAGAR')
+    idx_filial = colunas.index('CDCENTRODECUSTO')
+
+    registros_por_filial = {}
+    sem_filial = []
+    for reg in todos_registros:
+        if reg[idx_filial]:
+            registros_por_filial.setdefault(reg[idx_filial], []).append(reg)
+        else:
+            # Filial 0 (contas sem filial): fica pendente até ganhar um centro de custo (por no máximo
+            # DIAS_LIMITE_PENDENTE dias)
+            sem_filial.append(reg[idx_cdapagar])
+
+    filiais_encontradas = sorted(registros_por_filial)
+    print(f"Filiais encontradas com movimentos: {filiais_encontradas}")
 
     for cd_filial in filiais_encontradas:
         print(f"\n--- Processando Filial {cd_filial} ---")
 
-        cursor.execute(sql, (cd_filial,))
-        registros = cursor.fetchall()
+        registros = registros_por_filial[cd_filial]
 
         # Listas separadas
         dados_sucesso = []
@@ -285,9 +430,6 @@ def main():
         ids_sucesso_para_salvar = []  # Lista temporária de IDs processados com sucesso
         ids_analise_para_salvar = []  # Lista temporária de IDs enviados para análise
 
-        # Obter nomes das colunas para mapear no dict
-        colunas = [desc[0] for desc in cursor.description]
-
         for reg in registros:
             # Cria um dicionário da linha para facilitar acesso
             row = dict(zip(colunas, reg))
@@ -306,10 +448,10 @@ def main():
 
             # --- VERIFICAÇÃO DE DUPLICIDADE ---
             # A. Sempre verifica se o ID novo (mais específico) já existe. Se sim, pula.
-            if ja_foi_exportado(id_novo):
+            if controle.ja_foi_exportado(id_novo):
                 continue
             # B. Se a conta venceu ANTES da data de corte, também verifica o ID antigo para não reimportar o histórico.
-            elif ja_foi_exportado(id_antigo) and row["CDAPAGAR"] < 107236:
+            elif controle.ja_foi_exportado(id_antigo) and row["CDAPAGAR"] < 107236:
                 continue
 
             # --- Processamento Lógico ---
@@ -396,7 +538,7 @@ def main():
             nome_arq_sucesso = f"arquivos/importacao_xfin_filial_{cd_filial}_PRONTO.csv"
             df_sucesso.to_csv(nome_arq_sucesso, index=False, sep=';', encoding='utf-8-sig')
 
-            marcar_como_exportado(ids_sucesso_para_salvar)  # Persiste no SQLite
+            controle.marcar_como_exportado(ids_sucesso_para_salvar, nome_arq_sucesso)  # Persiste no SQLite
             arquivos_gerados_prontos.append(nome_arq_sucesso)
             print(f"SUCESSO: '{nome_arq_sucesso}' gerado com {len(dados_sucesso)} registros.")
 
@@ -407,14 +549,31 @@ def main():
             nome_arq_analise = f"arquivos/importacao_xfin_filial_{cd_filial}_PARA_ANALISE.csv"
             df_analise.to_csv(nome_arq_analise, index=False, sep=';', encoding='utf-8-sig')
 
-            marcar_como_exportado(ids_analise_para_salvar)  # Persiste no SQLite também os enviados para análise
+            # Persiste no SQLite também os enviados para análise
+            controle.marcar_como_exportado(ids_analise_para_salvar, nome_arq_analise)
             # Envia e-mail de alerta IMEDIATAMENTE para esta filial
             email_alert.enviar_email_erro(nome_arq_analise, len(dados_analise))
             print(f"ATENÇÃO: '{nome_arq_analise}' gerado com {len(dados_analise)} registros para revisão.")
 
+    # Tudo gravado: avança a marca d'água e guarda quem ficou pendente
+    if todos_registros:
+        descartados = controle.atualizar_marca_dagua(max(reg[idx_cdapagar] for reg in todos_registros), sem_filial)
+        if descartados:
+            print(f"Aviso: {len(descartados)} títulos sem centro de custo há mais de {DIAS_LIMITE_PENDENTE} dias "
+                  f"deixaram de ser conferidos (rode com --completo depois de corrigi-los): "
+                  f"{sorted(descartados)[:20]}")
+
+    # Registra o fim da execução (total exportado) no controle
+    controle.fechar()
     conn.close()
     return arquivos_gerados_prontos
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Exporta o contas a pagar do Seculos para CSVs de importação do Xfin")
+    parser.add_argument("--completo", action="store_true",
+                        help="ignora a marca d'água e relê todos os títulos com vencimento desde --desde")
+    parser.add_argument("--desde", type=date.fromisoformat, default=DATA_INICIO_APAGAR,
+                        help=f"vencimento mínimo lido do APAGAR, AAAA-MM-DD (padrão {DATA_INICIO_APAGAR})")
+    args = parser.parse_args()
+    main(completo=args.completo, desde=args.desde)
@@ -0,0 +1,764 @@
+"""
+Planilha de pagamentos do robô Xfin: uma aba por filial, tabelas empilhadas por forma de pagamento
+(título, cabeçalho, títulos a pagar, TOTAL e seletor de agendamento) e os totais por forma em K3.
+
+create_excel() grava com o openpyxl em modo write-only:
+- o layout de cada aba é calculado antes de escrever (linha de título, dados, TOTAL e agendamento de
+  cada tabela, blocos do PIX por fornecedor e linhas do resumo), então as fórmulas de total, de valor
+  total do fornecedor e do resumo já saem com as referências certas;
+- as linhas vão para o arquivo na ordem, sem montar a planilha inteira em memória, e os dados saem das
+  colunas do DataFrame (sem iterrows);
+- fonte, preenchimento e borda são estilos nomeados criados uma vez por arquivo e compartilhados.
+Linha com 'Associado_Auto' preenchido (dados bancários copiados de um nome parecido da planilha) sai com
+o fornecedor em amarelo e um comentário dizendo de quem vieram os dados.
+create_excel_legado() é o caminho antigo (célula a célula), mantido para comparação
+(benchmark_planilha.py). Os dois geram o mesmo layout.
+"""
+from copy import copy
+
+import pandas as pd
+
+def clean_sheet_name(name):
+    """Remove caracteres inválidos para nome de aba do Excel."""
+    invalid_chars = ['\\', '/', '*', '[', ']', ':', '?']
+    for char in invalid_chars:
+        name = name.replace(char, '')
+    # Excel limita a 31 caracteres
+    return name[:31]
+
+# Espaçamento entre tabelas empilhadas na mesma aba
+GAP_ENTRE_TABELAS = 3
+# Tabela de totais por forma de pagamento começa em K3
+COL_RESUMO_TIPO = 11  # K
+COL_RESUMO_VALOR = 12  # L
+LINHA_RESUMO_CABECALHO = 3
+# Fornecedor com dados bancários associados automaticamente (nome parecido + mesmo CNPJ)
+COR_ASSOCIADO_AUTO = "FFFF00"
+
+
+def _comentario_associado(associado):
+    """Comentário da célula do fornecedor associado automaticamente (None se a linha não foi associada)."""
+    from openpyxl.comments import Comment
+
+    if not isinstance(associado, str) or not associado:
+        return None
+    return Comment(f"Dados bancários copiados de '{associado}' da planilha (nome parecido, mesmo CNPJ). "
+                   "Confira antes de pagar.", "Robô de Pagamentos")
+
+
+def _doc_priority(x):
+    """Ordena formas de pagamento: NF, DDA, Boleto, PIX e demais."""
+    xu = x.upper()
+    if "NF" in xu or "NOTA" in xu:
+        return (0, xu)
+    if "BOLETO" in xu:
+        return (1, xu)
+    if "PIX" in xu:
+        return (2, xu)
+    if "VALE" in xu:
+        return (3, xu)
+    return (4, xu)
+
+
+def _get_doc_style(doc_type):
+    """Retorna cores de cabeçalho conforme o tipo de pagamento."""
+    dt_upper = doc_type.upper()
+    if "NF" in dt_upper or "NOTA" in dt_upper:
+        return "C4BD96", "000000"  # marrom-claro (0.77, 0.74, 0.59)
+    if "BOLETO" in dt_upper:
+        return "B2A1C7", "000000"  # lilás (0.70, 0.63, 0.78)
+    if "CRÉDITO" in dt_upper or "CREDITO" in dt_upper or "ESTORNO" in dt_upper:
+        return "366191", "FFFFFF"  # azul-escuro (0.21, 0.38, 0.57)
+    if "PIX" in dt_upper:
+        return "FABF8F", "000000"  # pêssego (0.98, 0.75, 0.56)
+    if "VALE" in dt_upper:
+        return "1AB394", "FFFFFF"  # verde (0.10, 0.70, 0.58)
+    return "BFBFBF", "000000"  # cinza (0.75, 0.75, 0.75) — demais tipos
+
+
+def _prepare_group_df(group_df, is_pix_layout, col_forn, col_valor, col_obs, col_venc):
+    """Ordena e agrupa faturas/PIX antes de escrever a tabela."""
+    group_df = group_df.copy()
+
+    if is_pix_layout:
+        group_df['__Total_Supplier'] = group_df.groupby(col_forn)[col_valor].transform('sum')
+        return group_df.sort_values(
+            by=['__Total_Supplier', col_forn, col_valor],
+            ascending=[True, True, True])
+
+    if 'Fatura' in group_df.columns:
+        group_df['Fatura'] = group_df['Fatura'].fillna('').astype(str).str.strip()
+        mask_invoice = group_df['Fatura'] != ''
+        df_invoice = group_df[mask_invoice].copy()
+        df_no_invoice = group_df[~mask_invoice].copy()
+
+        if not df_invoice.empty:
+            grp_keys = ['Fatura', col_forn, col_venc]
+            if 'CNPJ_Final' in df_invoice.columns:
+                df_invoice['CNPJ_Final'] = df_invoice['CNPJ_Final'].fillna('')
+                grp_keys.append('CNPJ_Final')
+            if 'Config_Banco' in df_invoice.columns:
+                df_invoice['Config_Banco'] = df_invoice['Config_Banco'].fillna('')
+                grp_keys.append('Config_Banco')
+
+            grouped_rows = []
+            for key, block in df_invoice.groupby(grp_keys):
+                row_data = block.iloc[0].copy()
+                row_data[col_valor] = block[col_valor].sum()
+                if col_obs:
+                    row_data[col_obs] = f"Fatura - {key[0]}"
+                grouped_rows.append(row_data)
+            group_df = pd.concat([df_no_invoice, pd.DataFrame(grouped_rows)], ignore_index=True)
+
+    return group_df.sort_values(by=[col_valor], ascending=True)
+
+
+def _add_schedule_dropdown(ws, row, col, dv_agendamento):
+    """Adiciona seletor de agendamento com cor verde/vermelha."""
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.utils import get_column_letter
+
+    col_letter = get_column_letter(col)
+    cell_ref = f"${col_letter}${row}"
+
+    schedule_cell = ws.cell(row=row, column=col, value="Não Agendado")
+    schedule_cell.font = Font(bold=True, color="FFFFFF")
+    schedule_cell.fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+
+    dv_agendamento.add(schedule_cell)
+
+    green_rule = FormulaRule(
+        formula=[f'{cell_ref}="Agendado"'],
+        fill=PatternFill(start_color="00B050", end_color="00B050", fill_type="solid"),
+        font=Font(bold=True, color="FFFFFF"),
+    )
+    red_rule = FormulaRule(
+        formula=[f'{cell_ref}="Não Agendado"'],
+        fill=PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"),
+        font=Font(bold=True, color="FFFFFF"),
+    )
+    ws.conditional_formatting.add(f"{col_letter}{row}", green_rule)
+    ws.conditional_formatting.add(f"{col_letter}{row}", red_rule)
+
+
+def _marcar_associado(cell, associado):
+    from openpyxl.styles import PatternFill
+
+    comentario = _comentario_associado(associado)
+    if comentario is not None:
+        cell.fill = PatternFill(start_color=COR_ASSOCIADO_AUTO, end_color=COR_ASSOCIADO_AUTO, fill_type="solid")
+        cell.comment = comentario
+
+
+def _write_payment_table(ws, group_df, table_title, doc_type, start_row, cols_map, border, currency_fmt, dv_agendamento):
+    """
+    Escreve uma tabela de pagamento empilhada na aba.
+    Retorna (próxima_linha_livre, referência_célula_total).
+    """
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
+    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
+    current_row = start_row
+
+    # Título da tabela (nome da forma de pagamento)
+    fill_color, font_color = _get_doc_style(doc_type)
+    title_cell = ws.cell(row=current_row, column=1, value=table_title.upper())
+    title_cell.font = Font(bold=True, color=font_color, size=12)
+    title_cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+    current_row += 1
+
+    is_pix_layout = "PIX" in doc_type.upper()
+    if is_pix_layout:
+        headers = ["Vencimento", "Nome Recebedor", "Fornecedor",
+                   "Chave PIX", "Nº Doc", "Observação", "Valor", "Valor Total"]
+        val_col_idx = 8
+    else:
+        headers = ["Vencimento", "Banco/Conta", "Fornecedor", "CNPJ", "Nº Doc", "Observação", "Valor"]
+        val_col_idx = 7
+
+    header_font = Font(bold=True, color=font_color)
+    header_fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+
+    header_row = current_row
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=header_row, column=col_num, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = border
+        ws.column_dimensions[get_column_letter(col_num)].width = 20
+
+    group_df = _prepare_group_df(group_df, is_pix_layout, col_forn, col_valor, col_obs, col_venc)
+    current_row = header_row + 1
+    data_start_row = current_row
+
+    start_merge_row = current_row
+    current_supplier = None
+    supplier_total = 0.0
+
+    for _, row in group_df.iterrows():
+        val = row[col_valor]
+
+        if is_pix_layout:
+            supplier = row[col_forn]
+            if supplier != current_supplier:
+                if current_supplier is not None:
+                    if start_merge_row < current_row - 1:
+                        ws.merge_cells(start_row=start_merge_row, start_column=8,
+                                       end_row=current_row - 1, end_column=8)
+                    ws.cell(row=start_merge_row, column=8, value=supplier_total).number_format = currency_fmt
+                    ws.cell(row=start_merge_row, column=8).alignment = Alignment(vertical='center')
+                current_supplier = supplier
+                start_merge_row = current_row
+                supplier_total = 0.0
+            supplier_total += val
+
+            ws.cell(row=current_row, column=1, value=row[col_venc].strftime('%d/%m/%Y'))
+            ws.cell(row=current_row, column=2, value=row.get('Config_Nome Titular', ''))
+            _marcar_associado(ws.cell(row=current_row, column=3, value=supplier), row.get('Associado_Auto'))
+            ws.cell(row=current_row, column=4, value=row.get('Config_Chave PIX', ''))
+            ws.cell(row=current_row, column=5, value=row[col_doc] if col_doc and col_doc in row else "")
+            ws.cell(row=current_row, column=6, value=row[col_obs] if col_obs and col_obs in row else "")
+            ws.cell(row=current_row, column=7, value=val).number_format = currency_fmt
+        else:
+            banco_val = row.get('Config_Banco', '')
+            ws.cell(row=current_row, column=1, value=row[col_venc].strftime('%d/%m/%Y'))
+            ws.cell(row=current_row, column=2, value=banco_val)
+            _marcar_associado(ws.cell(row=current_row, column=3, value=row[col_forn]), row.get('Associado_Auto'))
+            ws.cell(row=current_row, column=4, value=row.get('CNPJ_Final', ''))
+            ws.cell(row=current_row, column=5, value=row[col_doc] if col_doc and col_doc in row else "")
+            ws.cell(row=current_row, column=6, value=row[col_obs] if col_obs and col_obs in row else "")
+            ws.cell(row=current_row, column=7, value=val).number_format = currency_fmt
+
+        ws.column_dimensions['E'].width = 7
+        current_row += 1
+
+    if is_pix_layout and current_supplier is not None:
+        if start_merge_row < current_row - 1:
+            ws.merge_cells(start_row=start_merge_row, start_column=8, end_row=current_row - 1, end_column=8)
+        ws.cell(row=start_merge_row, column=8, value=supplier_total).number_format = currency_fmt
+        ws.cell(row=start_merge_row, column=8).alignment = Alignment(vertical='center')
+
+    data_end_row = current_row - 1
+    total_row = current_row + 1
+    col_letter = get_column_letter(val_col_idx)
+
+    ws.cell(row=total_row, column=val_col_idx - 1, value="TOTAL:").font = Font(bold=True)
+    if data_end_row >= data_start_row:
+        sum_formula = f"=SUM({col_letter}{data_start_row}:{col_letter}{data_end_row})"
+    else:
+        sum_formula = 0
+    c_total = ws.cell(row=total_row, column=val_col_idx, value=sum_formula)
+    c_total.number_format = currency_fmt
+    c_total.font = Font(bold=True)
+
+    schedule_row = total_row + 2
+    _add_schedule_dropdown(ws, schedule_row, 1, dv_agendamento)
+
+    next_row = schedule_row + 1 + GAP_ENTRE_TABELAS
+    return next_row, f"{col_letter}{total_row}"
+
+
+def _write_summary_table(ws, summary_data, border, currency_fmt):
+    """Escreve tabela de totais na mesma aba, a partir de K3."""
+    from openpyxl.styles import Font, PatternFill
+
+    header_font_tot = Font(bold=True, color="FFFFFF")
+    header_fill_tot = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+    ws.column_dimensions['K'].width = 30
+    ws.column_dimensions['L'].width = 20
+
+    cell_h1 = ws.cell(row=LINHA_RESUMO_CABECALHO, column=COL_RESUMO_TIPO, value="Tipo de Pagamento")
+    cell_h2 = ws.cell(row=LINHA_RESUMO_CABECALHO, column=COL_RESUMO_VALOR, value="Valor Total")
+    for c in [cell_h1, cell_h2]:
+        c.font = header_font_tot
+        c.fill = header_fill_tot
+        c.border = border
+
+    r = LINHA_RESUMO_CABECALHO + 1
+    first_data_row = r
+    for name, cell_ref in summary_data:
+        fill_color, font_color = _get_doc_style(name)
+        row_font = Font(bold=True, color=font_color)
+        row_fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+
+        c_tipo = ws.cell(row=r, column=COL_RESUMO_TIPO, value=name)
+        c_tipo.font = row_font
+        c_tipo.fill = row_fill
+        c_tipo.border = border
+
+        c_val = ws.cell(row=r, column=COL_RESUMO_VALOR, value=f"={cell_ref}")
+        c_val.font = row_font
+        c_val.fill = row_fill
+        c_val.border = border
+        c_val.number_format = currency_fmt
+        r += 1
+
+    if summary_data:
+        r += 1
+        gt_fill, gt_font = "BFBFBF", "000000"
+        gt_style_font = Font(bold=True, size=12, color=gt_font)
+        gt_style_fill = PatternFill(start_color=gt_fill, end_color=gt_fill, fill_type="solid")
+        cell_gt_lbl = ws.cell(row=r, column=COL_RESUMO_TIPO, value="TOTAL GERAL")
+        cell_gt_val = ws.cell(row=r, column=COL_RESUMO_VALOR, value=f"=SUM(L{first_data_row}:L{r - 1})")
+        for c in [cell_gt_lbl, cell_gt_val]:
+            c.font = gt_style_font
+            c.fill = gt_style_fill
+            c.border = border
+        cell_gt_val.number_format = currency_fmt
+
+
+def _build_payment_subgroups(df_filial, col_forma, col_banco):
+    """Monta subgrupos por forma de pagamento (separando bancos quando necessário)."""
+    doc_vals = list(df_filial[col_forma].astype(str).fillna('').unique())
+    doc_types = sorted(doc_vals, key=_doc_priority)
+    sub_groups = []
+
+    for doc_type in doc_types:
+        df_doc = df_filial[df_filial[col_forma] == doc_type].copy()
+        unique_banks = df_doc[col_banco].unique()
+        real_banks = [b for b in unique_banks if str(b).strip()]
+
+        if len(real_banks) > 1:
+            for bank in unique_banks:
+                sub_df = df_doc[df_doc[col_banco] == bank]
+                if sub_df.empty:
+                    continue
+                s_name = f"{doc_type}"
+                if str(bank).strip():
+                    s_name += f" - {bank}"
+                sub_groups.append((s_name, doc_type, sub_df))
+        else:
+            sub_groups.append((doc_type, doc_type, df_doc))
+
+    return sub_groups
+
+
+def create_excel_legado(df, output_path, cols_map):
+    """Caminho antigo: Workbook comum, célula a célula (mantido para comparação com create_excel)."""
+    import openpyxl
+    from openpyxl.styles import Border, Side
+    from openpyxl.worksheet.datavalidation import DataValidation
+
+    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
+
+    wb = openpyxl.Workbook()
+    if 'Sheet' in wb.sheetnames:
+        wb.remove(wb['Sheet'])
+
+    # Garantir colunas de agrupamento
+    if col_forma and col_forma in df.columns:
+        df[col_forma] = df[col_forma].fillna('Indefinido')
+    else:
+        df['__Forma_Temp'] = 'Indefinido'
+        col_forma = '__Forma_Temp'
+
+    if col_banco and col_banco in df.columns:
+        df[col_banco] = df[col_banco].fillna('')
+    else:
+        df['__Banco_Temp'] = ''
+        col_banco = '__Banco_Temp'
+
+    currency_fmt = '_-R$* #,##0.00_-;-R$* #,##0.00_-;_-R$* \"-\"??_-;_-@_-'
+    border = Border(
+        left=Side(style='thin'), right=Side(style='thin'),
+        top=Side(style='thin'), bottom=Side(style='thin'),
+    )
+
+    # Uma aba por filial, na ordem Loja -> Oficina -> Divisa -> Serviços
+    filiais = (
+        df[['Filial_Order', 'Filial_Sheet']]
+        .drop_duplicates()
+        .sort_values('Filial_Order')
+    )
+
+    for _, filial_row in filiais.iterrows():
+        sheet_name = clean_sheet_name(filial_row['Filial_Sheet'])
+        df_filial = df[df['Filial_Sheet'] == filial_row['Filial_Sheet']].copy()
+        if df_filial.empty:
+            continue
+
+        ws = wb.create_sheet(sheet_name)
+
+        # Validação de agendamento reutilizada em todas as tabelas da aba
+        dv_agendamento = DataValidation(
+            type="list",
+            formula1='"Agendado,Não Agendado"',
+            allow_blank=False,
+        )
+        dv_agendamento.error = "Selecione Agendado ou Não Agendado"
+        dv_agendamento.errorTitle = "Agendamento"
+        ws.add_data_validation(dv_agendamento)
+
+        current_row = 1
+        sheet_summary = []
+
+        for table_title, doc_type, group_df in _build_payment_subgroups(df_filial, col_forma, col_banco):
+            current_row, total_ref = _write_payment_table(
+                ws, group_df, table_title, doc_type, current_row,
+                cols_map, border, currency_fmt, dv_agendamento,
+            )
+            sheet_summary.append((table_title, total_ref))
+
+        if sheet_summary:
+            _write_summary_table(ws, sheet_summary, border, currency_fmt)
+
+    if not wb.sheetnames:
+        wb.create_sheet("VAZIO")
+
+    try:
+        wb.save(output_path)
+    except PermissionError:
+        output_path = output_path + ".error"
+
+    wb.save(output_path)
+
+
+# --- ESCRITA EM STREAMING (write-only) ---
+
+MOEDA_FMT = '_-R$* #,##0.00_-;-R$* #,##0.00_-;_-R$* \"-\"??_-;_-@_-'
+# Colunas da tabela PIX que levam o total do fornecedor (mesclada por bloco) e o valor
+COL_TOTAL_FORNECEDOR_PIX = 8
+
+
+class EstilosPlanilha:
+    """
+    Estilos nomeados da planilha, criados na primeira vez que são pedidos e registrados no Workbook.
+    Cada método devolve o nome do estilo, que é o que a célula recebe.
+    """
+
+    def __init__(self, wb, currency_fmt=MOEDA_FMT):
+        from openpyxl.styles import Border, Side
+
+        self.wb = wb
+        self.currency_fmt = currency_fmt
+        self.border = Border(
+            left=Side(style='thin'), right=Side(style='thin'),
+            top=Side(style='thin'), bottom=Side(style='thin'),
+        )
+        self._criados = set()
+
+    def _estilo(self, nome, font=None, fill_color=None, border=False, moeda=False, centro=False):
+        if nome not in self._criados:
+            from openpyxl.styles import Alignment, NamedStyle, PatternFill
+            from openpyxl.styles.fonts import DEFAULT_FONT
+
+            # Sem fonte própria fica a padrão do arquivo (Calibri 11), como nas células sem estilo
+            estilo = NamedStyle(name=nome, font=font if font is not None else copy(DEFAULT_FONT))
+            if fill_color:
+                estilo.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+            if border:
+                estilo.border = self.border
+            if moeda:
+                estilo.number_format = self.currency_fmt
+            if centro:
+                estilo.alignment = Alignment(vertical='center')
+            self.wb.add_named_style(estilo)
+            self._criados.add(nome)
+        return nome
+
+    def titulo(self, fill_color, font_color):
+        from openpyxl.styles import Font
+        return self._estilo(f"Pagto Título {fill_color} {font_color}", Font(bold=True, color=font_color, size=12),
+                            fill_color)
+
+    def cabecalho(self, fill_color, font_color):
+        from openpyxl.styles import Font
+        return self._estilo(f"Pagto Cabeçalho {fill_color} {font_color}", Font(bold=True, color=font_color),
+                            fill_color, border=True)
+
+    def moeda(self):
+        return self._estilo("Pagto Valor", moeda=True)
+
+    def total_fornecedor(self):
+        return self._estilo("Pagto Total Fornecedor", moeda=True, centro=True)
+
+    def rotulo_total(self):
+        from openpyxl.styles import Font
+        return self._estilo("Pagto Rótulo Total", Font(bold=True))
+
+    def total(self):
+        from openpyxl.styles import Font
+        return self._estilo("Pagto Total", Font(bold=True), moeda=True)
+
+    def associado_auto(self):
+        return self._estilo("Pagto Associado Automático", fill_color=COR_ASSOCIADO_AUTO)
+
+    def agendamento(self):
+        from openpyxl.styles import Font
+        return self._estilo("Pagto Agendamento", Font(bold=True, color="FFFFFF"), "FF0000")
+
+    def resumo_cabecalho(self):
+        from openpyxl.styles import Font
+        return self._estilo("Pagto Resumo Cabeçalho", Font(bold=True, color="FFFFFF"), "366092", border=True)
+
+    def resumo(self, fill_color, font_color, moeda=False):
+        from openpyxl.styles import Font
+        nome = f"Pagto Resumo {'Valor' if moeda else 'Tipo'} {fill_color} {font_color}"
+        return self._estilo(nome, Font(bold=True, color=font_color), fill_color, border=True, moeda=moeda)
+
+    def total_geral(self, moeda=False):
+        from openpyxl.styles import Font
+        nome = f"Pagto Total Geral{' Valor' if moeda else ''}"
+        return self._estilo(nome, Font(bold=True, size=12, color="000000"), "BFBFBF", border=True, moeda=moeda)
+
+
+def _celula(ws, valor, estilo):
+    from openpyxl.cell import WriteOnlyCell
+
+    cell = WriteOnlyCell(ws, value=valor)
+    cell.style = estilo
+    return cell
+
+
+def _coluna(group_df, coluna, padrao=""):
+    """Valores da coluna como lista (ou o valor padrão em todas as linhas se ela não existir)."""
+    if coluna and coluna in group_df.columns:
+        return group_df[coluna].tolist()
+    return [padrao] * len(group_df)
+
+
+def _planejar_tabelas(sub_groups, cols_map):
+    """
+    Posição de cada tabela empilhada na aba, antes de escrever qualquer linha.
+    Mesmo empilhamento do caminho antigo: título, cabeçalho, dados, uma linha em branco, TOTAL,
+    uma em branco, agendamento e GAP_ENTRE_TABELAS linhas até a próxima tabela.
+    """
+    from openpyxl.utils import get_column_letter
+
+    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
+    tabelas = []
+    linha = 1
+    for table_title, doc_type, group_df in sub_groups:
+        is_pix_layout = "PIX" in doc_type.upper()
+        group_df = _prepare_group_df(group_df, is_pix_layout, col_forn, col_valor, col_obs, col_venc)
+        n = len(group_df)
+        val_col_idx = COL_TOTAL_FORNECEDOR_PIX if is_pix_layout else 7
+        linha_total = linha + n + 3
+        tabelas.append({
+            'titulo': table_title,
+            'doc_type': doc_type,
+            'df': group_df,
+            'pix': is_pix_layout,
+            'linha_titulo': linha,
+            'linha_dados': linha + 2,
+            'linha_total': linha_total,
+            'linha_agendamento': linha_total + 2,
+            'col_total': val_col_idx,
+            'ref_total': f"{get_column_letter(val_col_idx)}{linha_total}",
+        })
+        linha = linha_total + 3 + GAP_ENTRE_TABELAS
+    return tabelas
+
+
+def _blocos_fornecedor(fornecedores, valores):
+    """[(início, fim, total)] das sequências de linhas do mesmo fornecedor (índices na tabela PIX)."""
+    blocos = []
+    inicio = 0
+    atual = None
+    total = 0.0
+    for i, (fornecedor, valor) in enumerate(zip(fornecedores, valores)):
+        if i == 0 or fornecedor != atual:
+            if i > 0:
+                blocos.append((inicio, i - 1, total))
+            atual = fornecedor
+            inicio = i
+            total = 0.0
+        total += valor
+    if fornecedores:
+        blocos.append((inicio, len(fornecedores) - 1, total))
+    return blocos
+
+
+def _linhas_tabela(ws, tabela, cols_map, estilos, dv_agendamento):
+    """Gera (número_da_linha, células) da tabela, na ordem; mesclas e validação vão direto para a aba."""
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
+    group_df = tabela['df']
+    fill_color, font_color = _get_doc_style(tabela['doc_type'])
+    linha = tabela['linha_titulo']
+
+    yield linha, [_celula(ws, tabela['titulo'].upper(), estilos.titulo(fill_color, font_color))]
+
+    if tabela['pix']:
+        headers = ["Vencimento", "Nome Recebedor", "Fornecedor",
+                   "Chave PIX", "Nº Doc", "Observação", "Valor", "Valor Total"]
+        colunas = [_coluna(group_df, 'Config_Nome Titular'), _coluna(group_df, col_forn),
+                   _coluna(group_df, 'Config_Chave PIX')]
+    else:
+        headers = ["Vencimento", "Banco/Conta", "Fornecedor", "CNPJ", "Nº Doc", "Observação", "Valor"]
+        colunas = [_coluna(group_df, 'Config_Banco'), _coluna(group_df, col_forn),
+                   _coluna(group_df, 'CNPJ_Final')]
+    estilo_cabecalho = estilos.cabecalho(fill_color, font_color)
+    yield linha + 1, [_celula(ws, h, estilo_cabecalho) for h in headers]
+
+    vencimentos = [v.strftime('%d/%m/%Y') for v in group_df[col_venc]]
+    docs = _coluna(group_df, col_doc)
+    obs = _coluna(group_df, col_obs)
+    valores = group_df[col_valor].tolist()
+    associados = _coluna(group_df, 'Associado_Auto', None)
+
+    # Total do fornecedor na primeira linha de cada bloco (mesclado até a última do bloco)
+    totais_fornecedor = {}
+    if tabela['pix']:
+        for inicio, fim, total in _blocos_fornecedor(colunas[1], valores):
+            totais_fornecedor[inicio] = total
+            if fim > inicio:
+                ws.merged_cells.add(f"H{tabela['linha_dados'] + inicio}:H{tabela['linha_dados'] + fim}")
+
+    estilo_moeda = estilos.moeda()
+    estilo_total_fornecedor = estilos.total_fornecedor()
+    linha = tabela['linha_dados']
+    for i, (venc, col2, col3, col4, doc, ob, val, associado) in enumerate(
+            zip(vencimentos, *colunas, docs, obs, valores, associados)):
+        comentario = _comentario_associado(associado)
+        if comentario is not None:
+            col3 = _celula(ws, col3, estilos.associado_auto())
+            col3.comment = comentario
+        celulas = [venc, col2, col3, col4, doc, ob, _celula(ws, val, estilo_moeda)]
+        if i in totais_fornecedor:
+            celulas.append(_celula(ws, totais_fornecedor[i], estilo_total_fornecedor))
+        yield linha, celulas
+        linha += 1
+
+    # TOTAL e agendamento nas linhas já reservadas no planejamento
+    col_total = tabela['col_total']
+    col_letter = get_column_letter(col_total)
+    if valores:
+        sum_formula = f"=SUM({col_letter}{tabela['linha_dados']}:{col_letter}{linha - 1})"
+    else:
+        sum_formula = 0
+    celulas = [None] * (col_total - 2)
+    celulas += [_celula(ws, "TOTAL:", estilos.rotulo_total()), _celula(ws, sum_formula, estilos.total())]
+    yield tabela['linha_total'], celulas
+
+    linha_agendamento = tabela['linha_agendamento']
+    dv_agendamento.add(f"A{linha_agendamento}")
+    for valor, cor in (("Agendado", "00B050"), ("Não Agendado", "FF0000")):
+        ws.conditional_formatting.add(f"A{linha_agendamento}", FormulaRule(
+            formula=[f'$A${linha_agendamento}="{valor}"'],
+            fill=PatternFill(start_color=cor, end_color=cor, fill_type="solid"),
+            font=Font(bold=True, color="FFFFFF"),
+        ))
+    yield linha_agendamento, [_celula(ws, "Não Agendado", estilos.agendamento())]
+
+
+def _linhas_resumo(ws, tabelas, estilos):
+    """{número_da_linha: [célula K, célula L]} da tabela de totais por forma de pagamento."""
+    estilo_cabecalho = estilos.resumo_cabecalho()
+    linhas = {LINHA_RESUMO_CABECALHO: [_celula(ws, "Tipo de Pagamento", estilo_cabecalho),
+                                       _celula(ws, "Valor Total", estilo_cabecalho)]}
+    r = LINHA_RESUMO_CABECALHO + 1
+    for tabela in tabelas:
+        fill_color, font_color = _get_doc_style(tabela['titulo'])
+        linhas[r] = [_celula(ws, tabela['titulo'], estilos.resumo(fill_color, font_color)),
+                     _celula(ws, f"={tabela['ref_total']}", estilos.resumo(fill_color, font_color, moeda=True))]
+        r += 1
+    if tabelas:
+        r += 1
+        linhas[r] = [_celula(ws, "TOTAL GERAL", estilos.total_geral()),
+                     _celula(ws, f"=SUM(L{LINHA_RESUMO_CABECALHO + 1}:L{r - 1})", estilos.total_geral(moeda=True))]
+    return linhas
+
+
+def _escrever_aba(ws, tabelas, cols_map, estilos, dv_agendamento):
+    """Escreve a aba linha a linha: tabelas à esquerda e, nas mesmas linhas, o resumo em K/L."""
+    # Larguras precisam estar definidas antes da primeira linha
+    for tabela in tabelas:
+        for col in "ABCDEFG" + ("H" if tabela['pix'] else ""):
+            ws.column_dimensions[col].width = 20
+        if len(tabela['df']):
+            ws.column_dimensions['E'].width = 7
+    if tabelas:
+        ws.column_dimensions['K'].width = 30
+        ws.column_dimensions['L'].width = 20
+
+    resumo = _linhas_resumo(ws, tabelas, estilos) if tabelas else {}
+
+    def com_resumo(numero, celulas):
+        extra = resumo.pop(numero, None)
+        if extra is None:
+            return celulas
+        return list(celulas) + [None] * (COL_RESUMO_TIPO - 1 - len(celulas)) + extra
+
+    proxima = 1
+    for tabela in tabelas:
+        for numero, celulas in _linhas_tabela(ws, tabela, cols_map, estilos, dv_agendamento):
+            while proxima < numero:
+                ws.append(com_resumo(proxima, []))
+                proxima += 1
+            ws.append(com_resumo(numero, celulas))
+            proxima += 1
+    while resumo:
+        ws.append(com_resumo(proxima, []))
+        proxima += 1
+
+
+def create_excel(df, output_path, cols_map):
+    """
+    Gera a planilha de pagamentos em 'output_path' (write-only, mesmo layout do create_excel_legado).
+    Se o arquivo estiver aberto em outro programa, grava em 'output_path.error'. Retorna o caminho gravado.
+    """
+    import openpyxl
+    from openpyxl.worksheet.datavalidation import DataValidation
+
+    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
+
+    wb = openpyxl.Workbook(write_only=True)
+    estilos = EstilosPlanilha(wb)
+
+    # Garantir colunas de agrupamento
+    if col_forma and col_forma in df.columns:
+        df[col_forma] = df[col_forma].fillna('Indefinido')
+    else:
+        df['__Forma_Temp'] = 'Indefinido'
+        col_forma = '__Forma_Temp'
+
+    if col_banco and col_banco in df.columns:
+        df[col_banco] = df[col_banco].fillna('')
+    else:
+        df['__Banco_Temp'] = ''
+        col_banco = '__Banco_Temp'
+
+    # Uma aba por filial, na ordem Loja -> Oficina -> Divisa -> Serviços
+    filiais = (
+        df[['Filial_Order', 'Filial_Sheet']]
+        .drop_duplicates()
+        .sort_values('Filial_Order')
+    )
+
+    for filial_sheet in filiais['Filial_Sheet']:
+        df_filial = df[df['Filial_Sheet'] == filial_sheet]
+        if df_filial.empty:
+            continue
+
+        ws = wb.create_sheet(clean_sheet_name(filial_sheet))
+
+        # Validação de agendamento reutilizada em todas as tabelas da aba
+        dv_agendamento = DataValidation(
+            type="list",
+            formula1='"Agendado,Não Agendado"',
+            allow_blank=False,
+        )
+        dv_agendamento.error = "Selecione Agendado ou Não Agendado"
+        dv_agendamento.errorTitle = "Agendamento"
+        ws.data_validations.append(dv_agendamento)
+
+        tabelas = _planejar_tabelas(_build_payment_subgroups(df_filial, col_forma, col_banco), cols_map)
+        _escrever_aba(ws, tabelas, cols_map, estilos, dv_agendamento)
+
+    if not wb.sheetnames:
+        wb.create_sheet("VAZIO")
+
+    # Workbook write-only só pode ser gravado uma vez; o PermissionError sai antes de gravar qualquer aba
+    try:
+        wb.save(output_path)
+    except PermissionError:
+        output_path = output_path + ".error"
+        wb.save(output_path)
+    return output_path
@@ -1,9 +1,16 @@
 import os
-import firebirdsql
+import sys
+import json
+import sqlite3
+import hashlib
 import pandas as pd
 from dotenv import load_dotenv
 from datetime import date, datetime, timedelta
 
+# Raiz do repositório no path para usar o pacote compartilhado seculos_db
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import seculos_db  # noqa: E402
+
 # ==============================================================================
 # CONFIGURAÇÕES GERAIS
 # ==============================================================================
@@ -15,6 +22,17 @@ DATA_BUSCA_SQL = '2025-01-01'
 # O que realmente vai para o arquivo (Vencimentos ou Pagamentos a partir desta data)
 DATA_CORTE_XFIN = date(2026, 1, 1)
 
+# Mesmo banco de controle do pagto_sec_p_xfin.py (tabelas próprias para o contas a receber)
+DB_CONTROLE = "controle_exportacao.db"
+
+# Pedido quitado há menos dias que isso ainda é reprocessado (pega estorno de pagamento recente)
+DIAS_RECONFERIR_QUITADOS = 30
+
+ARQUIVO_CSV = "arquivos/importacao_RECEITAS_xfin_LOJA.csv"
+# Títulos alterados ou removidos depois de exportados: não vão para a importação (o Xfin criaria outro
+# título), ficam neste arquivo para acerto manual
+ARQUIVO_ANALISE = "arquivos/importacao_RECEITAS_xfin_LOJA_PARA_ANALISE.csv"
+
 MAPA_PAGAMENTO = {
     # --- DINHEIRO E CAIXA ---
     1:  {'Tipo': 'Dinheiro', 'Natureza': 'Vista', 'Conta': 'Caixa Empresa'},
@@ -64,19 +82,141 @@ MAPA_PAGAMENTO = {
 }
 
 
+# ==============================================================================
+# CONTROLE DO QUE JÁ FOI EXPORTADO (LIVRO DE RECEBÍVEIS)
+# ==============================================================================
+
+
+def _hash(valor):
+    return hashlib.sha1(json.dumps(valor, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def chave_titulo(linha):
+    """Identifica o título dentro do pedido (a descrição e o pagamento mudam quando o título é baixado)."""
+    return "|".join(str(linha[c]) for c in ("Número Documento", "Parcela", "Tipo Documento", "Vencimento"))
+
+
+class ControleRecebimentos:
+    """
+    Livro dos títulos a receber já exportados, por CDPEDIDOVENDA (tabela historico_receber).
+
+    Para cada pedido guarda o hash do conjunto de linhas exportadas e o hash de cada título; comparar()
+    devolve só os títulos novos ou alterados desde a última exportação e registrar() grava o novo estado
+    (e o motivo de cada mudança em mudancas_receber) numa transação só, depois que o CSV foi gerado.
+    Pedidos com todos os títulos pagos ficam marcados como quitados e, passados DIAS_RECONFERIR_QUITADOS
+    dias, não são mais processados (a não ser numa execução completa).
+    """
+
+    def __init__(self, arquivo=DB_CONTROLE, id_execucao=None):
+        self.id_execucao = id_execucao or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.conn = sqlite3.connect(arquivo)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS historico_receber (
+                    cdpedidovenda INTEGER PRIMARY KEY,
+                    hash TEXT,
+                    titulos TEXT,
+                    quitado INTEGER DEFAULT 0,
+                    id_execucao TEXT,
+                    arquivo TEXT,
+                    atualizado_em TIMESTAMP
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS mudancas_receber (
+                    id_execucao TEXT,
+                    cdpedidovenda INTEGER,
+                    titulo TEXT,
+                    motivo TEXT
+                )
+            """)
+        # cd_pedido -> (hash, {chave_titulo: [hash_titulo, pago]}, quitado)
+        self.pedidos = {}
+        # cd_pedido -> última gravação (para quitado, quando ficou quitado)
+        self.atualizado_em = {}
+        for cd, hash_pedido, titulos, quitado, atualizado_em in self.conn.execute(
+                "SELECT cdpedidovenda, hash, titulos, quitado, atualizado_em FROM historico_receber"):
+            self.pedidos[cd] = (hash_pedido, json.loads(titulos or "{}"), bool(quitado))
+            self.atualizado_em[cd] = atualizado_em or ""
+        self._alterados = {}
+        self._mudancas = []
+        print(f"Controle de recebíveis: {len(self.pedidos)} pedidos já exportados, "
+              f"{len(self.quitados())} quitados (execução {self.id_execucao}).")
+
+    def quitados(self, antes_de=None):
+        """Pedidos quitados; com antes_de (datetime) só os que ficaram quitados antes dessa data."""
+        limite = antes_de.isoformat(sep=' ', timespec='seconds') if antes_de else None
+        return {cd for cd, (_, _, quitado) in self.pedidos.items()
+                if quitado and (limite is None or self.atualizado_em[cd] < limite)}
+
+    def comparar(self, cd_pedido, linhas, quitado):
+        """
+        Compara as linhas do pedido com o que já foi exportado. Retorna a lista de (linha, motivo) dos
+        títulos novos ou alterados - motivo 'novo', 'pagamento' (chegou o pagamento), 'alterado' ou
+        'removido' (título exportado que sumiu do pedido, como num estorno; a linha só tem os campos da chave).
+        """
+        hash_pedido = _hash(linhas)
+        anterior = self.pedidos.get(cd_pedido)
+        if anterior is not None and anterior[0] == hash_pedido and anterior[2] == quitado:
+            return []
+
+        titulos_anteriores = anterior[1] if anterior is not None else {}
+        titulos = {}
+        saida = []
+        for linha in linhas:
+            chave = chave_titulo(linha)
+            pago = bool(linha["Data Pagamento"])
+            hash_titulo = _hash(linha)
+            titulos[chave] = [hash_titulo, pago]
+
+            antes = titulos_anteriores.get(chave)
+            if antes is None:
+                # Título que não existia num pedido já exportado e já vem pago = baixa de previsão
+                motivo = "pagamento" if anterior is not None and pago else "novo"
+            elif antes[0] == hash_titulo:
+                continue
+            elif pago and not antes[1]:
+                motivo = "pagamento"
+            else:
+                motivo = "alterado"
+            saida.append((linha, motivo))
+            self._mudancas.append((self.id_execucao, cd_pedido, chave, motivo))
+
+        for chave in titulos_anteriores.keys() - titulos.keys():
+            doc, parcela, tipo, vencimento = chave.split("|")
+            saida.append(({"Número Documento": doc, "Parcela": parcela, "Tipo Documento": tipo,
+                           "Vencimento": date.fromisoformat(vencimento)}, "removido"))
+            self._mudancas.append((self.id_execucao, cd_pedido, chave, "removido"))
+
+        self._alterados[cd_pedido] = (hash_pedido, titulos, quitado)
+        return saida
+
+    def registrar(self, arquivo=None):
+        """Grava o estado novo dos pedidos comparados nesta execução. Retorna quantos pedidos mudaram."""
+        agora = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO historico_receber
+                    (cdpedidovenda, hash, titulos, quitado, id_execucao, arquivo, atualizado_em)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(cd, h, json.dumps(titulos), int(quitado), self.id_execucao, arquivo, agora)
+                  for cd, (h, titulos, quitado) in self._alterados.items()])
+            self.conn.executemany(
+                "INSERT INTO mudancas_receber (id_execucao, cdpedidovenda, titulo, motivo) VALUES (?, ?, ?, ?)",
+                self._mudancas)
+        self.pedidos.update(self._alterados)
+        total = len(self._alterados)
+        self._alterados, self._mudancas = {}, []
+        return total
+
+    def fechar(self):
+        self.conn.close()
+
+
 def get_firebird_connection():
     try:
-        return firebirdsql.connect(
-            host=os.getenv('HOST'),
-            port=int(os.getenv('PORT', '3050')),
-            database=os.getenv('DB_PATH'),
-            user=os.getenv('APP_USER'),
-            password=os.getenv('PASSWORD'),
-            role=os.getenv('ROLE'),
-            auth_plugin_name=os.getenv('AUTH'),
-            wire_crypt=False,
-            charset='ISO8859_1'
-        )
+        return seculos_db.get_firebird_connection()
     except Exception as e:
         print(f"Erro CRÍTICO ao tentar conectar ao banco de dados: {e}")
         print("Verifique as variáveis de ambiente no seu arquivo .env")
@@ -118,23 +258,157 @@ def definir_plano_contas(valor_produtos, valor_total):
     return "Prestação de serviços"
 
 # ==============================================================================
-# LÓGICA 1: FATURADOS (DUPLICATADAFATURA)
+# CARGA EM LOTE (substitui as consultas pedido a pedido)
 # ==============================================================================
 
+# O Firebird aceita no máximo 1500 itens num IN
+TAMANHO_BLOCO_IN = 1000
 
-def processar_faturado(conn, cd_fatura, num_pedido):
-    cursor = conn.cursor()
 
-    sql = """
-    SELECT 
-        D.NUMDUPLICATA, D.VALOR, D.DTVENCIMENTO, D.PAGO, 
-        D.DTULTPGTO, D.JUROSTOTALPAGO, D.DTSITUACAO
-    FROM DUPLICATADAFATURA D
-    WHERE D.CDFATURA = ?
-    ORDER BY D.DTVENCIMENTO
+def _em_blocos(valores, tamanho=TAMANHO_BLOCO_IN):
+    valores = list(valores)
+    for i in range(0, len(valores), tamanho):
+        yield valores[i:i + tamanho]
+
+
+class DadosRecebimento:
+    """
+    Tudo o que as regras consultavam pedido a pedido, carregado de uma vez para o conjunto de pedidos:
+    duplicatas das faturas, recebimentos (ITENSRECEBIMENTO/RECEBIMENTO), pagamentos e parcelas de cartão
+    e os clientes que pagaram boleto nos últimos 60 dias. As regras rodam em memória em cima disto.
     """
-    cursor.execute(sql, (cd_fatura,))
-    duplicatas = cursor.fetchall()
+
+    def __init__(self, conn, pedidos):
+        self.cursor = conn.cursor()
+        cds_pedido = {p[0] for p in pedidos}
+        cds_fatura = {p[7] for p in pedidos if p[7] and p[7] > 0}
+        cds_nota = {p[8] for p in pedidos if p[8]}
+        # Sem nota a busca de recebimento é pelo pedido
+        cds_pedido_sem_nota = {p[0] for p in pedidos if not p[8]}
+
+        self._duplicatas = self._carregar_duplicatas(cds_fatura)
+        self._receb_por_nota, self._receb_por_pedido = self._carregar_recebimentos(cds_nota, cds_pedido_sem_nota)
+
+        # O cartão é procurado pelo pedido ou pelo número do documento (o próprio pedido ou o recebimento)
+        cds_recebimento = {r[4] for lista in self._receb_por_nota.values() for r in lista}
+        cds_recebimento |= {r[4] for lista in self._receb_por_pedido.values() for r in lista}
+        self._cartao_por_pedido, self._cartao_por_receb = self._carregar_pagamentos_cartao(
+            cds_pedido, cds_pedido | cds_recebimento)
+        cds_pagto = {c[0] for lista in self._cartao_por_pedido.values() for c in lista}
+        cds_pagto |= {c[0] for lista in self._cartao_por_receb.values() for c in lista}
+        self._parcelas = self._carregar_parcelas_cartao(cds_pagto)
+
+        self._clientes_boleto = self._carregar_clientes_boleto()
+
+        print(f"Carga em lote: {len(self._duplicatas)} faturas, "
+              f"{len(self._receb_por_nota) + len(self._receb_por_pedido)} notas/pedidos com recebimento, "
+              f"{len(cds_pagto)} pagamentos a cartão, {len(self._clientes_boleto)} clientes no boleto.")
+
+    def _agrupar(self, sql, chaves, idx_chave):
+        """Executa 'sql' (com {marcadores} para o IN) em blocos e agrupa as linhas pela coluna idx_chave."""
+        grupos = {}
+        for bloco in _em_blocos(chaves):
+            self.cursor.execute(sql.format(marcadores=','.join(['?'] * len(bloco))), tuple(bloco))
+            for row in self.cursor.fetchall():
+                grupos.setdefault(row[idx_chave], []).append(row)
+        return grupos
+
+    def _carregar_duplicatas(self, cds_fatura):
+        sql = """
+        SELECT
+            D.NUMDUPLICATA, D.VALOR, D.DTVENCIMENTO, D.PAGO,
+            D.DTULTPGTO, D.JUROSTOTALPAGO, D.DTSITUACAO, D.CDFATURA
+        FROM DUPLICATADAFATURA D
+        WHERE D.CDFATURA IN ({marcadores})
+        ORDER BY D.CDFATURA, D.DTVENCIMENTO
+        """
+        grupos = self._agrupar(sql, cds_fatura, 7)
+        return {cd: [row[:7] for row in rows] for cd, rows in grupos.items()}
+
+    def _carregar_recebimentos(self, cds_nota, cds_pedido):
+        sql = """
+        SELECT
+            R.DATA,
+            I.VALORREAL, -- Pegamos o valor amortizado do item, não o total do recibo
+            R.CDFORMAPAG,
+            R.VALORTOTAL,
+            R.CDRECEBIMENTO,
+            I.{coluna}
+        FROM ITENSRECEBIMENTO I
+        JOIN RECEBIMENTO R ON I.CDRECEBIMENTO = R.CDRECEBIMENTO
+        WHERE I.{coluna} IN ({{marcadores}})
+        """
+        por_nota = self._agrupar(sql.format(coluna="CDNOTA"), cds_nota, 5)
+        por_pedido = self._agrupar(sql.format(coluna="CDPEDIDOVENDA"), cds_pedido, 5)
+        return ({cd: [row[:5] for row in rows] for cd, rows in por_nota.items()},
+                {cd: [row[:5] for row in rows] for cd, rows in por_pedido.items()})
+
+    def _carregar_pagamentos_cartao(self, cds_pedido, cds_recebimento):
+        sql = """
+        SELECT
+            P.CDPAGAMENTOACARTAO, P.CREDITODEBITO, P.CDPEDIDOVENDA, P.CDRECEBIMENTO
+        FROM PAGAMENTOSACARTAO P
+        WHERE P.{coluna} IN ({{marcadores}})
+        """
+        por_pedido = self._agrupar(sql.format(coluna="CDPEDIDOVENDA"), cds_pedido, 2)
+        por_receb = self._agrupar(sql.format(coluna="CDRECEBIMENTO"), cds_recebimento, 3)
+        return por_pedido, por_receb
+
+    def _carregar_parcelas_cartao(self, cds_pagto):
+        sql = """
+        SELECT
+            PC.PARCELANUM, PC.VALOR, PC.DTVENCIMENTO,
+            PC.LANCADO, PC.DTCOMPENSADO, PC.CDPAGAMENTOACARTAO
+        FROM PARCELASCARTAO PC
+        WHERE PC.CDPAGAMENTOACARTAO IN ({marcadores})
+        ORDER BY PC.CDPAGAMENTOACARTAO, PC.PARCELANUM
+        """
+        grupos = self._agrupar(sql, cds_pagto, 5)
+        return {cd: [row[:5] for row in rows] for cd, rows in grupos.items()}
+
+    def _carregar_clientes_boleto(self):
+        # Define limite de 60 dias atrás para considerar o cliente "ativo no boleto"
+        data_limite = date.today() - timedelta(days=60)
+        self.cursor.execute("""
+        SELECT DISTINCT CDCLIENTE
+        FROM RECEBIMENTO
+        WHERE CDFORMAPAG = 11
+          AND DATA >= ?
+        """, (data_limite,))
+        return {row[0] for row in self.cursor.fetchall()}
+
+    # --- Consultas em memória (mesmas perguntas que as funções faziam ao banco) ---
+
+    def duplicatas(self, cd_fatura):
+        return self._duplicatas.get(cd_fatura, [])
+
+    def recebimentos(self, cd_pedido, cd_nota):
+        if cd_nota:
+            return self._receb_por_nota.get(cd_nota, [])
+        return self._receb_por_pedido.get(cd_pedido, [])
+
+    def pagamento_cartao(self, cd_pedido, num_doc_ou_pedido):
+        """(CDPAGAMENTOACARTAO, CREDITODEBITO) do pedido ou do documento, ou None."""
+        candidatos = self._cartao_por_pedido.get(cd_pedido, []) + self._cartao_por_receb.get(num_doc_ou_pedido, [])
+        if not candidatos:
+            return None
+        # A consulta antiga pegava a primeira linha da tabela: a de menor código
+        cd_pagto, tipo_cd = min(candidatos)[:2]
+        return cd_pagto, tipo_cd
+
+    def parcelas_cartao(self, cd_pagto_cartao):
+        return self._parcelas.get(cd_pagto_cartao, [])
+
+    def cliente_paga_boleto(self, cd_cliente):
+        return cd_cliente in self._clientes_boleto
+
+# ==============================================================================
+# LÓGICA 1: FATURADOS (DUPLICATADAFATURA)
+# ==============================================================================
+
+
+def processar_faturado(dados, cd_fatura, num_pedido):
+    duplicatas = dados.duplicatas(cd_fatura)
 
     titulos = []
     if not duplicatas:
@@ -180,18 +454,8 @@ def processar_faturado(conn, cd_fatura, num_pedido):
 # ==============================================================================
 
 
-def processar_cartao(conn, cd_pedido, dt_venda_original, num_doc_ou_pedido, nome_cliente, nome_conta):
-    cursor = conn.cursor()
-
-    sql_head = """
-    SELECT 
-        P.CDPAGAMENTOACARTAO, P.CREDITODEBITO 
-    FROM PAGAMENTOSACARTAO P 
-    WHERE P.CDPEDIDOVENDA = ?
-        OR P.CDRECEBIMENTO = ? 
-    """
-    cursor.execute(sql_head, (cd_pedido, num_doc_ou_pedido))
-    pagto_cartao = cursor.fetchone()
+def processar_cartao(dados, cd_pedido, dt_venda_original, num_doc_ou_pedido, nome_cliente, nome_conta):
+    pagto_cartao = dados.pagamento_cartao(cd_pedido, num_doc_ou_pedido)
 
     if not pagto_cartao:
         print(f"Nenhum pagamento por cartão encontrado para o pedido {cd_pedido}.")
@@ -204,16 +468,7 @@ def processar_cartao(conn, cd_pedido, dt_venda_original, num_doc_ou_pedido, nome
         return [], True
 
     # Se for CRÉDITO -> Busca Parcelas
-    sql_parcelas = """
-    SELECT 
-        PC.PARCELANUM, PC.VALOR, PC.DTVENCIMENTO, 
-        PC.LANCADO, PC.DTCOMPENSADO 
-    FROM PARCELASCARTAO PC 
-    WHERE PC.CDPAGAMENTOACARTAO = ? 
-    ORDER BY PC.PARCELANUM
-    """
-    cursor.execute(sql_parcelas, (cd_pagto_cartao,))
-    parcelas = cursor.fetchall()
+    parcelas = dados.parcelas_cartao(cd_pagto_cartao)
 
     if not parcelas:
         return [], True  # Fallback
@@ -250,43 +505,12 @@ def processar_cartao(conn, cd_pedido, dt_venda_original, num_doc_ou_pedido, nome
 # ==============================================================================
 
 
-def verificar_recebimento_carteira(conn, cd_pedido, cd_nota, nome_cliente=""):
+def verificar_recebimento_carteira(dados, cd_pedido, cd_nota, nome_cliente=""):
     """
     Verifica se um pedido a prazo foi pago na tabela RECEBIMENTOS.
+    Se temos a Nota, o caminho é mais preciso; sem ela, tenta pelo pedido.
     """
-    cursor = conn.cursor()
-
-    # Se temos a Nota, o caminho é mais preciso
-    if cd_nota:
-        sql = """
-        SELECT 
-            R.DATA, 
-            I.VALORREAL, -- Pegamos o valor amortizado do item, não o total do recibo
-            R.CDFORMAPAG,
-            R.VALORTOTAL,
-            R.CDRECEBIMENTO
-        FROM ITENSRECEBIMENTO I
-        JOIN RECEBIMENTO R ON I.CDRECEBIMENTO = R.CDRECEBIMENTO
-        WHERE I.CDNOTA = ?
-        """
-        cursor.execute(sql, (cd_nota,))
-
-    else:
-        # Fallback: tenta pelo pedido se não tiver nota
-        sql = """
-        SELECT 
-            R.DATA, 
-            I.VALORREAL,
-            R.CDFORMAPAG,
-            R.VALORTOTAL,
-            R.CDRECEBIMENTO
-        FROM ITENSRECEBIMENTO I
-        JOIN RECEBIMENTO R ON I.CDRECEBIMENTO = R.CDRECEBIMENTO
-        WHERE I.CDPEDIDOVENDA = ?
-        """
-        cursor.execute(sql, (cd_pedido,))
-
-    recebimentos = cursor.fetchall()
+    recebimentos = dados.recebimentos(cd_pedido, cd_nota)
     pagamentos_detectados = []
 
     if recebimentos:
@@ -298,7 +522,7 @@ def verificar_recebimento_carteira(conn, cd_pedido, cd_nota, nome_cliente=""):
             if valor_final <= 0:
                 continue
 
-            titulos = resolver_pagamento(conn, cd_forma_real, valor_final, data_rec, cd_pedido,
+            titulos = resolver_pagamento(dados, cd_forma_real, valor_final, data_rec, cd_pedido,
                                          cd_recebimento, nome_cliente, f"Receb. Baixa Pedido {cd_pedido}")
 
             pagamentos_detectados.extend(titulos)
@@ -306,32 +530,19 @@ def verificar_recebimento_carteira(conn, cd_pedido, cd_nota, nome_cliente=""):
     return pagamentos_detectados
 
 
-def cliente_costuma_pagar_boleto(conn, cd_cliente):
+def cliente_costuma_pagar_boleto(dados, cd_cliente):
     """
-    Verifica se o cliente tem histórico recente de pagamento via Boleto (11).
+    Verifica se o cliente tem histórico recente (60 dias) de pagamento via Boleto (11).
     Isso indica que ele é 'Faturado' e não devemos lançar pedidos avulsos.
     """
-    # Define limite de 60 dias atrás para considerar o cliente "ativo no boleto"
-    data_limite = date.today() - timedelta(days=60)
-
-    cursor = conn.cursor()
-    # Usando RECEBIMENTOS (Plural, conforme padrão do banco)
-    sql = """
-    SELECT FIRST 1 1 
-    FROM RECEBIMENTO
-    WHERE CDCLIENTE = ? 
-      AND CDFORMAPAG = 11 
-      AND DATA >= ?
-    """
-    cursor.execute(sql, (cd_cliente, data_limite))
-    return cursor.fetchone() is not None
+    return dados.cliente_paga_boleto(cd_cliente)
 
 # ==============================================================================
 # NOVA FUNÇÃO UNIFICADA: O CORAÇÃO DO PAGAMENTO
 # ==============================================================================
 
 
-def resolver_pagamento(conn, cd_forma, valor, dt_venda, cd_pedido, num_doc_ou_pedido, nome_cli, contexto_desc=""):
+def resolver_pagamento(dados, cd_forma, valor, dt_venda, cd_pedido, num_doc_ou_pedido, nome_cli, contexto_desc=""):
     """
     Função Universal: Recebe um valor e uma forma de pagamento e decide como transformar
     isso em títulos (seja cartão, pix, dinheiro, etc).
@@ -360,7 +571,7 @@ def resolver_pagamento(conn, cd_forma, valor, dt_venda, cd_pedido, num_doc_ou_pe
     if cd_forma == 16:
         # Passo A: Tenta extrair a parte do Cartão
         titulos_card, eh_debito_ou_falha = processar_cartao(
-            conn, cd_pedido, dt_venda, num_doc_ou_pedido, nome_cli, "Banco do Brasil Peças")
+            dados, cd_pedido, dt_venda, num_doc_ou_pedido, nome_cli, "Banco do Brasil Peças")
 
         soma_cartao = 0.0
         if titulos_card:
@@ -394,7 +605,7 @@ def resolver_pagamento(conn, cd_forma, valor, dt_venda, cd_pedido, num_doc_ou_pe
         # Tenta buscar os detalhes na tabela de cartão
         # OBS: Se for recebimento de carteira, passamos a data do recebimento como base
         titulos_card, eh_debito_ou_falha = processar_cartao(
-            conn, cd_pedido, dt_venda, num_doc_ou_pedido, nome_cli, conta_destino
+            dados, cd_pedido, dt_venda, num_doc_ou_pedido, nome_cli, conta_destino
         )
 
         if titulos_card:
@@ -433,10 +644,20 @@ def resolver_pagamento(conn, cd_forma, valor, dt_venda, cd_pedido, num_doc_ou_pe
 # ==============================================================================
 
 
-def main():
+def main(completo=False):
+    """
+    Gera o CSV só com os títulos novos ou com pagamento novo desde a última execução (completo=True gera
+    todos e reprocessa também os pedidos já quitados). Títulos alterados ou removidos depois de exportados
+    vão para ARQUIVO_ANALISE. Retorna o caminho do CSV de importação ou None (e aí não fica CSV antigo na pasta).
+    """
     conn = get_firebird_connection()
     if not conn:
-        return
+        return None
+
+    # O CSV da execução anterior sairia de novo como se fosse desta
+    for arquivo in (ARQUIVO_CSV, ARQUIVO_ANALISE):
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
 
     # Filtro de Data Fixa
     print(f"--- Iniciando Migração de Contas a Receber (Apenas LOJA) ---")
@@ -466,7 +687,20 @@ def main():
 
     print(f"Pedidos encontrados: {len(pedidos)}")
 
+    controle = ControleRecebimentos()
+    if not completo:
+        # Pedido quitado há mais de DIAS_RECONFERIR_QUITADOS dias fica fora das consultas e das regras
+        quitados = controle.quitados(antes_de=datetime.now() - timedelta(days=DIAS_RECONFERIR_QUITADOS))
+        pedidos = [ped for ped in pedidos if ped[0] not in quitados]
+        print(f"Pedidos a processar (sem os quitados há mais de {DIAS_RECONFERIR_QUITADOS} dias): {len(pedidos)}")
+
+    # Carrega de uma vez tudo o que as regras abaixo precisam; daqui para frente não há mais consultas
+    dados = DadosRecebimento(conn, pedidos)
+    conn.close()
+
     dados_exportacao = []
+    dados_analise = []
+    motivos = {"novo": 0, "pagamento": 0, "alterado": 0, "removido": 0}
 
     # --- CACHE PARA NÃO CONSULTAR O MESMO CLIENTE MIL VEZES ---
     cache_clientes_faturados = {}
@@ -483,7 +717,7 @@ def main():
 
         # Pedidos faturados
         if cd_fatura and cd_fatura > 0:
-            titulos_fat, faturado_ok = processar_faturado(conn, cd_fatura, num_pedido)
+            titulos_fat, faturado_ok = processar_faturado(dados, cd_fatura, num_pedido)
             if faturado_ok:
                 titulos_do_pedido.extend(titulos_fat)
                 # Se achou faturado, não precisa verificar outras lógicas de forma de pgto
@@ -494,7 +728,7 @@ def main():
                 pass
 
         if not titulos_do_pedido:
-            titulos_recuperados = verificar_recebimento_carteira(conn, cd_pedido, cd_nota, nome_cli)
+            titulos_recuperados = verificar_recebimento_carteira(dados, cd_pedido, cd_nota, nome_cli)
 
             if titulos_recuperados:
                 titulos_do_pedido.extend(titulos_recuperados)
@@ -509,19 +743,19 @@ def main():
             # CASO VISTA OU CARTÃO
             if natureza in ['Vista', 'Cartao']:
                 titulos_do_pedido = resolver_pagamento(
-                    conn, cd_forma, total, dt_venda, cd_pedido, num_pedido, nome_cli, f"Venda Pedido {num_pedido}"
+                    dados, cd_forma, total, dt_venda, cd_pedido, num_pedido, nome_cli, f"Venda Pedido {num_pedido}"
                 )
 
             # CASO PRAZO
             elif natureza == 'Prazo':
-                titulos_pagos = verificar_recebimento_carteira(conn, cd_pedido, cd_nota, nome_cli)
+                titulos_pagos = verificar_recebimento_carteira(dados, cd_pedido, cd_nota, nome_cli)
 
                 if titulos_pagos:
                     titulos_do_pedido.extend(titulos_pagos)
                 else:
                     # Verifica Cache
                     if cd_cli not in cache_clientes_faturados:
-                        cache_clientes_faturados[cd_cli] = cliente_costuma_pagar_boleto(conn, cd_cli)
+                        cache_clientes_faturados[cd_cli] = cliente_costuma_pagar_boleto(dados, cd_cli)
 
                     # Se não paga boleto, gera previsão de carteira
                     if not cache_clientes_faturados[cd_cli]:
@@ -536,6 +770,7 @@ def main():
                         })
                     # Se paga boleto e não achou fatura lá em cima, provavelmente é um erro de cadastro ou delay
 
+        linhas_pedido = []
         for item in titulos_do_pedido:
             dt_venc = item['Vencimento']
             dt_pgto = item['DataPagamento']
@@ -555,7 +790,7 @@ def main():
                 # Se não, usa a data da venda do pedido mesmo
                 emissao_final = item.get('EmissaoReal', dt_venda)
             
-                dados_exportacao.append({
+                linhas_pedido.append({
                     "Pessoa": nome_cli,
                     "Emissao": emissao_final,
                     "Vencimento": item['Vencimento'],
@@ -570,48 +805,82 @@ def main():
                     "Descrição": item['Descricao']
                 })
 
-    conn.close()
+        quitado = bool(titulos_do_pedido) and all(item['DataPagamento'] for item in titulos_do_pedido)
+        alteracoes = controle.comparar(cd_pedido, linhas_pedido, quitado)
+        for _, motivo in alteracoes:
+            motivos[motivo] += 1
+        if completo:
+            dados_exportacao.extend(linhas_pedido)
+        else:
+            for linha, motivo in alteracoes:
+                if motivo in ("novo", "pagamento"):
+                    dados_exportacao.append(linha)
+                else:
+                    # Reenviar criaria um segundo título no Xfin: vai para conferência manual
+                    dados_analise.append(dict(linha, Motivo=motivo))
 
+    print(f"Títulos novos: {motivos['novo']}, com pagamento novo: {motivos['pagamento']}, "
+          f"alterados: {motivos['alterado']}, removidos: {motivos['removido']}.")
+
+    nome_arq = None
     if dados_exportacao:
-        df = pd.DataFrame(dados_exportacao)
+        nome_arq = gravar_csv(dados_exportacao, ARQUIVO_CSV)
+        print(f"\nSUCESSO! Arquivo '{nome_arq}' gerado com {len(dados_exportacao)} títulos.")
+    elif completo:
+        print("Nenhuma venda da LOJA encontrada no período.")
+    else:
+        print("Nenhum título novo ou pago desde a última exportação.")
 
-        colunas_data = ['Emissao', 'Vencimento', 'Data Pagamento']
-        for col in colunas_data:
+    if dados_analise:
+        gravar_csv(dados_analise, ARQUIVO_ANALISE, ["Motivo"])
+        print(f"ATENÇÃO: '{ARQUIVO_ANALISE}' gerado com {len(dados_analise)} títulos alterados ou removidos "
+              f"depois de exportados (acertar direto no Xfin).")
+
+    # Só depois do CSV gravado o livro passa a considerar os títulos exportados
+    print(f"Controle de recebíveis atualizado: {controle.registrar(nome_arq)} pedidos.")
+    controle.fechar()
+    return nome_arq
+
+
+def gravar_csv(linhas, nome_arq, colunas_extra=()):
+    """Grava as linhas no layout de importação do Xfin (mais as colunas_extra no fim). Retorna nome_arq."""
+    # Linha de título removido só tem os campos da chave: o resto sai vazio
+    df = pd.DataFrame(linhas).fillna("")
+
+    colunas_data = ['Emissao', 'Vencimento', 'Data Pagamento']
+    for col in colunas_data:
+        if col in df.columns:
             df[col] = df[col].apply(formatar_data_br)
 
-        colunas_valor = ['Valor', 'Valor Pago']
-        for col in colunas_valor:
+    colunas_valor = ['Valor', 'Valor Pago']
+    for col in colunas_valor:
+        if col in df.columns:
             df[col] = df[col].apply(formatar_valor_br)
 
-        mapa_colunas = {
-            "Pessoa": "Pessoa*",
-            "Emissao": "Emissao*",
-            "Vencimento": "Vencimento*",
-            "Valor": "Valor*",
-            "Plano Contas": "Plano Contas*",
-            "Tipo Documento": "Tipo Documento*",
-            "Valor Pago": "Valor Pago",
-            "Data Pagamento": "Data Pagamento",
-            "Conta/Banco": "Conta/Banco",
-            "Parcela": "Parcela",
-            "Número Documento": "Número Documento",
-            "Descrição": "Descrição"
-        }
-        df = df.rename(columns=mapa_colunas)
-
-        for col in mapa_colunas.values():
-            if col not in df.columns:
-                df[col] = ""
-
-        df = df[list(mapa_colunas.values())]
-
-        nome_arq = "arquivos/importacao_RECEITAS_xfin_LOJA.csv"
-        df.to_csv(nome_arq, index=False, sep=';', encoding='utf-8-sig')
-
-        print(f"\nSUCESSO! Arquivo '{nome_arq}' gerado com {len(df)} títulos.")
-    else:
-        print("Nenhuma venda da LOJA encontrada no período.")
+    mapa_colunas = {
+        "Pessoa": "Pessoa*",
+        "Emissao": "Emissao*",
+        "Vencimento": "Vencimento*",
+        "Valor": "Valor*",
+        "Plano Contas": "Plano Contas*",
+        "Tipo Documento": "Tipo Documento*",
+        "Valor Pago": "Valor Pago",
+        "Data Pagamento": "Data Pagamento",
+        "Conta/Banco": "Conta/Banco",
+        "Parcela": "Parcela",
+        "Número Documento": "Número Documento",
+        "Descrição": "Descrição"
+    }
+    df = df.rename(columns=mapa_colunas)
+
+    colunas = list(mapa_colunas.values()) + list(colunas_extra)
+    for col in colunas:
+        if col not in df.columns:
+            df[col] = ""
+
+    df[colunas].to_csv(nome_arq, index=False, sep=';', encoding='utf-8-sig')
+    return nome_arq
 
 
 if __name__ == "__main__":
-    main()
+    main(completo="--completo" in sys.argv)
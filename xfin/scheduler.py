@@ -25,12 +25,11 @@ def executar_sincronizacao():
     # 2. Gera o arquivo CSV e salva IDs no SQLite
     arquivos_csv = pagto_sec_p_xfin.main()
     
-    # 3. Se gerou arquivo, faz o upload
+    # 3. Se gerou arquivo, faz o upload (todos numa sessão só do navegador: um login para o lote)
     if arquivos_csv:
-        for arquivo in arquivos_csv:
-            print(f"Arquivo gerado: {arquivo}. Iniciando upload...")
-            sucesso_upload = xfin_uploader.upload_arquivo_xfin(arquivo)
-            
+        print(f"Arquivos gerados: {', '.join(arquivos_csv)}. Iniciando upload...")
+        resultado_upload = xfin_uploader.upload_arquivos_xfin(arquivos_csv)
+        for arquivo, sucesso_upload in resultado_upload.items():
             if sucesso_upload:
                 print(f"Ciclo concluído para {arquivo}: Enviado com sucesso.")
             else:
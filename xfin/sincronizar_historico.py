@@ -1,132 +1,212 @@
 import os
+import csv
 import glob
+import codecs
 import pandas as pd
-import sqlite3
+from datetime import datetime
 from dotenv import load_dotenv
-from pagto_sec_p_xfin import get_firebird_connection, inicializar_db_controle, DB_CONTROLE
+from pagto_sec_p_xfin import get_firebird_connection, ControleExportacao
 
 load_dotenv()
 
+CHAVE = ["doc", "parcela", "valor"]
+
+
+def formatar_valores(valores):
+    """Série numérica -> texto com 2 casas ('1200.5' -> '1200.50'), igual dos dois lados da conferência."""
+    return valores.map("{:.2f}".format)
+
+
 def carregar_titulos_firebird():
     """
-    Carrega todos os títulos do Firebird para criar um mapa de identificação.
-    Chave: (NumeroDocLimpo, Parcela, ValorFormatado)
-    Valor: ID_UNICO (usado no controle_exportacao.db)
+    Carrega todos os títulos do Firebird para identificar as linhas dos CSVs do XFIN.
+    DataFrame com a chave (doc, parcela, valor) e o id_unico (usado no controle_exportacao.db).
+    Chave repetida fica com o último título lido (como no dicionário de antes); 'ambiguas' conta essas chaves.
     """
     print("Conectando ao Firebird para buscar títulos...")
     conn = get_firebird_connection()
     if not conn:
         print("Erro de conexão com Firebird.")
-        return {}
-    
+        return None
+
     cursor = conn.cursor()
     # Busca títulos de um período abrangente para garantir que encontramos os dados do XFIN
     # Ajuste a data conforme a antiguidade dos dados no XFIN, se necessário
     sql = """
-    SELECT 
-        A.CDFORNECEDOR, 
-        A.NUMDOCUMENTO, 
-        A.NUMPARCELA, 
+    SELECT
+        A.CDFORNECEDOR,
+        A.NUMDOCUMENTO,
+        A.NUMPARCELA,
         A.VALOR
     FROM APAGAR A
     WHERE A.DTVENCIMENTO >= '2024-01-01'
     """
-    
+
     try:
         cursor.execute(sql)
         rows = cursor.fetchall()
     except Exception as e:
         print(f"Erro ao consultar Firebird: {e}")
         conn.close()
-        return {}
-    
+        return None
+
     conn.close()
-    
-    lookup = {}
-    for row in rows:
-        cd_forn, num_doc, num_parc, valor = row
-        
-        # Lógica de limpeza idêntica ao script principal
-        doc_limpo = str(num_doc).split('/')[0].strip() if num_doc else "S_DOC"
-        
-        # ID Único que queremos salvar no SQLite
-        id_unico = f"DOC_{doc_limpo}_FORN_{cd_forn}_PARC_{num_parc}"
-        
-        # Chave para encontrar este título usando dados do CSV do XFIN
-        # Usamos Valor com 2 casas decimais para evitar erros de arredondamento
-        val_str = f"{float(valor):.2f}"
-        parc_str = str(num_parc).strip()
-        
-        # Chave composta: (Documento, Parcela, Valor)        
-        key = (doc_limpo, parc_str, val_str)
-        lookup[key] = id_unico
-        
-    print(f"Mapeados {len(lookup)} títulos do Firebird para conferência.")
-    return lookup
-
-def normalizar_valor(valor_str):
-    """Converte string de valor (ex: '1.200,50' ou '1200.50') para string '1200.50'"""
-    if pd.isna(valor_str): return "0.00"
-    v = str(valor_str).strip()
-    v = v.replace('R$', '').strip()
-    
-    # Tenta detectar formato brasileiro (vírgula como decimal)
-    if ',' in v and '.' in v:
-        v = v.replace('.', '').replace(',', '.')
-    elif ',' in v:
-        v = v.replace(',', '.')
-    
+
+    df = pd.DataFrame(rows, columns=["cdfornecedor", "numdocumento", "numparcela", "valor"], dtype=object)
+
+    # Lógica de limpeza idêntica ao script principal (documento vazio vira S_DOC)
+    sem_doc = df["numdocumento"].isna() | (df["numdocumento"].map(str) == "")
+    doc = df["numdocumento"].map(str).str.split("/").str[0].str.strip()
+    df["doc"] = doc.where(~sem_doc, "S_DOC")
+    df["parcela"] = df["numparcela"].map(str).str.strip()
+    # Valor com 2 casas decimais para evitar erros de arredondamento
+    df["valor"] = formatar_valores(pd.to_numeric(df["valor"], errors="coerce"))
+    df["id_unico"] = ("DOC_" + df["doc"] + "_FORN_" + df["cdfornecedor"].map(str)
+                      + "_PARC_" + df["numparcela"].map(str))
+
+    ambiguas = df[df.duplicated(CHAVE, keep=False)].groupby(CHAVE)["id_unico"].nunique()
+    df = df.drop_duplicates(CHAVE, keep="last")[CHAVE + ["id_unico"]]
+    df.attrs["ambiguas"] = int((ambiguas > 1).sum())
+
+    print(f"Mapeados {len(df)} títulos do Firebird para conferência.")
+    return df
+
+
+def normalizar_valores(valores):
+    """Texto de valor ('1.200,50', 'R$ 1200.50') -> '1200.50'; vazio ou inválido vira '0.00'."""
+    v = valores.fillna("").astype(str).str.replace("R$", "", regex=False).str.strip()
+    # Formato brasileiro: com vírgula e ponto, o ponto é milhar; só com vírgula, ela é o decimal
+    brasileiro = v.str.contains(",", regex=False) & v.str.contains(".", regex=False)
+    v = v.where(~brasileiro, v.str.replace(".", "", regex=False))
+    v = v.str.replace(",", ".", regex=False)
+    return formatar_valores(pd.to_numeric(v, errors="coerce").fillna(0.0))
+
+
+def detectar_formato(arquivo):
+    """
+    (encoding, separador) do CSV: UTF-8 (com ou sem BOM) ou latin1, e ';', ',', tab ou '|'.
+    O arquivo inteiro passa pelo decodificador incremental: um acento em latin1 lá no fim ou um
+    caractere UTF-8 cortado entre dois blocos não enganam a detecção.
+    """
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    encoding = "utf-8-sig"
+    with open(arquivo, "rb") as f:
+        try:
+            for bloco in iter(lambda: f.read(64 * 1024), b""):
+                decodificador.decode(bloco)
+            decodificador.decode(b"", final=True)
+        except UnicodeDecodeError:
+            encoding = "latin1"
+    with open(arquivo, encoding=encoding, newline="") as f:
+        primeira_linha = f.readline().rstrip("\r\n")
     try:
-        return f"{float(v):.2f}"
-    except:
-        return "0.00"
+        separador = csv.Sniffer().sniff(primeira_linha, delimiters=";,\t|").delimiter
+    except csv.Error:
+        separador = ";"
+    return encoding, separador
+
+
+def ler_csv_xfin(arquivo):
+    """Linhas do CSV com a chave normalizada (doc, parcela, valor), ou None se faltar alguma coluna."""
+    encoding, separador = detectar_formato(arquivo)
+    df = pd.read_csv(arquivo, sep=separador, engine="c", dtype=str, encoding=encoding)
+    df.columns = [c.lower().strip() for c in df.columns]
 
-def processar_arquivos_xfin():
-    inicializar_db_controle()
-    mapa_fb = carregar_titulos_firebird()
-    if not mapa_fb: return
+    col_doc = next((c for c in df.columns if 'número documento' in c), None)
+    col_parc = next((c for c in df.columns if 'parcela' in c), None)
+    col_valor = next((c for c in df.columns if 'valor' in c and 'pago' not in c), None)
 
-    lista_arquivos = glob.glob("arquivos/*.csv")
+    if not (col_doc and col_parc and col_valor):
+        print(f"  [!] Colunas não identificadas em {arquivo}. Pulando.")
+        return None
+
+    return pd.DataFrame({
+        "arquivo": arquivo,
+        "linha": range(2, len(df) + 2),
+        "doc": df[col_doc].str.split("/").str[0].str.strip(),
+        "parcela": df[col_parc].str.split("/").str[0].str.strip(),
+        "valor": normalizar_valores(df[col_valor]),
+    })
+
+
+def conciliar(df_csv, df_fb):
+    """
+    Junta as linhas dos CSVs com os títulos do Firebird pela chave.
+    Linha com a mesma chave de uma anterior (mesmo título em outro arquivo ou repetido) é marcada como duplicada.
+    """
+    df = df_csv.merge(df_fb, on=CHAVE, how="left")
+    df["duplicada"] = df.duplicated(CHAVE, keep="first")
+    return df
+
+
+def processar_arquivos_xfin(padrao="arquivos/*.csv"):
+    """
+    Marca como já exportados os títulos do Firebird que aparecem nos CSVs do XFIN.
+    Retorna o resumo: linhas lidas, encontradas, sem correspondência, duplicadas, já marcadas e inseridas.
+    """
+    df_fb = carregar_titulos_firebird()
+    if df_fb is None or df_fb.empty:
+        return None
+
+    lista_arquivos = glob.glob(padrao)
     if not lista_arquivos:
         print("Nenhum arquivo .csv encontrado na pasta 'arquivos'.")
-        return
+        return None
 
-    conn_sqlite = sqlite3.connect(DB_CONTROLE)
-    cursor_sqlite = conn_sqlite.cursor()
-    total_inseridos = 0
-    
+    partes = []
     for arquivo in lista_arquivos:
         print(f"\nProcessando arquivo: {arquivo}")
         try:
-            df = pd.read_csv(arquivo, sep=None, engine='python', dtype=str, encoding='latin1')
-            df.columns = [c.lower().strip() for c in df.columns]
-            
-            col_doc = next((c for c in df.columns if 'número documento' in c), None)
-            col_parc = next((c for c in df.columns if 'parcela' in c), None)
-            col_valor = next((c for c in df.columns if 'valor' in c and 'pago' not in c), None)
-            
-            if not (col_doc and col_parc and col_valor):
-                print(f"  [!] Colunas não identificadas em {arquivo}. Pulando.")
-                continue
-            
-            for _, row in df.iterrows():
-                doc_limpo = str(row[col_doc]).split('/')[0].strip()
-                parc_limpa = str(row[col_parc]).split('/')[0].strip()
-                val_csv = normalizar_valor(row[col_valor])
-                
-                print(f"  Verificando: Doc='{doc_limpo}', Parc='{parc_limpa}', Valor='{val_csv}'")
-                
-                if (doc_limpo, parc_limpa, val_csv) in mapa_fb:
-                    id_unico = mapa_fb[(doc_limpo, parc_limpa, val_csv)]
-                    try:
-                        cursor_sqlite.execute("INSERT INTO historico_pagar (id_unico) VALUES (?)", (id_unico,))
-                        total_inseridos += 1
-                    except sqlite3.IntegrityError: pass
-        except Exception as e: print(f"  Erro: {e}")
-
-    conn_sqlite.commit()
-    conn_sqlite.close()
-    print(f"\nConcluído. {total_inseridos} registros marcados como já exportados.")
+            df_arquivo = ler_csv_xfin(arquivo)
+        except Exception as e:
+            print(f"  Erro: {e}")
+            continue
+        if df_arquivo is not None:
+            print(f"  {len(df_arquivo)} linhas lidas.")
+            partes.append(df_arquivo)
+
+    if not partes:
+        print("\nNenhuma linha lida dos arquivos.")
+        return None
+
+    df = conciliar(pd.concat(partes, ignore_index=True), df_fb)
+    encontradas = df[df["id_unico"].notna()]
+
+    # IDs novos gravados numa transação só, com o arquivo de onde cada um veio
+    controle = ControleExportacao(id_execucao="sincronizacao_" + datetime.now().strftime("%Y%m%d_%H%M%S"))
+    try:
+        unicos = encontradas.drop_duplicates("id_unico")
+        inseridas = controle.marcar_lote_como_exportado(zip(unicos["id_unico"], unicos["arquivo"]))
+    finally:
+        controle.fechar()
+
+    resumo = {
+        "arquivos": len(partes),
+        "linhas": len(df),
+        "encontradas": len(encontradas),
+        "sem_correspondencia": int(df["id_unico"].isna().sum()),
+        "duplicadas": int(df["duplicada"].sum()),
+        "ja_marcadas": len(unicos) - inseridas,
+        "inseridas": inseridas,
+        "chaves_ambiguas_firebird": df_fb.attrs.get("ambiguas", 0),
+    }
+
+    print("\nResumo por arquivo (linhas / encontradas / sem correspondência):")
+    por_arquivo = df.groupby("arquivo", sort=False)["id_unico"].agg(["size", "count"])
+    for arquivo, (linhas, achadas) in por_arquivo.iterrows():
+        print(f"  {os.path.basename(arquivo)}: {linhas} / {achadas} / {linhas - achadas}")
+
+    sem_correspondencia = df[df["id_unico"].isna()]
+    if not sem_correspondencia.empty:
+        print("Exemplos sem correspondência no Firebird (arquivo:linha doc/parcela/valor):")
+        for row in sem_correspondencia.head(10).itertuples():
+            print(f"  {os.path.basename(row.arquivo)}:{row.linha} {row.doc}/{row.parcela}/{row.valor}")
+
+    print(f"\nConcluído. {resumo['linhas']} linhas: {resumo['encontradas']} encontradas, "
+          f"{resumo['sem_correspondencia']} sem correspondência, {resumo['duplicadas']} duplicadas. "
+          f"{resumo['inseridas']} registros marcados como já exportados ({resumo['ja_marcadas']} já estavam).")
+    return resumo
+
 
 if __name__ == "__main__":
-    processar_arquivos_xfin()
\ No newline at end of file
+    processar_arquivos_xfin()
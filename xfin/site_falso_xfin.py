@@ -0,0 +1,357 @@
+"""
+Site falso do Xfin para testar o xfin_uploader.py sem o sistema de verdade.
+
+Serve o mesmo caminho que o robô percorre, com as páginas salvas no repositório:
+- /Identity/Account/Login            -> "Login - XFin.html" (POST confere usuário e senha)
+- /Identity/Account/EscolheModulo    -> "html_xfin/Login - Escolha de Módulo.html"
+- /Identity/Account/EscolheFilial    -> select Input_IdFilial com as filiais configuradas
+- /Titulo/Importacao?tipo=1          -> o bloco de importação de "html_xfin/Importação de Contas a Pagar..."
+  (mesmos ids: file, selColuna, chk..., btnImportar, bannerErros) com um script sem jQuery no lugar do
+  original: lê o CSV (';'), monta os selects selColuna_<n> e posta as linhas em /Titulo/Importacao/Importar,
+  que responde com o toast de sucesso ou o banner de erros.
+/__estado devolve em JSON o que aconteceu (logins, trocas de filial, importações por filial), para
+conferir por exemplo que um lote de quatro arquivos fez um login só.
+
+    python xfin/site_falso_xfin.py --porta 8765 [--falhar 1]
+"""
+import os
+import json
+import uuid
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, quote
+
+DIR_XFIN = os.path.dirname(os.path.abspath(__file__))
+PAGINA_LOGIN = os.path.join(DIR_XFIN, "Login - XFin.html")
+PAGINA_MODULO = os.path.join(DIR_XFIN, "html_xfin", "Login - Escolha de Módulo.html")
+PAGINA_IMPORTACAO = os.path.join(DIR_XFIN, "html_xfin", "Importação de Contas a Pagar - Controle Financeiro.html")
+
+# ids que o xfin_uploader usa na tela de importação (conferidos contra a página salva)
+IDS_IMPORTACAO = ["file", "selColuna", "chkVerificarTituloExistente", "chkCadastrarTipoDocumento",
+                  "btnImportar", "bannerErros", "divTabela", "divTabelaValores"]
+
+FILIAIS_PADRAO = [
+    ("101", "COMAGRO PEÇAS E SERVIÇOS LTDA - 14.255.350/0001-03"),
+    ("102", "COMAGRO PEÇAS E SERVIÇOS LTDA - 14.255.350/0004-56"),
+    ("103", "COMAGRO DIVISA LTDA - 59.185.879/0001-36"),
+    ("104", "COMAGRO SERVIÇOS LTDA - 62.188.494/0001-37"),
+]
+
+SCRIPT_IMPORTACAO = """
+<div id="toast-container"></div>
+<script type="text/javascript">
+    var linhasArquivo = [];
+
+    function Toast(tipo, mensagem) {
+        var div = document.createElement('div');
+        div.className = 'toast toast-' + tipo;
+        div.textContent = mensagem;
+        document.getElementById('toast-container').appendChild(div);
+    }
+
+    function DesabilitarOpcoesUsadas(elemento) { }
+
+    function MontarTabela(texto) {
+        var linhas = texto.split('\\n').filter(function (l) { return l.trim() !== ''; });
+        if (linhas.length > 1000) {
+            Toast('error', 'Máximo de 1000 títulos permitidos para importação!');
+            return;
+        }
+        linhasArquivo = linhas.map(function (l) { return l.replace(/\\r$/, '').split(';'); });
+        var table = document.createElement('table');
+        var tr = document.createElement('tr');
+        for (var j = 0; j < linhasArquivo[0].length; j++) {
+            var select = document.getElementById('selColuna').cloneNode(true);
+            select.id = 'selColuna_' + j;
+            var th = document.createElement('th');
+            th.appendChild(select);
+            tr.appendChild(th);
+        }
+        table.appendChild(tr);
+        linhasArquivo.forEach(function (campos) {
+            var trDados = document.createElement('tr');
+            campos.forEach(function (campo) {
+                var td = document.createElement('td');
+                td.textContent = campo;
+                trDados.appendChild(td);
+            });
+            table.appendChild(trDados);
+        });
+        var divTabela = document.getElementById('divTabela');
+        divTabela.innerHTML = '';
+        divTabela.appendChild(table);
+        document.getElementById('file').value = '';
+        document.getElementById('divTabelaValores').style.display = '';
+    }
+
+    document.getElementById('file').addEventListener('change', function (evt) {
+        var arquivo = evt.target.files[0];
+        if (!arquivo) return;
+        var reader = new FileReader();
+        reader.onload = function (e) { MontarTabela(e.target.result); };
+        reader.readAsText(arquivo, 'ISO-8859-1');
+    });
+
+    function ExtrairTabela() {
+        var mapeamento = [];
+        for (var j = 0; j < linhasArquivo[0].length; j++) {
+            mapeamento.push(document.getElementById('selColuna_' + j).value);
+        }
+        var obrigatorias = ['0', '1', '2', '3', '4', '5'];
+        for (var i = 0; i < obrigatorias.length; i++) {
+            if (mapeamento.indexOf(obrigatorias[i]) < 0) {
+                Toast('error', 'Coluna obrigatória não mapeada: ' + obrigatorias[i]);
+                return;
+            }
+        }
+        var botao = document.getElementById('btnImportar');
+        botao.disabled = true;
+        fetch('/Titulo/Importacao/Importar', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                linhas: linhasArquivo,
+                mapeamento: mapeamento,
+                VerificarTituloExistente: document.getElementById('chkVerificarTituloExistente').checked,
+                CadastrarTipoDocumento: document.getElementById('chkCadastrarTipoDocumento').checked
+            })
+        }).then(function (r) { return r.json(); }).then(function (dados) {
+            botao.disabled = false;
+            if (dados.erros && dados.erros.length) {
+                document.getElementById('spnErros').textContent = dados.erros.join(' ');
+                document.getElementById('bannerErros').style.display = '';
+            } else {
+                Toast('success', dados.qtdSucesso + ' de ' + dados.total + ' contas importadas!');
+            }
+        });
+    }
+</script>
+"""
+
+
+def _ler(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return f.read()
+
+
+def bloco_importacao():
+    """Trecho da página de importação salva com o formulário (do divArquivo até o select modelo)."""
+    html = _ler(PAGINA_IMPORTACAO)
+    inicio = html.index('<div class="ibox mt-3 mb-6')
+    fim = html.index('<div class="modal inmodal" id="modalDetalhes"')
+    bloco = html[inicio:fim]
+    faltando = [i for i in IDS_IMPORTACAO if f'id="{i}"' not in bloco]
+    if faltando:
+        raise RuntimeError(f"Página de importação salva sem os ids {faltando}: o site falso ficou desatualizado.")
+    return bloco
+
+
+class SiteFalsoXfin:
+    """
+    Servidor local (thread) com o fluxo de login, escolha de filial e importação.
+    'falhar' = quantas importações seguidas respondem com o banner de erros.
+    """
+
+    def __init__(self, porta=0, email="robo@teste", senha="senha", filiais=None, falhar=0):
+        self.email = email
+        self.senha = senha
+        self.filiais = filiais or FILIAIS_PADRAO
+        self.falhar = falhar
+        self.sessoes = {}
+        self.estado = {"logins": 0, "logins_recusados": 0, "trocas_filial": 0, "importacoes": []}
+        self._lock = threading.Lock()
+        self._pagina_importacao = f"<html><head><meta charset='utf-8'><title>Importação de Contas a Pagar" \
+                                  f" - Controle Financeiro</title></head><body>{bloco_importacao()}" \
+                                  f"{SCRIPT_IMPORTACAO}</body></html>"
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", porta), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def derrubar_sessoes(self):
+        """Simula sessão expirada: o próximo acesso volta para o login."""
+        with self._lock:
+            self.sessoes.clear()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    def _pagina_filiais(self, sessao):
+        opcoes = "".join(f'<option value="{i}"{" selected" if i == sessao.get("filial") else ""}>{nome}</option>'
+                         for i, nome in self.filiais)
+        return ("<html><head><meta charset='utf-8'><title>Escolha de Filial</title></head><body>"
+                "<form method='post' action='/Identity/Account/EscolheFilial'>"
+                f"<select id='Input_IdFilial' name='Input.IdFilial'><option value=''></option>{opcoes}</select>"
+                "<button type='submit'>Escolher</button></form></body></html>")
+
+    def _pagina_inicio(self, sessao):
+        nome = dict(self.filiais).get(sessao.get("filial"), "")
+        return ("<html><head><meta charset='utf-8'><title>Index - Controle Financeiro</title></head><body>"
+                f"<a href='/Identity/Account/EscolheFilial'>Filial: {nome}</a></body></html>")
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def _sessao(self):
+                cookie = self.headers.get("Cookie", "")
+                for parte in cookie.split(";"):
+                    chave, _, valor = parte.strip().partition("=")
+                    if chave == "sessao_falsa":
+                        with site._lock:
+                            return valor, site.sessoes.get(valor)
+                return None, None
+
+            def _responder(self, corpo, tipo="text/html; charset=utf-8", status=200, cookie=None):
+                dados = corpo.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(dados)))
+                if cookie:
+                    self.send_header("Set-Cookie", f"sessao_falsa={cookie}; Path=/")
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def _redirecionar(self, destino, cookie=None):
+                self.send_response(302)
+                self.send_header("Location", destino)
+                self.send_header("Content-Length", "0")
+                if cookie:
+                    self.send_header("Set-Cookie", f"sessao_falsa={cookie}; Path=/")
+                self.end_headers()
+
+            def _corpo(self):
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(tamanho).decode("utf-8") if tamanho else ""
+
+            def _exigir_login(self, partes):
+                token, sessao = self._sessao()
+                if sessao is None:
+                    self._redirecionar("/Identity/Account/Login?ReturnUrl=" + quote(partes.path, safe=""))
+                    return None, None
+                if not sessao.get("modulo"):
+                    self._redirecionar("/Identity/Account/EscolheModulo")
+                    return None, None
+                return token, sessao
+
+            def do_GET(self):
+                partes = urlsplit(self.path)
+                caminho = partes.path
+                if caminho == "/__estado":
+                    with site._lock:
+                        return self._responder(json.dumps(site.estado, ensure_ascii=False), "application/json")
+                if caminho == "/Identity/Account/Login":
+                    return self._responder(_ler(PAGINA_LOGIN))
+                if caminho == "/Identity/Account/EscolheModulo":
+                    return self._responder(_ler(PAGINA_MODULO))
+
+                token, sessao = self._exigir_login(partes)
+                if sessao is None:
+                    return
+                if caminho == "/Identity/Account/EscolheFilial":
+                    return self._responder(site._pagina_filiais(sessao))
+                if caminho == "/":
+                    return self._responder(site._pagina_inicio(sessao))
+                if caminho == "/Titulo/Importacao":
+                    if not sessao.get("filial"):
+                        return self._redirecionar("/Identity/Account/EscolheFilial")
+                    return self._responder(site._pagina_importacao)
+                # Recursos das páginas salvas (css, js, imagens) não existem aqui
+                self._responder("", "text/plain", status=404)
+
+            def do_POST(self):
+                partes = urlsplit(self.path)
+                caminho = partes.path
+                corpo = self._corpo()
+
+                if caminho == "/Identity/Account/Login":
+                    form = parse_qs(corpo)
+                    if (form.get("Input.Email", [""])[0] == site.email
+                            and form.get("Input.Password", [""])[0] == site.senha):
+                        token = uuid.uuid4().hex
+                        with site._lock:
+                            site.sessoes[token] = {}
+                            site.estado["logins"] += 1
+                        return self._redirecionar("/Identity/Account/EscolheModulo", cookie=token)
+                    with site._lock:
+                        site.estado["logins_recusados"] += 1
+                    return self._responder(_ler(PAGINA_LOGIN))
+
+                token, sessao = self._sessao()
+                if sessao is None:
+                    return self._redirecionar("/Identity/Account/Login")
+
+                if caminho == "/Identity/Account/EscolheModulo":
+                    modulo = parse_qs(partes.query).get("handler", [""])[0]
+                    with site._lock:
+                        sessao["modulo"] = modulo
+                    return self._redirecionar("/Identity/Account/EscolheFilial" if modulo == "ControleFinanceiro"
+                                              else "/")
+
+                if caminho == "/Identity/Account/EscolheFilial":
+                    filial = parse_qs(corpo).get("Input.IdFilial", [""])[0]
+                    with site._lock:
+                        sessao["filial"] = filial
+                        site.estado["trocas_filial"] += 1
+                    return self._redirecionar("/")
+
+                if caminho == "/Titulo/Importacao/Importar":
+                    dados = json.loads(corpo or "{}")
+                    with site._lock:
+                        falhar = site.falhar > 0
+                        if falhar:
+                            site.falhar -= 1
+                        site.estado["importacoes"].append({
+                            "filial": sessao.get("filial"),
+                            "linhas": len(dados.get("linhas", [])),
+                            "mapeamento": dados.get("mapeamento"),
+                            "verificar_existente": dados.get("VerificarTituloExistente"),
+                            "cadastrar_tipo_documento": dados.get("CadastrarTipoDocumento"),
+                            "sucesso": not falhar,
+                        })
+                    total = len(dados.get("linhas", []))
+                    resposta = {"qtdSucesso": 0 if falhar else total, "total": total,
+                                "erros": ["Falha simulada pelo site falso."] if falhar else []}
+                    return self._responder(json.dumps(resposta, ensure_ascii=False), "application/json")
+
+                self._responder("", "text/plain", status=404)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Site falso do Xfin para testar o xfin_uploader.py")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--email", default="robo@teste", help="Usuário aceito (XFIN_USER do teste)")
+    parser.add_argument("--senha", default="senha", help="Senha aceita (XFIN_PASS do teste)")
+    parser.add_argument("--falhar", type=int, default=0, help="Quantas importações seguidas devem falhar")
+    args = parser.parse_args()
+
+    site = SiteFalsoXfin(args.porta, args.email, args.senha, falhar=args.falhar)
+    print(f"Site falso do Xfin em {site.url} (usuário {args.email}). Ctrl+C para parar.")
+    try:
+        site.servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.servidor.server_close()
@@ -0,0 +1,98 @@
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import pagto_sec_p_xfin
+from pagto_sec_p_xfin import ControleExportacao, buscar_apagar
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+
+ESQUEMA = """
+    CREATE TABLE APAGAR (CDAPAGAR INTEGER, CDCENTRODECUSTO INTEGER, CDFORNECEDOR INTEGER, NOMEFORNECEDOR TEXT,
+                         CDNOTACOMPRA INTEGER, DTVENCIMENTO DATE, VALOR REAL, SUBSUBNUMCONTA INTEGER,
+                         NUMCONTACRED INTEGER, DESCRICAO TEXT, VALORPAGO REAL, DTPGTO DATE, NUMPARCELA INTEGER,
+                         NUMDOCUMENTO TEXT);
+    CREATE TABLE FORNECEDOR (CDFORNECEDOR INTEGER);
+    CREATE TABLE SUBSUBCONTA (SUBSUBNUMCONTA INTEGER, NOME TEXT);
+    CREATE TABLE NOTACOMPRA (CDNOTACOMPRA INTEGER, DTEMISSAO DATE);
+"""
+
+
+def conexao_apagar(titulos):
+    """APAGAR em memória com (CDAPAGAR, CDCENTRODECUSTO, DTVENCIMENTO) de cada título."""
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.executescript(ESQUEMA)
+    conn.executemany("INSERT INTO APAGAR (CDAPAGAR, CDCENTRODECUSTO, DTVENCIMENTO) VALUES (?, ?, ?)", titulos)
+    return conn
+
+
+@pytest.fixture
+def controle(tmp_path):
+    controle = ControleExportacao(str(tmp_path / "controle.db"))
+    yield controle
+    controle.fechar()
+
+
+def lidos(conn, controle, **kwargs):
+    _, registros = buscar_apagar(conn, controle, **kwargs)
+    return sorted(reg[0] for reg in registros)
+
+
+def test_data_inicial_configuravel(controle):
+    conn = conexao_apagar([(1, 1, date(2025, 12, 31)), (2, 1, date(2026, 1, 1)), (3, 1, date(2026, 6, 1))])
+
+    assert lidos(conn, controle) == [2, 3]
+    assert lidos(conn, controle, desde=date(2026, 3, 1)) == [3]
+    assert lidos(conn, controle, desde=date(2025, 1, 1)) == [1, 2, 3]
+
+
+def test_incremental_le_janela_e_pendentes(controle, monkeypatch):
+    monkeypatch.setattr(pagto_sec_p_xfin, "JANELA_SEGURANCA_CDAPAGAR", 10)
+    vencimento = date(2026, 2, 1)
+    conn = conexao_apagar([(cd, 1, vencimento) for cd in (5, 50, 95, 120)])
+    controle.atualizar_marca_dagua(100, [5])
+
+    # 5 vem por estar pendente, 95 pela janela de segurança e 120 por ser novo; 50 (abaixo da janela) não
+    assert lidos(conn, controle) == [5, 95, 120]
+    assert lidos(conn, controle, completo=True) == [5, 50, 95, 120]
+
+
+def test_pendente_sem_filial_sai_da_lista_depois_do_limite(controle):
+    hoje = date(2026, 5, 1)
+    assert controle.atualizar_marca_dagua(100, [1, 2], hoje=hoje) == []
+    assert controle.atualizar_marca_dagua(100, [1, 2, 3], hoje=hoje + timedelta(days=30)) == []
+    assert sorted(controle.pendentes()) == [1, 2, 3]
+
+    # 1 e 2 estão pendentes desde o dia 1º, 3 só desde o 30º dia: só os dois primeiros vencem o prazo
+    descartados = controle.atualizar_marca_dagua(
+        100, [1, 2, 3], hoje=hoje + timedelta(days=pagto_sec_p_xfin.DIAS_LIMITE_PENDENTE + 1))
+    assert sorted(descartados) == [1, 2]
+    assert controle.pendentes() == [3]
+
+
+def test_pendente_resolvido_nao_volta_com_a_data_antiga(controle):
+    hoje = date(2026, 5, 1)
+    controle.atualizar_marca_dagua(100, [1], hoje=hoje)
+    controle.atualizar_marca_dagua(100, [], hoje=hoje + timedelta(days=1))
+
+    # Voltou a ficar sem filial: o prazo recomeça
+    limite = hoje + timedelta(days=pagto_sec_p_xfin.DIAS_LIMITE_PENDENTE + 1)
+    assert controle.atualizar_marca_dagua(100, [1], hoje=limite) == []
+
+
+def test_banco_antigo_sem_data_dos_pendentes(tmp_path):
+    banco = str(tmp_path / "controle.db")
+    with sqlite3.connect(banco) as conn:
+        conn.execute("CREATE TABLE pendentes_pagar (cdapagar INTEGER PRIMARY KEY)")
+        conn.execute("INSERT INTO pendentes_pagar VALUES (7)")
+
+    controle = ControleExportacao(banco)
+    try:
+        assert controle.pendentes() == [7]
+        # Sem data gravada o pendente começa a contar na primeira execução depois da migração
+        assert controle.atualizar_marca_dagua(10, [7], hoje=date(2026, 5, 1)) == []
+        assert controle.conn.execute("SELECT desde FROM pendentes_pagar").fetchone() == ("2026-05-01",)
+    finally:
+        controle.fechar()
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import receb_sec_p_xfin
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ARQUIVO_CSV = os.path.join("arquivos", "importacao_RECEITAS_xfin_LOJA.csv")
+
+# O Firebird devolve DATE como datetime.date; no SQLite a coluna declarada DATE é convertida igual
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+
+
+def conexao_fixture():
+    """Banco da fixture em memória. O recebimento em boleto é recente em relação a hoje (regra dos 60 dias)."""
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    with open(os.path.join(FIXTURES, "recebimentos.sql"), encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO RECEBIMENTO VALUES (8100, ?, 11, 500.00, 3)", (date.today() - timedelta(days=10),))
+    return conn
+
+
+@pytest.fixture
+def pasta_execucao(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("arquivos")
+    monkeypatch.setattr(receb_sec_p_xfin, "get_firebird_connection", conexao_fixture)
+    return tmp_path
+
+
+def test_csv_completo_igual_ao_arquivo_de_referencia(pasta_execucao):
+    assert receb_sec_p_xfin.main(completo=True) == "arquivos/importacao_RECEITAS_xfin_LOJA.csv"
+
+    with open(ARQUIVO_CSV, encoding="utf-8-sig") as f:
+        gerado = f.read()
+    with open(os.path.join(FIXTURES, "recebimentos_esperado.csv"), encoding="utf-8-sig") as f:
+        esperado = f.read()
+    assert gerado == esperado
+
+
+def test_segunda_execucao_sem_mudancas_nao_gera_csv(pasta_execucao):
+    assert receb_sec_p_xfin.main() is not None
+    # O CSV da primeira execução não fica na pasta como se fosse da segunda
+    assert receb_sec_p_xfin.main() is None
+    assert not os.path.exists(ARQUIVO_CSV)
+    assert not os.path.exists(receb_sec_p_xfin.ARQUIVO_ANALISE)
+
+
+def alterar_fixture(monkeypatch, *comandos):
+    """Próximas execuções leem a fixture com os comandos SQL aplicados."""
+    def conexao():
+        conn = conexao_fixture()
+        for comando in comandos:
+            conn.execute(comando)
+        return conn
+    monkeypatch.setattr(receb_sec_p_xfin, "get_firebird_connection", conexao)
+
+
+def ler_csv(caminho):
+    with open(caminho, encoding="utf-8-sig") as f:
+        return [linha.split(";") for linha in f.read().splitlines()[1:]]
+
+
+def test_estorno_em_pedido_quitado_recente(pasta_execucao, monkeypatch):
+    receb_sec_p_xfin.main()
+    # O recebimento do pedido 5019 (quitado) é estornado: volta a ser previsão de carteira
+    alterar_fixture(monkeypatch, "DELETE FROM ITENSRECEBIMENTO WHERE CDPEDIDOVENDA = 5019")
+
+    assert receb_sec_p_xfin.main() == ARQUIVO_CSV
+
+    assert [(l[5], l[10], l[11]) for l in ler_csv(ARQUIVO_CSV)] == [
+        ("Fatura", "5019", "Venda Carteira Pedido 5019")]
+    analise = ler_csv(receb_sec_p_xfin.ARQUIVO_ANALISE)
+    assert [(l[2], l[5], l[10], l[12]) for l in analise] == [("10/03/2026", "Depósito Bancário", "5019", "removido")]
+
+
+def test_pedido_quitado_antigo_nao_e_reprocessado(pasta_execucao, monkeypatch):
+    receb_sec_p_xfin.main()
+    antigo = (datetime.now() - timedelta(days=receb_sec_p_xfin.DIAS_RECONFERIR_QUITADOS + 1))
+    with sqlite3.connect(receb_sec_p_xfin.DB_CONTROLE) as conn:
+        conn.execute("UPDATE historico_receber SET atualizado_em = ? WHERE cdpedidovenda = 5019",
+                     (antigo.isoformat(sep=" ", timespec="seconds"),))
+    alterar_fixture(monkeypatch, "DELETE FROM ITENSRECEBIMENTO WHERE CDPEDIDOVENDA = 5019")
+
+    assert receb_sec_p_xfin.main() is None
+    assert not os.path.exists(receb_sec_p_xfin.ARQUIVO_ANALISE)
+
+
+def test_titulo_alterado_vai_para_analise_e_nao_para_importacao(pasta_execucao, monkeypatch):
+    receb_sec_p_xfin.main()
+    alterar_fixture(monkeypatch, "UPDATE DUPLICATADAFATURA SET VALOR = 350 WHERE NUMDUPLICATA = '123/3'")
+
+    assert receb_sec_p_xfin.main() is None
+
+    assert not os.path.exists(ARQUIVO_CSV)
+    analise = ler_csv(receb_sec_p_xfin.ARQUIVO_ANALISE)
+    assert [(l[3], l[10], l[11], l[12]) for l in analise] == [("350,00", "123", "Fatura NF 123, Parc 3/3", "alterado")]
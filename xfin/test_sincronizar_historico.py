@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import functools
+
+import pandas as pd
+import pytest
+
+import pagto_sec_p_xfin
+import sincronizar_historico
+from sincronizar_historico import detectar_formato, ler_csv_xfin
+
+CABECALHO = "Fornecedor;Número Documento;Parcela;Valor;Valor Pago\r\n"
+
+
+def linha(i, fornecedor="FORNECEDOR"):
+    return f"{fornecedor} {i:05d};NF{i}/1;1/3;1.200,50;\r\n"
+
+
+def test_latin1_com_acento_so_depois_de_64_kb(tmp_path):
+    arquivo = tmp_path / "pagar.csv"
+    corpo = "Fornecedor;Numero;Parcela;Valor\r\n" + "".join(linha(i) for i in range(3000))
+    assert len(corpo) > 64 * 1024
+    arquivo.write_bytes((corpo + linha(3000, "JOSÉ CONCEIÇÃO")).encode("latin1"))
+
+    assert detectar_formato(str(arquivo)) == ("latin1", ";")
+
+
+def test_utf8_com_caractere_cortado_no_limite_do_bloco(tmp_path):
+    arquivo = tmp_path / "pagar.csv"
+    texto = CABECALHO
+    i = 0
+    while len(texto.encode("utf-8")) < 64 * 1024 - 200:
+        texto += linha(i)
+        i += 1
+    # Fornecedor preenchido até o 'Ç' começar no último byte do primeiro bloco de 64 KB
+    texto += "X" * (64 * 1024 - 1 - len(texto.encode("utf-8"))) + "Ç;NFX/1;1/1;5,00;\r\n"
+    dados = texto.encode("utf-8")
+    assert dados[64 * 1024 - 1:64 * 1024 + 1] == "Ç".encode("utf-8")
+    arquivo.write_bytes(dados)
+
+    assert detectar_formato(str(arquivo)) == ("utf-8-sig", ";")
+    df = ler_csv_xfin(str(arquivo))
+    assert df is not None and len(df) == i + 1
+    assert df["doc"].iloc[-1] == "NFX" and df["valor"].iloc[0] == "1200.50"
+
+
+def test_latin1_com_cabecalho_acentuado(tmp_path):
+    arquivo = tmp_path / "pagar.csv"
+    arquivo.write_bytes((CABECALHO + linha(1, "AÇOS") + linha(2)).encode("latin1"))
+
+    df = ler_csv_xfin(str(arquivo))
+    assert detectar_formato(str(arquivo)) == ("latin1", ";")
+    assert df["doc"].tolist() == ["NF1", "NF2"] and df["parcela"].tolist() == ["1", "1"]
+
+
+@pytest.fixture
+def controle_temporario(tmp_path, monkeypatch):
+    """ControleExportacao do sincronizar_historico gravando num banco da pasta temporária."""
+    banco = str(tmp_path / "controle.db")
+    monkeypatch.setattr(sincronizar_historico, "ControleExportacao",
+                        functools.partial(pagto_sec_p_xfin.ControleExportacao, banco))
+    return banco
+
+
+def test_sincronizacao_marca_os_ids_de_todos_os_arquivos(tmp_path, monkeypatch, controle_temporario):
+    controle = pagto_sec_p_xfin.ControleExportacao(controle_temporario, "anterior")
+    controle.marcar_como_exportado(["DOC_NF1_FORN_7_PARC_1"], "velho.csv")
+    controle.fechar()
+    (tmp_path / "a.csv").write_bytes((CABECALHO + linha(1) + linha(2) + linha(9)).encode("latin1"))
+    (tmp_path / "b.csv").write_bytes((CABECALHO + linha(3) + linha(3)).encode("latin1"))
+    titulos = pd.DataFrame({"doc": ["NF1", "NF2", "NF3"], "parcela": "1", "valor": "1200.50",
+                            "id_unico": [f"DOC_NF{i}_FORN_7_PARC_1" for i in (1, 2, 3)]})
+    monkeypatch.setattr(sincronizar_historico, "carregar_titulos_firebird", lambda: titulos)
+
+    resumo = sincronizar_historico.processar_arquivos_xfin(str(tmp_path / "*.csv"))
+
+    assert (resumo["linhas"], resumo["encontradas"], resumo["sem_correspondencia"]) == (5, 4, 1)
+    assert (resumo["duplicadas"], resumo["ja_marcadas"], resumo["inseridas"]) == (1, 1, 2)
+    with sqlite3.connect(controle_temporario) as conn:
+        gravados = conn.execute("SELECT id_unico, id_execucao, arquivo FROM historico_pagar ORDER BY 1").fetchall()
+    assert [(i, e.split("_")[0], os.path.basename(a)) for i, e, a in gravados] == [
+        ("DOC_NF1_FORN_7_PARC_1", "anterior", "velho.csv"),
+        ("DOC_NF2_FORN_7_PARC_1", "sincronizacao", "a.csv"),
+        ("DOC_NF3_FORN_7_PARC_1", "sincronizacao", "b.csv"),
+    ]
+
+
+def test_lote_com_falha_no_meio_nao_grava_nada(tmp_path):
+    controle = pagto_sec_p_xfin.ControleExportacao(str(tmp_path / "controle.db"))
+    try:
+        with pytest.raises(sqlite3.Error):
+            controle.marcar_lote_como_exportado([("DOC_A", "a.csv"), (object(), "b.csv")])
+        assert controle.conn.execute("SELECT COUNT(*) FROM historico_pagar").fetchone()[0] == 0
+        assert controle.exportados == set() and controle.total_exportados == 0
+    finally:
+        controle.fechar()
@@ -0,0 +1,195 @@
+import os
+import json
+import shutil
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import xfin_api
+from xfin_api import CacheContasPagar, ClienteXfin, ErroApiXfin
+
+PAGINAS = {
+    1: [{"id": 1, "fornecedor": "COELBA", "valor": "150.25"},
+        {"id": 2, "fornecedor": "EMBASA", "valor": "80"}],
+    2: [{"id": 3, "fornecedor": "VIVO", "valor": "99.9"}],
+    # Coluna nova só na última página: as linhas anteriores ficam com None
+    3: [{"id": 4, "fornecedor": "SEFAZ", "valor": "1200.00", "observacao": "ICMS"}],
+}
+
+
+class ServidorXfin(ThreadingHTTPServer):
+    """contasPagar paginado; 'roteiro' diz o que responder nas primeiras chamadas de cada página."""
+
+    daemon_threads = True
+
+    def __init__(self, roteiro):
+        super().__init__(("127.0.0.1", 0), TratadorXfin)
+        self.roteiro = {pagina: list(respostas) for pagina, respostas in roteiro.items()}
+        self.chamadas = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class TratadorXfin(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        pagina = int(params["pagina"])
+        servidor = self.server
+        with servidor.lock:
+            servidor.chamadas.append((pagina, self.headers.get("Authorization"), params))
+            roteiro = servidor.roteiro.get(pagina)
+            especial = roteiro.pop(0) if roteiro else None
+
+        if url.path != "/api/v1/contasPagar":
+            self._responder(404, {"sucesso": False, "mensagem": "rota"})
+        elif especial is not None:
+            status, cabecalhos = especial
+            self._responder(status, {"sucesso": False, "mensagem": f"erro {status}"}, cabecalhos)
+        else:
+            self._responder(200, {"sucesso": True, "totalPaginas": len(PAGINAS), "itens": PAGINAS[pagina]})
+
+
+@pytest.fixture
+def servidor(request):
+    srv = ServidorXfin(getattr(request, "param", {}))
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def pausas(monkeypatch):
+    """Registra as esperas entre tentativas em vez de dormir."""
+    registradas = []
+    monkeypatch.setattr(xfin_api.time, "sleep", registradas.append)
+    return registradas
+
+
+def chamadas_por_pagina(servidor):
+    contagem = {}
+    for pagina, _, _ in servidor.chamadas:
+        contagem[pagina] = contagem.get(pagina, 0) + 1
+    return contagem
+
+
+@pytest.mark.parametrize("servidor", [{2: [(429, {"Retry-After": "7"})], 3: [(503, {}), (500, {})]}],
+                         indirect=True)
+def test_repete_429_e_5xx_e_monta_as_colunas_na_ordem_das_paginas(servidor, pausas):
+    cliente = ClienteXfin("segredo", base_url=servidor.url, tamanho_pagina=2, max_paralelo=3, espera=0.5)
+    try:
+        df = cliente.contas_pagar("2026-01-01", "2026-01-31", filtros_extra={"status": "aberto"})
+    finally:
+        cliente.fechar()
+
+    assert list(df.columns) == ["id", "fornecedor", "valor", "observacao"]
+    assert df["id"].tolist() == [1, 2, 3, 4]
+    assert df["valor"].tolist() == [150.25, 80.0, 99.9, 1200.0]
+    assert df["observacao"].isna().tolist() == [True, True, True, False]
+    assert df["observacao"].iloc[3] == "ICMS"
+
+    assert chamadas_por_pagina(servidor) == {1: 1, 2: 2, 3: 3}
+    # Retry-After do 429 vale; nos 5xx a espera dobra a cada tentativa
+    assert sorted(pausas) == [0.5, 1.0, 7.0]
+    for _, autorizacao, params in servidor.chamadas:
+        assert autorizacao == "Bearer segredo"
+        assert params["dataVencimentoInicial"] == "2026-01-01" and params["status"] == "aberto"
+        assert params["tamanhoPagina"] == "2"
+
+
+@pytest.mark.parametrize("servidor", [{1: [(503, {})] * 10}], indirect=True)
+def test_desiste_depois_das_tentativas(servidor, pausas):
+    cliente = ClienteXfin("segredo", base_url=servidor.url, tentativas=3, espera=1)
+    with pytest.raises(ErroApiXfin):
+        cliente.contas_pagar("2026-01-01", "2026-01-31")
+    cliente.fechar()
+    assert chamadas_por_pagina(servidor) == {1: 3}
+    assert pausas == [1, 2]
+
+
+@pytest.mark.parametrize("servidor", [{2: [(403, {})]}], indirect=True)
+def test_erro_4xx_nao_e_repetido(servidor, pausas):
+    cliente = ClienteXfin("segredo", base_url=servidor.url)
+    with pytest.raises(ErroApiXfin):
+        cliente.contas_pagar("2026-01-01", "2026-01-31")
+    cliente.fechar()
+    assert chamadas_por_pagina(servidor)[2] == 1
+    assert pausas == []
+
+
+def envelhecer(cache, dt_ini, dt_fim, horas):
+    """Recua as datas gravadas na entrada do cache, como se a busca tivesse sido 'horas' atrás."""
+    entrada = cache._ler(dt_ini, dt_fim)
+    cache._gravar(dt_ini, dt_fim, entrada["buscado_em"] - horas * 3600, entrada["df"],
+                  entrada["completa_em"] - horas * 3600)
+
+
+def test_cache_sobrevive_a_limpeza_da_pasta_temporaria(servidor, tmp_path):
+    # Como no robô: a TEMP_DIR é apagada no fim de cada execução, o cache fica em outra pasta
+    pasta_temporaria = tmp_path / "temp_xfin"
+    pasta_temporaria.mkdir()
+    cliente = ClienteXfin("segredo", base_url=servidor.url, tamanho_pagina=2)
+    try:
+        primeira = CacheContasPagar(str(tmp_path / "cache_xfin")).obter(cliente, "2026-01-01", "2026-01-31")
+        shutil.rmtree(pasta_temporaria)
+
+        # Próxima execução: objeto novo, mesmo diretório
+        cache = CacheContasPagar(str(tmp_path / "cache_xfin"))
+        segunda = cache.obter(cliente, "2026-01-01", "2026-01-31")
+    finally:
+        cliente.fechar()
+
+    assert chamadas_por_pagina(servidor) == {1: 1, 2: 1, 3: 1}
+    assert segunda.equals(primeira)
+    assert cache.acertos == 1 and cache.resumo().endswith("de 0 min atrás")
+
+
+def test_cache_do_robo_fica_fora_da_temp_dir():
+    pytest.importorskip("tkcalendar")
+    import xfin_payment_bot
+
+    temp_dir = os.path.abspath(xfin_payment_bot.TEMP_DIR)
+    assert os.path.commonpath([temp_dir, os.path.abspath(xfin_payment_bot.XFIN_CACHE_DIR)]) != temp_dir
+
+
+def test_busca_parcial_vira_completa_uma_vez_por_dia(servidor, tmp_path):
+    cache = CacheContasPagar(str(tmp_path), ttl_minutos=30, param_alteracao="dataAlteracaoInicial",
+                             recarga_completa_horas=24)
+    cliente = ClienteXfin("segredo", base_url=servidor.url, tamanho_pagina=2)
+    modos = []
+    try:
+        for horas in (None, 1, 2, 24):
+            if horas is not None:
+                envelhecer(cache, "2026-01-01", "2026-01-31", horas)
+            servidor.chamadas.clear()
+            cache.obter(cliente, "2026-01-01", "2026-01-31")
+            modos.append(cache.ultima["modo"].split()[0])
+            assert all(("dataAlteracaoInicial" in params) == (modos[-1] == "alterados")
+                       for _, _, params in servidor.chamadas)
+    finally:
+        cliente.fechar()
+
+    # Vencido o TTL busca só os alterados; passadas 24 h desde a última completa, busca tudo de novo
+    assert modos == ["completa", "alterados", "alterados", "completa"]
@@ -0,0 +1,109 @@
+from datetime import date
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import xfin_payment_bot
+from planilha_pagamentos import COR_ASSOCIADO_AUTO, create_excel, create_excel_legado
+from xfin_payment_bot import match_missing_suppliers
+
+# Planilha de dados bancários já com as colunas renomeadas como no process_data
+CONFIG = pd.DataFrame({
+    "Fornecedor": ["MARIA DA SILVA", "PEDRO ALVES", "COMERCIAL SANTOS ANDRADE", "COMERCIAL SANTOS ANDRADA"],
+    "Config_CNPJ": ["111.111.111-11", "22222222222", "33333333000133", "44444444000144"],
+    "Config_Chave PIX": ["maria@pix", "pedro@pix", "andrade@pix", "andrada@pix"],
+    "Config_Banco": [None, None, None, None],
+    "Config_Nome Titular": ["MARIA DA SILVA", "PEDRO ALVES", "SANTOS ANDRADE", "SANTOS ANDRADA"],
+})
+CONFIG["Fornecedor_Norm"] = CONFIG["Fornecedor"]
+
+
+class IndiceFalso:
+    def aproximados(self, nome, limite=3):
+        return [("SUGESTAO SECULOS", "99999999000199")]
+
+
+def titulos(*linhas):
+    """df_merged de títulos sem dados bancários: (Fornecedor_Norm, CNPJ_FB) por linha."""
+    df = pd.DataFrame(linhas, columns=["Fornecedor_Norm", "CNPJ_FB"])
+    for col in ["Config_CNPJ", "Config_Chave PIX", "Config_Banco", "Config_Nome Titular"]:
+        df[col] = None
+    return df
+
+
+def associar(df_merged):
+    faltantes = df_merged["Fornecedor_Norm"].unique()
+    return match_missing_suppliers(df_merged, CONFIG.copy(), faltantes, IndiceFalso())
+
+
+def test_nome_parecido_com_mesmo_cnpj_e_associado_e_marcado():
+    df = titulos(("MARIA SILVA", "11111111111"), ("MARIA SILVA", "111.111.111-11"))
+
+    sugestoes = associar(df)
+
+    assert sugestoes.empty
+    assert df["Config_Chave PIX"].tolist() == ["maria@pix", "maria@pix"]
+    assert df["Associado_Auto"].tolist() == ["MARIA DA SILVA (100%)"] * 2
+
+
+@pytest.mark.parametrize("cnpj_fb", [None, "55555555555"], ids=["sem_cnpj", "cnpj_diferente"])
+def test_nome_parecido_sem_cnpj_que_confirme_vai_para_o_alerta(cnpj_fb):
+    df = titulos(("MARIA SILVA", cnpj_fb))
+
+    sugestoes = associar(df)
+
+    assert df["Config_Chave PIX"].isna().all() and "Associado_Auto" not in df.columns
+    assert sugestoes["Fornecedor"].tolist() == ["MARIA SILVA"]
+    assert sugestoes["Sugestões Planilha"].iloc[0] == "MARIA DA SILVA (100%)"
+    assert sugestoes["CNPJ Seculos"].iloc[0] == "99999999000199"
+
+
+def test_abaixo_do_limiar_nao_associa():
+    # 'PEDRO ALVE' fica com 91% para 'PEDRO ALVES' (limiar de 92%), mesmo com o CNPJ batendo
+    df = titulos(("PEDRO ALVE", "22222222222"))
+
+    sugestoes = associar(df)
+
+    assert xfin_payment_bot.LIMIAR_ASSOCIACAO_AUTOMATICA > 0.91
+    assert df["Config_Chave PIX"].isna().all()
+    assert sugestoes["Sugestões Planilha"].iloc[0].startswith("PEDRO ALVES (91%)")
+
+
+def test_dois_candidatos_sem_margem_nao_associa():
+    # Os dois 'COMERCIAL SANTOS ANDRAD?' ficam com 96%: acima do limiar, mas sem a margem para o segundo
+    df = titulos(("COMERCIAL SANTOS ANDRAD", "33333333000133"))
+
+    sugestoes = associar(df)
+
+    assert df["Config_Chave PIX"].isna().all()
+    assert sugestoes["Sugestões Planilha"].iloc[0].count("(96%)") == 2
+
+
+@pytest.mark.parametrize("gerar", [create_excel, create_excel_legado], ids=["write_only", "legado"])
+def test_planilha_destaca_fornecedor_associado(tmp_path, gerar):
+    df = pd.DataFrame({
+        "pessoa": ["MARIA SILVA", "PEDRO ALVES"],
+        "dataVencimento": [date(2026, 5, 4)] * 2,
+        "valor": [100.0, 50.0],
+        "numeroDocumento": ["1", "2"],
+        "descricao": ["", ""],
+        "tipoDocumento": ["PIX"] * 2,
+        "banco": [""] * 2,
+        "Config_Chave PIX": ["maria@pix", "pedro@pix"],
+        "Config_Nome Titular": ["MARIA DA SILVA", "PEDRO ALVES"],
+        "Associado_Auto": ["MARIA DA SILVA (100%)", None],
+        "Filial_Order": [1] * 2,
+        "Filial_Sheet": ["LOJA"] * 2,
+    })
+    cols_map = ("pessoa", "dataVencimento", "valor", "numeroDocumento", "descricao", "tipoDocumento", "banco")
+
+    caminho = str(tmp_path / "pagamentos.xlsx")
+    gerar(df, caminho, cols_map)
+
+    ws = openpyxl.load_workbook(caminho)["LOJA"]
+    celulas = {ws.cell(row=r, column=3).value: ws.cell(row=r, column=3) for r in (3, 4)}
+    assert celulas["MARIA SILVA"].fill.start_color.rgb.endswith(COR_ASSOCIADO_AUTO)
+    assert "MARIA DA SILVA (100%)" in celulas["MARIA SILVA"].comment.text
+    assert celulas["PEDRO ALVES"].comment is None
+    assert not celulas["PEDRO ALVES"].fill.start_color.rgb.endswith(COR_ASSOCIADO_AUTO)
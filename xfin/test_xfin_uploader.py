@@ -0,0 +1,93 @@
+import json
+import urllib.request
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from selenium import webdriver  # noqa: E402
+from selenium.common.exceptions import WebDriverException  # noqa: E402
+
+from site_falso_xfin import SiteFalsoXfin  # noqa: E402
+from xfin_uploader import SessaoXfin  # noqa: E402
+
+LINHA_CSV = "FORNECEDOR TESTE;01/03/2026;10/03/2026;150,25;2.1.01;BOLETO;;;;1/1;4512;Compra de peças\r\n"
+
+
+@pytest.fixture
+def site():
+    with SiteFalsoXfin(email="robo@teste", senha="senha") as site:
+        yield site
+
+
+@pytest.fixture
+def navegador():
+    """Chrome headless local; sem navegador/driver na máquina o teste é pulado."""
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    try:
+        driver = webdriver.Chrome(options=options)
+    except WebDriverException as e:
+        pytest.skip(f"Chrome indisponível: {e.msg}")
+    yield driver
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+def estado(site):
+    with urllib.request.urlopen(f"{site.url}/__estado") as resposta:
+        return json.loads(resposta.read().decode("utf-8"))
+
+
+def criar_csv(pasta, nome, linhas):
+    caminho = pasta / nome
+    caminho.write_bytes((LINHA_CSV * linhas).encode("iso-8859-1"))
+    return str(caminho)
+
+
+def test_estado_inicial_do_site_falso(site):
+    assert estado(site) == {"logins": 0, "logins_recusados": 0, "trocas_filial": 0, "importacoes": []}
+
+
+def test_lote_faz_um_login_e_troca_de_filial_so_entre_grupos(site, navegador, tmp_path):
+    # Fora de ordem de propósito: os dois arquivos da filial 1 vão juntos
+    arquivos = [
+        criar_csv(tmp_path, "a_filial_1_PRONTO.csv", 2),
+        criar_csv(tmp_path, "b_filial_2_PRONTO.csv", 1),
+        criar_csv(tmp_path, "c_filial_1_PRONTO.csv", 3),
+        criar_csv(tmp_path, "d_filial_3_PRONTO.csv", 1),
+    ]
+
+    with SessaoXfin(base_url=site.url, email="robo@teste", senha="senha",
+                    driver_factory=lambda headless: navegador) as sessao:
+        resultado = sessao.enviar_lote(arquivos)
+
+    assert resultado == {caminho: True for caminho in arquivos}
+    final = estado(site)
+    assert final["logins"] == 1 and final["logins_recusados"] == 0
+    assert final["trocas_filial"] == 3
+    assert [(i["filial"], i["linhas"]) for i in final["importacoes"]] == [
+        ("101", 2), ("101", 3), ("102", 1), ("103", 1)]
+    for importacao in final["importacoes"]:
+        assert importacao["mapeamento"] == [str(i) for i in range(12)]
+        assert importacao["verificar_existente"] is False
+        assert importacao["cadastrar_tipo_documento"] is False
+
+
+def test_banner_de_erros_marca_so_o_arquivo_que_falhou(site, navegador, tmp_path):
+    site.falhar = 1
+    arquivos = [criar_csv(tmp_path, "a_filial_4_PRONTO.csv", 1), criar_csv(tmp_path, "b_filial_4_PRONTO.csv", 1)]
+
+    with SessaoXfin(base_url=site.url, email="robo@teste", senha="senha",
+                    driver_factory=lambda headless: navegador) as sessao:
+        resultado = sessao.enviar_lote(arquivos)
+
+    assert resultado == {arquivos[0]: False, arquivos[1]: True}
+    final = estado(site)
+    assert final["logins"] == 1 and final["trocas_filial"] == 1
+    assert [i["sucesso"] for i in final["importacoes"]] == [False, True]
@@ -0,0 +1,245 @@
+"""
+Cliente da API do Xfin (/api/v1/contasPagar) usado pelo robô de pagamentos.
+
+- Uma requests.Session só, com pool de conexões (keep-alive) do tamanho do paralelismo, reaproveitada
+  entre buscas.
+- Busca a página 1, descobre totalPaginas e pede as demais em paralelo (no máximo 'max_paralelo' ao mesmo tempo).
+- 429 e 5xx (e erro de rede / timeout) são repetidos com espera exponencial; o Retry-After do servidor
+  é respeitado quando vier. Erro 4xx e resposta com "sucesso": false não são repetidos.
+- Os itens de cada página vão direto para listas por coluna, na ordem das páginas, e viram o DataFrame
+  no fim (em vez de uma lista de dicts com todos os itens). 'valor' já sai como float.
+- CacheContasPagar guarda o resultado de cada janela de vencimento em disco por 'ttl_minutos', para os
+  cliques repetidos na tela não buscarem tudo de novo.
+
+Não depende da tela: XFIN_URL pode apontar para um servidor local de testes.
+"""
+import os
+import time
+import pickle
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+import requests
+
+from requests.adapters import HTTPAdapter
+
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+COLUNAS_NUMERICAS = ("valor",)
+
+
+class ErroApiXfin(Exception):
+    """Falha definitiva na API (sem mais tentativas ou resposta com "sucesso": false)."""
+
+
+class ClienteXfin:
+
+    def __init__(self, token, base_url="https://app.xfin.com.br", tamanho_pagina=500, max_paralelo=4,
+                 tentativas=5, espera=1.0, timeout=(5, 60)):
+        self.base_url = base_url.rstrip("/")
+        self.tamanho_pagina = tamanho_pagina
+        self.max_paralelo = max_paralelo
+        self.tentativas = tentativas
+        self.espera = espera
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "accept": "*/*",
+            "Authorization": f"Bearer {token}"
+        })
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_paralelo)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+    def _pausa(self, tentativa, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.espera * 2 ** (tentativa - 1)
+
+    def _get(self, caminho, params):
+        """GET com novas tentativas em 429/5xx e erro de rede. Retorna o JSON já validado."""
+        url = f"{self.base_url}{caminho}"
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if tentativa == self.tentativas:
+                    raise ErroApiXfin(f"{e} (página {params.get('pagina')}, {tentativa} tentativas)")
+                pausa = self._pausa(tentativa)
+                print(f"Aviso: erro de rede na página {params.get('pagina')} ({e}). "
+                      f"Tentativa {tentativa}/{self.tentativas}, nova tentativa em {pausa}s.")
+                time.sleep(pausa)
+                continue
+
+            if response.status_code in STATUS_REPETIR and tentativa < self.tentativas:
+                pausa = self._pausa(tentativa, response)
+                print(f"Aviso: API respondeu {response.status_code} na página {params.get('pagina')}. "
+                      f"Tentativa {tentativa}/{self.tentativas}, nova tentativa em {pausa}s.")
+                time.sleep(pausa)
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.HTTPError as e:
+                raise ErroApiXfin(f"{e} (página {params.get('pagina')})")
+            data = response.json()
+            if not data.get("sucesso", False):
+                raise ErroApiXfin(f"Erro na API: {data.get('mensagem', 'Desconhecido')}")
+            return data
+
+    def contas_pagar(self, dt_ini_api, dt_fim_api, status_callback=None, stop_event=None, filtros_extra=None):
+        """
+        Todos os títulos a pagar com vencimento entre as datas (yyyy-MM-dd), como DataFrame.
+        'filtros_extra' vai junto em todas as páginas. Se stop_event for acionado no meio, devolve um DataFrame vazio.
+        """
+        status = status_callback or (lambda texto: None)
+
+        def params(pagina):
+            return {
+                "pagina": pagina,
+                "tamanhoPagina": self.tamanho_pagina,
+                "dataVencimentoInicial": dt_ini_api,
+                "dataVencimentoFinal": dt_fim_api,
+                **(filtros_extra or {})
+            }
+
+        colunas = {}
+        total_itens = 0
+
+        def acumular(itens):
+            # Coluna que aparece só em páginas posteriores é completada com None para trás
+            nonlocal total_itens
+            for item in itens:
+                for chave in item:
+                    if chave not in colunas:
+                        colunas[chave] = [None] * total_itens
+                for chave, valores in colunas.items():
+                    valores.append(item.get(chave))
+                total_itens += 1
+
+        status("Buscando dados na API... Página 1")
+        primeira = self._get("/api/v1/contasPagar", params(1))
+        acumular(primeira.get("itens", []))
+        total_paginas = primeira.get("totalPaginas", 1) or 1
+
+        if total_paginas > 1:
+            # Páginas que chegam fora de ordem esperam aqui até as anteriores chegarem
+            recebidas = {}
+            proxima = 2
+            with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+                pendentes = {executor.submit(self._get, "/api/v1/contasPagar", params(pagina)): pagina
+                             for pagina in range(2, total_paginas + 1)}
+                try:
+                    while pendentes:
+                        if stop_event is not None and stop_event.is_set():
+                            return pd.DataFrame()
+                        prontas, _ = wait(pendentes, timeout=0.5, return_when=FIRST_COMPLETED)
+                        for fut in prontas:
+                            recebidas[pendentes.pop(fut)] = fut.result().get("itens", [])
+                        while proxima in recebidas:
+                            acumular(recebidas.pop(proxima))
+                            proxima += 1
+                        if prontas:
+                            status(f"Buscando dados na API... {proxima - 1}/{total_paginas} páginas")
+                finally:
+                    for fut in pendentes:
+                        fut.cancel()
+
+        df = pd.DataFrame(colunas)
+        for coluna in COLUNAS_NUMERICAS:
+            if coluna in df.columns:
+                df[coluna] = pd.to_numeric(df[coluna], errors="coerce")
+        print(f"API Xfin: {total_itens} títulos em {total_paginas} página(s).")
+        return df
+
+    def fechar(self):
+        self.session.close()
+
+
+class CacheContasPagar:
+    """
+    Resultado da API por janela de vencimento (dt_ini, dt_fim), em disco (um pickle por janela).
+
+    Dentro de 'ttl_minutos' a janela sai do cache. Vencido o prazo, busca tudo de novo; se a API tiver um
+    filtro por data de alteração ('param_alteracao', ex.: o nome do parâmetro na documentação do Xfin),
+    busca só o que mudou desde a última busca e junta ao cache pela coluna 'chave_item'.
+    Título pago ou excluído no Xfin não vem nessa busca parcial, então a cada 'recarga_completa_horas'
+    a janela é buscada inteira de novo.
+    'ultima' descreve a última consulta (acerto ou não e idade do dado) para a tela mostrar.
+    """
+
+    def __init__(self, diretorio, ttl_minutos=30, param_alteracao=None, chave_item="id", recarga_completa_horas=24):
+        self.diretorio = diretorio
+        self.ttl_minutos = ttl_minutos
+        self.recarga_completa_horas = recarga_completa_horas
+        self.param_alteracao = param_alteracao
+        self.chave_item = chave_item
+        self.consultas = 0
+        self.acertos = 0
+        self.ultima = None
+
+    def _arquivo(self, dt_ini, dt_fim):
+        return os.path.join(self.diretorio, f"contasPagar_{dt_ini}_{dt_fim}.pickle")
+
+    def _ler(self, dt_ini, dt_fim):
+        try:
+            with open(self._arquivo(dt_ini, dt_fim), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def _gravar(self, dt_ini, dt_fim, buscado_em, df, completa_em=None):
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            arquivo = self._arquivo(dt_ini, dt_fim)
+            with open(arquivo + ".tmp", "wb") as f:
+                pickle.dump({"buscado_em": buscado_em, "completa_em": completa_em or buscado_em, "df": df}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(arquivo + ".tmp", arquivo)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cache da API Xfin: {e}")
+
+    def obter(self, cliente, dt_ini, dt_fim, status_callback=None, stop_event=None, forcar=False):
+        """DataFrame da janela (datas yyyy-MM-dd), do cache se ainda estiver na validade."""
+        self.consultas += 1
+        agora = time.time()
+        entrada = None if forcar else self._ler(dt_ini, dt_fim)
+
+        if entrada is not None and agora - entrada["buscado_em"] <= self.ttl_minutos * 60:
+            self.acertos += 1
+            self.ultima = {"acerto": True, "idade": agora - entrada["buscado_em"], "modo": "cache"}
+            return entrada["df"].copy()
+
+        # Cache de antes da recarga completa periódica não tem 'completa_em'
+        completa_em = entrada.get("completa_em", entrada["buscado_em"]) if entrada is not None else None
+        if (entrada is not None and self.param_alteracao and self.chave_item in entrada["df"].columns
+                and agora - completa_em < self.recarga_completa_horas * 3600):
+            desde = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(entrada["buscado_em"]))
+            novos = cliente.contas_pagar(dt_ini, dt_fim, status_callback, stop_event,
+                                         filtros_extra={self.param_alteracao: desde})
+            df = pd.concat([entrada["df"], novos], ignore_index=True)
+            df = df.drop_duplicates(subset=[self.chave_item], keep="last").reset_index(drop=True)
+            modo = f"alterados desde {desde} ({len(novos)})"
+        else:
+            df = cliente.contas_pagar(dt_ini, dt_fim, status_callback, stop_event)
+            modo = "completa"
+            completa_em = agora
+
+        if stop_event is not None and stop_event.is_set():
+            # Busca interrompida: não vale como cache
+            return pd.DataFrame()
+        self._gravar(dt_ini, dt_fim, agora, df, completa_em)
+        self.ultima = {"acerto": False, "idade": 0.0, "modo": modo}
+        return df.copy()
+
+    def resumo(self):
+        """Texto curto para a tela: acertos e idade do dado usado na última consulta."""
+        if self.ultima is None:
+            return "Cache API: sem consultas"
+        texto = f"Cache API: {self.acertos}/{self.consultas} acertos"
+        if self.ultima["acerto"]:
+            minutos = int(self.ultima["idade"] // 60)
+            return f"{texto} - último dado do cache, de {minutos} min atrás"
+        return f"{texto} - último dado da API ({self.ultima['modo']})"
@@ -5,7 +5,7 @@ from dotenv import load_dotenv
 import tkinter as tk
 import pandas as pd
 import threading
-import requests
+import sys
 import os
 
 
@@ -22,14 +22,30 @@ CONFIG_FILE = os.path.join(DRIVE_PATH, "CONTAS A PAGAR", "0 Extras", "[CONFIG] D
 XFIN_URL = "https://app.xfin.com.br"
 TK_XFIN = os.getenv('TK_XFIN')
 
-# Configurações do Banco de Dados (Firebird)
-FB_HOST = os.getenv('HOST')
-FB_PORT = int(os.getenv('PORT', '3050'))
-FB_DB = os.getenv('DB_PATH')
-FB_USER = os.getenv('APP_USER')
-FB_PASS = os.getenv('PASSWORD')
-FB_ROLE = os.getenv('ROLE')
-FB_AUTH = os.getenv('AUTH')
+# Cache das respostas da API por janela de vencimento (cliques repetidos na mesma janela não buscam de novo).
+# A pasta fica fora da TEMP_DIR, que é apagada no fim de cada execução
+XFIN_CACHE_TTL_MINUTOS = 30
+# Com o filtro de alteração, a janela ainda é buscada inteira uma vez por dia (some o que foi pago/excluído)
+XFIN_CACHE_RECARGA_COMPLETA_HORAS = 24
+# Nome do parâmetro de "data de alteração" da API, se ela tiver um; None = recarrega a janela inteira
+XFIN_PARAM_ALTERACAO = None
+
+# Banco de Dados (Firebird): as credenciais vêm do mesmo .env (HOST, PORT, DB_PATH, ...)
+# Raiz do repositório no path para usar o pacote compartilhado seculos_db
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seculos_db import BuscaAproximada, IndiceFornecedores, pool_compartilhado  # noqa: E402
+from seculos_db.correspondencia import somente_digitos  # noqa: E402
+from seculos_db.historico import DIR_CACHE  # noqa: E402
+from xfin_api import CacheContasPagar, ClienteXfin  # noqa: E402
+from planilha_pagamentos import create_excel  # noqa: E402
+
+XFIN_CACHE_DIR = os.path.join(DIR_CACHE, "cache_xfin")
+
+# Fornecedor sem correspondência exata na planilha é associado sozinho quando o nome mais parecido
+# passa do limiar, fica à frente do segundo pela margem e o CNPJ do Seculos bate com o da planilha;
+# senão vai para o alerta com as sugestões
+LIMIAR_ASSOCIACAO_AUTOMATICA = 0.92
+MARGEM_ASSOCIACAO_AUTOMATICA = 0.05
 
 # Mapeamento de Colunas do Xfin (Resposta da API)
 COL_XFIN_FORNECEDOR = "pessoa"
@@ -45,24 +61,19 @@ COL_XFIN_FILIAL = "filial"
 
 
 def get_firebird_connection():
-    import firebirdsql
+    """Empresta uma conexão do pool do processo (a tela reaproveita a mesma entre cliques).
+    Devolver com release_firebird_connection()."""
     try:
-        return firebirdsql.connect(
-            host=FB_HOST,
-            port=FB_PORT,
-            database=FB_DB,
-            user=FB_USER,
-            password=FB_PASS,
-            role=FB_ROLE,
-            auth_plugin_name=FB_AUTH,
-            wire_crypt=False,
-            charset='ISO8859_1'
-        )
+        return pool_compartilhado(max_tamanho=2).obter()
     except Exception as e:
         print(f"Erro ao conectar ao Firebird: {e}")
         return None
 
 
+def release_firebird_connection(conn):
+    pool_compartilhado(max_tamanho=2).devolver(conn)
+
+
 def check_drive_access():
     if not os.path.exists(DRIVE_PATH):
         raise Exception(f"Drive de rede inacessível: {DRIVE_PATH}")
@@ -201,65 +212,115 @@ def get_file_date(dt):
 # --- INTEGRAÇÃO API XFIN ---
 
 
-def fetch_xfin_data_api(status_callback, dt_ini, dt_fim, stop_event):
+_cliente_xfin = None
+_cache_xfin = None
 
-    if not TK_XFIN:
-        raise Exception("Token XFIN (TK_XFIN) não encontrado no arquivo .env. Configure-o para acessar a API.")
 
-    status_callback("Iniciando busca na API...")
+def get_xfin_client():
+    """Cliente da API compartilhado pelo processo: a sessão (e as conexões keep-alive) sobrevive entre cliques."""
+    global _cliente_xfin
+    if _cliente_xfin is None:
+        _cliente_xfin = ClienteXfin(TK_XFIN, base_url=XFIN_URL)
+    return _cliente_xfin
 
-    # A API exige o formato yyyy-MM-dd
-    dt_ini_api = datetime.strptime(dt_ini, "%d/%m/%Y").strftime("%Y-%m-%d")
-    dt_fim_api = datetime.strptime(dt_fim, "%d/%m/%Y").strftime("%Y-%m-%d")
 
-    url = f"{XFIN_URL}/api/v1/contasPagar"
-    headers = {
-        "accept": "*/*",
-        "Authorization": f"Bearer {TK_XFIN}"
-    }
+_indice_fornecedores = None
 
-    tamanho_pagina = 500
-    pagina = 1
-    todos_itens = []
 
-    while True:
-        if stop_event.is_set():
-            return pd.DataFrame()
+def get_supplier_index():
+    """Índice de fornecedores do processo (FORNECEDOR + planilha de dados bancários), mantido entre cliques."""
+    global _indice_fornecedores
+    if _indice_fornecedores is None:
+        _indice_fornecedores = IndiceFornecedores(CONFIG_FILE)
+    return _indice_fornecedores
 
-        status_callback(f"Buscando dados na API... Página {pagina}")
-        params = {
-            "pagina": pagina,
-            "tamanhoPagina": tamanho_pagina,
-            "dataVencimentoInicial": dt_ini_api,
-            "dataVencimentoFinal": dt_fim_api
-        }
 
-        try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
+def get_xfin_cache():
+    global _cache_xfin
+    if _cache_xfin is None:
+        _cache_xfin = CacheContasPagar(XFIN_CACHE_DIR, XFIN_CACHE_TTL_MINUTOS, XFIN_PARAM_ALTERACAO,
+                                       recarga_completa_horas=XFIN_CACHE_RECARGA_COMPLETA_HORAS)
+    return _cache_xfin
 
-            if not data.get("sucesso", False):
-                raise Exception(f"Erro na API: {data.get('mensagem', 'Desconhecido')}")
 
-            itens = data.get("itens", [])
-            todos_itens.extend(itens)
+def fetch_xfin_data_api(status_callback, dt_ini, dt_fim, stop_event, forcar=False):
+    """Títulos a pagar da janela (datas dd/mm/yyyy), do cache local se ainda válido (forcar=True ignora o cache)."""
 
-            total_paginas = data.get("totalPaginas", 1)
-            if pagina >= total_paginas:
-                break
+    if not TK_XFIN:
+        raise Exception("Token XFIN (TK_XFIN) não encontrado no arquivo .env. Configure-o para acessar a API.")
 
-            pagina += 1
+    status_callback("Iniciando busca na API...")
 
-        except Exception as e:
-            print(f"Erro ao acessar API na página {pagina}: {e}")
-            raise Exception(f"Falha na comunicação com a API XFIN: {e}")
+    # A API exige o formato yyyy-MM-dd
+    dt_ini_api = datetime.strptime(dt_ini, "%d/%m/%Y").strftime("%Y-%m-%d")
+    dt_fim_api = datetime.strptime(dt_fim, "%d/%m/%Y").strftime("%Y-%m-%d")
+
+    if stop_event.is_set():
+        return pd.DataFrame()
+
+    try:
+        df = get_xfin_cache().obter(get_xfin_client(), dt_ini_api, dt_fim_api, status_callback, stop_event, forcar)
+    except Exception as e:
+        print(f"Erro ao acessar API: {e}")
+        raise Exception(f"Falha na comunicação com a API XFIN: {e}")
 
-    return pd.DataFrame(todos_itens)
+    print(get_xfin_cache().resumo())
+    return df
 
 # --- PROCESSAMENTO DE DADOS ---
 
 
+def match_missing_suppliers(df_merged, df_config, missing_suppliers, indice):
+    """
+    Procura cada fornecedor sem dados bancários entre os nomes parecidos da planilha (só as linhas com
+    PIX ou banco) e do FORNECEDOR do Seculos.
+
+    Quem não está na planilha com o nome exato, tem um único candidato claro (LIMIAR/MARGEM) e o mesmo
+    CNPJ dele (CNPJ_FB do Seculos igual ao Config_CNPJ da planilha) recebe os dados bancários desse
+    candidato em df_merged; essas linhas ficam marcadas em 'Associado_Auto' para a planilha destacar.
+    Nome parecido sem CNPJ que confirme não basta. Os demais voltam num DataFrame com as sugestões ranqueadas.
+    """
+    colunas = ['Fornecedor', 'Sugestões Planilha', 'Sugestão Seculos', 'CNPJ Seculos']
+    if len(missing_suppliers) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    config_util = df_config[df_config['Config_Chave PIX'].notna() | df_config['Config_Banco'].notna()]
+    config_util = config_util.drop_duplicates('Fornecedor_Norm').set_index('Fornecedor_Norm')
+    busca_config = BuscaAproximada(config_util.index.dropna())
+    nomes_config = set(df_config['Fornecedor_Norm'].dropna())
+    colunas_config = [c for c in df_config.columns if c.startswith('Config_')]
+
+    sugestoes = []
+    for nome in missing_suppliers:
+        candidatos = busca_config.candidatos(nome, limite=3)
+        claro = (candidatos and candidatos[0][1] >= LIMIAR_ASSOCIACAO_AUTOMATICA and
+                 (len(candidatos) == 1 or candidatos[0][1] - candidatos[1][1] >= MARGEM_ASSOCIACAO_AUTOMATICA))
+        if nome not in nomes_config and claro:
+            escolhido, nota = candidatos[0]
+            mascara = df_merged['Fornecedor_Norm'] == nome
+            cnpj_seculos = {somente_digitos(c) for c in df_merged.loc[mascara, 'CNPJ_FB'].dropna()} - {""}
+            cnpj_planilha = somente_digitos(config_util.at[escolhido, 'Config_CNPJ']
+                                            if 'Config_CNPJ' in config_util.columns else None)
+            if cnpj_planilha and cnpj_seculos == {cnpj_planilha}:
+                for col in colunas_config:
+                    df_merged.loc[mascara, col] = config_util.at[escolhido, col]
+                df_merged.loc[mascara, 'Associado_Auto'] = f"{escolhido} ({nota:.0%})"
+                print(f"Fornecedor '{nome}' associado automaticamente a '{escolhido}' da planilha ({nota:.0%}).")
+                continue
+            print(f"Fornecedor '{nome}' parecido com '{escolhido}' da planilha ({nota:.0%}), mas o CNPJ não "
+                  f"confirma: vai para o alerta.")
+
+        seculos = indice.aproximados(nome, limite=1)
+        sugestoes.append({
+            'Fornecedor': nome,
+            'Sugestões Planilha': " | ".join(f"{c} ({n:.0%})" for c, n in candidatos),
+            'Sugestão Seculos': seculos[0][0] if seculos else "",
+            'CNPJ Seculos': seculos[0][1] if seculos else "",
+        })
+
+    return pd.DataFrame(sugestoes, columns=colunas)
+
+
 def process_data(df_xfin, status_callback, stop_event, dt_ini_ui=None, dt_fim_ui=None):
     import re
     status_callback("Processando dados da API...")
@@ -381,7 +442,21 @@ def process_data(df_xfin, status_callback, stop_event, dt_ini_ui=None, dt_fim_ui
         status_callback("Criando arquivo de configuração padrão...")
         create_default_config(CONFIG_FILE)
 
-    df_config = pd.read_excel(CONFIG_FILE, dtype=str)
+    # 3. Atualizar o índice de fornecedores: só relê a planilha (rede) e o FORNECEDOR (Firebird) se mudaram
+    status_callback("Conferindo fornecedores (Firebird e planilha)...")
+    indice = get_supplier_index()
+    conn_fb = get_firebird_connection()
+    if stop_event.is_set():
+        if conn_fb:
+            release_firebird_connection(conn_fb)
+        return None, [], start_date, end_date, None
+    try:
+        indice.atualizar(conn_fb)
+    finally:
+        if conn_fb:
+            release_firebird_connection(conn_fb)
+
+    df_config = indice.planilha()
     # Renomear colunas do config para evitar colisão com o CSV do Xfin
     df_config.columns = [f"Config_{c}" if c != "Fornecedor" else c for c in df_config.columns]
 
@@ -400,27 +475,9 @@ def process_data(df_xfin, status_callback, stop_event, dt_ini_ui=None, dt_fim_ui
 
     df_filtered['Fornecedor_Norm'] = df_filtered[col_fornecedor].apply(clean_supplier_name)
 
-    # 3. Buscar CNPJ no Firebird (Enriquecimento)
-    status_callback("Consultando Firebird...")
-    conn_fb = get_firebird_connection()
-    if stop_event.is_set():
-        if conn_fb:
-            conn_fb.close()
-        return None, [], start_date, end_date, None
-
-    fb_data = {}
-    if conn_fb:
-        cursor = conn_fb.cursor()
-        # Busca todos fornecedores para criar um dict de lookup
-        cursor.execute("SELECT NOME, CPF_CNPJ FROM FORNECEDOR")
-        for row in cursor.fetchall():
-            nome = row[0].strip().upper() if row[0] else ""
-            cnpj = row[1].strip() if row[1] else ""
-            fb_data[nome] = cnpj
-        print(f"Carregados {len(fb_data)} fornecedores do Firebird.")
-        conn_fb.close()
-
-    # Aplicar CNPJ do Firebird no DataFrame
+    # Aplicar CNPJ do Firebird (índice local) no DataFrame
+    fb_data = indice.mapa_cnpj_por_nome()
+    print(f"Índice com {len(fb_data)} fornecedores do Firebird.")
     df_filtered['CNPJ_FB'] = df_filtered['Fornecedor_Norm'].map(fb_data)
 
     # 4. Merge com Configuração Bancária
@@ -430,6 +487,8 @@ def process_data(df_xfin, status_callback, stop_event, dt_ini_ui=None, dt_fim_ui
     # Identificar faltantes
     missing_suppliers = df_merged[df_merged['Config_Chave PIX'].isna(
     ) & df_merged['Config_Banco'].isna()]['Fornecedor_Norm'].unique()
+    # Tenta os nomes parecidos antes de pedir cadastro (devolve os que sobraram, com sugestões)
+    missing_suppliers = match_missing_suppliers(df_merged, df_config, missing_suppliers, indice)
 
     # Preparar dados para Excel
     # A API já retorna valores numéricos, mas garantimos o tipo e tratamos vazios
@@ -470,383 +529,6 @@ def process_data(df_xfin, status_callback, stop_event, dt_ini_ui=None, dt_fim_ui
         col_fornecedor, col_vencimento, col_valor, col_doc, col_obs, col_forma, col_banco)
 
 
-def clean_sheet_name(name):
-    """Remove caracteres inválidos para nome de aba do Excel."""
-    invalid_chars = ['\\', '/', '*', '[', ']', ':', '?']
-    for char in invalid_chars:
-        name = name.replace(char, '')
-    # Excel limita a 31 caracteres
-    return name[:31]
-
-# --- GERAÇÃO DE EXCEL ---
-
-# Espaçamento entre tabelas empilhadas na mesma aba
-GAP_ENTRE_TABELAS = 3
-# Tabela de totais por forma de pagamento começa em K3
-COL_RESUMO_TIPO = 11  # K
-COL_RESUMO_VALOR = 12  # L
-LINHA_RESUMO_CABECALHO = 3
-
-
-def _doc_priority(x):
-    """Ordena formas de pagamento: NF, DDA, Boleto, PIX e demais."""
-    xu = x.upper()
-    if "NF" in xu or "NOTA" in xu:
-        return (0, xu)
-    if "BOLETO" in xu:
-        return (1, xu)
-    if "PIX" in xu:
-        return (2, xu)
-    if "VALE" in xu:
-        return (3, xu)
-    return (4, xu)
-
-
-def _get_doc_style(doc_type):
-    """Retorna cores de cabeçalho conforme o tipo de pagamento."""
-    dt_upper = doc_type.upper()
-    if "NF" in dt_upper or "NOTA" in dt_upper:
-        return "C4BD96", "000000"  # marrom-claro (0.77, 0.74, 0.59)
-    if "BOLETO" in dt_upper:
-        return "B2A1C7", "000000"  # lilás (0.70, 0.63, 0.78)
-    if "CRÉDITO" in dt_upper or "CREDITO" in dt_upper or "ESTORNO" in dt_upper:
-        return "366191", "FFFFFF"  # azul-escuro (0.21, 0.38, 0.57)
-    if "PIX" in dt_upper:
-        return "FABF8F", "000000"  # pêssego (0.98, 0.75, 0.56)
-    if "VALE" in dt_upper:
-        return "1AB394", "FFFFFF"  # verde (0.10, 0.70, 0.58)
-    return "BFBFBF", "000000"  # cinza (0.75, 0.75, 0.75) — demais tipos
-
-
-def _prepare_group_df(group_df, is_pix_layout, col_forn, col_valor, col_obs, col_venc):
-    """Ordena e agrupa faturas/PIX antes de escrever a tabela."""
-    group_df = group_df.copy()
-
-    if is_pix_layout:
-        group_df['__Total_Supplier'] = group_df.groupby(col_forn)[col_valor].transform('sum')
-        return group_df.sort_values(
-            by=['__Total_Supplier', col_forn, col_valor],
-            ascending=[True, True, True])
-
-    if 'Fatura' in group_df.columns:
-        group_df['Fatura'] = group_df['Fatura'].fillna('').astype(str).str.strip()
-        mask_invoice = group_df['Fatura'] != ''
-        df_invoice = group_df[mask_invoice].copy()
-        df_no_invoice = group_df[~mask_invoice].copy()
-
-        if not df_invoice.empty:
-            grp_keys = ['Fatura', col_forn, col_venc]
-            if 'CNPJ_Final' in df_invoice.columns:
-                df_invoice['CNPJ_Final'] = df_invoice['CNPJ_Final'].fillna('')
-                grp_keys.append('CNPJ_Final')
-            if 'Config_Banco' in df_invoice.columns:
-                df_invoice['Config_Banco'] = df_invoice['Config_Banco'].fillna('')
-                grp_keys.append('Config_Banco')
-
-            grouped_rows = []
-            for key, block in df_invoice.groupby(grp_keys):
-                row_data = block.iloc[0].copy()
-                row_data[col_valor] = block[col_valor].sum()
-                if col_obs:
-                    row_data[col_obs] = f"Fatura - {key[0]}"
-                grouped_rows.append(row_data)
-            group_df = pd.concat([df_no_invoice, pd.DataFrame(grouped_rows)], ignore_index=True)
-
-    return group_df.sort_values(by=[col_valor], ascending=True)
-
-
-def _add_schedule_dropdown(ws, row, col, dv_agendamento):
-    """Adiciona seletor de agendamento com cor verde/vermelha."""
-    from openpyxl.styles import Font, PatternFill
-    from openpyxl.formatting.rule import FormulaRule
-    from openpyxl.utils import get_column_letter
-
-    col_letter = get_column_letter(col)
-    cell_ref = f"${col_letter}${row}"
-
-    schedule_cell = ws.cell(row=row, column=col, value="Não Agendado")
-    schedule_cell.font = Font(bold=True, color="FFFFFF")
-    schedule_cell.fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-
-    dv_agendamento.add(schedule_cell)
-
-    green_rule = FormulaRule(
-        formula=[f'{cell_ref}="Agendado"'],
-        fill=PatternFill(start_color="00B050", end_color="00B050", fill_type="solid"),
-        font=Font(bold=True, color="FFFFFF"),
-    )
-    red_rule = FormulaRule(
-        formula=[f'{cell_ref}="Não Agendado"'],
-        fill=PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"),
-        font=Font(bold=True, color="FFFFFF"),
-    )
-    ws.conditional_formatting.add(f"{col_letter}{row}", green_rule)
-    ws.conditional_formatting.add(f"{col_letter}{row}", red_rule)
-
-
-def _write_payment_table(ws, group_df, table_title, doc_type, start_row, cols_map, border, currency_fmt, dv_agendamento):
-    """
-    Escreve uma tabela de pagamento empilhada na aba.
-    Retorna (próxima_linha_livre, referência_célula_total).
-    """
-    from openpyxl.styles import Font, PatternFill, Alignment
-    from openpyxl.utils import get_column_letter
-
-    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
-    current_row = start_row
-
-    # Título da tabela (nome da forma de pagamento)
-    fill_color, font_color = _get_doc_style(doc_type)
-    title_cell = ws.cell(row=current_row, column=1, value=table_title.upper())
-    title_cell.font = Font(bold=True, color=font_color, size=12)
-    title_cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-    current_row += 1
-
-    is_pix_layout = "PIX" in doc_type.upper()
-    if is_pix_layout:
-        headers = ["Vencimento", "Nome Recebedor", "Fornecedor",
-                   "Chave PIX", "Nº Doc", "Observação", "Valor", "Valor Total"]
-        val_col_idx = 8
-    else:
-        headers = ["Vencimento", "Banco/Conta", "Fornecedor", "CNPJ", "Nº Doc", "Observação", "Valor"]
-        val_col_idx = 7
-
-    header_font = Font(bold=True, color=font_color)
-    header_fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-
-    header_row = current_row
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = border
-        ws.column_dimensions[get_column_letter(col_num)].width = 20
-
-    group_df = _prepare_group_df(group_df, is_pix_layout, col_forn, col_valor, col_obs, col_venc)
-    current_row = header_row + 1
-    data_start_row = current_row
-
-    start_merge_row = current_row
-    current_supplier = None
-    supplier_total = 0.0
-
-    for _, row in group_df.iterrows():
-        val = row[col_valor]
-
-        if is_pix_layout:
-            supplier = row[col_forn]
-            if supplier != current_supplier:
-                if current_supplier is not None:
-                    if start_merge_row < current_row - 1:
-                        ws.merge_cells(start_row=start_merge_row, start_column=8,
-                                       end_row=current_row - 1, end_column=8)
-                    ws.cell(row=start_merge_row, column=8, value=supplier_total).number_format = currency_fmt
-                    ws.cell(row=start_merge_row, column=8).alignment = Alignment(vertical='center')
-                current_supplier = supplier
-                start_merge_row = current_row
-                supplier_total = 0.0
-            supplier_total += val
-
-            ws.cell(row=current_row, column=1, value=row[col_venc].strftime('%d/%m/%Y'))
-            ws.cell(row=current_row, column=2, value=row.get('Config_Nome Titular', ''))
-            ws.cell(row=current_row, column=3, value=supplier)
-            ws.cell(row=current_row, column=4, value=row.get('Config_Chave PIX', ''))
-            ws.cell(row=current_row, column=5, value=row[col_doc] if col_doc and col_doc in row else "")
-            ws.cell(row=current_row, column=6, value=row[col_obs] if col_obs and col_obs in row else "")
-            ws.cell(row=current_row, column=7, value=val).number_format = currency_fmt
-        else:
-            banco_val = row.get('Config_Banco', '')
-            ws.cell(row=current_row, column=1, value=row[col_venc].strftime('%d/%m/%Y'))
-            ws.cell(row=current_row, column=2, value=banco_val)
-            ws.cell(row=current_row, column=3, value=row[col_forn])
-            ws.cell(row=current_row, column=4, value=row.get('CNPJ_Final', ''))
-            ws.cell(row=current_row, column=5, value=row[col_doc] if col_doc and col_doc in row else "")
-            ws.cell(row=current_row, column=6, value=row[col_obs] if col_obs and col_obs in row else "")
-            ws.cell(row=current_row, column=7, value=val).number_format = currency_fmt
-
-        ws.column_dimensions['E'].width = 7
-        current_row += 1
-
-    if is_pix_layout and current_supplier is not None:
-        if start_merge_row < current_row - 1:
-            ws.merge_cells(start_row=start_merge_row, start_column=8, end_row=current_row - 1, end_column=8)
-        ws.cell(row=start_merge_row, column=8, value=supplier_total).number_format = currency_fmt
-        ws.cell(row=start_merge_row, column=8).alignment = Alignment(vertical='center')
-
-    data_end_row = current_row - 1
-    total_row = current_row + 1
-    col_letter = get_column_letter(val_col_idx)
-
-    ws.cell(row=total_row, column=val_col_idx - 1, value="TOTAL:").font = Font(bold=True)
-    if data_end_row >= data_start_row:
-        sum_formula = f"=SUM({col_letter}{data_start_row}:{col_letter}{data_end_row})"
-    else:
-        sum_formula = 0
-    c_total = ws.cell(row=total_row, column=val_col_idx, value=sum_formula)
-    c_total.number_format = currency_fmt
-    c_total.font = Font(bold=True)
-
-    schedule_row = total_row + 2
-    _add_schedule_dropdown(ws, schedule_row, 1, dv_agendamento)
-
-    next_row = schedule_row + 1 + GAP_ENTRE_TABELAS
-    return next_row, f"{col_letter}{total_row}"
-
-
-def _write_summary_table(ws, summary_data, border, currency_fmt):
-    """Escreve tabela de totais na mesma aba, a partir de K3."""
-    from openpyxl.styles import Font, PatternFill
-
-    header_font_tot = Font(bold=True, color="FFFFFF")
-    header_fill_tot = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-
-    ws.column_dimensions['K'].width = 30
-    ws.column_dimensions['L'].width = 20
-
-    cell_h1 = ws.cell(row=LINHA_RESUMO_CABECALHO, column=COL_RESUMO_TIPO, value="Tipo de Pagamento")
-    cell_h2 = ws.cell(row=LINHA_RESUMO_CABECALHO, column=COL_RESUMO_VALOR, value="Valor Total")
-    for c in [cell_h1, cell_h2]:
-        c.font = header_font_tot
-        c.fill = header_fill_tot
-        c.border = border
-
-    r = LINHA_RESUMO_CABECALHO + 1
-    first_data_row = r
-    for name, cell_ref in summary_data:
-        fill_color, font_color = _get_doc_style(name)
-        row_font = Font(bold=True, color=font_color)
-        row_fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-
-        c_tipo = ws.cell(row=r, column=COL_RESUMO_TIPO, value=name)
-        c_tipo.font = row_font
-        c_tipo.fill = row_fill
-        c_tipo.border = border
-
-        c_val = ws.cell(row=r, column=COL_RESUMO_VALOR, value=f"={cell_ref}")
-        c_val.font = row_font
-        c_val.fill = row_fill
-        c_val.border = border
-        c_val.number_format = currency_fmt
-        r += 1
-
-    if summary_data:
-        r += 1
-        gt_fill, gt_font = "BFBFBF", "000000"
-        gt_style_font = Font(bold=True, size=12, color=gt_font)
-        gt_style_fill = PatternFill(start_color=gt_fill, end_color=gt_fill, fill_type="solid")
-        cell_gt_lbl = ws.cell(row=r, column=COL_RESUMO_TIPO, value="TOTAL GERAL")
-        cell_gt_val = ws.cell(row=r, column=COL_RESUMO_VALOR, value=f"=SUM(L{first_data_row}:L{r - 1})")
-        for c in [cell_gt_lbl, cell_gt_val]:
-            c.font = gt_style_font
-            c.fill = gt_style_fill
-            c.border = border
-        cell_gt_val.number_format = currency_fmt
-
-
-def _build_payment_subgroups(df_filial, col_forma, col_banco):
-    """Monta subgrupos por forma de pagamento (separando bancos quando necessário)."""
-    doc_vals = list(df_filial[col_forma].astype(str).fillna('').unique())
-    doc_types = sorted(doc_vals, key=_doc_priority)
-    sub_groups = []
-
-    for doc_type in doc_types:
-        df_doc = df_filial[df_filial[col_forma] == doc_type].copy()
-        unique_banks = df_doc[col_banco].unique()
-        real_banks = [b for b in unique_banks if str(b).strip()]
-
-        if len(real_banks) > 1:
-            for bank in unique_banks:
-                sub_df = df_doc[df_doc[col_banco] == bank]
-                if sub_df.empty:
-                    continue
-                s_name = f"{doc_type}"
-                if str(bank).strip():
-                    s_name += f" - {bank}"
-                sub_groups.append((s_name, doc_type, sub_df))
-        else:
-            sub_groups.append((doc_type, doc_type, df_doc))
-
-    return sub_groups
-
-
-def create_excel(df, output_path, cols_map):
-    import openpyxl
-    from openpyxl.styles import Border, Side
-    from openpyxl.worksheet.datavalidation import DataValidation
-
-    col_forn, col_venc, col_valor, col_doc, col_obs, col_forma, col_banco = cols_map
-
-    wb = openpyxl.Workbook()
-    if 'Sheet' in wb.sheetnames:
-        wb.remove(wb['Sheet'])
-
-    # Garantir colunas de agrupamento
-    if col_forma and col_forma in df.columns:
-        df[col_forma] = df[col_forma].fillna('Indefinido')
-    else:
-        df['__Forma_Temp'] = 'Indefinido'
-        col_forma = '__Forma_Temp'
-
-    if col_banco and col_banco in df.columns:
-        df[col_banco] = df[col_banco].fillna('')
-    else:
-        df['__Banco_Temp'] = ''
-        col_banco = '__Banco_Temp'
-
-    currency_fmt = '_-R$* #,##0.00_-;-R$* #,##0.00_-;_-R$* \"-\"??_-;_-@_-'
-    border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin'),
-    )
-
-    # Uma aba por filial, na ordem Loja -> Oficina -> Divisa -> Serviços
-    filiais = (
-        df[['Filial_Order', 'Filial_Sheet']]
-        .drop_duplicates()
-        .sort_values('Filial_Order')
-    )
-
-    for _, filial_row in filiais.iterrows():
-        sheet_name = clean_sheet_name(filial_row['Filial_Sheet'])
-        df_filial = df[df['Filial_Sheet'] == filial_row['Filial_Sheet']].copy()
-        if df_filial.empty:
-            continue
-
-        ws = wb.create_sheet(sheet_name)
-
-        # Validação de agendamento reutilizada em todas as tabelas da aba
-        dv_agendamento = DataValidation(
-            type="list",
-            formula1='"Agendado,Não Agendado"',
-            allow_blank=False,
-        )
-        dv_agendamento.error = "Selecione Agendado ou Não Agendado"
-        dv_agendamento.errorTitle = "Agendamento"
-        ws.add_data_validation(dv_agendamento)
-
-        current_row = 1
-        sheet_summary = []
-
-        for table_title, doc_type, group_df in _build_payment_subgroups(df_filial, col_forma, col_banco):
-            current_row, total_ref = _write_payment_table(
-                ws, group_df, table_title, doc_type, current_row,
-                cols_map, border, currency_fmt, dv_agendamento,
-            )
-            sheet_summary.append((table_title, total_ref))
-
-        if sheet_summary:
-            _write_summary_table(ws, sheet_summary, border, currency_fmt)
-
-    if not wb.sheetnames:
-        wb.create_sheet("VAZIO")
-
-    try:
-        wb.save(output_path)
-    except PermissionError:
-        output_path = output_path + ".error"
-
-    wb.save(output_path)
-
 # --- CLASSE PRINCIPAL DA UI ---
 
 
@@ -854,7 +536,7 @@ class PaymentBotApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Robô de Pagamentos Xfin")
-        self.root.geometry("450x400")
+        self.root.geometry("450x450")
 
         self.stop_event = threading.Event()
 
@@ -896,6 +578,14 @@ class PaymentBotApp:
             root, text="Fundir dias em um único arquivo (Feriados)", variable=self.var_merge_days)
         self.chk_merge.pack(pady=5)
 
+        self.var_force_refresh = tk.BooleanVar()
+        self.chk_force_refresh = tk.Checkbutton(
+            root, text="Ignorar cache e buscar tudo na API", variable=self.var_force_refresh)
+        self.chk_force_refresh.pack(pady=2)
+
+        self.lbl_cache = tk.Label(root, text="Cache API: sem consultas", fg="gray")
+        self.lbl_cache.pack()
+
         self.progress = ttk.Progressbar(root, orient="horizontal", length=300, mode="indeterminate")
         self.progress.pack(pady=10)
 
@@ -958,7 +648,9 @@ class PaymentBotApp:
             # Etapa A: Buscar na API
             if self.stop_event.is_set():
                 return
-            df_xfin = fetch_xfin_data_api(self.update_status, dt_ini, dt_fim, self.stop_event)
+            df_xfin = fetch_xfin_data_api(self.update_status, dt_ini, dt_fim, self.stop_event,
+                                          forcar=self.var_force_refresh.get())
+            self.lbl_cache.config(text=get_xfin_cache().resumo())
 
             if self.stop_event.is_set():
                 self.finish("Processo cancelado pelo usuário.")
@@ -1056,10 +748,9 @@ class PaymentBotApp:
                     return
 
                 self.update_status("Enviando alerta de fornecedores...")
-                # Cria um CSV temporário com os faltantes para anexar
-                missing_df = pd.DataFrame(missing, columns=['Fornecedor'])
+                # Cria um CSV temporário com os faltantes (e as sugestões de nome) para anexar
                 missing_csv = os.path.join(TEMP_DIR, "falta_cadastrar.csv")
-                missing_df.to_csv(missing_csv, index=False)
+                missing.to_csv(missing_csv, index=False)
                 email_alert.enviar_email_erro(missing_csv, len(missing), True)
 
             self.finish(f"Sucesso!\nGerado(s): {len(generated_files)} arquivo(s)\nSalvos em {current_base_path}.")
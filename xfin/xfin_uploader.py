@@ -1,6 +1,24 @@
+"""
+Envio dos CSVs de contas a pagar para a tela de importação do Xfin (Selenium).
+
+SessaoXfin abre o navegador uma vez (headless por padrão), faz o login uma vez, lê a lista de filiais
+uma vez e envia um lote de arquivos, trocando de filial só quando o próximo arquivo é de outra filial
+(os arquivos do lote são agrupados por filial). Se o site voltar para a tela de login no meio do lote,
+loga de novo e segue. 'tempos' guarda a duração de cada etapa (navegador, login, filiais, filial,
+upload) e resumo_tempos() monta o texto para o log.
+
+upload_arquivos_xfin(caminhos) envia um lote numa sessão só; upload_arquivo_xfin(caminho) é o lote de
+um arquivo. Para testar sem o Xfin, com o site falso (páginas salvas em html_xfin):
+    python xfin/site_falso_xfin.py --porta 8765
+    python xfin/xfin_uploader.py --url http://127.0.0.1:8765 arquivos/importacao_xfin_filial_1_PRONTO.csv
+"""
 import os
-import time
 import re
+import time
+import argparse
+
+from contextlib import contextmanager
+
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
@@ -18,17 +36,29 @@ XFIN_PASS = os.getenv('XFIN_PASS')  # Adicione ao seu .env
 
 # URLs
 BASE_URL = "https://app.xfin.com.br"
-URL_IMPORTACAO = f"{BASE_URL}/Titulo/Importacao?tipo=1"
 URL_LOGIN_PARTIAL = "Login"
-URL_ESCOLHA_FILIAL = f"{BASE_URL}/Identity/Account/EscolheFilial"
 
+# Mapeamento ID Seculos -> Trecho do CNPJ/Nome no XFIN
+MAPA_FILIAIS = {
+    "1": "14.255.350/0001-03",  # Loja
+    "2": "14.255.350/0004-56",  # Oficina
+    "3": "59.185.879/0001-36",  # Divisa
+    "4": "62.188.494/0001-37",  # Serviços
+}
+
+# Recargas da importação quando o Xfin responde "Acesso Negado" logo depois da troca de filial
+TENTATIVAS_ACESSO_NEGADO = 5
 
-def get_driver():
+
+def get_driver(headless=True):
     options = webdriver.ChromeOptions()
-    # options.add_argument("--headless") # Descomente para rodar em background
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+    else:
+        options.add_argument("--start-maximized")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--start-maximized")
 
     # Ignorar erros de certificado e logs inúteis
     options.add_argument("--ignore-certificate-errors")
@@ -39,330 +69,363 @@ def get_driver():
     return driver
 
 
-def fazer_login(driver):
-    """Realiza o login se estiver na tela de login."""
-    if not XFIN_EMAIL or not XFIN_PASS:
-        print("ERRO: Credenciais XFIN_USER ou XFIN_PASS não encontradas no arquivo .env")
-        return False
-
-    # 1. Preencher Usuário/Email
-    # Usa ID específico encontrado no HTML: id="Input_Email"
-    try:
-        # Verifica se estamos na tela de login
-        if URL_LOGIN_PARTIAL.lower() not in driver.current_url.lower():
-            return True  # Já estamos logados ou em outra tela
-
-        email_elem = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "Input_Email"))
-        )
-        email_elem.clear()
-        email_elem.send_keys(XFIN_EMAIL)
-    except Exception as e:
-        print(f"Erro ao encontrar campo de email: {e}")
-        return False
-    
-    # 1.1 Verificar se já estamos na tela de escolha de módulo (pode acontecer se o cookie estiver meio vivo)
-    try:
-        if "EscolheModulo" in driver.current_url:
-            print("Tela de escolha de módulo detectada. Selecionando Controle Financeiro...")
-            btn_financeiro = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "button[formaction*='ControleFinanceiro']"))
-            )
-            btn_financeiro.click()
-            time.sleep(2) # Espera redirecionar
-    except Exception:
-        pass
-
-    # 2. Preencher Senha
-    # Usa ID específico encontrado no HTML: id="Input_Password"
-    try:
-        pass_elem = driver.find_element(By.ID, "Input_Password")
-        pass_elem.clear()
-        pass_elem.send_keys(XFIN_PASS)
-    except Exception as e:
-        print(f"Erro ao encontrar campo de senha: {e}")
-        return False
-
-    # 3. Clicar em Entrar/Login
-    try:
-        # Procura botão de submit ou botão com texto "Entrar"/"Login"
-        btn_login = driver.find_element(By.CSS_SELECTOR, "button[type='submit'], input[type='submit']")
-        btn_login.click()
-    except Exception as e:
-        print(f"Erro ao clicar no botão de login: {e}")
-        return False
-
-    # 4. Esperar a "Segunda Tela" (Home/Módulos)
-    # Espera a URL mudar e não conter mais "Login"
-    try:
-        WebDriverWait(driver, 20).until(
-            lambda d: URL_LOGIN_PARTIAL.lower() not in d.current_url.lower()
-        )
-        
-        # 5. Verificar se caiu na tela de Escolha de Módulo PÓS-LOGIN
-        if "EscolheModulo" in driver.current_url:
-            print("Redirecionado para escolha de módulo. Selecionando Controle Financeiro...")
-            btn_financeiro = WebDriverWait(driver, 10).until(
+def extrair_id_filial_arquivo(caminho_arquivo):
+    """Extrai o ID da filial do nome do arquivo (ex: ...filial_2_PRONTO.csv -> '2')"""
+    match = re.search(r'filial_(\d+)_', caminho_arquivo)
+    if match:
+        return match.group(1)
+    return None
+
+
+class SessaoXfin:
+    """
+    Uma sessão do navegador no Xfin para vários uploads.
+
+        with SessaoXfin() as sessao:
+            resultado = sessao.enviar_lote(arquivos)   # {caminho: True/False}
+            print(sessao.resumo_tempos())
+    """
+
+    def __init__(self, base_url=BASE_URL, email=None, senha=None, headless=True, driver_factory=None):
+        self.base_url = base_url.rstrip("/")
+        self.url_importacao = f"{self.base_url}/Titulo/Importacao?tipo=1"
+        self.url_escolha_filial = f"{self.base_url}/Identity/Account/EscolheFilial"
+        self.email = email or XFIN_EMAIL
+        self.senha = senha or XFIN_PASS
+        self.headless = headless
+        self.driver_factory = driver_factory or get_driver
+        self.driver = None
+        self.filial_atual = None
+        self._filiais = None
+        self.tempos = {}
+
+    # ------------------------------------------------------------------ #
+    # Infra                                                               #
+    # ------------------------------------------------------------------ #
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tempos.setdefault(etapa, []).append(time.perf_counter() - inicio)
+
+    def resumo_tempos(self):
+        """Uma linha por etapa: quantas vezes rodou, total e média."""
+        linhas = []
+        for etapa, tempos in self.tempos.items():
+            linhas.append(f"  {etapa:<10} {len(tempos):3d}x  total {sum(tempos):7.2f}s  "
+                          f"média {sum(tempos) / len(tempos):6.2f}s")
+        return "Tempos do upload Xfin:\n" + "\n".join(linhas) if linhas else "Tempos do upload Xfin: nada medido"
+
+    def abrir(self):
+        if self.driver is None:
+            with self.medir("navegador"):
+                self.driver = self.driver_factory(self.headless)
+
+    def fechar(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+            self.filial_atual = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def _na_tela_de_login(self):
+        return URL_LOGIN_PARTIAL.lower() in self.driver.current_url.lower()
+
+    def _abrir_pagina(self, url):
+        """driver.get que refaz o login (uma vez) se o site mandar para a tela de login."""
+        self.driver.get(url)
+        if self._na_tela_de_login():
+            if not self.login():
+                return False
+            self.driver.get(url)
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Login                                                               #
+    # ------------------------------------------------------------------ #
+    def _escolher_modulo_financeiro(self, mensagem):
+        if "EscolheModulo" in self.driver.current_url:
+            print(mensagem)
+            btn_financeiro = WebDriverWait(self.driver, 10).until(
                 EC.element_to_be_clickable((By.CSS_SELECTOR, "button[formaction*='ControleFinanceiro']"))
             )
             btn_financeiro.click()
-            time.sleep(2)
-            
-        print("Login realizado com sucesso. Tela inicial carregada.")
-        return True
-    except Exception:
-        print("Timeout aguardando redirecionamento pós-login.")
-        return False
+            WebDriverWait(self.driver, 10).until(lambda d: "EscolheModulo" not in d.current_url)
 
+    def login(self):
+        """Realiza o login se estiver na tela de login."""
+        if not self.email or not self.senha:
+            print("ERRO: Credenciais XFIN_USER ou XFIN_PASS não encontradas no arquivo .env")
+            return False
 
-def obter_filiais(driver):
-    """Vai para a tela de escolha e retorna uma lista de dicts {id, nome} das filiais."""
-    print("Obtendo lista de filiais...")
-    try:
-        driver.get(URL_IMPORTACAO)
+        driver = self.driver
+        with self.medir("login"):
+            # Tela de login pode já ter passado (cookie ainda válido)
+            if not self._na_tela_de_login():
+                return True
 
-        # Se cair no login, loga e volta
-        if URL_LOGIN_PARTIAL.lower() in driver.current_url.lower():
-            if not fazer_login(driver):
-                return []
-            driver.get(URL_ESCOLHA_FILIAL)
+            # Login invalida a filial escolhida
+            self.filial_atual = None
 
-        # Aguarda o select carregar
-        select_elem = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "Input_IdFilial"))
-        )
+            # Usa IDs específicos encontrados no HTML: id="Input_Email" e id="Input_Password"
+            try:
+                email_elem = WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.ID, "Input_Email"))
+                )
+                email_elem.clear()
+                email_elem.send_keys(self.email)
+                pass_elem = driver.find_element(By.ID, "Input_Password")
+                pass_elem.clear()
+                pass_elem.send_keys(self.senha)
+            except Exception as e:
+                print(f"Erro ao preencher usuário/senha: {e}")
+                return False
 
-        select = Select(select_elem)
-        filiais = []
+            try:
+                btn_login = driver.find_element(By.CSS_SELECTOR, "button[type='submit'], input[type='submit']")
+                btn_login.click()
+            except Exception as e:
+                print(f"Erro ao clicar no botão de login: {e}")
+                return False
+
+            # Espera a URL mudar e não conter mais "Login"; pode cair na escolha de módulo
+            try:
+                WebDriverWait(driver, 20).until(
+                    lambda d: URL_LOGIN_PARTIAL.lower() not in d.current_url.lower()
+                )
+                self._escolher_modulo_financeiro(
+                    "Redirecionado para escolha de módulo. Selecionando Controle Financeiro...")
+                print("Login realizado com sucesso. Tela inicial carregada.")
+                return True
+            except Exception:
+                print("Timeout aguardando redirecionamento pós-login.")
+                return False
 
-        for option in select.options:
-            val = option.get_attribute("value")
-            text = option.text
-            if val:
-                filiais.append({"id": val, "nome": text})
+    # ------------------------------------------------------------------ #
+    # Filiais                                                             #
+    # ------------------------------------------------------------------ #
+    def filiais(self, recarregar=False):
+        """Lista de dicts {id, nome} das filiais (lida uma vez por sessão)."""
+        if self._filiais is not None and not recarregar:
+            return self._filiais
+
+        print("Obtendo lista de filiais...")
+        with self.medir("filiais"):
+            try:
+                if not self._abrir_pagina(self.url_escolha_filial):
+                    return []
+                select_elem = WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.ID, "Input_IdFilial"))
+                )
+                filiais = []
+                for option in Select(select_elem).options:
+                    val = option.get_attribute("value")
+                    if val:
+                        filiais.append({"id": val, "nome": option.text})
+            except Exception as e:
+                print(f"Erro ao obter filiais: {e}")
+                return []
 
         print(f"Filiais encontradas: {len(filiais)}")
+        self._filiais = filiais
         return filiais
 
-    except Exception as e:
-        print(f"Erro ao obter filiais: {e}")
-        return []
+    def filial_por_cnpj(self, cnpj):
+        for filial in self.filiais():
+            if cnpj in filial['nome']:
+                return filial
+        return None
 
+    def selecionar_filial(self, filial_id):
+        """Seleciona a filial na tela de escolha (nada a fazer se ela já for a atual)."""
+        if filial_id == self.filial_atual:
+            return True
 
-def selecionar_filial(driver, filial_id):
-    """Seleciona uma filial específica na tela de escolha."""
-    try:
-        # Garante que estamos na tela certa
-        if "EscolheFilial" not in driver.current_url:
-            driver.get(URL_ESCOLHA_FILIAL)
+        with self.medir("filial"):
+            try:
+                if "EscolheFilial" not in self.driver.current_url:
+                    if not self._abrir_pagina(self.url_escolha_filial):
+                        return False
+
+                select_elem = WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.ID, "Input_IdFilial"))
+                )
+                Select(select_elem).select_by_value(filial_id)
+                self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+
+                # Aguarda sair da tela de escolha (pode ir para Home ou Acesso Negado)
+                WebDriverWait(self.driver, 10).until(
+                    lambda d: "EscolheFilial" not in d.current_url
+                )
+            except Exception as e:
+                print(f"Erro ao selecionar filial {filial_id}: {e}")
+                self.filial_atual = None
+                return False
 
-        select_elem = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "Input_IdFilial"))
-        )
+        self.filial_atual = filial_id
+        return True
 
-        select = Select(select_elem)
-        select.select_by_value(filial_id)
+    # ------------------------------------------------------------------ #
+    # Upload                                                              #
+    # ------------------------------------------------------------------ #
+    def enviar(self, caminho_arquivo):
+        """Envia um arquivo na filial atual pela tela de importação."""
+        driver = self.driver
+        with self.medir("upload"):
+            try:
+                print(f"Acessando tela de importação: {self.url_importacao}")
+                filial = self.filial_atual
+                if not self._abrir_pagina(self.url_importacao):
+                    return False
+                if self.filial_atual != filial:
+                    # Caiu no login no meio do lote: a filial precisa ser escolhida de novo
+                    if not self.selecionar_filial(filial):
+                        return False
+                    driver.get(self.url_importacao)
+
+                for _ in range(TENTATIVAS_ACESSO_NEGADO):
+                    if "AcessoNegado" not in driver.current_url and "AccessDenied" not in driver.current_url:
+                        break
+                    print("Acesso Negado detectado. Tentando recarregar a página de importação...")
+                    driver.get(self.url_importacao)
+
+                file_input = WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.ID, "file"))
+                )
+                abs_path = os.path.abspath(caminho_arquivo)
+                file_input.send_keys(abs_path)
+                print(f"Arquivo anexado: {abs_path}")
+
+                # Espera o primeiro select aparecer (indicando que o JS processou o arquivo)
+                WebDriverWait(driver, 15).until(
+                    EC.presence_of_element_located((By.ID, "selColuna_0"))
+                )
+
+                # Mapear as 12 colunas conforme ordem do CSV e IDs do sistema
+                # CSV: Pessoa(0), Emissao(1), Vencimento(2), Valor(3), Plano(4), TipoDoc(5),
+                #      ValorPago(6), DataPag(7), Banco(8), Parcela(9), NumDoc(10), Desc(11)
+                for i in range(12):
+                    # O value no HTML corresponde exatamente ao índice da coluna esperada pelo sistema
+                    Select(driver.find_element(By.ID, f"selColuna_{i}")).select_by_value(str(i))
+
+                # Desmarcar opções indesejadas (clicando no label do switch)
+                for chk_id, descricao in (("chkVerificarTituloExistente", "Verificar existência"),
+                                          ("chkCadastrarTipoDocumento", "Cadastrar tipo documento")):
+                    if driver.find_element(By.ID, chk_id).is_selected():
+                        label = driver.find_element(By.CSS_SELECTOR, f"label[for='{chk_id}']")
+                        driver.execute_script("arguments[0].click();", label)
+                        print(f"Opção '{descricao}' desmarcada.")
+
+                # O botão pode estar desabilitado inicialmente ou demorar para aparecer
+                btn_importar = WebDriverWait(driver, 10).until(
+                    EC.element_to_be_clickable((By.ID, "btnImportar"))
+                )
+                # Clica via JS (mais seguro se tiver sobreposição)
+                driver.execute_script("arguments[0].click();", btn_importar)
+                print("Botão 'Importar títulos' clicado.")
+            except Exception as e:
+                print(f"Erro durante o upload: {e}")
+                return False
 
-        # Clica em Escolher
-        btn_escolher = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        btn_escolher.click()
+            # O sistema usa toastr.success ou exibe o banner de erros
+            try:
+                WebDriverWait(driver, 30).until(
+                    lambda d: d.find_elements(By.CLASS_NAME, "toast-success")
+                    or d.find_element(By.ID, "bannerErros").is_displayed()
+                )
+            except Exception as e:
+                print(f"Timeout aguardando resposta da importação: {e}")
+                return False
 
-        # Aguarda sair da tela de escolha (pode ir para Home ou Acesso Negado)
-        WebDriverWait(driver, 10).until(
-            lambda d: "EscolheFilial" not in d.current_url
-        )
-        return True
-    except Exception as e:
-        print(f"Erro ao selecionar filial {filial_id}: {e}")
-        return False
-
-
-def realizar_upload(driver, caminho_arquivo):
-    """Navega para a importação e envia o arquivo."""
-    try:
-        print(f"Acessando tela de importação: {URL_IMPORTACAO}")
-        driver.get(URL_IMPORTACAO)
-
-        # Verifica se caiu em Acesso Negado ou Login novamente
-        while "AcessoNegado" in driver.current_url or "AccessDenied" in driver.current_url:
-            print("Acesso Negado detectado. Tentando recarregar a página de importação...")
-            driver.get(URL_IMPORTACAO)
-
-        # Input de arquivo
-        file_input = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "file"))
-        )
-
-        abs_path = os.path.abspath(caminho_arquivo)
-        file_input.send_keys(abs_path)
-        print(f"Arquivo anexado: {abs_path}")
-
-        # --- NOVO: Mapeamento de Colunas e Configuração ---
-        print("Aguardando processamento do arquivo e tabela de mapeamento...")
-        
-        # Espera o primeiro select aparecer (indicando que o JS processou o arquivo)
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.ID, "selColuna_0"))
-        )
-        
-        # Mapear as 12 colunas conforme ordem do CSV e IDs do sistema
-        # CSV: Pessoa(0), Emissao(1), Vencimento(2), Valor(3), Plano(4), TipoDoc(5), 
-        #      ValorPago(6), DataPag(7), Banco(8), Parcela(9), NumDoc(10), Desc(11)
-        for i in range(12):
-            select_elem = driver.find_element(By.ID, f"selColuna_{i}")
-            select = Select(select_elem)
-            # O value no HTML corresponde exatamente ao índice da coluna esperada pelo sistema
-            select.select_by_value(str(i))
-        
-        print("Colunas mapeadas com sucesso.")
-
-        # Desmarcar opções indesejadas (clicando no label do switch)
-        # 1. Verificar existencia
-        chk_existencia = driver.find_element(By.ID, "chkVerificarTituloExistente")
-        if chk_existencia.is_selected():
-            label_existencia = driver.find_element(By.CSS_SELECTOR, "label[for='chkVerificarTituloExistente']")
-            driver.execute_script("arguments[0].click();", label_existencia)
-            print("Opção 'Verificar existência' desmarcada.")
-
-        # 2. Cadastrar tipo documento
-        chk_tipo_doc = driver.find_element(By.ID, "chkCadastrarTipoDocumento")
-        if chk_tipo_doc.is_selected():
-            label_tipo_doc = driver.find_element(By.CSS_SELECTOR, "label[for='chkCadastrarTipoDocumento']")
-            driver.execute_script("arguments[0].click();", label_tipo_doc)
-            print("Opção 'Cadastrar tipo documento' desmarcada.")
-
-        # Botão Importar
-        # O botão pode estar desabilitado inicialmente ou demorar para aparecer
-        btn_importar = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "btnImportar"))
-        )
-
-        # Clica no botão (usando JS as vezes é mais seguro se tiver sobreposição)
-        driver.execute_script("arguments[0].click();", btn_importar)
-        print("Botão 'Importar títulos' clicado.")
-
-        # Aguardar feedback de sucesso
-        # O sistema usa toastr.success ou exibe um alerta
-        try:
-            # Espera genérica para processamento (ajustar conforme velocidade do sistema)
-            # Procura por toast-success ou banner de erro
-            WebDriverWait(driver, 30).until(
-                lambda d: d.find_elements(By.CLASS_NAME, "toast-success") or d.find_element(By.ID, "bannerErros").is_displayed()
-            )
-            
-            # Verifica qual apareceu
             if driver.find_elements(By.CLASS_NAME, "toast-success"):
                 print("Sucesso: Mensagem de confirmação detectada.")
                 return True
-            
-            try:
-                erro = driver.find_element(By.ID, "bannerErros")
-                if erro.is_displayed():
-                    print("ERRO na importação: Banner de erros exibido.")
-                    return False
-            except:
-                pass
-                
-            return True # Fallback se passou pelo wait
-        except Exception as e:
-            print(f"Timeout aguardando resposta da importação: {e}")
+            print("ERRO na importação: Banner de erros exibido.")
             return False
 
-    except Exception as e:
-        print(f"Erro durante o upload: {e}")
-        return False
+    def enviar_lote(self, caminhos):
+        """
+        Envia vários arquivos numa sessão só, agrupados por filial.
+        Retorna {caminho: True/False} na ordem recebida.
+        """
+        resultado = {caminho: False for caminho in caminhos}
+        por_filial = {}
+        for caminho in caminhos:
+            if not caminho or not os.path.exists(caminho):
+                print(f"Arquivo não encontrado para upload: {caminho}")
+                continue
+            # Identifica qual filial do Seculos gerou este arquivo
+            id_filial_seculos = extrair_id_filial_arquivo(caminho)
+            if not id_filial_seculos:
+                print(f"Não foi possível identificar a filial no nome do arquivo: {caminho}")
+                continue
+            cnpj_alvo = MAPA_FILIAIS.get(id_filial_seculos)
+            if not cnpj_alvo:
+                print(f"ID de filial {id_filial_seculos} não mapeado para CNPJ do XFIN.")
+                continue
+            por_filial.setdefault(cnpj_alvo, []).append(caminho)
+
+        if not por_filial:
+            return resultado
 
+        try:
+            self.abrir()
+            if not self.filiais():
+                print("Nenhuma filial encontrada ou erro ao listar.")
+                return resultado
+
+            for cnpj_alvo, arquivos in por_filial.items():
+                filial = self.filial_por_cnpj(cnpj_alvo)
+                if filial is None:
+                    print(f"Filial com CNPJ {cnpj_alvo} não encontrada no Xfin.")
+                    continue
+
+                print(f"\n--- Processando Filial Alvo: {filial['nome']} (ID: {filial['id']}) ---")
+                if not self.selecionar_filial(filial['id']):
+                    print(f"Falha ao selecionar filial {filial['nome']}")
+                    continue
+
+                for caminho in arquivos:
+                    resultado[caminho] = self.enviar(caminho)
+                    if resultado[caminho]:
+                        print(f"Upload concluído para {filial['nome']}: {caminho}")
+                    else:
+                        print(f"Falha no upload para {filial['nome']}: {caminho}")
+        except Exception as e:
+            print(f"Erro geral no Selenium: {e}")
 
-def extrair_id_filial_arquivo(caminho_arquivo):
-    """Extrai o ID da filial do nome do arquivo (ex: ...filial_2_PRONTO.csv -> '2')"""
-    match = re.search(r'filial_(\d+)_', caminho_arquivo)
-    if match:
-        return match.group(1)
-    return None
+        return resultado
 
 
-def upload_arquivo_xfin(caminho_arquivo):
-    if not caminho_arquivo or not os.path.exists(caminho_arquivo):
-        print(f"Arquivo não encontrado para upload: {caminho_arquivo}")
-        return False
-
-    # Identifica qual filial do Seculos gerou este arquivo
-    id_filial_seculos = extrair_id_filial_arquivo(caminho_arquivo)
-    if not id_filial_seculos:
-        print(f"Não foi possível identificar a filial no nome do arquivo: {caminho_arquivo}")
-        return False
-
-    # Mapeamento ID Seculos -> Trecho do CNPJ/Nome no XFIN
-    # 1 - Loja (14.255.350/0001-03)
-    # 2 - Oficina (14.255.350/0004-56)
-    # 3 - Divisa (59.185.879/0001-36)
-    # 4 - Serviços (62.188.494/0001-37)
-    mapa_filiais = {
-        "1": "14.255.350/0001-03",
-        "2": "14.255.350/0004-56",
-        "3": "59.185.879/0001-36",
-        "4": "62.188.494/0001-37"
-    }
-    
-    cnpj_alvo = mapa_filiais.get(id_filial_seculos)
-    if not cnpj_alvo:
-        print(f"ID de filial {id_filial_seculos} não mapeado para CNPJ do XFIN.")
-        return False
-
-    driver = get_driver()
-    sucesso_geral = False # Inicializa como False
-
-    try:
-        # 1. Tenta acessar direto a escolha de filial para ver se pede login
-        driver.get(URL_ESCOLHA_FILIAL)
-
-        if URL_LOGIN_PARTIAL.lower() in driver.current_url.lower():
-            if not fazer_login(driver):
-                driver.quit()
-                return False
+def upload_arquivos_xfin(caminhos, **kwargs_sessao):
+    """Envia o lote numa sessão só (um navegador, um login). Retorna {caminho: True/False}."""
+    with SessaoXfin(**kwargs_sessao) as sessao:
+        resultado = sessao.enviar_lote(caminhos)
+        print(sessao.resumo_tempos())
+    return resultado
 
-        # 2. Obtém lista de filiais
-        filiais = obter_filiais(driver)
 
-        if not filiais:
-            print("Nenhuma filial encontrada ou erro ao listar.")
-            driver.quit()
-            return False
-        
-        # 3. Itera sobre cada filial
-        for filial in filiais:
-            # Verifica se esta é a filial correta para o arquivo
-            if cnpj_alvo not in filial['nome']:
-                continue # Pula se não for a filial alvo
-            
-            print(f"\n--- Processando Filial Alvo: {filial['nome']} (ID: {filial['id']}) ---")
-            
-            # Seleciona a filial
-            if selecionar_filial(driver, filial['id']):
-                # Faz o upload
-                if realizar_upload(driver, caminho_arquivo):
-                    print(f"Upload concluído para {filial['nome']}")
-                    sucesso_geral = True
-                else:
-                    print(f"Falha no upload para {filial['nome']}")
-                    sucesso_geral = False
-            else:
-                print(f"Falha ao selecionar filial {filial['nome']}")
-                sucesso_geral = False
-            
-            break # Se já processou a filial correta, pode sair do loop
-
-            # Pequena pausa antes da próxima
-            time.sleep(2)
-
-    except Exception as e:
-        print(f"Erro geral no Selenium: {e}")
-    finally:
-        driver.quit()
-
-    return sucesso_geral
+def upload_arquivo_xfin(caminho_arquivo, **kwargs_sessao):
+    return upload_arquivos_xfin([caminho_arquivo], **kwargs_sessao)[caminho_arquivo]
 
 
 if __name__ == "__main__":
-    # Teste isolado
-    upload_arquivo_xfin("./arquivos/importacao_xfin_oficina_PRONTO - cópia.csv")
+    parser = argparse.ArgumentParser(description="Envia CSVs de contas a pagar para a importação do Xfin")
+    parser.add_argument("arquivos", nargs="+", help="CSVs no padrão ...filial_<id>_PRONTO.csv")
+    parser.add_argument("--url", default=BASE_URL, help="Endereço do Xfin (ou do site_falso_xfin.py)")
+    parser.add_argument("--visivel", action="store_true", help="Mostra o navegador (padrão: headless)")
+    args = parser.parse_args()
+
+    resultado = upload_arquivos_xfin(args.arquivos, base_url=args.url, headless=not args.visivel)
+    for arquivo, sucesso in resultado.items():
+        print(f"{'OK   ' if sucesso else 'FALHA'} {arquivo}")